@@ -0,0 +1,22 @@
+<?php
+/**
+ * APCu Availability - shared check for the modules with an APCu fast path
+ *
+ * peer_lookup.php, relay_wake.php, relay_shm.php, relay_stats.php,
+ * rate_limit.php and Database's profiler keep their state in APCu when the
+ * extension is loaded and enabled for this SAPI, and fall back to files or
+ * MySQL otherwise.
+ *
+ * Usage:
+ *   if (apcuAvailable()) { apcu_inc($key); } else { ... }
+ */
+
+function apcuAvailable() {
+    static $available = null;
+    if ($available === null) {
+        $available = function_exists('apcu_enabled') && apcu_enabled();
+    }
+    return $available;
+}
+
+?>
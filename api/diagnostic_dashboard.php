@@ -13,6 +13,7 @@ header('Access-Control-Allow-Origin: *');
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/relay_stats.php';
 
 $code = isset($_GET['code']) ? $_GET['code'] : null;
 $format = isset($_GET['format']) ? $_GET['format'] : 'html';
@@ -77,113 +78,57 @@ if ($session_result && $session_result->num_rows > 0) {
 $client_session_id = $client_session ? $client_session['session_id'] : null;
 $admin_session_id = $admin_session ? $admin_session['session_id'] : null;
 
-// Get frame statistics (last 5 minutes)
+// Traffic sent by this pair (last 5 minutes) - incremental counters (relay_stats.php);
+// frames are counted on the way in, relay_frame_slots only keeps the newest one
 $current_time = time();
-$frame_sql = "SELECT 
-    COUNT(*) as total_frames,
-    MAX(created_at) as last_frame_time,
-    MIN(created_at) as first_frame_time,
-    AVG(LENGTH(message_data)) as avg_frame_size,
-    SUM(LENGTH(message_data)) as total_bytes
-    FROM relay_messages 
-    WHERE message_type = 'frame' 
-    AND session_id IN (
-        SELECT session_id FROM sessions WHERE code = '$escaped_code'
-    )
-    AND created_at > " . ($current_time - 300);
+$session_ids = array_values(array_filter([$client_session_id, $admin_session_id]));
+$relay_stats = relayStats($session_ids);
+$frame_stats = $relay_stats['frame'];
+$input_stats = $relay_stats['input'];
+$cursor_stats = $relay_stats['cursor'];
 
-$frame_result = Database::query($frame_sql);
-$frame_stats = null;
-if ($frame_result && $frame_result->num_rows > 0) {
-    $frame_stats = $frame_result->fetch_assoc();
-}
-
-// Calculate FPS if we have frame data
-$estimated_fps = 0.0;
-if ($frame_stats && $frame_stats['first_frame_time'] && $frame_stats['last_frame_time'] && $frame_stats['total_frames'] > 1) {
-    $time_span = $frame_stats['last_frame_time'] - $frame_stats['first_frame_time'];
-    if ($time_span > 0) {
-        $estimated_fps = round($frame_stats['total_frames'] / $time_span, 2);
-    }
-}
-
-// Get recent frames (last 30 seconds) for real-time monitoring
-$recent_frames_sql = "SELECT 
-    id, created_at, LENGTH(message_data) as size
-    FROM relay_messages 
-    WHERE message_type = 'frame' 
-    AND session_id IN (
-        SELECT session_id FROM sessions WHERE code = '$escaped_code'
-    )
-    AND created_at > " . ($current_time - 30) . "
-    ORDER BY created_at DESC
-    LIMIT 100";
+$estimated_fps = relayStatsRate($frame_stats);
 
-$recent_frames_result = Database::query($recent_frames_sql);
+// Frames per RELAY_STATS_BUCKET seconds over the last 30 seconds for real-time monitoring
 $recent_frames = [];
-if ($recent_frames_result && $recent_frames_result->num_rows > 0) {
-    while ($row = $recent_frames_result->fetch_assoc()) {
-        $recent_frames[] = [
-            'id' => $row['id'],
-            'time' => $row['created_at'],
-            'age_seconds' => $current_time - $row['created_at'],
-            'size' => intval($row['size'])
-        ];
+$recent_frame_count = 0;
+foreach ($frame_stats['buckets'] as $bucket => $counts) {
+    if ($bucket <= $current_time - 30) {
+        break;
     }
-}
-
-// Get input events
-$input_sql = "SELECT COUNT(*) as count, MAX(created_at) as last_input
-    FROM relay_messages 
-    WHERE message_type = 'input' 
-    AND session_id IN (
-        SELECT session_id FROM sessions WHERE code = '$escaped_code'
-    )
-    AND created_at > " . ($current_time - 300);
-
-$input_result = Database::query($input_sql);
-$input_stats = null;
-if ($input_result && $input_result->num_rows > 0) {
-    $input_stats = $input_result->fetch_assoc();
-}
-
-// Get cursor positions
-$cursor_sql = "SELECT COUNT(*) as count, MAX(created_at) as last_cursor
-    FROM relay_messages 
-    WHERE message_type = 'cursor' 
-    AND session_id IN (
-        SELECT session_id FROM sessions WHERE code = '$escaped_code'
-    )
-    AND created_at > " . ($current_time - 300);
-
-$cursor_result = Database::query($cursor_sql);
-$cursor_stats = null;
-if ($cursor_result && $cursor_result->num_rows > 0) {
-    $cursor_stats = $cursor_result->fetch_assoc();
+    $recent_frame_count += $counts['count'];
+    $recent_frames[] = [
+        'time' => $bucket,
+        'age_seconds' => $current_time - $bucket,
+        'count' => $counts['count'],
+        'size' => $counts['bytes']
+    ];
 }
 
 // Get signals
-$signal_sql = "SELECT signal_type, created_at, read_at
+$signals = [];
+$signal_where = 'code = ?';
+$signal_types = 's';
+$signal_params = [$code];
+if (!empty($session_ids)) {
+    $signal_where .= ' OR session_id IN (' . implode(', ', array_fill(0, count($session_ids), '?')) . ')';
+    $signal_types .= str_repeat('s', count($session_ids));
+    $signal_params = array_merge($signal_params, $session_ids);
+}
+$signal_rows = Database::fetchAll("SELECT signal_type, created_at, read_at
     FROM signals 
-    WHERE code = '$escaped_code' OR session_id IN (
-        SELECT session_id FROM sessions WHERE code = '$escaped_code'
-    )
-    AND created_at > " . ($current_time - 300) . "
+    WHERE ($signal_where)
+    AND created_at > ?
     ORDER BY created_at DESC
-    LIMIT 20";
-
-$signal_result = Database::query($signal_sql);
-$signals = [];
-if ($signal_result && $signal_result->num_rows > 0) {
-    while ($row = $signal_result->fetch_assoc()) {
-        $signals[] = [
-            'type' => $row['signal_type'],
-            'created_at' => $row['created_at'],
-            'read_at' => $row['read_at'],
-            'age_seconds' => $current_time - $row['created_at'],
-            'is_read' => !empty($row['read_at'])
-        ];
-    }
+    LIMIT 20", $signal_types . 'i', array_merge($signal_params, [$current_time - 300]));
+foreach ($signal_rows as $row) {
+    $signals[] = [
+        'type' => $row['signal_type'],
+        'created_at' => $row['created_at'],
+        'read_at' => $row['read_at'],
+        'age_seconds' => $current_time - $row['created_at'],
+        'is_read' => !empty($row['read_at'])
+    ];
 }
 
 // Prepare diagnostic data
@@ -203,34 +148,36 @@ $diagnostic_data = [
         ] : null
     ],
     'frame_flow' => [
-        'status' => $frame_stats && $frame_stats['total_frames'] > 0 ? 'active' : 'inactive',
-        'total_frames_5min' => $frame_stats ? intval($frame_stats['total_frames']) : 0,
+        'status' => $frame_stats['count'] > 0 ? 'active' : 'inactive',
+        'total_frames_5min' => $frame_stats['count'],
         'estimated_fps' => $estimated_fps,
-        'last_frame' => $frame_stats && $frame_stats['last_frame_time'] ? [
-            'time' => date('Y-m-d H:i:s', $frame_stats['last_frame_time']),
-            'age_seconds' => $current_time - $frame_stats['last_frame_time']
+        'last_frame' => $frame_stats['last_at'] ? [
+            'time' => date('Y-m-d H:i:s', $frame_stats['last_at']),
+            'age_seconds' => $current_time - $frame_stats['last_at']
         ] : null,
-        'avg_frame_size_kb' => $frame_stats ? round(intval($frame_stats['avg_frame_size']) / 1024, 2) : 0,
-        'recent_frames_30s' => count($recent_frames),
-        'frames_per_second_recent' => count($recent_frames) > 0 ? round(count($recent_frames) / 30, 2) : 0
+        'avg_frame_size_kb' => $frame_stats['count'] > 0 ? round($frame_stats['bytes'] / $frame_stats['count'] / 1024, 2) : 0,
+        'recent_frames_30s' => $recent_frame_count,
+        'frames_per_second_recent' => round($recent_frame_count / 30, 2)
     ],
     'input_flow' => [
-        'total_inputs_5min' => $input_stats ? intval($input_stats['count']) : 0,
-        'last_input' => $input_stats && $input_stats['last_input'] ? [
-            'time' => date('Y-m-d H:i:s', $input_stats['last_input']),
-            'age_seconds' => $current_time - $input_stats['last_input']
+        'total_inputs_5min' => $input_stats['count'],
+        'last_input' => $input_stats['last_at'] ? [
+            'time' => date('Y-m-d H:i:s', $input_stats['last_at']),
+            'age_seconds' => $current_time - $input_stats['last_at']
         ] : null
     ],
     'cursor_flow' => [
-        'total_updates_5min' => $cursor_stats ? intval($cursor_stats['count']) : 0,
-        'last_update' => $cursor_stats && $cursor_stats['last_cursor'] ? [
-            'time' => date('Y-m-d H:i:s', $cursor_stats['last_cursor']),
-            'age_seconds' => $current_time - $cursor_stats['last_cursor']
+        'total_updates_5min' => $cursor_stats['count'],
+        'last_update' => $cursor_stats['last_at'] ? [
+            'time' => date('Y-m-d H:i:s', $cursor_stats['last_at']),
+            'age_seconds' => $current_time - $cursor_stats['last_at']
         ] : null
     ],
     'signals' => $signals,
+    // Per-endpoint request profile (database.php profiler, PROFILER_ENABLED in config.php)
+    'endpoint_profile' => Database::profileStats(),
     'diagnostic_status' => [
-        'frame_flow_healthy' => $frame_stats && $frame_stats['total_frames'] > 0 && ($current_time - $frame_stats['last_frame_time']) < 10,
+        'frame_flow_healthy' => $frame_stats['count'] > 0 && ($current_time - $frame_stats['last_at']) < 10,
         'connection_active' => ($client_session && $client_session['connected']) && ($admin_session && $admin_session['connected']),
         'fps_acceptable' => $estimated_fps >= 10
     ]
@@ -392,6 +339,10 @@ if ($format === 'json') {
                 font-size: 12px;
             }
             .signal-read { opacity: 0.6; }
+            .profile-table { width: 100%; border-collapse: collapse; font-size: 13px; }
+            .profile-table th, .profile-table td { padding: 6px 8px; border-bottom: 1px solid #eee; text-align: right; }
+            .profile-table th:first-child, .profile-table td:first-child { text-align: left; }
+            .profile-sql { font-family: monospace; font-size: 11px; color: #666; word-break: break-all; }
         </style>
         <script>
             function refresh() {
@@ -617,10 +568,10 @@ if ($format === 'json') {
                     <?php if (empty($recent_frames)): ?>
                         <p style="color: #dc3545; padding: 20px; text-align: center;">⚠️ No frames detected in last 30 seconds</p>
                     <?php else: ?>
-                        <?php foreach (array_slice($recent_frames, 0, 50) as $frame): ?>
+                        <?php foreach ($recent_frames as $frame): ?>
                             <div class="frame-item">
-                                <span>Frame #<?php echo $frame['id']; ?></span>
-                                <span><?php echo $frame['age_seconds']; ?>s ago</span>
+                                <span><?php echo date('H:i:s', $frame['time']); ?> (<?php echo $frame['age_seconds']; ?>s ago)</span>
+                                <span><?php echo $frame['count']; ?> frames</span>
                                 <span><?php echo round($frame['size'] / 1024, 1); ?> KB</span>
                             </div>
                         <?php endforeach; ?>
@@ -644,6 +595,32 @@ if ($format === 'json') {
                 <?php endif; ?>
             </div>
             
+            <!-- Endpoint Profile -->
+            <div class="card">
+                <h2>⏱️ Endpoint Profile</h2>
+                <?php if (empty($diagnostic_data['endpoint_profile'])): ?>
+                    <p style="color: #666; padding: 20px;">No profile data - set PROFILER_ENABLED in config.php</p>
+                <?php else: ?>
+                    <table class="profile-table">
+                        <tr><th>Endpoint</th><th>Requests</th><th>Avg ms</th><th>Avg DB ms</th><th>Avg queries</th><th>Slow queries</th></tr>
+                        <?php foreach ($diagnostic_data['endpoint_profile'] as $endpoint => $profile): ?>
+                            <tr>
+                                <td><?php echo htmlspecialchars($endpoint); ?></td>
+                                <td><?php echo $profile['requests']; ?></td>
+                                <td><?php echo $profile['avg_ms']; ?></td>
+                                <td><?php echo $profile['avg_db_ms']; ?></td>
+                                <td><?php echo $profile['avg_queries']; ?></td>
+                                <td><?php echo $profile['slow_queries']; ?></td>
+                            </tr>
+                            <?php if (!empty($profile['slow_samples'])): ?>
+                                <?php $sample = end($profile['slow_samples']); ?>
+                                <tr><td colspan="6" class="profile-sql">Last slow (<?php echo $sample['ms']; ?> ms): <?php echo htmlspecialchars($sample['sql']); ?></td></tr>
+                            <?php endif; ?>
+                        <?php endforeach; ?>
+                    </table>
+                <?php endif; ?>
+            </div>
+            
             <!-- Diagnostic Status -->
             <div class="card">
                 <h2>✅ Diagnostic Status</h2>
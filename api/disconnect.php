@@ -17,16 +17,19 @@ if ($_SERVER['REQUEST_METHOD'] === 'OPTIONS') {
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/peer_lookup.php';
+require_once __DIR__ . '/relay_shm.php';
+require_once __DIR__ . '/relay_log.php';
 
 function disconnectSession($session_id, $code) {
-    // Clean up relay files (hybrid storage)
-    $relay_storage_path = __DIR__ . '/../storage/relay/';
-    if (is_dir($relay_storage_path)) {
-        $relay_files = [
-            $relay_storage_path . $session_id . '_relay.json'
-        ];
+    // Shared-memory relay rings (no-op unless RELAY_STORAGE_METHOD is 'shm')
+    relayShmClear($session_id);
+    
+    // Clean up relay logs (hybrid storage, relay_log.php)
+    if (is_dir(RELAY_STORAGE_PATH)) {
+        $relay_streams = [$session_id];
         
-        // Also try to get peer_id to clean up peer's relay file
+        // Also try to get peer_id to clean up peer's relay log
         if (STORAGE_METHOD === 'database') {
             $escaped_session_id = Database::escape($session_id);
             $sql = "SELECT peer_id FROM sessions WHERE session_id = '$escaped_session_id' LIMIT 1";
@@ -34,15 +37,13 @@ function disconnectSession($session_id, $code) {
             if ($result && $result->num_rows > 0) {
                 $row = $result->fetch_assoc();
                 if ($row['peer_id']) {
-                    $relay_files[] = $relay_storage_path . $row['peer_id'] . '_relay.json';
+                    $relay_streams[] = $row['peer_id'];
                 }
             }
         }
         
-        foreach ($relay_files as $file) {
-            if (file_exists($file)) {
-                @unlink($file);
-            }
+        foreach ($relay_streams as $stream_id) {
+            deleteRelayLog($stream_id);
         }
     }
     
@@ -63,7 +64,9 @@ function disconnectSession($session_id, $code) {
         
         // Delete session-specific data
         Database::query("DELETE FROM signals WHERE session_id = '$escaped_session_id'");
+        Database::query("DELETE FROM signal_queues WHERE session_id = '$escaped_session_id'");
         Database::query("DELETE FROM relay_messages WHERE session_id = '$escaped_session_id'");
+        Database::query("DELETE FROM relay_frame_slots WHERE session_id = '$escaped_session_id'");
         
         if ($is_admin) {
             // Admin disconnecting - remove admin session but keep client session
@@ -80,7 +83,9 @@ function disconnectSession($session_id, $code) {
             $escaped_peer_id = Database::escape($session['peer_id']);
             if ($session['peer_id']) {
                 Database::query("DELETE FROM signals WHERE session_id = '$escaped_peer_id'");
+                Database::query("DELETE FROM signal_queues WHERE session_id = '$escaped_peer_id'");
                 Database::query("DELETE FROM relay_messages WHERE session_id = '$escaped_peer_id'");
+                Database::query("DELETE FROM relay_frame_slots WHERE session_id = '$escaped_peer_id'");
                 Database::query("DELETE FROM admin_sessions WHERE peer_session_id = '$escaped_session_id'");
                 Database::query("DELETE FROM sessions WHERE session_id = '$escaped_peer_id'");
             }
@@ -90,23 +95,33 @@ function disconnectSession($session_id, $code) {
             Database::query("DELETE FROM sessions WHERE code = '$escaped_code' AND mode = 'client'");
         }
         
+        if ($session['peer_id']) {
+            relayShmClear($session['peer_id']);
+        }
+        invalidatePeerCache(array($session_id, $session['peer_id']), $code);
         return true;
     } elseif (STORAGE_METHOD === 'file') {
         // First, check what type of session this is
         $session_file = STORAGE_PATH . $session_id . '.json';
         $is_admin = false;
+        $peer_id = null;
         
         if (file_exists($session_file)) {
             $session_data = json_decode(file_get_contents($session_file), true);
             if (is_array($session_data) && isset($session_data['mode'])) {
                 $is_admin = ($session_data['mode'] === 'admin');
             }
+            if (is_array($session_data) && isset($session_data['peer_id'])) {
+                $peer_id = $session_data['peer_id'];
+            }
         }
+        invalidatePeerCache(array($session_id, $peer_id), $code);
         
         // Always remove the session-specific files
         $files = [
             STORAGE_PATH . $session_id . '.json',
-            STORAGE_PATH . $session_id . '_signals.json'
+            STORAGE_PATH . $session_id . '_signals.json',
+            STORAGE_PATH . $session_id . '_frame.json'
         ];
         
         foreach ($files as $file) {
@@ -0,0 +1,146 @@
+<?php
+/**
+ * Peer Lookup - shared, cached session -> peer resolution
+ *
+ * Every relay/signal write has to find the peer its data is delivered to
+ * (sessions.peer_id, by session_id first and by code as a fallback). The
+ * answer is cached in APCu across requests for PEER_CACHE_TTL seconds, so in
+ * steady state a frame costs no sessions query at all.
+ *
+ * Entries are invalidated through per-session and per-code generation
+ * counters: invalidatePeerCache() bumps them, which orphans every cached
+ * lookup involving that session or code (register.php, disconnect.php and
+ * terminate_session.php call it when links change).
+ * Without APCu the cache only lives for the current request.
+ *
+ * Usage:
+ *   $peer_id = resolvePeerId($session_id, $code);              // cached
+ *   invalidatePeerCache(array($session_id, $peer_id), $code);  // after (un)linking
+ */
+
+require_once __DIR__ . '/../config.php';
+require_once __DIR__ . '/apcu.php';
+require_once __DIR__ . '/../database.php';
+
+define('PEER_CACHE_TTL', 30);  // Seconds a resolved peer is trusted without invalidation
+
+function peerCacheGenerationKey($kind, $value) {
+    return 'sharefast_peer_gen_' . $kind . '_' . md5($value);
+}
+
+function peerCacheEntryKey($session_id, $code) {
+    return 'sharefast_peer_' . md5($session_id . '|' . $code);
+}
+
+/**
+ * Uncached lookup: peer of $session_id, falling back to the session linked under $code
+ */
+function lookupPeerId($session_id, $code) {
+    if (STORAGE_METHOD === 'database') {
+        // OPTIMIZATION: Try session_id first (has index), then code (has index)
+        // This avoids the OR condition which can't use indexes efficiently
+        $peer_row = Database::fetchOne("SELECT peer_id FROM sessions WHERE session_id = ? AND peer_id IS NOT NULL LIMIT 1", 's', array($session_id));
+        if ($peer_row) {
+            return $peer_row['peer_id'];
+        }
+
+        $peer_row = Database::fetchOne("SELECT peer_id FROM sessions WHERE code = ? AND peer_id IS NOT NULL LIMIT 1", 's', array($code));
+        return $peer_row ? $peer_row['peer_id'] : null;
+    } elseif (STORAGE_METHOD === 'file') {
+        // Check by session_id first (most reliable), then by code (backwards compatibility)
+        foreach (array($session_id, $code) as $key) {
+            $session_file = STORAGE_PATH . $key . '.json';
+            if (file_exists($session_file)) {
+                $session = json_decode(file_get_contents($session_file), true);
+                if (isset($session['peer_id'])) {
+                    return $session['peer_id'];
+                }
+            }
+        }
+    }
+
+    return null;
+}
+
+/**
+ * Cached lookup. Only found peers are cached - an unlinked session is
+ * re-checked on every call so it sees the link as soon as it exists.
+ */
+function resolvePeerId($session_id, $code) {
+    static $request_cache = array();
+
+    $entry_key = peerCacheEntryKey($session_id, $code);
+    if (isset($request_cache[$entry_key])) {
+        return $request_cache[$entry_key];
+    }
+
+    if (!apcuAvailable()) {
+        $started = microtime(true);
+        $peer_id = lookupPeerId($session_id, $code);
+        Database::span('peer', $started);
+        if ($peer_id) {
+            $request_cache[$entry_key] = $peer_id;
+        }
+        return $peer_id;
+    }
+
+    // One shared-memory read: the entry plus both generation counters
+    $session_gen_key = peerCacheGenerationKey('session', $session_id);
+    $code_gen_key = peerCacheGenerationKey('code', $code);
+    $cached = apcu_fetch(array($entry_key, $session_gen_key, $code_gen_key));
+    $session_gen = isset($cached[$session_gen_key]) ? $cached[$session_gen_key] : 0;
+    $code_gen = isset($cached[$code_gen_key]) ? $cached[$code_gen_key] : 0;
+
+    if (isset($cached[$entry_key])) {
+        $entry = $cached[$entry_key];
+        if ($entry['session_gen'] === $session_gen && $entry['code_gen'] === $code_gen) {
+            $request_cache[$entry_key] = $entry['peer_id'];
+            return $entry['peer_id'];
+        }
+    }
+
+    $started = microtime(true);
+    $peer_id = lookupPeerId($session_id, $code);
+    Database::span('peer', $started);
+    if ($peer_id) {
+        apcu_store($entry_key, array(
+            'peer_id' => $peer_id,
+            'session_gen' => $session_gen,
+            'code_gen' => $code_gen
+        ), PEER_CACHE_TTL);
+        $request_cache[$entry_key] = $peer_id;
+    }
+
+    return $peer_id;
+}
+
+/**
+ * Drop cached lookups for these sessions and/or codes (call after any
+ * change to sessions.peer_id, or when sessions are deleted)
+ */
+function invalidatePeerCache($session_ids = array(), $codes = array()) {
+    if (!apcuAvailable()) {
+        return;
+    }
+
+    $keys = array();
+    foreach ((array)$session_ids as $session_id) {
+        if ($session_id !== null && $session_id !== '') {
+            $keys[] = peerCacheGenerationKey('session', $session_id);
+        }
+    }
+    foreach ((array)$codes as $code) {
+        if ($code !== null && $code !== '') {
+            $keys[] = peerCacheGenerationKey('code', $code);
+        }
+    }
+
+    foreach ($keys as $key) {
+        // Generation counters never expire; a missing one starts at 1 (entries were stored with 0)
+        if (apcu_inc($key) === false) {
+            apcu_add($key, 1);
+        }
+    }
+}
+
+?>
@@ -18,14 +18,10 @@ if ($_SERVER['REQUEST_METHOD'] === 'OPTIONS') {
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
 require_once __DIR__ . '/rate_limit.php';
-
-// Enforce rate limiting (prevents abuse)
-if (!enforceRateLimit()) {
-    exit;
-}
+require_once __DIR__ . '/relay_shm.php';
 
 function getSignals($session_id, $code) {
-    if (STORAGE_METHOD === 'database') {
+    if (relayStorageMethod() === 'database') {
         $escaped_session_id = Database::escape($session_id);
         $escaped_code = Database::escape($code);
         
@@ -39,9 +35,9 @@ function getSignals($session_id, $code) {
             $signal = $result->fetch_assoc();
             error_log("getSignals: Found signal id=" . $signal['id'] . ", type=" . $signal['signal_type']);
             
-            // Mark as read
+            // Mark as read (created_at confines the UPDATE to the signal's own partition)
             $signal_id = intval($signal['id']);
-            $update_sql = "UPDATE signals SET read_at = " . time() . " WHERE id = $signal_id";
+            $update_sql = "UPDATE signals SET read_at = " . time() . " WHERE id = $signal_id AND created_at = " . intval($signal['created_at']);
             Database::query($update_sql);
             
             return array(
@@ -60,7 +56,7 @@ function getSignals($session_id, $code) {
         }
         
         return null;
-    } elseif (STORAGE_METHOD === 'file') {
+    } elseif (relayStorageMethod() === 'file') {
         // Get signals for this session
         $signal_file = STORAGE_PATH . $session_id . '_signals.json';
         
@@ -105,6 +101,17 @@ function getSignals($session_id, $code) {
             ];
         }
         
+        return null;
+    } elseif (relayStorageMethod() === 'shm') {
+        // Oldest unread signal from this session's ring (relay_shm.php)
+        $entries = relayShmClaim('signal', $session_id, 1);
+        if (!empty($entries)) {
+            return [
+                'type' => $entries[0]['type'],
+                'data' => $entries[0]['data']
+            ];
+        }
+        
         return null;
     }
     
@@ -123,6 +130,11 @@ $session_id = $input['session_id'];
 $code = trim($input['code']);
 $code = strtolower($code);  // Normalize code (handle word-word codes)
 
+// Enforce rate limiting (prevents abuse) - signalling budget, per session and per IP
+if (!enforceRateLimit('signal', $session_id)) {
+    exit;
+}
+
 error_log("poll.php: Request from session_id=$session_id, code=$code");
 
 // Debug mode - return additional info
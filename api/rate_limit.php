@@ -1,23 +1,52 @@
 <?php
 /**
  * Rate Limiting Helper for API Endpoints
- * 
- * Prevents abuse by limiting requests per IP address
- * Usage: Call rateLimit() at the start of each API endpoint
+ *
+ * Token buckets per client IP and per session, with a separate budget for
+ * each kind of endpoint (registration, signalling, frames, input). Buckets
+ * live in APCu as a single integer each - the bucket's "theoretical arrival
+ * time" (GCRA) - updated with compare-and-swap, so a check is one shared
+ * memory read and one atomic write: no file I/O, no locks, no cleanup scans.
+ * Idle buckets simply expire.
+ *
+ * Without APCu the limiter falls back to the per-IP file window it used to
+ * be, for the register budget only - other budgets are not limited, as
+ * before, so hosts without APCu keep registration protection without file
+ * I/O on every relay request.
+ *
+ * Usage: Call enforceRateLimit() at the start of each API endpoint
+ *   if (!enforceRateLimit('signal', $session_id)) { exit; }
  */
 
 require_once __DIR__ . '/../config.php';
+require_once __DIR__ . '/apcu.php';
 
 // Rate limiting configuration
 define('RATE_LIMIT_ENABLED', true);
-define('RATE_LIMIT_REQUESTS', 100);  // Max requests per window
+define('RATE_LIMIT_REQUESTS', 100);  // register budget: max requests per window per IP
 define('RATE_LIMIT_WINDOW', 60);     // Time window in seconds (1 minute)
-define('RATE_LIMIT_STORAGE', STORAGE_PATH . 'rate_limit/');
+define('RATE_LIMIT_STORAGE', STORAGE_PATH . 'rate_limit/');  // File fallback only
+define('RATE_LIMIT_BUCKET_TTL', 3600);  // Idle bucket lifetime in APCu
 
-// Create rate limit storage directory if it doesn't exist
-if (!file_exists(RATE_LIMIT_STORAGE)) {
-    @mkdir(RATE_LIMIT_STORAGE, 0755, true);
-}
+// Budget => scope ('ip' / 'session') => refill rate (requests per second) and burst size.
+// Per-IP buckets are sized for many clients behind one NAT address.
+define('RATE_LIMIT_BUDGETS', array(
+    'register' => array(
+        'ip' => array('rate' => RATE_LIMIT_REQUESTS / RATE_LIMIT_WINDOW, 'burst' => RATE_LIMIT_REQUESTS)
+    ),
+    'signal' => array(
+        'session' => array('rate' => 5, 'burst' => 50),
+        'ip' => array('rate' => 50, 'burst' => 500)
+    ),
+    'frame' => array(
+        'session' => array('rate' => 60, 'burst' => 120),
+        'ip' => array('rate' => 600, 'burst' => 1200)
+    ),
+    'input' => array(
+        'session' => array('rate' => 200, 'burst' => 400),
+        'ip' => array('rate' => 2000, 'burst' => 4000)
+    )
+));
 
 /**
  * Get client IP address
@@ -34,18 +63,109 @@ function getClientIP() {
 }
 
 /**
- * Check rate limit for client IP
- * Returns: array('allowed' => bool, 'remaining' => int, 'reset' => int)
+ * Take one request from a token bucket (GCRA). The stored value is the time,
+ * in microseconds, at which the bucket would be full again; a request pushes
+ * it one interval further and is refused if that is more than a full burst
+ * ahead of now.
+ * Returns: array('allowed' => bool, 'remaining' => int, 'reset' => int, 'limit' => int)
+ */
+function takeRateLimitToken($key, $rate, $burst) {
+    $interval = max(1, (int)(1000000 / $rate));
+    $capacity = $interval * $burst;
+    $now = (int)(microtime(true) * 1000000);
+    
+    // Concurrent requests on the same bucket retry the compare-and-swap
+    for ($attempt = 0; $attempt < 5; $attempt++) {
+        $tat = apcu_fetch($key);
+        $new_tat = max($tat === false ? $now : $tat, $now) + $interval;
+        
+        if ($new_tat - $now > $capacity) {
+            return [
+                'allowed' => false,
+                'remaining' => 0,
+                'reset' => (int)ceil(($new_tat - $capacity) / 1000000),
+                'limit' => $burst
+            ];
+        }
+        
+        $stored = $tat === false
+            ? apcu_add($key, $new_tat, RATE_LIMIT_BUCKET_TTL)
+            : apcu_cas($key, $tat, $new_tat);
+        if ($stored) {
+            return [
+                'allowed' => true,
+                'remaining' => (int)floor(($capacity - ($new_tat - $now)) / $interval),
+                'reset' => (int)ceil($new_tat / 1000000),
+                'limit' => $burst
+            ];
+        }
+    }
+    
+    // Heavy contention on one bucket - let the request through rather than spin
+    return ['allowed' => true, 'remaining' => 0, 'reset' => time() + 1, 'limit' => $burst];
+}
+
+/**
+ * Check rate limit for a budget (see RATE_LIMIT_BUDGETS), charging the
+ * session bucket (if the budget has one and $session_id is known) and the
+ * client IP bucket
+ * Returns: array('allowed' => bool, 'remaining' => int, 'reset' => int, 'limit' => int)
  */
-function checkRateLimit($client_ip = null) {
+function checkRateLimit($budget = 'register', $session_id = null, $client_ip = null) {
     if (!RATE_LIMIT_ENABLED) {
-        return ['allowed' => true, 'remaining' => RATE_LIMIT_REQUESTS, 'reset' => time() + RATE_LIMIT_WINDOW];
+        return ['allowed' => true, 'remaining' => RATE_LIMIT_REQUESTS, 'reset' => time() + RATE_LIMIT_WINDOW, 'limit' => RATE_LIMIT_REQUESTS];
     }
     
     if (!$client_ip) {
         $client_ip = getClientIP();
     }
     
+    if (!apcuAvailable()) {
+        // The file window is far too small (and too slow) for relay/signal traffic
+        if ($budget !== 'register') {
+            return ['allowed' => true, 'remaining' => RATE_LIMIT_REQUESTS, 'reset' => time() + RATE_LIMIT_WINDOW, 'limit' => RATE_LIMIT_REQUESTS];
+        }
+        return checkFileRateLimit($client_ip);
+    }
+    
+    $started = microtime(true);
+    $scopes = isset(RATE_LIMIT_BUDGETS[$budget]) ? RATE_LIMIT_BUDGETS[$budget] : RATE_LIMIT_BUDGETS['register'];
+    
+    // Most specific bucket first, so a single busy session is refused before it drains its IP's bucket
+    $result = null;
+    foreach (array('session' => $session_id, 'ip' => $client_ip) as $scope => $id) {
+        if (!isset($scopes[$scope]) || $id === null || $id === '') {
+            continue;
+        }
+        $key = 'sharefast_rate_' . $budget . '_' . $scope . '_' . md5($id);
+        $bucket = takeRateLimitToken($key, $scopes[$scope]['rate'], $scopes[$scope]['burst']);
+        
+        if ($result === null || !$bucket['allowed'] || $bucket['remaining'] < $result['remaining']) {
+            $result = $bucket;
+        }
+        if (!$bucket['allowed']) {
+            break;
+        }
+    }
+    
+    if (class_exists('Database', false)) {
+        Database::span('ratelimit', $started);
+    }
+    
+    return $result ?: ['allowed' => true, 'remaining' => RATE_LIMIT_REQUESTS, 'reset' => time(), 'limit' => RATE_LIMIT_REQUESTS];
+}
+
+/**
+ * Fallback without APCu: fixed window of RATE_LIMIT_REQUESTS per IP in a file
+ * Returns: array('allowed' => bool, 'remaining' => int, 'reset' => int, 'limit' => int)
+ */
+function checkFileRateLimit($client_ip) {
+    $started = microtime(true);
+    
+    if (!file_exists(RATE_LIMIT_STORAGE)) {
+        @mkdir(RATE_LIMIT_STORAGE, 0755, true);
+    }
+    
     // Sanitize IP for filename
     $ip_file = RATE_LIMIT_STORAGE . md5($client_ip) . '.json';
     
@@ -78,9 +198,10 @@ function checkRateLimit($client_ip = null) {
     // Save updated rate limit data
     @file_put_contents($ip_file, json_encode($rate_data), LOCK_EX);
     
-    // Clean up old rate limit files (older than 1 hour)
-    if (rand(1, 100) === 1) { // 1% chance to cleanup on each request
-        cleanupOldRateLimitFiles();
+    // Idle window files are reaped by the maintenance daemon (rate_limit_files job)
+    
+    if (class_exists('Database', false)) {
+        Database::span('ratelimit', $started);
     }
     
     return [
@@ -91,26 +212,12 @@ function checkRateLimit($client_ip = null) {
     ];
 }
 
-/**
- * Clean up old rate limit files
- */
-function cleanupOldRateLimitFiles() {
-    $files = glob(RATE_LIMIT_STORAGE . '*.json');
-    $current_time = time();
-    
-    foreach ($files as $file) {
-        if (filemtime($file) < $current_time - 3600) { // Older than 1 hour
-            @unlink($file);
-        }
-    }
-}
-
 /**
  * Enforce rate limit - returns false if rate limit exceeded
  * Sets appropriate HTTP headers
  */
-function enforceRateLimit($client_ip = null) {
-    $rate_limit = checkRateLimit($client_ip);
+function enforceRateLimit($budget = 'register', $session_id = null, $client_ip = null) {
+    $rate_limit = checkRateLimit($budget, $session_id, $client_ip);
     
     // Set rate limit headers
     header('X-RateLimit-Limit: ' . $rate_limit['limit']);
@@ -119,12 +226,12 @@ function enforceRateLimit($client_ip = null) {
     
     if (!$rate_limit['allowed']) {
         http_response_code(429); // Too Many Requests
-        header('Retry-After: ' . ($rate_limit['reset'] - time()));
+        header('Retry-After: ' . max(1, $rate_limit['reset'] - time()));
         echo json_encode([
             'success' => false,
             'error' => 'Rate limit exceeded',
             'message' => 'Too many requests. Please try again later.',
-            'retry_after' => $rate_limit['reset'] - time()
+            'retry_after' => max(1, $rate_limit['reset'] - time())
         ]);
         return false;
     }
@@ -132,3 +239,4 @@ function enforceRateLimit($client_ip = null) {
     return true;
 }
 
+?>
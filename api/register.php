@@ -27,6 +27,7 @@ try {
     require_once __DIR__ . '/../config.php';
     require_once __DIR__ . '/../database.php';
     require_once __DIR__ . '/rate_limit.php';
+    require_once __DIR__ . '/peer_lookup.php';
     
     // Enforce rate limiting (prevents abuse)
     if (!enforceRateLimit()) {
@@ -123,6 +124,9 @@ function registerSession($code, $mode, $peer_ip = null, $peer_port = null, $allo
                                VALUES ('$escaped_session_id', '$escaped_code', '$escaped_mode', '$existing_session_id', '$escaped_ip', $escaped_port, $escaped_allow_autonomous, 1, $timestamp, $escaped_expires_at)";
                 Database::query($insert_sql);
                 
+                // Both sides (and the code) now resolve to a new peer
+                invalidatePeerCache(array($existing['session_id'], $session_id), $code);
+                
                 // Return peer IP/port info for P2P connection
                 return array(
                     'success' => true,
@@ -157,6 +161,9 @@ function registerSession($code, $mode, $peer_ip = null, $peer_port = null, $allo
         
         error_log("register.php: Session created successfully - insert_id=$insert_id, session_id=$session_id, code=$code, mode=$mode");
         
+        // Code lookups may still point at an earlier session that used this code
+        invalidatePeerCache(array(), $code);
+        
         return array(
             'success' => true,
             'session_id' => $session_id,
@@ -199,6 +206,7 @@ function registerSession($code, $mode, $peer_ip = null, $peer_port = null, $allo
                 
                 file_put_contents($file, json_encode($existing));
                 file_put_contents(STORAGE_PATH . $session_id . '.json', json_encode($session_data));
+                invalidatePeerCache(array($existing['session_id'], $session_id), $code);
                 
                 // Return peer IP/port info for P2P connection
                 return array(
@@ -216,6 +224,7 @@ function registerSession($code, $mode, $peer_ip = null, $peer_port = null, $allo
         // Create new session
         file_put_contents(STORAGE_PATH . $code . '.json', json_encode($session_data));
         file_put_contents(STORAGE_PATH . $session_id . '.json', json_encode($session_data));
+        invalidatePeerCache(array(), $code);
         
         return array(
             'success' => true,
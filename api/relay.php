@@ -23,35 +23,25 @@ if ($_SERVER['REQUEST_METHOD'] === 'OPTIONS') {
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/peer_lookup.php';
+require_once __DIR__ . '/relay_shm.php';
+require_once __DIR__ . '/relay_wake.php';
+require_once __DIR__ . '/relay_binary.php';
+require_once __DIR__ . '/relay_frame_slot.php';
+require_once __DIR__ . '/relay_lanes.php';
+require_once __DIR__ . '/relay_stats.php';
+require_once __DIR__ . '/rate_limit.php';
+
+// send_batch limits
+define('RELAY_BATCH_MAX_MESSAGES', 200);                // Messages per send_batch request
+define('RELAY_BATCH_INSERT_BYTES', 4 * 1024 * 1024);    // Payload bytes per INSERT (stay under max_allowed_packet)
+define('RELAY_MESSAGE_TYPES', array('frame', 'input', 'cursor'));
 
 function storeRelayData($session_id, $code, $data_type, $data) {
-    if (STORAGE_METHOD === 'database') {
-        $escaped_session_id = Database::escape($session_id);
-        $escaped_code = Database::escape($code);
-        $escaped_type = Database::escape($data_type);
+    if (relayStorageMethod() === 'database') {
         $timestamp = time();
         
-        // OPTIMIZATION: Try session_id first (has index), then code (has index)
-        // This avoids the OR condition which can't use indexes efficiently
-        $peer_id = null;
-        
-        // First try by session_id (most common case, has index)
-        $peer_sql = "SELECT peer_id FROM sessions WHERE session_id = '$escaped_session_id' AND peer_id IS NOT NULL LIMIT 1";
-        $peer_result = Database::query($peer_sql);
-        if ($peer_result && $peer_result->num_rows > 0) {
-            $peer_row = $peer_result->fetch_assoc();
-            $peer_id = $peer_row['peer_id'];
-        }
-        
-        // If not found, try by code (has index)
-        if (!$peer_id) {
-            $peer_sql = "SELECT peer_id FROM sessions WHERE code = '$escaped_code' AND peer_id IS NOT NULL LIMIT 1";
-            $peer_result = Database::query($peer_sql);
-            if ($peer_result && $peer_result->num_rows > 0) {
-                $peer_row = $peer_result->fetch_assoc();
-                $peer_id = $peer_row['peer_id'];
-            }
-        }
+        $peer_id = resolvePeerId($session_id, $code);
         
         if (!$peer_id) {
             // Only log errors, not debug info (reduces overhead)
@@ -59,8 +49,14 @@ function storeRelayData($session_id, $code, $data_type, $data) {
             return false;
         }
         
+        if ($data_type === 'frame') {
+            // Latest frame wins: overwrite the peer's frame slot instead of queueing
+            return storeRelayFrame($peer_id, $data);
+        }
+        
         // Store data for peer to retrieve
         $escaped_peer_id = Database::escape($peer_id);
+        $escaped_type = Database::escape($data_type);
         
         // For large data (frames), use prepared statement or direct insert with proper escaping
         // real_escape_string might have issues with very large strings
@@ -84,6 +80,7 @@ function storeRelayData($session_id, $code, $data_type, $data) {
                     // Don't cleanup on every insert - it's too expensive
                     // Instead, cleanup will happen periodically or on disconnect
                     // This significantly improves frame rate performance
+                    relayWake($peer_id);
                     return true;
                 }
             } else {
@@ -105,32 +102,16 @@ function storeRelayData($session_id, $code, $data_type, $data) {
             
             // Don't cleanup on every insert - cleanup happens periodically
             // This significantly improves frame rate performance
+            relayWake($peer_id);
             return true;
         }
         
         return false;
-    } elseif (STORAGE_METHOD === 'file') {
-        // Find peer session - check both by code and by session_id
-        $peer_id = null;
-        
-        // First check by session_id (most reliable)
-        $session_file = STORAGE_PATH . $session_id . '.json';
-        if (file_exists($session_file)) {
-            $session = json_decode(file_get_contents($session_file), true);
-            if (isset($session['peer_id'])) {
-                $peer_id = $session['peer_id'];
-            }
-        }
+    } elseif (relayStorageMethod() === 'file') {
+        $peer_id = resolvePeerId($session_id, $code);
         
-        // Also check by code (for backwards compatibility)
-        if (!$peer_id) {
-            $session_file = STORAGE_PATH . $code . '.json';
-            if (file_exists($session_file)) {
-                $session = json_decode(file_get_contents($session_file), true);
-                if (isset($session['peer_id'])) {
-                    $peer_id = $session['peer_id'];
-                }
-            }
+        if ($peer_id && $data_type === 'frame') {
+            return storeRelayFrame($peer_id, $data);
         }
         
         // Store data for peer to retrieve
@@ -153,45 +134,357 @@ function storeRelayData($session_id, $code, $data_type, $data) {
             }
             
             file_put_contents($relay_file, json_encode($messages));
+            relayWake($peer_id);
             return true;
         }
         
         return false;
+    } elseif (relayStorageMethod() === 'shm') {
+        $peer_id = resolvePeerId($session_id, $code);
+        if (!$peer_id) {
+            return false;
+        }
+        
+        if ($data_type === 'frame') {
+            return storeRelayFrame($peer_id, $data);
+        }
+        if (!in_array($data_type, RELAY_MESSAGE_TYPES, true)) {
+            error_log("storeRelayData: Unknown message type for shm storage: $data_type");
+            return false;
+        }
+        
+        // One atomic reservation + one shared-memory write (relay_shm.php)
+        if (!relayShmPush($data_type, $peer_id, array(array('type' => $data_type, 'data' => $data, 'timestamp' => time())))) {
+            return false;
+        }
+        relayWake($peer_id);
+        return true;
+    }
+    
+    return false;
+}
+
+/**
+ * Split batch messages into INSERT-sized chunks (by payload bytes)
+ */
+function chunkRelayBatch($messages) {
+    $chunks = array();
+    $chunk = array();
+    $chunk_bytes = 0;
+    
+    foreach ($messages as $message) {
+        $size = strlen($message['data']);
+        if (!empty($chunk) && $chunk_bytes + $size > RELAY_BATCH_INSERT_BYTES) {
+            $chunks[] = $chunk;
+            $chunk = array();
+            $chunk_bytes = 0;
+        }
+        $chunk[] = $message;
+        $chunk_bytes += $size;
+    }
+    if (!empty($chunk)) {
+        $chunks[] = $chunk;
+    }
+    
+    return $chunks;
+}
+
+/**
+ * Store several messages for the peer at once: one peer lookup and, with
+ * database storage, multi-row INSERTs inside one transaction (all or nothing).
+ * Frames go to the peer's frame slot - only the batch's last frame is kept.
+ * $messages: list of array('type' => ..., 'data' => string)
+ */
+function storeRelayBatch($session_id, $code, $messages) {
+    $peer_id = resolvePeerId($session_id, $code);
+    if (!$peer_id) {
+        error_log("storeRelayBatch: No peer_id found for session_id=$session_id, code=$code, messages=" . count($messages));
+        return false;
+    }
+    
+    // Earlier frames of the batch would be overwritten in the slot right away
+    $frame = null;
+    $queue = array();
+    foreach ($messages as $message) {
+        if ($message['type'] === 'frame') {
+            $frame = $message;
+        } else {
+            $queue[] = $message;
+        }
+    }
+    
+    if (relayStorageMethod() === 'database') {
+        $conn = Database::getConnection();
+        if (!$conn) {
+            return false;
+        }
+        
+        $timestamp = time();
+        $stored = $conn->begin_transaction();
+        
+        foreach (chunkRelayBatch($queue) as $chunk) {
+            $placeholders = implode(', ', array_fill(0, count($chunk), '(?, ?, ?, ?)'));
+            $stmt = $conn->prepare("INSERT INTO relay_messages (session_id, message_type, message_data, created_at) VALUES $placeholders");
+            if (!$stmt) {
+                error_log("storeRelayBatch: Failed to prepare statement: " . $conn->error);
+                $stored = false;
+                break;
+            }
+            
+            $params = array();
+            foreach ($chunk as $message) {
+                $params[] = $peer_id;
+                $params[] = $message['type'];
+                $params[] = $message['data'];
+                $params[] = $timestamp;
+            }
+            $stmt->bind_param(str_repeat('sssi', count($chunk)), ...$params);
+            
+            if (!$stmt->execute()) {
+                error_log("storeRelayBatch: Insert failed: " . $stmt->error . " | messages=" . count($chunk) . ", peer_id=$peer_id");
+                $stored = false;
+            }
+            $stmt->close();
+            
+            if (!$stored) {
+                break;
+            }
+        }
+        
+        if ($stored && $frame !== null) {
+            $stored = storeRelayFrame($peer_id, $frame['data']);
+        }
+        
+        if ($stored) {
+            $stored = $conn->commit();
+        } else {
+            $conn->rollback();
+        }
+        
+        if ($stored) {
+            relayWake($peer_id);
+        }
+        return $stored;
+    } elseif (relayStorageMethod() === 'file') {
+        if ($frame !== null) {
+            storeRelayFrame($peer_id, $frame['data']);
+        }
+        if (empty($queue)) {
+            return true;
+        }
+        
+        $relay_file = STORAGE_PATH . $peer_id . '_relay.json';
+        $queued = array();
+        if (file_exists($relay_file)) {
+            $queued = json_decode(file_get_contents($relay_file), true) ?: [];
+        }
+        
+        $timestamp = time();
+        foreach ($queue as $message) {
+            $queued[] = [
+                'type' => $message['type'],
+                'data' => $message['data'],
+                'timestamp' => $timestamp
+            ];
+        }
+        
+        // Keep only last 100 messages (prevent memory issues)
+        if (count($queued) > 100) {
+            $queued = array_slice($queued, -100);
+        }
+        
+        file_put_contents($relay_file, json_encode($queued));
+        relayWake($peer_id);
+        return true;
+    } elseif (relayStorageMethod() === 'shm') {
+        $stored = $frame === null || storeRelayFrame($peer_id, $frame['data']);
+        
+        // One ring per lane - push each lane's messages in one step
+        $timestamp = time();
+        $lanes = array();
+        foreach ($queue as $message) {
+            $lanes[$message['type']][] = array('type' => $message['type'], 'data' => $message['data'], 'timestamp' => $timestamp);
+        }
+        foreach ($lanes as $lane => $entries) {
+            $stored = relayShmPush($lane, $peer_id, $entries) && $stored;
+        }
+        
+        if ($stored) {
+            relayWake($peer_id);
+        }
+        return $stored;
     }
     
     return false;
 }
 
-function getRelayData($session_id, $code) {
-    if (STORAGE_METHOD === 'database') {
+/**
+ * Store binary protocol messages (relay_binary.php) read from $stream.
+ * With database storage each message body is streamed into
+ * relay_messages.message_blob (frames: relay_frame_slots.frame_blob) with
+ * send_long_data() in RELAY_BINARY_CHUNK_BYTES pieces, so a frame is never
+ * held whole in PHP memory; all messages of the request are stored in one
+ * transaction (all or nothing).
+ * Returns array('stored' => count, 'counts' => per-type totals for
+ * recordRelayStats(), 'message' => error or status text).
+ */
+function storeRelayBinary($session_id, $code, $stream) {
+    if (relayStorageMethod() === 'file' || relayStorageMethod() === 'shm') {
+        // File and shared-memory storage keep the JSON representation - convert and store as a batch
+        $messages = readRelayBinaryMessages($stream);
+        if ($messages === false) {
+            return array('stored' => 0, 'message' => 'Malformed binary message');
+        }
+        if (empty($messages) || count($messages) > RELAY_BATCH_MAX_MESSAGES) {
+            return array('stored' => 0, 'message' => 'Request must contain 1 to ' . RELAY_BATCH_MAX_MESSAGES . ' messages');
+        }
+        $counts = relayStatsCount($messages);
+        foreach ($messages as $index => $message) {
+            $messages[$index]['data'] = relayJsonFromBinaryData($message['type'], $message['data']);
+        }
+        if (!storeRelayBatch($session_id, $code, $messages)) {
+            return array('stored' => 0, 'message' => 'Failed to store relay data - peer may not be connected');
+        }
+        return array('stored' => count($messages), 'counts' => $counts, 'message' => 'Data relayed');
+    }
+    
+    if (relayStorageMethod() !== 'database') {
+        return array('stored' => 0, 'message' => 'Unsupported storage method');
+    }
+    
+    $peer_id = resolvePeerId($session_id, $code);
+    if (!$peer_id) {
+        error_log("storeRelayBinary: No peer_id found for session_id=$session_id, code=$code");
+        return array('stored' => 0, 'message' => 'Failed to store relay data - peer may not be connected');
+    }
+    
+    $conn = Database::getConnection();
+    if (!$conn) {
+        return array('stored' => 0, 'message' => 'Database connection failed');
+    }
+    
+    $stmt = $conn->prepare("INSERT INTO relay_messages (session_id, message_type, message_data, message_blob, created_at) VALUES (?, ?, '', ?, ?)");
+    $frame_stmt = $conn->prepare(RELAY_FRAME_SLOT_BLOB_SQL);
+    if (!$stmt || !$frame_stmt) {
+        error_log("storeRelayBinary: Failed to prepare statement: " . $conn->error);
+        return array('stored' => 0, 'message' => 'Failed to store relay data');
+    }
+    
+    // Bound by reference: $type changes per message, the blob goes through send_long_data()
+    $type = null;
+    $blob = null;
+    $timestamp = time();
+    $stmt->bind_param('ssbi', $peer_id, $type, $blob, $timestamp);
+    $frame_stmt->bind_param('sbi', $peer_id, $blob, $timestamp);
+    
+    $conn->begin_transaction();
+    $stored = 0;
+    $counts = array();
+    $error = null;
+    
+    while (($header = readRelayBinaryHeader($stream)) !== null) {
+        if ($header === false) {
+            $error = 'Malformed binary message';
+            break;
+        }
+        if ($stored >= RELAY_BATCH_MAX_MESSAGES) {
+            $error = 'Too many messages in request (max ' . RELAY_BATCH_MAX_MESSAGES . ')';
+            break;
+        }
+        
+        $type = $header['type'];
+        // Frames overwrite the peer's frame slot, input/cursor messages are queued
+        $target = $type === 'frame' ? $frame_stmt : $stmt;
+        $blob_param = $type === 'frame' ? 1 : 2;
+        
+        $remaining = $header['length'];
+        while ($remaining > 0) {
+            $chunk = readRelayBinaryBytes($stream, min($remaining, RELAY_BINARY_CHUNK_BYTES));
+            if ($chunk === '') {
+                break;
+            }
+            $target->send_long_data($blob_param, $chunk);
+            $remaining -= strlen($chunk);
+        }
+        if ($remaining > 0) {
+            $error = 'Truncated binary message';
+            break;
+        }
+        
+        if (!$target->execute()) {
+            error_log("storeRelayBinary: Insert failed: " . $target->error . " | type=$type, data_size=" . $header['length'] . ", peer_id=$peer_id");
+            $error = 'Failed to store relay data';
+            break;
+        }
+        $stored++;
+        if (!isset($counts[$type])) {
+            $counts[$type] = array('count' => 0, 'bytes' => 0);
+        }
+        $counts[$type]['count']++;
+        $counts[$type]['bytes'] += $header['length'];
+    }
+    $stmt->close();
+    $frame_stmt->close();
+    
+    if ($error === null && $stored === 0) {
+        $error = 'No messages in request';
+    }
+    if ($error !== null || !$conn->commit()) {
+        $conn->rollback();
+        return array('stored' => 0, 'message' => $error !== null ? $error : 'Failed to store relay data');
+    }
+    
+    relayWake($peer_id);
+    return array('stored' => $stored, 'counts' => $counts, 'message' => 'Data relayed');
+}
+
+/**
+ * Claim unread queued messages, lane by lane up to $limits (relay_lanes.php),
+ * plus the newest unread frame for $session_id (marks them read).
+ * Rows are array('type', 'data', 'blob', 'timestamp'): 'blob' holds the raw
+ * bytes of messages sent with the binary protocol (null otherwise), 'data'
+ * the JSON API text. The frame row also has 'seq' and 'skipped'
+ * (relay_frame_slot.php).
+ */
+function fetchRelayRows($session_id, $limits = RELAY_LANE_LIMITS) {
+    $rows = fetchRelayQueueRows($session_id, $limits);
+    
+    $frame = $limits['frame'] > 0 ? fetchRelayFrame($session_id) : null;
+    if ($frame !== null) {
+        $rows[] = $frame;
+    }
+    
+    return $rows;
+}
+
+/**
+ * Unread messages from the ordered relay_messages queue (input, cursor),
+ * highest priority lane first
+ */
+function fetchRelayQueueRows($session_id, $limits) {
+    if (relayStorageMethod() === 'database') {
         $escaped_session_id = Database::escape($session_id);
         $current_time = time();
         
-        // OPTIMIZATION: Use composite index (session_id, read_at) for faster queries
-        // Get unread relay messages (limit to 10 for performance - process in batches)
+        // OPTIMIZATION: One query, one index range per lane (idx_relay_session_lane)
         // Only select needed columns (not *) for better performance
-        $sql = "SELECT id, message_type, message_data, created_at FROM relay_messages WHERE session_id = '$escaped_session_id' AND read_at IS NULL ORDER BY created_at ASC LIMIT 10";
-        $result = Database::query($sql);
+        $sql = relayLaneQuery($escaped_session_id, relayQueueLimits($limits), 'id, message_type, message_data, message_blob, created_at');
+        $result = $sql !== null ? Database::query($sql) : false;
         
-        $messages = array();
+        $rows = array();
         $message_ids = array();
         
         if ($result && $result->num_rows > 0) {
+            $fetched = array();
             while ($row = $result->fetch_assoc()) {
-                $msg_data = $row['message_data'];
-                
-                // If it's input data, try to decode JSON
-                // Frame data is base64 string, keep as-is
-                if ($row['message_type'] === 'input' && !empty($msg_data)) {
-                    $decoded = json_decode($msg_data, true);
-                    if ($decoded !== null) {
-                        $msg_data = $decoded;
-                    }
-                }
-                
-                $messages[] = array(
+                $fetched[] = $row;
+            }
+            
+            foreach (relayLaneSort($fetched, 'message_type') as $row) {
+                $rows[] = array(
                     'type' => $row['message_type'],
-                    'data' => $msg_data,
+                    'data' => $row['message_data'],
+                    'blob' => $row['message_blob'],
                     'timestamp' => $row['created_at']
                 );
                 
@@ -202,33 +495,148 @@ function getRelayData($session_id, $code) {
             // Batch mark all messages as read at once (much faster than individual updates)
             if (!empty($message_ids)) {
                 $ids_str = implode(',', $message_ids);
-                $update_sql = "UPDATE relay_messages SET read_at = $current_time WHERE id IN ($ids_str)";
+                $update_sql = "UPDATE relay_messages SET read_at = $current_time WHERE id IN ($ids_str)" . relayReadRange($fetched);
                 Database::query($update_sql);
             }
         }
         
-        return $messages;
-    } elseif (STORAGE_METHOD === 'file') {
+        return $rows;
+    } elseif (relayStorageMethod() === 'file') {
         $relay_file = STORAGE_PATH . $session_id . '_relay.json';
         
         if (file_exists($relay_file)) {
             $messages = json_decode(file_get_contents($relay_file), true) ?: [];
             
-            // Return all pending messages and clear them
+            // Return pending messages up to each lane's limit, keep the rest queued
             if (!empty($messages)) {
-                file_put_contents($relay_file, json_encode([])); // Clear after reading
-                return $messages;
+                $rows = array();
+                $remaining = array();
+                $taken = array();
+                foreach ($messages as $message) {
+                    $lane = $message['type'];
+                    if (isset($limits[$lane]) && (isset($taken[$lane]) ? $taken[$lane] : 0) >= $limits[$lane]) {
+                        $remaining[] = $message;
+                        continue;
+                    }
+                    $taken[$lane] = (isset($taken[$lane]) ? $taken[$lane] : 0) + 1;
+                    $rows[] = array(
+                        'type' => $message['type'],
+                        'data' => $message['data'],
+                        'blob' => null,
+                        'timestamp' => $message['timestamp']
+                    );
+                }
+                file_put_contents($relay_file, json_encode($remaining));
+                return relayLaneSort($rows, 'type');
             }
         }
         
         return [];
+    } elseif (relayStorageMethod() === 'shm') {
+        // Each lane is its own ring - claim them in priority order
+        $rows = array();
+        foreach ($limits as $lane => $limit) {
+            if (!in_array($lane, RELAY_SHM_STREAMS, true)) {
+                continue;  // Frames use the frame slot
+            }
+            foreach (relayShmClaim($lane, $session_id, $limit) as $entry) {
+                $rows[] = array(
+                    'type' => $entry['type'],
+                    'data' => $entry['data'],
+                    'blob' => null,
+                    'timestamp' => $entry['timestamp']
+                );
+            }
+        }
+        return $rows;
     }
     
     return [];
 }
 
-// Get POST data
-$input = json_decode(file_get_contents('php://input'), true);
+/**
+ * Send relay rows as a binary protocol response body
+ */
+function outputRelayBinary($rows) {
+    $count = 0;
+    $frame_seq = null;
+    $body = array();
+    foreach ($rows as $row) {
+        if (!in_array($row['type'], RELAY_BINARY_TYPES, true)) {
+            continue;
+        }
+        $bytes = $row['blob'] !== null ? $row['blob'] : relayBinaryFromJsonData($row['type'], $row['data']);
+        $body[] = encodeRelayBinaryHeader($row['type'], strlen($bytes));
+        $body[] = $bytes;
+        $count++;
+        if (isset($row['seq'])) {
+            $frame_seq = $row['seq'];
+        }
+    }
+    
+    header('Content-Type: ' . RELAY_BINARY_CONTENT_TYPE);
+    header('Access-Control-Expose-Headers: X-Relay-Count, X-Relay-Frame-Seq');
+    header('X-Relay-Count: ' . $count);
+    if ($frame_seq !== null) {
+        header('X-Relay-Frame-Seq: ' . $frame_seq);
+    }
+    foreach ($body as $part) {
+        echo $part;
+    }
+}
+
+/**
+ * Long-poll receive: returns as soon as messages arrive for $session_id, or an
+ * empty list after $timeout seconds. Between checks it sleeps on the wake
+ * signal (relay_wake.php) instead of re-querying relay_messages.
+ */
+function waitForRelayRows($session_id, $timeout, $limits) {
+    $deadline = microtime(true) + $timeout;
+    @set_time_limit((int)ceil($timeout) + 30);
+    
+    do {
+        // Token first: a send landing between the SELECT and the wait still wakes us
+        $token = relayWakeToken($session_id);
+        $rows = fetchRelayRows($session_id, $limits);
+        if (!empty($rows)) {
+            return $rows;
+        }
+    } while (relayWaitForWake($session_id, $token, $deadline));
+    
+    return [];
+}
+
+/**
+ * Rate limit budget for a relay request (see RATE_LIMIT_BUDGETS in rate_limit.php):
+ * anything that carries or fetches frames uses the frame budget, input/cursor-only
+ * sends the larger input budget
+ */
+function relayRateLimitBudget($action, $input, $binary_request) {
+    if ($action === 'send' && !$binary_request) {
+        return isset($input['type']) && $input['type'] === 'frame' ? 'frame' : 'input';
+    }
+    if ($action === 'send_batch' && isset($input['messages']) && is_array($input['messages'])) {
+        foreach ($input['messages'] as $message) {
+            if (isset($message['type']) && $message['type'] === 'frame') {
+                return 'frame';
+            }
+        }
+        return 'input';
+    }
+    return 'frame';
+}
+
+// Get POST data - binary protocol requests carry their fields in the query
+// string and relay messages in the body (see relay_binary.php)
+$binary_request = isRelayBinaryRequest();
+if ($binary_request) {
+    $input = $_GET;
+} else {
+    $input = json_decode(file_get_contents('php://input'), true);
+    if (!is_array($input) && isset($_GET['action'])) {
+        $input = $_GET;  // Bodiless GET receive
+    }
+}
 
 if (!isset($input['action'])) {
     echo json_encode(['success' => false, 'message' => 'Missing action']);
@@ -236,8 +644,37 @@ if (!isset($input['action'])) {
 }
 
 $action = $input['action'];
+Database::profileEndpoint('relay.' . $action);
+
+// Enforce rate limiting (prevents abuse) - frame or input budget, per session and per IP
+if (!enforceRateLimit(relayRateLimitBudget($action, $input, $binary_request), isset($input['session_id']) ? $input['session_id'] : null)) {
+    exit;
+}
 
-if ($action === 'send') {
+if ($action === 'send' && $binary_request) {
+    // Send one or more raw binary messages to peer
+    if (!isset($input['session_id']) || !isset($input['code'])) {
+        echo json_encode(['success' => false, 'message' => 'Missing required fields']);
+        exit;
+    }
+    
+    $session_id = $input['session_id'];
+    $code = strtolower(trim($input['code']));
+    
+    $body = fopen('php://input', 'rb');
+    $result = storeRelayBinary($session_id, $code, $body);
+    fclose($body);
+    if ($result['stored'] > 0) {
+        recordRelayStats($session_id, $result['counts']);
+    }
+    
+    echo json_encode([
+        'success' => $result['stored'] > 0,
+        'stored' => $result['stored'],
+        'message' => $result['message']
+    ]);
+    
+} elseif ($action === 'send') {
     // Send data to peer
     if (!isset($input['session_id']) || !isset($input['code']) || !isset($input['type']) || !isset($input['data'])) {
         echo json_encode(['success' => false, 'message' => 'Missing required fields']);
@@ -257,6 +694,9 @@ if ($action === 'send') {
     }
     
     $result = storeRelayData($session_id, $code, $data_type, $data);
+    if ($result) {
+        recordRelayStats($session_id, relayStatsCount(array(array('type' => $data_type, 'data' => $data))));
+    }
     
     // Get more detailed error info if failed (only when needed)
     $error_msg = 'Data relayed';
@@ -268,6 +708,61 @@ if ($action === 'send') {
     
     echo json_encode(['success' => $result, 'message' => $error_msg]);
     
+} elseif ($action === 'send_batch') {
+    // Send several frame/input/cursor messages to the peer in one request
+    if (!isset($input['session_id']) || !isset($input['code']) || !isset($input['messages']) || !is_array($input['messages'])) {
+        echo json_encode(['success' => false, 'message' => 'Missing required fields']);
+        exit;
+    }
+    
+    $batch = array_values($input['messages']);
+    if (count($batch) > RELAY_BATCH_MAX_MESSAGES) {
+        echo json_encode(['success' => false, 'message' => 'Too many messages in batch (max ' . RELAY_BATCH_MAX_MESSAGES . ')']);
+        exit;
+    }
+    
+    $session_id = $input['session_id'];
+    $code = strtolower(trim($input['code']));
+    
+    // Validate each message; invalid ones are reported and skipped, the rest are stored together
+    $results = [];
+    $valid = [];
+    $valid_positions = [];
+    foreach ($batch as $index => $message) {
+        if (!is_array($message) || !isset($message['type']) || !isset($message['data']) ||
+            !in_array($message['type'], RELAY_MESSAGE_TYPES, true)) {
+            $results[] = ['index' => $index, 'success' => false, 'message' => 'Invalid message - needs type (frame, input or cursor) and data'];
+            continue;
+        }
+        
+        $data = $message['data'];
+        if (is_array($data)) {
+            $data = json_encode($data);
+        }
+        
+        $valid[] = ['type' => $message['type'], 'data' => (string)$data];
+        $valid_positions[] = count($results);
+        $results[] = ['index' => $index, 'success' => true];
+    }
+    
+    if (!empty($valid)) {
+        if (storeRelayBatch($session_id, $code, $valid)) {
+            recordRelayStats($session_id, relayStatsCount($valid));
+        } else {
+            foreach ($valid_positions as $position) {
+                $results[$position]['success'] = false;
+                $results[$position]['message'] = 'Failed to store relay data - peer may not be connected';
+            }
+        }
+    }
+    
+    $stored = count(array_filter($results, function ($result) { return $result['success']; }));
+    echo json_encode([
+        'success' => $stored === count($batch),
+        'stored' => $stored,
+        'results' => $results
+    ]);
+    
 } elseif ($action === 'receive') {
     // Receive data from peer
     if (!isset($input['session_id']) || !isset($input['code'])) {
@@ -278,12 +773,28 @@ if ($action === 'send') {
     $session_id = $input['session_id'];
     $code = preg_replace('/[^0-9]/', '', $input['code']);
     
-    $messages = getRelayData($session_id, $code);
-    echo json_encode([
+    // Optional long-poll: 'wait' => seconds to hold the request open (max RELAY_LONG_POLL_MAX)
+    $wait = relayLongPollTimeout($input);
+    // Optional per-lane limits: 'limits' => {'input': n, 'cursor': n, 'frame': n} (relay_lanes.php)
+    $limits = relayLaneLimits($input);
+    $started = microtime(true);
+    $rows = $wait > 0 ? waitForRelayRows($session_id, $wait, $limits) : fetchRelayRows($session_id, $limits);
+    Database::span($wait > 0 ? 'wait' : 'fetch', $started);
+    
+    if (wantsRelayBinaryResponse()) {
+        outputRelayBinary($rows);
+        exit;
+    }
+    
+    $started = microtime(true);
+    $messages = formatRelayMessages($rows);
+    $body = json_encode([
         'success' => true,
         'messages' => $messages,
         'count' => count($messages)
     ]);
+    Database::span('json', $started);
+    echo $body;
     
 } else {
     echo json_encode(['success' => false, 'message' => 'Invalid action']);
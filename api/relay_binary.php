@@ -0,0 +1,161 @@
+<?php
+/**
+ * Relay Binary Protocol - raw frame upload/download for relay.php
+ *
+ * Same length-prefixed framing as websocket_relay_server.js:
+ *
+ *   [type:1][length:4 BE][data]      type 0x01 frame, 0x02 input, 0x04 cursor
+ *
+ * A request body (Content-Type: application/octet-stream) is one or more of
+ * these messages; a receive with "Accept: application/octet-stream" gets its
+ * messages back the same way. Frames travel as raw image bytes (no base64),
+ * input/cursor data as its JSON text.
+ *
+ * Usage:
+ *   if (isRelayBinaryRequest()) { $stream = fopen('php://input', 'rb'); ... }
+ *   while (($header = readRelayBinaryHeader($stream)) !== null) { ... }
+ *   echo encodeRelayBinaryHeader('frame', strlen($bytes)) . $bytes;
+ */
+
+define('RELAY_BINARY_CONTENT_TYPE', 'application/octet-stream');
+define('RELAY_BINARY_TYPES', array(0x01 => 'frame', 0x02 => 'input', 0x04 => 'cursor'));
+define('RELAY_BINARY_MAX_MESSAGE', 16 * 1024 * 1024 - 1);  // MEDIUMBLOB limit
+define('RELAY_BINARY_CHUNK_BYTES', 256 * 1024);            // Read/stream granularity for message bodies
+
+/**
+ * True if the request body is binary relay messages
+ */
+function isRelayBinaryRequest() {
+    $content_type = isset($_SERVER['CONTENT_TYPE']) ? $_SERVER['CONTENT_TYPE'] : '';
+    return stripos($content_type, RELAY_BINARY_CONTENT_TYPE) === 0;
+}
+
+/**
+ * True if the client asked for a binary receive response
+ */
+function wantsRelayBinaryResponse() {
+    $accept = isset($_SERVER['HTTP_ACCEPT']) ? $_SERVER['HTTP_ACCEPT'] : '';
+    return stripos($accept, RELAY_BINARY_CONTENT_TYPE) !== false;
+}
+
+/**
+ * Read exactly $length bytes (php://input may return short reads).
+ * Returns the bytes read - shorter than $length only at end of stream.
+ */
+function readRelayBinaryBytes($stream, $length) {
+    $data = '';
+    while (strlen($data) < $length && !feof($stream)) {
+        $chunk = fread($stream, $length - strlen($data));
+        if ($chunk === false || $chunk === '') {
+            break;
+        }
+        $data .= $chunk;
+    }
+    return $data;
+}
+
+/**
+ * Read the next message header. Returns array('type' => name, 'length' => n),
+ * null at a clean end of stream, or false if the header is malformed.
+ */
+function readRelayBinaryHeader($stream) {
+    $header = readRelayBinaryBytes($stream, 5);
+    if ($header === '') {
+        return null;
+    }
+    if (strlen($header) < 5) {
+        return false;
+    }
+
+    $fields = unpack('Ctype/Nlength', $header);
+    if (!isset(RELAY_BINARY_TYPES[$fields['type']]) || $fields['length'] < 1 || $fields['length'] > RELAY_BINARY_MAX_MESSAGE) {
+        return false;
+    }
+
+    return array('type' => RELAY_BINARY_TYPES[$fields['type']], 'length' => $fields['length']);
+}
+
+/**
+ * Read a whole request body into a list of array('type' => ..., 'data' => raw bytes).
+ * Returns false if any message is malformed or truncated.
+ */
+function readRelayBinaryMessages($stream) {
+    $messages = array();
+    while (($header = readRelayBinaryHeader($stream)) !== null) {
+        if ($header === false) {
+            return false;
+        }
+        $data = readRelayBinaryBytes($stream, $header['length']);
+        if (strlen($data) !== $header['length']) {
+            return false;
+        }
+        $messages[] = array('type' => $header['type'], 'data' => $data);
+    }
+    return $messages;
+}
+
+/**
+ * 5-byte header for a message of $type ('frame', 'input', 'cursor') and $length bytes
+ */
+function encodeRelayBinaryHeader($type, $length) {
+    return pack('CN', array_search($type, RELAY_BINARY_TYPES, true), $length);
+}
+
+/**
+ * Raw bytes of a frame/input/cursor payload as the JSON API carries it
+ * (frames are base64 there, input/cursor JSON text or an already-decoded array)
+ */
+function relayBinaryFromJsonData($type, $data) {
+    if (is_array($data)) {
+        return json_encode($data);
+    }
+    if ($type === 'frame') {
+        $decoded = base64_decode($data, true);
+        return $decoded === false ? $data : $decoded;
+    }
+    return (string)$data;
+}
+
+/**
+ * Inverse of relayBinaryFromJsonData() for JSON clients reading binary-stored data
+ */
+function relayJsonFromBinaryData($type, $bytes) {
+    return $type === 'frame' ? base64_encode($bytes) : $bytes;
+}
+
+/**
+ * Relay rows (type, data, blob, timestamp[, seq, skipped]) as JSON API messages,
+ * shared by relay.php and relay_optimized.php
+ */
+function formatRelayMessages($rows) {
+    $messages = array();
+    
+    foreach ($rows as $row) {
+        $msg_data = $row['blob'] !== null ? relayJsonFromBinaryData($row['type'], $row['blob']) : $row['data'];
+        
+        // If it's input or cursor data, try to decode JSON
+        // Frame data is base64 string, keep as-is
+        if (($row['type'] === 'input' || $row['type'] === 'cursor') && is_string($msg_data) && $msg_data !== '') {
+            $decoded = json_decode($msg_data, true);
+            if ($decoded !== null) {
+                $msg_data = $decoded;
+            }
+        }
+        
+        $message = array(
+            'type' => $row['type'],
+            'data' => $msg_data,
+            'timestamp' => $row['timestamp']
+        );
+        if (isset($row['seq'])) {
+            // Frame slot sequence - receivers drop frames older than the one on screen
+            $message['seq'] = $row['seq'];
+            $message['skipped'] = $row['skipped'];
+        }
+        $messages[] = $message;
+    }
+    
+    return $messages;
+}
+
+?>
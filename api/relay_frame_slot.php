@@ -0,0 +1,156 @@
+<?php
+/**
+ * Relay Frame Slot - latest-frame-wins storage for screen frames
+ *
+ * Each recipient has one "current frame" slot (relay_frame_slots row,
+ * <peer_id>_frame.json with file storage, or an APCu entry with shm storage -
+ * see relay_shm.php). A new frame overwrites it and bumps frame_seq; a
+ * receive returns the frame only if frame_seq moved past the recipient's
+ * read_seq. A lagging viewer therefore always jumps straight
+ * to the newest screen, and storage per session stays O(1). Input and cursor
+ * messages keep using the ordered relay_messages queue.
+ *
+ * Usage:
+ *   storeRelayFrame($peer_id, $base64_frame);   // after resolving the peer
+ *   $row = fetchRelayFrame($session_id);        // null if no new frame
+ */
+
+require_once __DIR__ . '/../config.php';
+require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/relay_wake.php';
+require_once __DIR__ . '/relay_shm.php';
+
+// Binary protocol frames (relay_binary.php) - bind 'sbi' and stream the blob with send_long_data(1, ...)
+define('RELAY_FRAME_SLOT_BLOB_SQL', "INSERT INTO relay_frame_slots (session_id, frame_seq, read_seq, frame_data, frame_blob, updated_at)
+    VALUES (?, 1, 0, '', ?, ?)
+    ON DUPLICATE KEY UPDATE frame_seq = frame_seq + 1, frame_data = '', frame_blob = VALUES(frame_blob), updated_at = VALUES(updated_at)");
+
+function relayFrameFile($session_id) {
+    return STORAGE_PATH . $session_id . '_frame.json';
+}
+
+/**
+ * Overwrite $peer_id's frame slot with $data (base64 frame as the JSON API carries it)
+ */
+function storeRelayFrame($peer_id, $data) {
+    $timestamp = time();
+
+    if (relayStorageMethod() === 'database') {
+        $result = Database::execute("INSERT INTO relay_frame_slots (session_id, frame_seq, read_seq, frame_data, frame_blob, updated_at)
+            VALUES (?, 1, 0, ?, NULL, ?)
+            ON DUPLICATE KEY UPDATE frame_seq = frame_seq + 1, frame_data = VALUES(frame_data), frame_blob = NULL, updated_at = VALUES(updated_at)",
+            'ssi', array($peer_id, $data, $timestamp));
+        if ($result === false) {
+            error_log("storeRelayFrame: Upsert failed | data_size=" . strlen($data) . ", peer_id=$peer_id");
+            return false;
+        }
+
+        relayWake($peer_id);
+        return true;
+    } elseif (relayStorageMethod() === 'file') {
+        $handle = @fopen(relayFrameFile($peer_id), 'c+');
+        if (!$handle) {
+            return false;
+        }
+        flock($handle, LOCK_EX);
+        $slot = json_decode(stream_get_contents($handle), true) ?: array('seq' => 0, 'read_seq' => 0);
+
+        $slot['seq']++;
+        $slot['data'] = $data;
+        $slot['timestamp'] = $timestamp;
+
+        ftruncate($handle, 0);
+        rewind($handle);
+        fwrite($handle, json_encode($slot));
+        flock($handle, LOCK_UN);
+        fclose($handle);
+
+        relayWake($peer_id);
+        return true;
+    } elseif (relayStorageMethod() === 'shm') {
+        if (!relayShmStoreFrame($peer_id, $data)) {
+            return false;
+        }
+        relayWake($peer_id);
+        return true;
+    }
+
+    return false;
+}
+
+/**
+ * Claim the newest frame for $session_id if it has not been read yet.
+ * Returns a relay row (see fetchRelayRows() in relay.php) with 'seq' and
+ * 'skipped' (frames overwritten since the last read), or null.
+ */
+function fetchRelayFrame($session_id) {
+    if (relayStorageMethod() === 'database') {
+        // Primary key lookup - an empty poll costs one index probe
+        $slot = Database::fetchOne("SELECT frame_seq, read_seq, frame_data, frame_blob, updated_at FROM relay_frame_slots WHERE session_id = ? AND frame_seq > read_seq", 's', array($session_id));
+        if (!$slot) {
+            return null;
+        }
+
+        $seq = intval($slot['frame_seq']);
+        Database::execute("UPDATE relay_frame_slots SET read_seq = GREATEST(read_seq, ?) WHERE session_id = ?", 'is', array($seq, $session_id));
+
+        return array(
+            'type' => 'frame',
+            'data' => $slot['frame_data'],
+            'blob' => $slot['frame_blob'],
+            'timestamp' => $slot['updated_at'],
+            'seq' => $seq,
+            'skipped' => max(0, $seq - intval($slot['read_seq']) - 1)
+        );
+    } elseif (relayStorageMethod() === 'file') {
+        $frame_file = relayFrameFile($session_id);
+        if (!file_exists($frame_file)) {
+            return null;
+        }
+
+        $handle = @fopen($frame_file, 'c+');
+        if (!$handle) {
+            return null;
+        }
+        flock($handle, LOCK_EX);
+        $slot = json_decode(stream_get_contents($handle), true);
+
+        $row = null;
+        if (is_array($slot) && $slot['seq'] > $slot['read_seq']) {
+            $row = array(
+                'type' => 'frame',
+                'data' => $slot['data'],
+                'blob' => null,
+                'timestamp' => $slot['timestamp'],
+                'seq' => $slot['seq'],
+                'skipped' => max(0, $slot['seq'] - $slot['read_seq'] - 1)
+            );
+
+            $slot['read_seq'] = $slot['seq'];
+            ftruncate($handle, 0);
+            rewind($handle);
+            fwrite($handle, json_encode($slot));
+        }
+
+        flock($handle, LOCK_UN);
+        fclose($handle);
+        return $row;
+    } elseif (relayStorageMethod() === 'shm') {
+        $slot = relayShmFetchFrame($session_id);
+        if ($slot === null) {
+            return null;
+        }
+        return array(
+            'type' => 'frame',
+            'data' => $slot['data'],
+            'blob' => null,
+            'timestamp' => $slot['timestamp'],
+            'seq' => $slot['seq'],
+            'skipped' => $slot['skipped']
+        );
+    }
+
+    return null;
+}
+
+?>
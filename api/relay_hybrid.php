@@ -3,8 +3,8 @@
  * Relay Server - Hybrid File + MySQL Storage
  * 
  * Performance Strategy:
- * - File storage: Fast frame/input data (append-only, direct I/O)
- * - MySQL: Session metadata (peer_id lookup, keepalive)
+ * - File storage: Fast frame/input data (append-only segmented log with read cursors)
+ * - MySQL: Session metadata (peer_id lookup - cached in APCu, keepalive)
  * 
  * This hybrid approach is 2-5x faster than pure MySQL for relay operations
  */
@@ -23,147 +23,56 @@ if ($_SERVER['REQUEST_METHOD'] === 'OPTIONS') {
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/peer_lookup.php';
+require_once __DIR__ . '/relay_log.php';
 
 // Hybrid storage: Use file for relay data, MySQL for session metadata
 define('USE_HYBRID_STORAGE', true);  // Enable hybrid mode
-define('RELAY_STORAGE_PATH', __DIR__ . '/../storage/relay/');
 
 // Create relay storage directory if it doesn't exist
 if (!is_dir(RELAY_STORAGE_PATH)) {
     mkdir(RELAY_STORAGE_PATH, 0755, true);
 }
 
-function getPeerIdFromMySQL($session_id, $code) {
-    /**
-     * Get peer_id from MySQL (fast lookup for small metadata)
-     * This is much faster than storing frames in MySQL
-     */
-    $escaped_session_id = Database::escape($session_id);
-    $escaped_code = Database::escape($code);
-    
-    $sql = "SELECT peer_id FROM sessions WHERE (session_id = '$escaped_session_id' OR code = '$escaped_code') AND peer_id IS NOT NULL LIMIT 1";
-    $result = Database::query($sql);
-    
-    if ($result && $result->num_rows > 0) {
-        $row = $result->fetch_assoc();
-        return $row['peer_id'];
-    }
-    
-    return null;
-}
-
 function storeRelayData($session_id, $code, $data_type, $data) {
     /**
-     * Optimized: Append-only file writes (much faster than read-modify-write)
-     * Each frame is written as a single JSON line (NDJSON format)
+     * Optimized: Append-only segmented log (relay_log.php) - one locked append,
+     * never a read-modify-write of the peer's queue
      */
     
-    // Get peer_id from MySQL (fast metadata lookup)
-    $peer_id = getPeerIdFromMySQL($session_id, $code);
+    // Get peer_id (shared APCu cache - usually no MySQL query at all)
+    $peer_id = resolvePeerId($session_id, $code);
     
     if (!$peer_id) {
         return false;
     }
     
-    // Store frame/input data in file (append-only - much faster!)
-    $relay_file = RELAY_STORAGE_PATH . $peer_id . '_relay.json';
-    
-    // Append as single JSON line (NDJSON format) - no locking needed for append!
-    $message = json_encode([
+    return appendRelayLog($peer_id, [
         'type' => $data_type,
         'data' => $data,
         'timestamp' => time()
-    ]) . "\n";
-    
-    // Append-only write (much faster, atomic on most filesystems)
-    $result = file_put_contents($relay_file, $message, FILE_APPEND | LOCK_EX);
-    
-    return $result !== false;
+    ]);
 }
 
 function getRelayData($session_id, $code) {
     /**
-     * Optimized: Atomic read-and-clear using rename pattern
-     * Uses NDJSON format (one JSON object per line)
-     * Prevents race conditions between concurrent reads and writes
+     * Optimized: Seek to this receiver's cursor and read only new records
+     * (relay_log.php) - cost is O(new data), not O(everything queued)
      */
     
     // Try session_id first (frames are stored using peer_id = admin's session_id)
-    $relay_file = RELAY_STORAGE_PATH . $session_id . '_relay.json';
+    $stream_id = $session_id;
     
-    // If file doesn't exist, try peer_id as fallback
-    if (!file_exists($relay_file)) {
-        $peer_id = getPeerIdFromMySQL($session_id, $code);
-        if ($peer_id) {
-            $relay_file = RELAY_STORAGE_PATH . $peer_id . '_relay.json';
-        }
-    }
-    
-    // If still no file, return empty
-    if (!file_exists($relay_file)) {
-        return [];
-    }
-    
-    // Atomic read-and-clear: rename file, then read from renamed file
-    // This prevents race conditions where frames are written while reading
-    $temp_file = $relay_file . '.tmp.' . time() . '.' . rand(1000, 9999);
-    
-    // Try to rename atomically (this will fail if file is being written)
-    $rename_success = @rename($relay_file, $temp_file);
-    
-    if (!$rename_success) {
-        // If rename failed, try reading with lock (fallback)
-        // This is slower but works if rename fails
-        $fp = @fopen($relay_file, 'r');
-        if (!$fp) {
+    // If there is no stream yet, try peer_id as fallback
+    if (!relayLogExists($stream_id)) {
+        $peer_id = resolvePeerId($session_id, $code);
+        if (!$peer_id || !relayLogExists($peer_id)) {
             return [];
         }
-        
-        // Try to get exclusive lock (non-blocking)
-        if (!flock($fp, LOCK_EX | LOCK_NB)) {
-            fclose($fp);
-            return [];  // File is being written, return empty and try again next poll
-        }
-        
-        // Read all lines
-        $messages = [];
-        while (($line = fgets($fp)) !== false) {
-            $line = trim($line);
-            if (empty($line)) continue;
-            $decoded = json_decode($line, true);
-            if ($decoded && is_array($decoded)) {
-                $messages[] = $decoded;
-            }
-        }
-        
-        // Clear file
-        ftruncate($fp, 0);
-        fflush($fp);
-        flock($fp, LOCK_UN);
-        fclose($fp);
-        
-        return $messages;
-    }
-    
-    // Read from renamed temp file
-    $messages = [];
-    if (file_exists($temp_file)) {
-        $lines = file($temp_file, FILE_IGNORE_NEW_LINES | FILE_SKIP_EMPTY_LINES);
-        
-        if ($lines) {
-            foreach ($lines as $line) {
-                $decoded = json_decode($line, true);
-                if ($decoded && is_array($decoded)) {
-                    $messages[] = $decoded;
-                }
-            }
-        }
-        
-        // Delete temp file
-        @unlink($temp_file);
+        $stream_id = $peer_id;
     }
     
-    return $messages;
+    return readRelayLog($stream_id);
 }
 
 // Get POST data
@@ -201,7 +110,7 @@ if ($action === 'send') {
     $error_msg = 'Data relayed';
     if (!$result) {
         // Check if it's a peer_id issue
-        $peer_id = getPeerIdFromMySQL($session_id, $code);
+        $peer_id = resolvePeerId($session_id, $code);
         if (!$peer_id) {
             $error_msg = 'No peer connection found - ensure admin and client are both connected';
         } else {
@@ -0,0 +1,94 @@
+<?php
+/**
+ * Relay Priority Lanes - per-type receive limits for relay_messages
+ *
+ * A receive reads each message type in its own lane, in priority order:
+ * input first, then cursor, then frame. Every lane has its own limit, so a
+ * backlog of frames can never push keystrokes and clicks into the next poll.
+ * Clients may lower or raise the limits per request:
+ *
+ *   {"action": "receive", ..., "limits": {"input": 100, "cursor": 5, "frame": 1}}
+ *
+ * A limit of 0 skips the lane (e.g. "frame": 0 for an input-only poll).
+ * The frame lane also covers the latest-frame slot (relay_frame_slot.php).
+ *
+ * relay_messages is partitioned by hour on created_at: lane reads are bounded
+ * to the last RELAY_MESSAGE_MAX_AGE seconds so they only touch the newest
+ * partitions, and relayReadRange() bounds the mark-read UPDATE the same way.
+ */
+
+// Priority order => default per-request limit
+define('RELAY_LANE_LIMITS', array('input' => 50, 'cursor' => 10, 'frame' => 10));
+define('RELAY_LANE_MAX', 200);  // Upper bound for a client-supplied limit
+define('RELAY_MESSAGE_MAX_AGE', 3600);  // Older unread messages are stale (and soon dropped with their partition)
+
+/**
+ * Lane limits for this request: defaults overridden by the optional `limits` field
+ */
+function relayLaneLimits($input) {
+    $limits = RELAY_LANE_LIMITS;
+
+    if (isset($input['limits']) && is_array($input['limits'])) {
+        foreach ($input['limits'] as $lane => $limit) {
+            if (isset($limits[$lane]) && is_numeric($limit)) {
+                $limits[$lane] = max(0, min((int)$limit, RELAY_LANE_MAX));
+            }
+        }
+    }
+
+    return $limits;
+}
+
+/**
+ * Lanes kept in the relay_messages queue - frames live in relay_frame_slots
+ * (relay_frame_slot.php), so the queue query never reads a frame lane
+ */
+function relayQueueLimits($limits) {
+    unset($limits['frame']);
+    return $limits;
+}
+
+/**
+ * One UNION ALL query reading every open lane's unread messages for a session,
+ * each lane in send order (order the result with relayLaneSort()).
+ * Uses idx_relay_session_lane (session_id, message_type, read_at, created_at).
+ * Returns null if every lane is closed.
+ */
+function relayLaneQuery($escaped_session_id, $limits, $columns) {
+    $since = time() - RELAY_MESSAGE_MAX_AGE;
+    $parts = array();
+    foreach ($limits as $lane => $limit) {
+        if ($limit <= 0) {
+            continue;
+        }
+        $parts[] = "(SELECT $columns FROM relay_messages
+            WHERE session_id = '$escaped_session_id' AND message_type = '$lane' AND read_at IS NULL
+            AND created_at >= $since
+            ORDER BY created_at ASC, id ASC LIMIT $limit)";
+    }
+
+    return empty($parts) ? null : implode(' UNION ALL ', $parts);
+}
+
+/**
+ * created_at range of fetched rows, as an SQL condition that lets an UPDATE
+ * by id prune to their partitions instead of probing every partition
+ */
+function relayReadRange($rows) {
+    $created = array_map('intval', array_column($rows, 'created_at'));
+    return empty($created) ? '' : ' AND created_at BETWEEN ' . min($created) . ' AND ' . max($created);
+}
+
+/**
+ * Group rows by lane in priority order, keeping send order within a lane
+ * (UNION ALL itself does not promise any order across its parts)
+ */
+function relayLaneSort($rows, $type_key) {
+    $lanes = array_fill_keys(array_keys(RELAY_LANE_LIMITS), array());
+    foreach ($rows as $row) {
+        $lanes[$row[$type_key]][] = $row;
+    }
+    return array_merge(...array_values($lanes));
+}
+
+?>
@@ -0,0 +1,195 @@
+<?php
+/**
+ * Relay Log - append-only segmented NDJSON log per recipient (relay_hybrid.php)
+ *
+ * Each recipient's stream is a series of fixed-size segment files:
+ *
+ *   <session_id>_relay.000001.ndjson   one JSON record per line
+ *   <session_id>_relay.head            segment writers append to (also the writers' lock)
+ *   <session_id>_relay.cursor          "<segment> <byte offset>" the reader has consumed up to
+ *
+ * A writer appends one line under the head lock and rotates to a new segment
+ * once the current one reaches RELAY_LOG_SEGMENT_BYTES. A reader seeks to its
+ * cursor, reads only the complete lines written since, and unlinks segments
+ * it has finished - a receive costs O(new data) no matter how much was sent
+ * before. A receiver that stops reading loses its oldest segments first, so
+ * a stream never holds more than RELAY_LOG_MAX_SEGMENTS segments on disk.
+ *
+ * Usage:
+ *   appendRelayLog($peer_id, array('type' => ..., 'data' => ..., 'timestamp' => time()));
+ *   $records = readRelayLog($session_id);
+ *   deleteRelayLog($session_id);   // on disconnect
+ */
+
+require_once __DIR__ . '/../config.php';
+
+define('RELAY_STORAGE_PATH', __DIR__ . '/../storage/relay/');
+define('RELAY_LOG_SEGMENT_BYTES', 2 * 1024 * 1024);  // Rotate after this many bytes
+define('RELAY_LOG_MAX_SEGMENTS', 8);                 // Unread segments kept per stream
+define('RELAY_LOG_READ_BYTES', 4 * 1024 * 1024);     // Max bytes returned by one read (rest stays queued)
+
+/**
+ * True if $session_id can name a stream: the uniqid('session_', true) charset, so
+ * client-supplied ids can never reach outside RELAY_STORAGE_PATH
+ */
+function relayLogValidId($session_id) {
+    return is_string($session_id) && preg_match('/^[A-Za-z0-9_.]{1,128}$/', $session_id) && strpos($session_id, '..') === false;
+}
+
+function relayLogFile($session_id, $suffix) {
+    return RELAY_STORAGE_PATH . $session_id . '_relay.' . $suffix;
+}
+
+function relayLogSegment($session_id, $segment) {
+    return relayLogFile($session_id, sprintf('%06d.ndjson', $segment));
+}
+
+/**
+ * True if $session_id has ever been written to
+ */
+function relayLogExists($session_id) {
+    return relayLogValidId($session_id) && file_exists(relayLogFile($session_id, 'head'));
+}
+
+/**
+ * Append one record to $session_id's stream
+ */
+function appendRelayLog($session_id, $record) {
+    if (!relayLogValidId($session_id)) {
+        return false;
+    }
+    $line = json_encode($record) . "\n";
+
+    $head = @fopen(relayLogFile($session_id, 'head'), 'c+');
+    if (!$head && !is_dir(RELAY_STORAGE_PATH)) {
+        @mkdir(RELAY_STORAGE_PATH, 0755, true);
+        $head = @fopen(relayLogFile($session_id, 'head'), 'c+');
+    }
+    if (!$head) {
+        return false;
+    }
+    flock($head, LOCK_EX);
+    $segment = max(1, (int)stream_get_contents($head));
+
+    $written = false;
+    $handle = @fopen(relayLogSegment($session_id, $segment), 'ab');
+    if ($handle) {
+        $written = fwrite($handle, $line) === strlen($line);
+        $size = fstat($handle)['size'];
+        fclose($handle);
+
+        if ($written && $size >= RELAY_LOG_SEGMENT_BYTES) {
+            // Rotate: later records go to the next segment, so this one is final
+            $segment++;
+            ftruncate($head, 0);
+            rewind($head);
+            fwrite($head, (string)$segment);
+
+            // Bound the footprint of a stream nobody reads
+            $expired = relayLogSegment($session_id, $segment - RELAY_LOG_MAX_SEGMENTS);
+            if (file_exists($expired)) {
+                @unlink($expired);
+            }
+        }
+    }
+
+    flock($head, LOCK_UN);
+    fclose($head);
+    return $written;
+}
+
+/**
+ * Read every complete record written since the last read (up to
+ * RELAY_LOG_READ_BYTES), advance the cursor and unlink finished segments
+ */
+function readRelayLog($session_id) {
+    if (!relayLogValidId($session_id)) {
+        return array();
+    }
+    $head_segment = max(1, (int)@file_get_contents(relayLogFile($session_id, 'head')));
+
+    $cursor = @fopen(relayLogFile($session_id, 'cursor'), 'c+');
+    if (!$cursor) {
+        return array();
+    }
+    // One reader at a time per stream
+    flock($cursor, LOCK_EX);
+    $position = explode(' ', trim(stream_get_contents($cursor)));
+    $segment = max(1, (int)$position[0]);
+    $offset = isset($position[1]) ? (int)$position[1] : 0;
+    $start = array($segment, $offset);
+
+    // Segments this far behind were dropped by the writer
+    if ($segment <= $head_segment - RELAY_LOG_MAX_SEGMENTS) {
+        $segment = $head_segment - RELAY_LOG_MAX_SEGMENTS + 1;
+        $offset = 0;
+    }
+
+    $records = array();
+    $read_bytes = 0;
+    while ($read_bytes < RELAY_LOG_READ_BYTES) {
+        $path = relayLogSegment($session_id, $segment);
+        $handle = @fopen($path, 'rb');
+        if ($handle) {
+            fseek($handle, $offset);
+            while ($read_bytes < RELAY_LOG_READ_BYTES && ($line = fgets($handle)) !== false) {
+                if (substr($line, -1) !== "\n") {
+                    break;  // Still being written - picked up by the next read
+                }
+                $offset += strlen($line);
+                $read_bytes += strlen($line);
+                $decoded = json_decode($line, true);
+                if (is_array($decoded)) {
+                    $records[] = $decoded;
+                }
+            }
+            $at_end = feof($handle) || fgetc($handle) === false;
+            fclose($handle);
+            if (!$at_end) {
+                break;  // Read budget used up mid-segment
+            }
+        }
+
+        if ($segment >= $head_segment) {
+            break;  // Caught up with the writers
+        }
+
+        // Writers moved past this segment before we started - it is complete and consumed
+        @unlink($path);
+        $segment++;
+        $offset = 0;
+    }
+
+    // An empty poll leaves the cursor file untouched
+    if (array($segment, $offset) !== $start) {
+        ftruncate($cursor, 0);
+        rewind($cursor);
+        fwrite($cursor, $segment . ' ' . $offset);
+    }
+    flock($cursor, LOCK_UN);
+    fclose($cursor);
+
+    return $records;
+}
+
+/**
+ * Remove $session_id's stream (segments, head, cursor, and the pre-segment <id>_relay.json)
+ */
+function deleteRelayLog($session_id) {
+    if (!relayLogValidId($session_id)) {
+        return;
+    }
+
+    // Exact names only - segments from the oldest one that can still exist up to the head
+    $head_segment = max(1, (int)@file_get_contents(relayLogFile($session_id, 'head')));
+    $position = explode(' ', trim((string)@file_get_contents(relayLogFile($session_id, 'cursor'))));
+    $first = max(1, (int)$position[0], $head_segment - RELAY_LOG_MAX_SEGMENTS + 1);
+    for ($segment = $first; $segment <= $head_segment; $segment++) {
+        @unlink(relayLogSegment($session_id, $segment));
+    }
+    @unlink(relayLogFile($session_id, 'head'));
+    @unlink(relayLogFile($session_id, 'cursor'));
+    @unlink(relayLogFile($session_id, 'json'));
+}
+
+?>
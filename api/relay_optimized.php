@@ -3,7 +3,7 @@
  * OPTIMIZED Relay Server - Performance improvements
  * 
  * Key optimizations:
- * - Separate queries for session_id and code (avoids OR condition)
+ * - Shared peer_id cache across requests (peer_lookup.php)
  * - Composite index usage (session_id, read_at)
  * - Reduced error logging overhead
  * - Prepared statements for large data
@@ -11,70 +11,31 @@
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
-
-// OPTIMIZATION: Cache peer_id lookups (in-memory, per-request)
-// This avoids repeated database queries for the same session
-static $peer_id_cache = array();
-static $cache_ttl = 5; // Cache for 5 seconds
-
-function getCachedPeerId($session_id, $code) {
-    global $peer_id_cache;
-    
-    // Check cache first
-    $cache_key = $session_id . '|' . $code;
-    if (isset($peer_id_cache[$cache_key])) {
-        $cached = $peer_id_cache[$cache_key];
-        if (time() - $cached['time'] < $GLOBALS['cache_ttl']) {
-            return $cached['peer_id'];
-        }
-        unset($peer_id_cache[$cache_key]);
-    }
-    
-    // Query database
-    $escaped_session_id = Database::escape($session_id);
-    $escaped_code = Database::escape($code);
-    
-    // Try session_id first (most common, has index)
-    $peer_sql = "SELECT peer_id FROM sessions WHERE session_id = '$escaped_session_id' AND peer_id IS NOT NULL LIMIT 1";
-    $peer_result = Database::query($peer_sql);
-    
-    $peer_id = null;
-    if ($peer_result && $peer_result->num_rows > 0) {
-        $peer_row = $peer_result->fetch_assoc();
-        $peer_id = $peer_row['peer_id'];
-    } else {
-        // Try code (has index)
-        $peer_sql = "SELECT peer_id FROM sessions WHERE code = '$escaped_code' AND peer_id IS NOT NULL LIMIT 1";
-        $peer_result = Database::query($peer_sql);
-        if ($peer_result && $peer_result->num_rows > 0) {
-            $peer_row = $peer_result->fetch_assoc();
-            $peer_id = $peer_row['peer_id'];
-        }
-    }
-    
-    // Cache result
-    if ($peer_id) {
-        $peer_id_cache[$cache_key] = array(
-            'peer_id' => $peer_id,
-            'time' => time()
-        );
-    }
-    
-    return $peer_id;
-}
+require_once __DIR__ . '/peer_lookup.php';
+require_once __DIR__ . '/relay_shm.php';
+require_once __DIR__ . '/relay_wake.php';
+require_once __DIR__ . '/relay_binary.php';
+require_once __DIR__ . '/relay_frame_slot.php';
+require_once __DIR__ . '/relay_lanes.php';
+require_once __DIR__ . '/relay_stats.php';
 
 function storeRelayData($session_id, $code, $data_type, $data) {
-    if (STORAGE_METHOD === 'database') {
+    if (relayStorageMethod() === 'database') {
         $escaped_type = Database::escape($data_type);
         $timestamp = time();
         
-        // OPTIMIZATION: Use cached peer_id lookup
-        $peer_id = getCachedPeerId($session_id, $code);
+        // OPTIMIZATION: Shared peer_id cache (APCu, survives across requests)
+        $peer_id = resolvePeerId($session_id, $code);
         
         if (!$peer_id) {
             return false;
         }
         
+        // OPTIMIZATION: Latest frame wins - one slot per peer instead of a frame backlog
+        if ($data_type === 'frame') {
+            return storeRelayFrame($peer_id, $data);
+        }
+        
         // Store data for peer to retrieve
         $conn = Database::getConnection();
         if ($conn) {
@@ -86,6 +47,8 @@ function storeRelayData($session_id, $code, $data_type, $data) {
                 $stmt->close();
                 
                 if ($result) {
+                    // Same relay_messages queue as relay.php - wake its long-polling receivers
+                    relayWake($peer_id);
                     return true;
                 }
             }
@@ -95,63 +58,98 @@ function storeRelayData($session_id, $code, $data_type, $data) {
             $escaped_data = Database::escape($data);
             $insert_sql = "INSERT INTO relay_messages (session_id, message_type, message_data, created_at) 
                           VALUES ('$escaped_peer_id', '$escaped_type', '$escaped_data', $timestamp)";
-            return Database::query($insert_sql) !== false;
+            if (Database::query($insert_sql) === false) {
+                return false;
+            }
+            relayWake($peer_id);
+            return true;
         }
         
         return false;
+    } elseif (relayStorageMethod() === 'shm') {
+        // Same rings relay.php receivers claim from (relay_shm.php)
+        $peer_id = resolvePeerId($session_id, $code);
+        if (!$peer_id) {
+            return false;
+        }
+        
+        if ($data_type === 'frame') {
+            return storeRelayFrame($peer_id, $data);
+        }
+        if (!isset(RELAY_LANE_LIMITS[$data_type])) {
+            return false;
+        }
+        
+        if (!relayShmPush($data_type, $peer_id, array(array('type' => $data_type, 'data' => $data, 'timestamp' => time())))) {
+            return false;
+        }
+        relayWake($peer_id);
+        return true;
     }
     
     // File storage (unchanged)
     return false;
 }
 
-function getRelayData($session_id, $code) {
-    if (STORAGE_METHOD === 'database') {
+function getRelayData($session_id, $code, $limits = RELAY_LANE_LIMITS) {
+    $rows = array();
+    
+    if (relayStorageMethod() === 'shm') {
+        // Each lane is its own ring - claim them in priority order, then the frame slot
+        foreach ($limits as $lane => $limit) {
+            if (!in_array($lane, RELAY_SHM_STREAMS, true)) {
+                continue;
+            }
+            foreach (relayShmClaim($lane, $session_id, $limit) as $entry) {
+                $rows[] = array(
+                    'type' => $entry['type'],
+                    'data' => $entry['data'],
+                    'blob' => null,
+                    'timestamp' => $entry['timestamp']
+                );
+            }
+        }
+    } elseif (relayStorageMethod() === 'database') {
         $escaped_session_id = Database::escape($session_id);
         $current_time = time();
         
-        // OPTIMIZATION: Use composite index (session_id, read_at) - only select needed columns
-        $sql = "SELECT id, message_type, message_data, created_at FROM relay_messages 
-                WHERE session_id = '$escaped_session_id' AND read_at IS NULL 
-                ORDER BY created_at ASC LIMIT 10";
-        $result = Database::query($sql);
-        
-        $messages = array();
-        $message_ids = array();
+        // OPTIMIZATION: Priority lanes (input, cursor) - one index range per lane, only needed columns
+        $sql = relayLaneQuery($escaped_session_id, relayQueueLimits($limits), 'id, message_type, message_data, message_blob, created_at');
+        $result = $sql !== null ? Database::query($sql) : false;
         
         if ($result && $result->num_rows > 0) {
+            $fetched = array();
             while ($row = $result->fetch_assoc()) {
-                $msg_data = $row['message_data'];
-                
-                // If it's input data, try to decode JSON
-                if ($row['message_type'] === 'input' && !empty($msg_data)) {
-                    $decoded = json_decode($msg_data, true);
-                    if ($decoded !== null) {
-                        $msg_data = $decoded;
-                    }
-                }
-                
-                $messages[] = array(
+                $fetched[] = $row;
+            }
+            
+            $message_ids = array();
+            foreach (relayLaneSort($fetched, 'message_type') as $row) {
+                $rows[] = array(
                     'type' => $row['message_type'],
-                    'data' => $msg_data,
+                    'data' => $row['message_data'],
+                    'blob' => $row['message_blob'],
                     'timestamp' => $row['created_at']
                 );
-                
                 $message_ids[] = intval($row['id']);
             }
             
             // OPTIMIZATION: Batch update (much faster than individual updates)
-            if (!empty($message_ids)) {
-                $ids_str = implode(',', $message_ids);
-                $update_sql = "UPDATE relay_messages SET read_at = $current_time WHERE id IN ($ids_str)";
-                Database::query($update_sql);
-            }
+            $ids_str = implode(',', $message_ids);
+            $update_sql = "UPDATE relay_messages SET read_at = $current_time WHERE id IN ($ids_str)" . relayReadRange($fetched);
+            Database::query($update_sql);
         }
-        
-        return $messages;
+    } else {
+        return array();
     }
     
-    return array();
+    // Newest unread frame from the peer's frame slot
+    $frame = $limits['frame'] > 0 ? fetchRelayFrame($session_id) : null;
+    if ($frame !== null) {
+        $rows[] = $frame;
+    }
+    
+    return formatRelayMessages($rows);
 }
 
 // Handle CORS
@@ -186,6 +184,9 @@ if ($action === 'send') {
     $data = is_array($input['data']) ? json_encode($input['data']) : $input['data'];
     
     $result = storeRelayData($session_id, $code, $data_type, $data);
+    if ($result) {
+        recordRelayStats($session_id, relayStatsCount(array(array('type' => $data_type, 'data' => $data))));
+    }
     echo json_encode(['success' => $result, 'message' => $result ? 'Data relayed' : 'Failed to relay']);
     
 } elseif ($action === 'receive') {
@@ -197,7 +198,7 @@ if ($action === 'send') {
     $session_id = $input['session_id'];
     $code = preg_replace('/[^0-9]/', '', $input['code']);
     
-    $messages = getRelayData($session_id, $code);
+    $messages = getRelayData($session_id, $code, relayLaneLimits($input));
     echo json_encode([
         'success' => true,
         'messages' => $messages,
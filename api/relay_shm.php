@@ -0,0 +1,271 @@
+<?php
+/**
+ * Relay Shared-Memory Storage - APCu ring buffers for relay messages and signals
+ *
+ * A third storage backend for the data path (relay.php, poll.php, signal.php),
+ * selected with RELAY_STORAGE_METHOD = 'shm' in config.php. Sessions stay in
+ * STORAGE_METHOD storage (normally MySQL, written once per connect), but frames,
+ * input, cursor messages and signals never touch the database or the disk -
+ * a single-VM deployment relays with no MySQL writes per frame.
+ *
+ * Each recipient has one bounded ring per stream ('input', 'cursor' - one per
+ * relay lane - and 'signal'):
+ *
+ *   head  - last sequence number written; writers reserve numbers with apcu_inc()
+ *   tail  - last sequence number read; the reader advances it with apcu_cas()
+ *   slot  - entry for sequence n lives in slot n % RELAY_SHM_CAPACITY
+ *
+ * Writers never lock and never touch the reader's cursor; a full ring simply
+ * overwrites its oldest entries. Frames use a latest-frame-wins slot like
+ * relay_frame_slot.php: each frame is stored under its own sequence number and
+ * published by advancing 'latest' with apcu_cas().
+ *
+ * Usage:
+ *   relayShmPush('input', $peer_id, $entries);            // after resolving the peer
+ *   $entries = relayShmClaim('input', $session_id, 50);   // oldest first, marks read
+ *   relayShmClear($session_id);                           // on disconnect
+ */
+
+require_once __DIR__ . '/../config.php';
+require_once __DIR__ . '/apcu.php';
+
+define('RELAY_SHM_CAPACITY', 256);      // Entries per ring - older entries are overwritten
+define('RELAY_SHM_TTL', 600);           // Seconds an unread entry is kept
+define('RELAY_SHM_COUNTER_TTL', 86400); // Head/tail cursors of idle sessions
+define('RELAY_SHM_GAP_TIMEOUT', 1.0);   // Seconds before a reserved but never written slot is skipped
+define('RELAY_SHM_STREAMS', array('input', 'cursor', 'signal'));
+
+/**
+ * Storage backend for relay messages and signals: RELAY_STORAGE_METHOD if set
+ * ('database', 'file' or 'shm'), otherwise STORAGE_METHOD
+ */
+function relayStorageMethod() {
+    static $method = null;
+    if ($method === null) {
+        $method = defined('RELAY_STORAGE_METHOD') ? RELAY_STORAGE_METHOD : STORAGE_METHOD;
+        if ($method === 'shm' && !apcuAvailable()) {
+            error_log("relay_shm: RELAY_STORAGE_METHOD is 'shm' but APCu is not available - using " . STORAGE_METHOD);
+            $method = STORAGE_METHOD;
+        }
+    }
+    return $method;
+}
+
+function relayShmKey($stream, $session_id, $name) {
+    return 'sharefast_shm_' . $stream . '_' . md5($session_id) . '_' . $name;
+}
+
+/**
+ * Append $entries (arrays with at least 'type' and 'data') to $session_id's
+ * $stream ring. Returns false if APCu refused the write.
+ */
+function relayShmPush($stream, $session_id, $entries) {
+    $count = count($entries);
+    if ($count === 0) {
+        return true;
+    }
+
+    // Reserve $count sequence numbers in one atomic step
+    $head_key = relayShmKey($stream, $session_id, 'head');
+    $last = apcu_inc($head_key, $count, $success, RELAY_SHM_COUNTER_TTL);
+    if ($last === false) {
+        apcu_add($head_key, 0, RELAY_SHM_COUNTER_TTL);
+        $last = apcu_inc($head_key, $count, $success, RELAY_SHM_COUNTER_TTL);
+        if ($last === false) {
+            error_log("relayShmPush: Failed to reserve $count entries in $stream ring for $session_id");
+            return false;
+        }
+    }
+
+    $slots = array();
+    $seq = $last - $count;
+    $now = microtime(true);
+    foreach ($entries as $entry) {
+        $seq++;
+        $entry['seq'] = $seq;
+        $entry['time'] = $now;
+        $slots[relayShmKey($stream, $session_id, $seq % RELAY_SHM_CAPACITY)] = $entry;
+    }
+
+    $failed = apcu_store($slots, null, RELAY_SHM_TTL);
+    return empty($failed);
+}
+
+/**
+ * Claim up to $limit unread entries of $session_id's $stream ring, oldest first
+ */
+function relayShmClaim($stream, $session_id, $limit) {
+    if ($limit <= 0) {
+        return array();
+    }
+
+    $head_key = relayShmKey($stream, $session_id, 'head');
+    $tail_key = relayShmKey($stream, $session_id, 'tail');
+
+    // Another receive for the same session may claim concurrently - retry on a lost race
+    for ($attempt = 0; $attempt < 3; $attempt++) {
+        $cursors = apcu_fetch(array($head_key, $tail_key));
+        $head = isset($cursors[$head_key]) ? $cursors[$head_key] : 0;
+        $tail = isset($cursors[$tail_key]) ? $cursors[$tail_key] : false;
+        $read = ($tail === false || $tail > $head) ? 0 : $tail;  // tail > head: cursors expired and restarted
+
+        if ($head <= $read) {
+            return array();
+        }
+
+        // Entries more than a ring behind were overwritten
+        $from = max($read + 1, $head - RELAY_SHM_CAPACITY + 1);
+        $to = min($head, $from + $limit - 1);
+
+        $keys = array();
+        for ($seq = $from; $seq <= $to; $seq++) {
+            $keys[$seq] = relayShmKey($stream, $session_id, $seq % RELAY_SHM_CAPACITY);
+        }
+        $slots = apcu_fetch(array_values($keys));
+
+        $entries = array();
+        $claimed = $from - 1;
+        $now = microtime(true);
+        foreach ($keys as $seq => $key) {
+            if (isset($slots[$key]) && $slots[$key]['seq'] === $seq) {
+                $entries[] = $slots[$key];
+                $claimed = $seq;
+                continue;
+            }
+
+            // Reserved but not written yet: wait for it unless later entries are
+            // already older than the gap timeout (its writer died)
+            $later = null;
+            for ($next = $seq + 1; $next <= $to && $later === null; $next++) {
+                $next_key = $keys[$next];
+                if (isset($slots[$next_key]) && $slots[$next_key]['seq'] === $next) {
+                    $later = $slots[$next_key];
+                }
+            }
+            if ($later === null || $now - $later['time'] < RELAY_SHM_GAP_TIMEOUT) {
+                break;
+            }
+            $claimed = $seq;
+        }
+
+        if ($claimed <= $read) {
+            return array();
+        }
+
+        $advanced = $tail === false
+            ? apcu_add($tail_key, $claimed, RELAY_SHM_COUNTER_TTL)
+            : apcu_cas($tail_key, $tail, $claimed);
+        if ($advanced) {
+            return $entries;
+        }
+    }
+
+    return array();
+}
+
+/**
+ * Overwrite $session_id's shared-memory frame slot (see relay_frame_slot.php)
+ */
+function relayShmStoreFrame($session_id, $data) {
+    $seq_key = relayShmKey('frame', $session_id, 'head');
+    $seq = apcu_inc($seq_key, 1, $success, RELAY_SHM_COUNTER_TTL);
+    if ($seq === false) {
+        apcu_add($seq_key, 0, RELAY_SHM_COUNTER_TTL);
+        $seq = apcu_inc($seq_key, 1, $success, RELAY_SHM_COUNTER_TTL);
+    }
+    if ($seq === false) {
+        return false;
+    }
+
+    // Each frame gets its own key; 'latest' only moves forward (apcu_cas), so a
+    // slow concurrent sender never replaces a newer frame with an older one
+    $slot_key = relayShmKey('frame', $session_id, 'slot_' . $seq);
+    if (!apcu_store($slot_key, array('seq' => $seq, 'data' => $data, 'timestamp' => time()), RELAY_SHM_TTL)) {
+        return false;
+    }
+
+    $latest_key = relayShmKey('frame', $session_id, 'latest');
+    while (true) {
+        $latest = apcu_fetch($latest_key);
+        // $seq 1 after a newer 'latest' means the head counter expired and restarted
+        if ($latest !== false && $latest >= $seq && $seq !== 1) {
+            apcu_delete($slot_key);  // Superseded before it was published
+            return true;
+        }
+        $published = $latest === false
+            ? apcu_add($latest_key, $seq, RELAY_SHM_COUNTER_TTL)
+            : apcu_cas($latest_key, $latest, $seq);
+        if ($published) {
+            if ($latest !== false && $latest !== $seq) {
+                apcu_delete(relayShmKey('frame', $session_id, 'slot_' . $latest));
+            }
+            return true;
+        }
+    }
+}
+
+/**
+ * Claim the newest frame for $session_id if it has not been read yet.
+ * Returns array('seq', 'skipped', 'data', 'timestamp') or null.
+ */
+function relayShmFetchFrame($session_id) {
+    $latest_key = relayShmKey('frame', $session_id, 'latest');
+    $read_key = relayShmKey('frame', $session_id, 'tail');
+
+    $values = apcu_fetch(array($latest_key, $read_key));
+    if (!isset($values[$latest_key])) {
+        return null;
+    }
+    $latest = $values[$latest_key];
+    $read = isset($values[$read_key]) ? $values[$read_key] : false;
+    $read_seq = ($read === false || $read > $latest) ? 0 : $read;
+
+    if ($latest <= $read_seq) {
+        return null;
+    }
+
+    $slot = apcu_fetch(relayShmKey('frame', $session_id, 'slot_' . $latest));
+    if ($slot === false) {
+        return null;  // Superseded meanwhile - the next receive gets the newer frame
+    }
+
+    $claimed = $read === false
+        ? apcu_add($read_key, $slot['seq'], RELAY_SHM_COUNTER_TTL)
+        : apcu_cas($read_key, $read, $slot['seq']);
+    if (!$claimed) {
+        return null;  // A concurrent receive took it
+    }
+
+    $slot['skipped'] = max(0, $slot['seq'] - $read_seq - 1);
+    return $slot;
+}
+
+/**
+ * Drop everything queued for $session_id (disconnect / terminate)
+ */
+function relayShmClear($session_id) {
+    if (relayStorageMethod() !== 'shm') {
+        return;
+    }
+
+    $latest_key = relayShmKey('frame', $session_id, 'latest');
+    $latest = apcu_fetch($latest_key);
+    $keys = array(
+        relayShmKey('frame', $session_id, 'head'),
+        relayShmKey('frame', $session_id, 'tail'),
+        $latest_key
+    );
+    if ($latest !== false) {
+        $keys[] = relayShmKey('frame', $session_id, 'slot_' . $latest);
+    }
+    foreach (RELAY_SHM_STREAMS as $stream) {
+        $keys[] = relayShmKey($stream, $session_id, 'head');
+        $keys[] = relayShmKey($stream, $session_id, 'tail');
+        for ($slot = 0; $slot < RELAY_SHM_CAPACITY; $slot++) {
+            $keys[] = relayShmKey($stream, $session_id, $slot);
+        }
+    }
+    apcu_delete($keys);
+}
+
+?>
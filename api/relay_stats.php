@@ -0,0 +1,180 @@
+<?php
+/**
+ * Relay Stats - incremental per-session / per-type traffic counters
+ *
+ * Every relay write adds its message count and payload bytes to a counter
+ * bucket (RELAY_STATS_BUCKET seconds wide) for the sending session and for
+ * the whole server, so status.php and diagnostic_dashboard.php read a fixed
+ * number of precomputed counters instead of aggregating relay_messages - and
+ * frames, which live in relay_frame_slots, are counted too.
+ *
+ * Counters live in APCu (apcu_inc, one key per scope/type/bucket, expiring
+ * after RELAY_STATS_WINDOW). Without APCu they are rollup rows in relay_stats
+ * (one upsert per request; the maintenance daemon reaps old buckets).
+ *
+ * Usage:
+ *   recordRelayStats($session_id, relayStatsCount($messages));   // after a successful store
+ *   $stats = relayStats(array($client_session_id, $admin_session_id));
+ *   $stats = relayStats();                                        // whole server
+ */
+
+require_once __DIR__ . '/../config.php';
+require_once __DIR__ . '/apcu.php';
+require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/relay_shm.php';
+
+define('RELAY_STATS_BUCKET', 10);   // Seconds per counter bucket
+define('RELAY_STATS_WINDOW', 300);  // Seconds of history kept and reported
+define('RELAY_STATS_TYPES', array('frame', 'input', 'cursor'));
+
+function relayStatsKey($scope, $type, $name) {
+    return 'sharefast_stats_' . ($scope === null ? 'all' : md5($scope)) . '_' . $type . '_' . $name;
+}
+
+/**
+ * Per-type totals of a list of messages (array('type' => ..., 'data' => string))
+ * in the form recordRelayStats() takes: type => array('count' => n, 'bytes' => n)
+ */
+function relayStatsCount($messages) {
+    $counts = array();
+    foreach ($messages as $message) {
+        $type = $message['type'];
+        if (!isset($counts[$type])) {
+            $counts[$type] = array('count' => 0, 'bytes' => 0);
+        }
+        $counts[$type]['count']++;
+        $counts[$type]['bytes'] += strlen($message['data']);
+    }
+    return $counts;
+}
+
+/**
+ * Add $counts (type => array('count', 'bytes')) sent by $session_id to the current bucket
+ */
+function recordRelayStats($session_id, $counts) {
+    $now = time();
+    $bucket = $now - $now % RELAY_STATS_BUCKET;
+
+    if (apcuAvailable()) {
+        $ttl = RELAY_STATS_WINDOW + RELAY_STATS_BUCKET;
+        foreach ($counts as $type => $count) {
+            foreach (array($session_id, null) as $scope) {
+                apcu_inc(relayStatsKey($scope, $type, $bucket . '_count'), $count['count'], $success, $ttl);
+                apcu_inc(relayStatsKey($scope, $type, $bucket . '_bytes'), $count['bytes'], $success, $ttl);
+                apcu_store(relayStatsKey($scope, $type, 'last'), $now, RELAY_STATS_WINDOW);
+            }
+        }
+        return;
+    }
+
+    if (relayStorageMethod() !== 'database' || empty($counts)) {
+        return;
+    }
+
+    $rows = array();
+    $params = array();
+    foreach ($counts as $type => $count) {
+        $rows[] = '(?, ?, ?, ?, ?, ?)';
+        array_push($params, $session_id, $type, $bucket, $count['count'], $count['bytes'], $now);
+    }
+    Database::execute("INSERT INTO relay_stats (session_id, message_type, bucket, messages, bytes, last_at) VALUES " . implode(', ', $rows) . "
+        ON DUPLICATE KEY UPDATE messages = messages + VALUES(messages), bytes = bytes + VALUES(bytes), last_at = VALUES(last_at)",
+        str_repeat('ssiiii', count($rows)), $params);
+}
+
+/**
+ * Traffic of the last RELAY_STATS_WINDOW seconds sent by $session_ids (all
+ * sessions if null): type => array('count', 'bytes', 'last_at', 'buckets'),
+ * where buckets maps each non-empty bucket's start time to array('count', 'bytes'),
+ * newest first
+ */
+function relayStats($session_ids = null) {
+    $now = time();
+    $oldest = $now - $now % RELAY_STATS_BUCKET - RELAY_STATS_WINDOW + RELAY_STATS_BUCKET;
+
+    $stats = array();
+    foreach (RELAY_STATS_TYPES as $type) {
+        $stats[$type] = array('count' => 0, 'bytes' => 0, 'last_at' => null, 'buckets' => array());
+    }
+
+    $add = function ($type, $bucket, $count, $bytes, $last_at) use (&$stats) {
+        if (!isset($stats[$type])) {
+            return;
+        }
+        $stats[$type]['count'] += $count;
+        $stats[$type]['bytes'] += $bytes;
+        if ($last_at !== null && $last_at > $stats[$type]['last_at']) {
+            $stats[$type]['last_at'] = $last_at;
+        }
+        if ($bucket !== null && $count > 0) {
+            $current = isset($stats[$type]['buckets'][$bucket]) ? $stats[$type]['buckets'][$bucket] : array('count' => 0, 'bytes' => 0);
+            $stats[$type]['buckets'][$bucket] = array('count' => $current['count'] + $count, 'bytes' => $current['bytes'] + $bytes);
+        }
+    };
+
+    if (apcuAvailable()) {
+        $scopes = $session_ids === null ? array(null) : array_filter((array)$session_ids);
+        $keys = array();
+        foreach ($scopes as $scope) {
+            foreach (RELAY_STATS_TYPES as $type) {
+                $keys[] = relayStatsKey($scope, $type, 'last');
+                for ($bucket = $oldest; $bucket <= $now; $bucket += RELAY_STATS_BUCKET) {
+                    $keys[] = relayStatsKey($scope, $type, $bucket . '_count');
+                    $keys[] = relayStatsKey($scope, $type, $bucket . '_bytes');
+                }
+            }
+        }
+        $values = empty($keys) ? array() : apcu_fetch($keys);
+
+        foreach ($scopes as $scope) {
+            foreach (RELAY_STATS_TYPES as $type) {
+                $last_key = relayStatsKey($scope, $type, 'last');
+                $add($type, null, 0, 0, isset($values[$last_key]) ? $values[$last_key] : null);
+                for ($bucket = $oldest; $bucket <= $now; $bucket += RELAY_STATS_BUCKET) {
+                    $count_key = relayStatsKey($scope, $type, $bucket . '_count');
+                    $bytes_key = relayStatsKey($scope, $type, $bucket . '_bytes');
+                    if (isset($values[$count_key])) {
+                        $add($type, $bucket, $values[$count_key], isset($values[$bytes_key]) ? $values[$bytes_key] : 0, null);
+                    }
+                }
+            }
+        }
+    } elseif (relayStorageMethod() === 'database') {
+        $where = 'bucket >= ?';
+        $types = 'i';
+        $params = array($oldest);
+        if ($session_ids !== null) {
+            $session_ids = array_values(array_filter((array)$session_ids));
+            if (empty($session_ids)) {
+                $session_ids = array('');
+            }
+            $where .= ' AND session_id IN (' . implode(', ', array_fill(0, count($session_ids), '?')) . ')';
+            $types .= str_repeat('s', count($session_ids));
+            $params = array_merge($params, $session_ids);
+        }
+        $rows = Database::fetchAll("SELECT message_type, bucket, SUM(messages) AS messages, SUM(bytes) AS bytes, MAX(last_at) AS last_at
+            FROM relay_stats WHERE $where GROUP BY message_type, bucket", $types, $params);
+        foreach ($rows as $row) {
+            $add($row['message_type'], intval($row['bucket']), intval($row['messages']), intval($row['bytes']), intval($row['last_at']));
+        }
+    }
+
+    foreach ($stats as $type => $stat) {
+        krsort($stats[$type]['buckets']);
+    }
+    return $stats;
+}
+
+/**
+ * Messages per second of one relayStats() entry over the time it was active in the window
+ */
+function relayStatsRate($stat) {
+    if ($stat['count'] === 0 || empty($stat['buckets'])) {
+        return 0.0;
+    }
+    $first = min(array_keys($stat['buckets']));
+    $span = max(RELAY_STATS_BUCKET, $stat['last_at'] - $first + 1);
+    return round($stat['count'] / $span, 2);
+}
+
+?>
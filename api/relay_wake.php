@@ -0,0 +1,93 @@
+<?php
+/**
+ * Relay Wake Signal - lets a long-polling `receive` sleep until data arrives
+ *
+ * Every relay write bumps a per-recipient counter; a waiting receive only
+ * re-queries relay_messages when that counter changes. The counter lives in
+ * APCu when available (a shared-memory read per check) and falls back to a
+ * tiny per-session file under STORAGE_PATH (page-cache read, no DB).
+ *
+ * Usage:
+ *   relayWake($peer_id);                                  // after storing data for $peer_id
+ *   $token = relayWakeToken($session_id);                 // before checking for data
+ *   relayWaitForWake($session_id, $token, $deadline);     // sleep until woken or deadline
+ */
+
+require_once __DIR__ . '/../config.php';
+require_once __DIR__ . '/apcu.php';
+
+// Long-poll configuration
+define('RELAY_LONG_POLL_MAX', 25);         // Max seconds a receive may wait (below proxy/LB timeouts)
+define('RELAY_WAKE_CHECK_MS', 20);         // How often a waiting request checks the wake counter
+define('RELAY_WAKE_TTL', 3600);            // Counter lifetime without writes
+define('RELAY_WAKE_STORAGE', STORAGE_PATH . 'relay_wake/');
+
+function relayWakeKey($session_id) {
+    return 'sharefast_relay_wake_' . $session_id;
+}
+
+function relayWakeFile($session_id) {
+    return RELAY_WAKE_STORAGE . md5($session_id);
+}
+
+/**
+ * Signal that new relay data is available for $session_id
+ */
+function relayWake($session_id) {
+    if (apcuAvailable()) {
+        $key = relayWakeKey($session_id);
+        // Older APCu versions don't create missing keys in apcu_inc()
+        if (apcu_inc($key, 1, $success, RELAY_WAKE_TTL) === false) {
+            apcu_add($key, 1, RELAY_WAKE_TTL);
+        }
+        return;
+    }
+
+    if (!is_dir(RELAY_WAKE_STORAGE)) {
+        @mkdir(RELAY_WAKE_STORAGE, 0755, true);
+    }
+    @file_put_contents(relayWakeFile($session_id), uniqid('', true), LOCK_EX);
+}
+
+/**
+ * Current wake token for $session_id (take it BEFORE looking for data, so a
+ * write between the check and the wait is not missed)
+ */
+function relayWakeToken($session_id) {
+    if (apcuAvailable()) {
+        $value = apcu_fetch(relayWakeKey($session_id));
+        return $value === false ? 0 : $value;
+    }
+
+    $value = @file_get_contents(relayWakeFile($session_id));
+    return $value === false ? '' : $value;
+}
+
+/**
+ * Sleep until the wake token changes or $deadline (microtime) passes.
+ * Returns true if woken, false on timeout.
+ */
+function relayWaitForWake($session_id, $token, $deadline) {
+    $check_us = RELAY_WAKE_CHECK_MS * 1000;
+
+    while (microtime(true) < $deadline) {
+        usleep($check_us);
+        if (relayWakeToken($session_id) !== $token) {
+            return true;
+        }
+    }
+
+    return false;
+}
+
+/**
+ * Requested long-poll timeout in seconds from the `wait` field (0 = plain receive)
+ */
+function relayLongPollTimeout($input) {
+    if (!isset($input['wait']) || !is_numeric($input['wait'])) {
+        return 0.0;
+    }
+    return max(0.0, min((float)$input['wait'], RELAY_LONG_POLL_MAX));
+}
+
+?>
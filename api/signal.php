@@ -17,80 +17,37 @@ if ($_SERVER['REQUEST_METHOD'] === 'OPTIONS') {
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/peer_lookup.php';
+require_once __DIR__ . '/rate_limit.php';
+require_once __DIR__ . '/relay_shm.php';
+require_once __DIR__ . '/signal_queue.php';
 
 function storeSignal($session_id, $code, $signal_type, $data) {
-    if (STORAGE_METHOD === 'database') {
-        $escaped_session_id = Database::escape($session_id);
-        $escaped_code = Database::escape($code);
-        $escaped_type = Database::escape($signal_type);
-        $escaped_data = Database::escape(json_encode($data));
-        $timestamp = time();
-        
+    if (relayStorageMethod() === 'database') {
         // Find peer session
         // IMPORTANT: When admin sends signal, we need to find the CLIENT's session_id (peer_id)
-        // So we should query by admin's session_id first, then fallback to code
-        $peer_sql = "SELECT peer_id FROM sessions WHERE session_id = '$escaped_session_id' AND peer_id IS NOT NULL LIMIT 1";
-        $peer_result = Database::query($peer_sql);
-        
-        $peer_id = null;
-        if ($peer_result && $peer_result->num_rows > 0) {
-            $peer_row = $peer_result->fetch_assoc();
-            $peer_id = $peer_row['peer_id'];
-            error_log("storeSignal: Found peer_id=$peer_id for session_id=$session_id");
-        } else {
-            // Fallback: try by code (but this might match wrong session)
-            $peer_sql = "SELECT peer_id FROM sessions WHERE code = '$escaped_code' AND peer_id IS NOT NULL LIMIT 1";
-            $peer_result = Database::query($peer_sql);
-            if ($peer_result && $peer_result->num_rows > 0) {
-                $peer_row = $peer_result->fetch_assoc();
-                $peer_id = $peer_row['peer_id'];
-                error_log("storeSignal: Found peer_id=$peer_id by code=$code (fallback)");
-            }
-        }
+        // So we look up by admin's session_id first, then fall back to code (peer_lookup.php, cached)
+        $peer_id = resolvePeerId($session_id, $code);
         
         // Store signal for peer to retrieve
         if ($peer_id) {
-            $escaped_peer_id = Database::escape($peer_id);
             error_log("storeSignal: Storing signal type=$signal_type for peer_id=$peer_id (original session_id=$session_id, code=$code)");
-            $insert_sql = "INSERT INTO signals (session_id, code, signal_type, signal_data, created_at) 
-                          VALUES ('$escaped_peer_id', '$escaped_code', '$escaped_type', '$escaped_data', $timestamp)";
-            $insert_result = Database::query($insert_sql);
-            if (!$insert_result) {
-                error_log("storeSignal: INSERT failed: " . Database::getConnection()->error);
+            // Bounded per-session queue, trimmed every SIGNAL_TRIM_EVERY signals (signal_queue.php)
+            if (!enqueueSignal($peer_id, $code, $signal_type, json_encode($data))) {
+                error_log("storeSignal: INSERT failed for peer_id=$peer_id");
             } else {
                 error_log("storeSignal: Signal stored successfully");
             }
             
-            // Clean up old signals (keep only last 100 per session)
-            $cleanup_sql = "DELETE FROM signals WHERE session_id = '$escaped_peer_id' AND id NOT IN 
-                           (SELECT id FROM (SELECT id FROM signals WHERE session_id = '$escaped_peer_id' ORDER BY created_at DESC LIMIT 100) AS temp)";
-            Database::query($cleanup_sql);
-            
             return true;
         } else {
             error_log("storeSignal: No peer_id found for session_id=$session_id, code=$code");
         }
         
         return false;
-    } elseif (STORAGE_METHOD === 'file') {
-        // Find peer session
-        $peer_id = null;
-        $session_file = STORAGE_PATH . $code . '.json';
-        if (file_exists($session_file)) {
-            $session = json_decode(file_get_contents($session_file), true);
-            if (isset($session['peer_id'])) {
-                $peer_id = $session['peer_id'];
-            }
-        }
-        
-        // Also check by session_id
-        $session_file = STORAGE_PATH . $session_id . '.json';
-        if (file_exists($session_file)) {
-            $session = json_decode(file_get_contents($session_file), true);
-            if (isset($session['peer_id']) && !$peer_id) {
-                $peer_id = $session['peer_id'];
-            }
-        }
+    } elseif (relayStorageMethod() === 'file') {
+        // Find peer session (by session_id first, then code - same order as database storage)
+        $peer_id = resolvePeerId($session_id, $code);
         
         // Store signal for peer to retrieve
         if ($peer_id) {
@@ -115,6 +72,15 @@ function storeSignal($session_id, $code, $signal_type, $data) {
         }
         
         return true;
+    } elseif (relayStorageMethod() === 'shm') {
+        $peer_id = resolvePeerId($session_id, $code);
+        if (!$peer_id) {
+            error_log("storeSignal: No peer_id found for session_id=$session_id, code=$code");
+            return false;
+        }
+        
+        // Bounded ring - the oldest signals are overwritten, no cleanup needed
+        return relayShmPush('signal', $peer_id, array(array('type' => $signal_type, 'data' => $data, 'timestamp' => time())));
     }
     
     return false;
@@ -134,6 +100,11 @@ $code = strtolower($code);  // Ensure code is lowercase to match database storag
 $signal_type = $input['type'];
 $data = $input['data'];
 
+// Enforce rate limiting (prevents abuse) - signalling budget, per session and per IP
+if (!enforceRateLimit('signal', $session_id)) {
+    exit;
+}
+
     // Allow WebRTC signals and custom signals like admin_connected
     $allowed_types = ['offer', 'answer', 'ice-candidate', 'admin_connected', 'admin_disconnected', 'client_ready', 'peer_info', 'p2p_connect_request', 'p2p_ready', 'clipboard_paste_request', 'clipboard_paste_approved', 'clipboard_paste_rejected'];
 if (!in_array($signal_type, $allowed_types)) {
@@ -0,0 +1,57 @@
+<?php
+/**
+ * Signal Queue - bounded per-session signal storage (database storage)
+ *
+ * Every recipient's signals carry a per-session sequence number (signals.seq),
+ * handed out by an upsert on its signal_queues row. The queue is capped by
+ * sequence rather than by sorting: only every SIGNAL_TRIM_EVERY-th signal
+ * deletes what fell more than SIGNAL_QUEUE_CAP sequence numbers behind - one
+ * range on idx_signals_session_seq, no subquery, no sort. A queue therefore
+ * holds at most SIGNAL_QUEUE_CAP + SIGNAL_TRIM_EVERY - 1 signals, and a burst
+ * of ICE candidates costs two point writes each instead of a DELETE apiece.
+ *
+ * Usage:
+ *   enqueueSignal($peer_id, $code, $signal_type, json_encode($data));   // after resolving the peer
+ */
+
+require_once __DIR__ . '/../config.php';
+require_once __DIR__ . '/../database.php';
+
+define('SIGNAL_QUEUE_CAP', 100);   // Newest signals kept per session
+define('SIGNAL_TRIM_EVERY', 20);   // Trim on every Nth signal of a session
+
+/**
+ * Next sequence number of $session_id's queue (1 for a new queue), or false on error
+ */
+function nextSignalSeq($session_id) {
+    // LAST_INSERT_ID(expr) hands the new value back through insert_id in both branches
+    $result = Database::execute("INSERT INTO signal_queues (session_id, last_seq) VALUES (?, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE last_seq = LAST_INSERT_ID(last_seq + 1)",
+        's', array($session_id));
+    return $result === false ? false : (int)Database::insertId();
+}
+
+/**
+ * Store one signal for $session_id, trimming its queue every SIGNAL_TRIM_EVERY signals
+ */
+function enqueueSignal($session_id, $code, $signal_type, $signal_json) {
+    $seq = nextSignalSeq($session_id);
+    if ($seq === false) {
+        return false;
+    }
+
+    $result = Database::execute("INSERT INTO signals (session_id, seq, code, signal_type, signal_data, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        'sisssi', array($session_id, $seq, $code, $signal_type, $signal_json, time()));
+    if ($result === false) {
+        return false;
+    }
+
+    if ($seq % SIGNAL_TRIM_EVERY === 0 && $seq > SIGNAL_QUEUE_CAP) {
+        Database::execute("DELETE FROM signals WHERE session_id = ? AND seq <= ?",
+            'si', array($session_id, $seq - SIGNAL_QUEUE_CAP));
+    }
+
+    return true;
+}
+
+?>
@@ -7,6 +7,7 @@
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/relay_stats.php';
 
 header('Content-Type: application/json');
 header('Access-Control-Allow-Origin: *');
@@ -86,15 +87,14 @@ foreach ($status['sessions'] as $session) {
 }
 $status['linked_pairs'] = array_values(array_unique($linked_sessions, SORT_REGULAR));
 
-// Get recent relay messages (last 100)
-$relay_sql = "SELECT id, session_id, message_type, LENGTH(message_data) as data_size, 
+// Get recent unread relay messages (from the last 100)
+$relay_sql = "SELECT id, session_id, message_type, (LENGTH(message_data) + COALESCE(LENGTH(message_blob), 0)) as data_size, 
               created_at, read_at 
               FROM relay_messages 
               ORDER BY created_at DESC 
               LIMIT 100";
 $relay_result = Database::query($relay_sql);
 
-$message_stats = array('frame' => 0, 'input' => 0, 'total' => 0, 'total_bytes' => 0);
 $recent_messages = array();
 
 if ($relay_result && $relay_result->num_rows > 0) {
@@ -102,10 +102,6 @@ if ($relay_result && $relay_result->num_rows > 0) {
         $msg_type = $row['message_type'];
         $data_size = intval($row['data_size']);
         
-        $message_stats[$msg_type] = isset($message_stats[$msg_type]) ? $message_stats[$msg_type] + 1 : 1;
-        $message_stats['total']++;
-        $message_stats['total_bytes'] += $data_size;
-        
         $message = array(
             'id' => intval($row['id']),
             'session_id' => $row['session_id'],
@@ -126,29 +122,30 @@ if ($relay_result && $relay_result->num_rows > 0) {
     }
 }
 
+// Traffic of the last 5 minutes by type - incremental counters (relay_stats.php),
+// which also cover frames (relay_frame_slots keeps only the newest one)
+$message_stats = array('frame' => 0, 'input' => 0, 'total' => 0, 'total_bytes' => 0);
+$by_type = array();
+foreach (relayStats() as $msg_type => $stats) {
+    if ($stats['count'] === 0) {
+        continue;
+    }
+    $message_stats[$msg_type] = $stats['count'];
+    $message_stats['total'] += $stats['count'];
+    $message_stats['total_bytes'] += $stats['bytes'];
+    $by_type[$msg_type] = array(
+        'count' => $stats['count'],
+        'total_bytes' => $stats['bytes'],
+        'total_bytes_formatted' => format_bytes($stats['bytes'])
+    );
+}
+
 $status['relay_messages'] = array(
     'recent_unread' => array_slice($recent_messages, 0, 20), // Last 20 unread
-    'statistics' => $message_stats
+    'statistics' => $message_stats,
+    'by_type_last_5min' => $by_type
 );
 
-// Get messages by type summary
-$type_summary_sql = "SELECT message_type, COUNT(*) as count, SUM(LENGTH(message_data)) as total_bytes 
-                     FROM relay_messages 
-                     WHERE created_at > " . ($current_time - 300) . " 
-                     GROUP BY message_type";
-$type_summary_result = Database::query($type_summary_sql);
-
-$status['relay_messages']['by_type_last_5min'] = array();
-if ($type_summary_result && $type_summary_result->num_rows > 0) {
-    while ($row = $type_summary_result->fetch_assoc()) {
-        $status['relay_messages']['by_type_last_5min'][$row['message_type']] = array(
-            'count' => intval($row['count']),
-            'total_bytes' => intval($row['total_bytes']),
-            'total_bytes_formatted' => format_bytes(intval($row['total_bytes']))
-        );
-    }
-}
-
 // Overall statistics
 $status['statistics'] = array(
     'total_sessions' => count($status['sessions']),
@@ -248,11 +245,11 @@ if ($format === 'html') {
                     </div>
                     <div class="stat-card">
                         <div class="stat-value"><?php echo $status['statistics']['frames_sent']; ?></div>
-                        <div class="stat-label">Frames Sent</div>
+                        <div class="stat-label">Frames Sent (5 min)</div>
                     </div>
                     <div class="stat-card">
                         <div class="stat-value"><?php echo $status['statistics']['total_relay_bytes_formatted']; ?></div>
-                        <div class="stat-label">Total Data Relayed</div>
+                        <div class="stat-label">Data Relayed (5 min)</div>
                     </div>
                 </div>
             </div>
@@ -17,6 +17,8 @@ if ($_SERVER['REQUEST_METHOD'] === 'OPTIONS') {
 
 require_once __DIR__ . '/../config.php';
 require_once __DIR__ . '/../database.php';
+require_once __DIR__ . '/peer_lookup.php';
+require_once __DIR__ . '/relay_shm.php';
 
 $code = isset($_POST['code']) ? $_POST['code'] : (isset($_GET['code']) ? $_GET['code'] : null);
 
@@ -37,8 +39,10 @@ try {
     $session_result = Database::query($session_sql);
     
     $session_ids = [];
+    $raw_session_ids = [];
     if ($session_result && $session_result->num_rows > 0) {
         while ($row = $session_result->fetch_assoc()) {
+            $raw_session_ids[] = $row['session_id'];
             $session_ids[] = Database::escape($row['session_id']);
         }
     }
@@ -81,14 +85,20 @@ try {
     // Delete relay messages (frames, inputs, cursor positions)
     $delete_relay_sql = "DELETE FROM relay_messages WHERE session_id IN ($session_ids_str)";
     Database::query($delete_relay_sql);
+    Database::query("DELETE FROM relay_frame_slots WHERE session_id IN ($session_ids_str)");
     
     // Delete signals
     $delete_signals_sql = "DELETE FROM signals WHERE session_id IN ($session_ids_str) OR code = '$escaped_code'";
     Database::query($delete_signals_sql);
+    Database::query("DELETE FROM signal_queues WHERE session_id IN ($session_ids_str)");
     
     // Delete sessions
     $delete_sessions_sql = "DELETE FROM sessions WHERE code = '$escaped_code'";
     Database::query($delete_sessions_sql);
+    invalidatePeerCache($raw_session_ids, $code);
+    foreach ($raw_session_ids as $raw_session_id) {
+        relayShmClear($raw_session_id);
+    }
     
     echo json_encode([
         'success' => true,
@@ -99,7 +99,7 @@ $escaped_code = Database::escape($code);
 $frame_sql = "SELECT COUNT(*) as count, 
               MAX(created_at) as last_frame,
               MIN(created_at) as first_frame,
-              AVG(LENGTH(message_data)) as avg_size
+              AVG(LENGTH(message_data) + COALESCE(LENGTH(message_blob), 0)) as avg_size
               FROM relay_messages 
               WHERE message_type = 'frame' 
               AND session_id IN (
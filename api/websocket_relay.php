@@ -93,6 +93,8 @@ function encodeWebSocketFrame($data) {
 if (isset($_SERVER['HTTP_UPGRADE']) && strtolower($_SERVER['HTTP_UPGRADE']) == 'websocket') {
     require_once __DIR__ . '/../config.php';
     require_once __DIR__ . '/../database.php';
+    require_once __DIR__ . '/peer_lookup.php';
+    require_once __DIR__ . '/relay_log.php';
     
     // Handle WebSocket upgrade
     handleWebSocketUpgrade();
@@ -107,14 +109,7 @@ if (isset($_SERVER['HTTP_UPGRADE']) && strtolower($_SERVER['HTTP_UPGRADE']) == '
     // Get peer_id
     $peer_id = null;
     if ($session_id && $code) {
-        $escaped_session_id = Database::escape($session_id);
-        $escaped_code = Database::escape($code);
-        $sql = "SELECT peer_id FROM sessions WHERE (session_id = '$escaped_session_id' OR code = '$escaped_code') AND peer_id IS NOT NULL LIMIT 1";
-        $result = Database::query($sql);
-        if ($result && $result->num_rows > 0) {
-            $row = $result->fetch_assoc();
-            $peer_id = $row['peer_id'];
-        }
+        $peer_id = resolvePeerId($session_id, $code);
     }
     
     if (!$peer_id) {
@@ -124,9 +119,6 @@ if (isset($_SERVER['HTTP_UPGRADE']) && strtolower($_SERVER['HTTP_UPGRADE']) == '
         exit;
     }
     
-    // Define relay file path
-    define('RELAY_STORAGE_PATH', __DIR__ . '/../storage/relay/');
-    
     // WebSocket message loop
     $socket = fopen('php://input', 'r');
     stream_set_blocking($socket, false);
@@ -144,14 +136,12 @@ if (isset($_SERVER['HTTP_UPGRADE']) && strtolower($_SERVER['HTTP_UPGRADE']) == '
                 
                 if ($message && isset($message['type'])) {
                     if ($message['type'] == 'send_frame' || $message['type'] == 'send_input') {
-                        // Store relay data
-                        $relay_file = RELAY_STORAGE_PATH . $peer_id . '_relay.json';
-                        $relay_message = json_encode([
+                        // Store relay data (same segmented log as relay_hybrid.php)
+                        appendRelayLog($peer_id, [
                             'type' => $message['type'] == 'send_frame' ? 'frame' : 'input',
                             'data' => $message['data'],
                             'timestamp' => time()
-                        ]) . "\n";
-                        file_put_contents($relay_file, $relay_message, FILE_APPEND | LOCK_EX);
+                        ]);
                         
                         // Send acknowledgment
                         $ack = json_encode(['type' => 'ack', 'success' => true]);
@@ -166,34 +156,18 @@ if (isset($_SERVER['HTTP_UPGRADE']) && strtolower($_SERVER['HTTP_UPGRADE']) == '
         
         // Send available frames (for admin mode)
         if ($mode == 'admin') {
-            $relay_file = RELAY_STORAGE_PATH . $session_id . '_relay.json';
-            if (!file_exists($relay_file)) {
-                $relay_file = RELAY_STORAGE_PATH . $peer_id . '_relay.json';
-            }
+            $stream_id = relayLogExists($session_id) ? $session_id : $peer_id;
             
-            if (file_exists($relay_file)) {
-                // Read and clear frames atomically
-                $temp_file = $relay_file . '.tmp.' . time() . '.' . rand(1000, 9999);
-                $rename_success = @rename($relay_file, $temp_file);
-                
-                if ($rename_success && file_exists($temp_file)) {
-                    $lines = file($temp_file, FILE_IGNORE_NEW_LINES | FILE_SKIP_EMPTY_LINES);
-                    @unlink($temp_file);
-                    
-                    if ($lines) {
-                        foreach ($lines as $line) {
-                            $decoded = json_decode($line, true);
-                            if ($decoded && isset($decoded['type'])) {
-                                // Send frame via WebSocket
-                                $ws_message = json_encode([
-                                    'type' => $decoded['type'],
-                                    'data' => $decoded['data']
-                                ]);
-                                echo encodeWebSocketFrame($ws_message);
-                                flush();
-                            }
-                        }
-                    }
+            // Only records written since the last pass (relay_log.php cursor)
+            foreach (readRelayLog($stream_id) as $decoded) {
+                if (isset($decoded['type'])) {
+                    // Send frame via WebSocket
+                    $ws_message = json_encode([
+                        'type' => $decoded['type'],
+                        'data' => $decoded['data']
+                    ]);
+                    echo encodeWebSocketFrame($ws_message);
+                    flush();
                 }
             }
         }
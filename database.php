@@ -2,34 +2,57 @@
 /**
  * Database Helper Functions
  * Provides MySQL database connection and helper functions
+ *
+ * Hot paths should prefer the prepared helpers - each distinct SQL string is
+ * prepared once per connection and reused:
+ *   $row  = Database::fetchOne("SELECT peer_id FROM sessions WHERE session_id = ?", 's', array($session_id));
+ *   $rows = Database::fetchAll($sql, 'si', array($session_id, $limit));
+ *   $n    = Database::execute($sql, 'ssi', array($a, $b, $c));
  */
 
 require_once __DIR__ . '/config.php';
+require_once __DIR__ . '/api/apcu.php';
 
 class Database {
     private static $connection = null;
+    private static $needs_check = false;   // Set after a connection-level error; next getConnection() pings
+    private static $statements = array();  // SQL text => mysqli_stmt, for the current connection
+    private static $profile = null;        // Request profile while the profiler is on (see startProfiling())
+    
+    const STATEMENT_CACHE_SIZE = 64;
+    const CONNECTION_LOST_ERRORS = array(2006, 2013);  // CR_SERVER_GONE_ERROR, CR_SERVER_LOST
+    const PROFILE_SLOW_SAMPLES = 10;                    // Slow queries kept per endpoint
+    const PROFILE_APCU_PREFIX = 'sharefast_profile_';
+    const PROFILE_TRACE_MAX_BYTES = 10485760;          // Trace file is rotated to <file>.1 at this size
     
     /**
-     * Get database connection with connection pooling
-     * OPTIMIZED: Reuses existing connection and checks if it's still alive
-     * This eliminates connection overhead (saves 50-200ms per request)
+     * Get database connection
+     * OPTIMIZED: Persistent connection (p: host prefix, unless DB_PERSISTENT is false), so
+     * most requests skip the TCP/auth handshake entirely. The connection is trusted until a
+     * query fails with a lost-connection error - only then is it pinged (and reopened if dead),
+     * instead of pinging on every call.
      */
     public static function getConnection() {
-        // Check if connection exists and is still alive
         if (self::$connection !== null) {
-            // Use ping() to check if connection is still valid (much faster than reconnect)
-            // ping() returns true if connection is alive, false if dead
+            if (!self::$needs_check) {
+                return self::$connection;
+            }
+            
+            self::$needs_check = false;
             if (self::$connection->ping()) {
                 return self::$connection;
-            } else {
-                // Connection is dead, close it and reconnect
-                self::$connection->close();
-                self::$connection = null;
             }
+            
+            // Connection is dead, close it and reconnect
+            self::close();
         }
         
         // Create new connection (only when needed)
         try {
+            // Callers check return values rather than catching mysqli exceptions (PHP 8.1+ default)
+            mysqli_report(MYSQLI_REPORT_OFF);
+            $connect_started = microtime(true);
+            
             // OPTIMIZED: Create mysqli object first, then set options before connecting
             self::$connection = mysqli_init();
             
@@ -37,9 +60,11 @@ class Database {
             // Must be set before connect()
             self::$connection->options(MYSQLI_OPT_CONNECT_TIMEOUT, 5);
             
+            $persistent = !defined('DB_PERSISTENT') || DB_PERSISTENT;
+            
             // Connect to database
             self::$connection->real_connect(
-                DB_HOST, 
+                ($persistent ? 'p:' : '') . DB_HOST, 
                 DB_USER, 
                 DB_PASS, 
                 DB_NAME,
@@ -50,11 +75,13 @@ class Database {
             
             if (self::$connection->connect_error) {
                 error_log("Database connection failed: " . self::$connection->connect_error);
+                self::$connection = null;
                 return null;
             }
             
             // OPTIMIZED: Set charset for better performance
             self::$connection->set_charset("utf8mb4");
+            self::span('connect', $connect_started);
             
         } catch (Exception $e) {
             error_log("Database connection error: " . $e->getMessage());
@@ -65,11 +92,141 @@ class Database {
         return self::$connection;
     }
     
+    /**
+     * Flag the connection for a liveness check if $errno means it was lost
+     */
+    private static function noteError($errno) {
+        if (in_array($errno, self::CONNECTION_LOST_ERRORS, true)) {
+            self::$needs_check = true;
+        }
+    }
+    
+    /**
+     * Prepared statement for $sql, prepared once per connection and reused.
+     * Do not close() the returned statement - the cache owns it.
+     */
+    public static function prepare($sql) {
+        $conn = self::getConnection();
+        if ($conn === null) {
+            return false;
+        }
+        
+        if (isset(self::$statements[$sql])) {
+            return self::$statements[$sql];
+        }
+        
+        $stmt = $conn->prepare($sql);
+        if (!$stmt) {
+            self::noteError($conn->errno);
+            error_log("Database prepare error: " . $conn->error . " | SQL: " . substr($sql, 0, 200));
+            return false;
+        }
+        
+        // Evict the oldest statement once the cache is full
+        if (count(self::$statements) >= self::STATEMENT_CACHE_SIZE) {
+            reset(self::$statements);
+            $oldest = key(self::$statements);
+            self::$statements[$oldest]->close();
+            unset(self::$statements[$oldest]);
+        }
+        
+        self::$statements[$sql] = $stmt;
+        return $stmt;
+    }
+    
+    /**
+     * Bind $params (bind_param() $types, e.g. 'ssi') to the cached statement for $sql and run it.
+     * Returns the statement, or false on error.
+     */
+    private static function run($sql, $types, $params) {
+        $stmt = self::prepare($sql);
+        if (!$stmt) {
+            return false;
+        }
+        
+        if ($types !== '' && !$stmt->bind_param($types, ...$params)) {
+            error_log("Database bind error: " . $stmt->error . " | SQL: " . substr($sql, 0, 200));
+            return false;
+        }
+        
+        $started = self::$profile !== null ? microtime(true) : 0;
+        $executed = $stmt->execute();
+        if ($started) {
+            self::recordQuery($sql, $started);
+        }
+        
+        if (!$executed) {
+            self::noteError($stmt->errno);
+            error_log("Database execute error: " . $stmt->error . " | SQL: " . substr($sql, 0, 200));
+            if (self::$needs_check) {
+                // The statement died with its connection
+                unset(self::$statements[$sql]);
+            }
+            return false;
+        }
+        
+        return $stmt;
+    }
+    
+    /**
+     * Run a write statement. Returns the number of affected rows, or false on error.
+     *
+     *   Database::execute("UPDATE sessions SET peer_id = ? WHERE session_id = ?", 'ss', array($peer_id, $session_id));
+     */
+    public static function execute($sql, $types = '', $params = array()) {
+        $stmt = self::run($sql, $types, $params);
+        return $stmt ? $stmt->affected_rows : false;
+    }
+    
+    /**
+     * First row of a query as an associative array, or null if there is none (or on error)
+     */
+    public static function fetchOne($sql, $types = '', $params = array()) {
+        $stmt = self::run($sql, $types, $params);
+        if (!$stmt) {
+            return null;
+        }
+        
+        $result = $stmt->get_result();
+        $row = $result ? $result->fetch_assoc() : null;
+        if ($result) {
+            $result->free();
+        }
+        return $row ?: null;
+    }
+    
+    /**
+     * All rows of a query as a list of associative arrays (empty on error)
+     */
+    public static function fetchAll($sql, $types = '', $params = array()) {
+        $stmt = self::run($sql, $types, $params);
+        if (!$stmt) {
+            return array();
+        }
+        
+        $rows = array();
+        $result = $stmt->get_result();
+        if ($result) {
+            while ($row = $result->fetch_assoc()) {
+                $rows[] = $row;
+            }
+            $result->free();
+        }
+        return $rows;
+    }
+    
     public static function close() {
+        foreach (self::$statements as $stmt) {
+            @$stmt->close();
+        }
+        self::$statements = array();
+        
         if (self::$connection !== null) {
-            self::$connection->close();
+            // A persistent connection goes back to the pool rather than closing
+            @self::$connection->close();
             self::$connection = null;
         }
+        self::$needs_check = false;
     }
     
     public static function escape($value) {
@@ -88,8 +245,14 @@ class Database {
         
         // OPTIMIZATION: Use unbuffered queries for large result sets (relay messages)
         // This reduces memory usage and improves performance
+        $started = self::$profile !== null ? microtime(true) : 0;
         $result = $conn->query($sql);
+        if ($started) {
+            self::recordQuery($sql, $started);
+        }
+        
         if (!$result) {
+            self::noteError($conn->errno);
             // Only log errors (not warnings) to reduce overhead
             error_log("Database query error: " . $conn->error . " | SQL: " . substr($sql, 0, 200));
             return false;
@@ -113,6 +276,255 @@ class Database {
         }
         return $conn->affected_rows;
     }
+    
+    /*
+     * Request profiler
+     *
+     * Off unless PROFILER_ENABLED is set in config.php; while off, the only cost
+     * per query is one null check. While on, every query is counted and timed,
+     * endpoints can add named spans (span()), and the request gets:
+     *   - a Server-Timing header (connect, db, custom spans, total)
+     *   - a JSON trace line in PROFILER_TRACE_FILE if PROFILER_TRACE is set, or if
+     *     the client sent "X-Profile-Trace: 1" and PROFILER_TRACE_HEADER allows it
+     *     (the file is rotated once it reaches PROFILER_TRACE_MAX_BYTES)
+     *   - its totals added to per-endpoint counters in APCu (or a stats file
+     *     without APCu), which diagnostic_dashboard.php reads via profileStats()
+     */
+    
+    public static function startProfiling($endpoint) {
+        if (self::$profile !== null) {
+            return;
+        }
+        
+        self::$profile = array(
+            'endpoint' => $endpoint,
+            'start' => isset($_SERVER['REQUEST_TIME_FLOAT']) ? $_SERVER['REQUEST_TIME_FLOAT'] : microtime(true),
+            'queries' => 0,
+            'db_ms' => 0.0,
+            'spans' => array(),
+            'slow' => array(),
+            'trace' => (defined('PROFILER_TRACE') && PROFILER_TRACE)
+                || (defined('PROFILER_TRACE_HEADER') && PROFILER_TRACE_HEADER
+                    && isset($_SERVER['HTTP_X_PROFILE_TRACE']) && $_SERVER['HTTP_X_PROFILE_TRACE'] === '1'),
+            'log' => array()
+        );
+        
+        // Headers go out with the first byte of output - add Server-Timing just before
+        header_register_callback(array('Database', 'sendServerTiming'));
+        register_shutdown_function(array('Database', 'finishProfiling'));
+    }
+    
+    /**
+     * Report this request under a more specific endpoint name (e.g. 'relay.receive')
+     */
+    public static function profileEndpoint($endpoint) {
+        if (self::$profile !== null) {
+            self::$profile['endpoint'] = $endpoint;
+        }
+    }
+    
+    /**
+     * Add the time since $started (microtime(true)) to span $name
+     */
+    public static function span($name, $started) {
+        if (self::$profile === null) {
+            return;
+        }
+        $ms = (microtime(true) - $started) * 1000;
+        $spans = &self::$profile['spans'];
+        $spans[$name] = (isset($spans[$name]) ? $spans[$name] : 0) + $ms;
+    }
+    
+    /**
+     * SQL with literals replaced by ? so samples of the same query group together
+     */
+    public static function normalizeSql($sql) {
+        $sql = preg_replace("/'(?:[^'\\\\]|\\\\.)*'/s", '?', $sql);
+        $sql = preg_replace('/\b\d+(?:\.\d+)?\b/', '?', $sql);
+        $sql = preg_replace('/\s+/', ' ', $sql);
+        $sql = preg_replace('/\(\s*\?(?:\s*,\s*\?)+\s*\)/', '(?+)', $sql);
+        return substr(trim($sql), 0, 300);
+    }
+    
+    private static function recordQuery($sql, $started) {
+        $ms = (microtime(true) - $started) * 1000;
+        self::$profile['queries']++;
+        self::$profile['db_ms'] += $ms;
+        
+        $slow = $ms >= (defined('PROFILER_SLOW_MS') ? PROFILER_SLOW_MS : 50);
+        if ($slow || self::$profile['trace']) {
+            $entry = array('sql' => self::normalizeSql($sql), 'ms' => round($ms, 2));
+            if ($slow) {
+                self::$profile['slow'][] = $entry;
+            }
+            if (self::$profile['trace']) {
+                self::$profile['log'][] = $entry;
+            }
+        }
+    }
+    
+    /**
+     * header_register_callback() hook - do not call directly
+     */
+    public static function sendServerTiming() {
+        if (self::$profile === null) {
+            return;
+        }
+        
+        $profile = self::$profile;
+        $metrics = array();
+        foreach ($profile['spans'] as $name => $ms) {
+            $metrics[] = $name . ';dur=' . round($ms, 1);
+        }
+        $metrics[] = 'db;dur=' . round($profile['db_ms'], 1) . ';desc="' . $profile['queries'] . ' queries"';
+        $metrics[] = 'total;dur=' . round((microtime(true) - $profile['start']) * 1000, 1);
+        
+        header('Server-Timing: ' . implode(', ', $metrics));
+    }
+    
+    /**
+     * Shutdown hook - writes the trace line and adds the request to the endpoint totals
+     */
+    public static function finishProfiling() {
+        if (self::$profile === null) {
+            return;
+        }
+        
+        $profile = self::$profile;
+        self::$profile = null;  // Queries from here on are not part of the request
+        $total_ms = (microtime(true) - $profile['start']) * 1000;
+        
+        if ($profile['trace']) {
+            $trace = array(
+                'endpoint' => $profile['endpoint'],
+                'at' => round($profile['start'], 3),
+                'total_ms' => round($total_ms, 2),
+                'db_ms' => round($profile['db_ms'], 2),
+                'queries' => $profile['log'],
+                'spans' => array_map(function ($ms) { return round($ms, 2); }, $profile['spans'])
+            );
+            $trace_file = defined('PROFILER_TRACE_FILE') ? PROFILER_TRACE_FILE : STORAGE_PATH . 'profile_trace.jsonl';
+            $max_bytes = defined('PROFILER_TRACE_MAX_BYTES') ? PROFILER_TRACE_MAX_BYTES : self::PROFILE_TRACE_MAX_BYTES;
+            if (@filesize($trace_file) >= $max_bytes) {
+                // Keep one previous file - the trace never takes more than twice the limit
+                @rename($trace_file, $trace_file . '.1');
+            }
+            @file_put_contents($trace_file, json_encode($trace) . "\n", FILE_APPEND | LOCK_EX);
+        }
+        
+        // Counters are integers: times in microseconds
+        $counts = array(
+            'requests' => 1,
+            'total_us' => (int)($total_ms * 1000),
+            'db_us' => (int)($profile['db_ms'] * 1000),
+            'queries' => $profile['queries'],
+            'slow_queries' => count($profile['slow'])
+        );
+        self::storeProfile($profile['endpoint'], $counts, $profile['slow']);
+    }
+    
+    private static function profileStatsFile() {
+        return STORAGE_PATH . 'profile_stats.json';
+    }
+    
+    private static function storeProfile($endpoint, $counts, $slow) {
+        if (apcuAvailable()) {
+            $prefix = self::PROFILE_APCU_PREFIX . md5($endpoint) . '_';
+            foreach ($counts as $name => $value) {
+                if ($value > 0 && apcu_inc($prefix . $name, $value) === false) {
+                    apcu_add($prefix . $name, $value);
+                }
+            }
+            
+            $endpoints = apcu_fetch(self::PROFILE_APCU_PREFIX . 'endpoints');
+            if (!is_array($endpoints) || !isset($endpoints[$endpoint])) {
+                $endpoints = is_array($endpoints) ? $endpoints : array();
+                $endpoints[$endpoint] = time();
+                apcu_store(self::PROFILE_APCU_PREFIX . 'endpoints', $endpoints);
+            }
+            
+            if ($slow) {
+                // Read-modify-write: a concurrent sample may be lost, which is fine for samples
+                $samples = apcu_fetch($prefix . 'slow_samples') ?: array();
+                $samples = self::mergeSlowSamples($samples, $slow);
+                apcu_store($prefix . 'slow_samples', $samples);
+            }
+            return;
+        }
+        
+        $handle = @fopen(self::profileStatsFile(), 'c+');
+        if (!$handle) {
+            return;
+        }
+        flock($handle, LOCK_EX);
+        $stats = json_decode(stream_get_contents($handle), true) ?: array();
+        
+        $entry = isset($stats[$endpoint]) ? $stats[$endpoint] : array('since' => time(), 'slow_samples' => array());
+        foreach ($counts as $name => $value) {
+            $entry[$name] = (isset($entry[$name]) ? $entry[$name] : 0) + $value;
+        }
+        $entry['slow_samples'] = self::mergeSlowSamples($entry['slow_samples'], $slow);
+        $stats[$endpoint] = $entry;
+        
+        ftruncate($handle, 0);
+        rewind($handle);
+        fwrite($handle, json_encode($stats));
+        flock($handle, LOCK_UN);
+        fclose($handle);
+    }
+    
+    private static function mergeSlowSamples($samples, $slow) {
+        foreach ($slow as $entry) {
+            $entry['at'] = time();
+            $samples[] = $entry;
+        }
+        return array_slice($samples, -self::PROFILE_SLOW_SAMPLES);
+    }
+    
+    /**
+     * Per-endpoint profiler totals: endpoint => requests, avg_ms, avg_db_ms,
+     * avg_queries, slow_queries, slow_samples (newest last). Empty if the
+     * profiler never ran.
+     */
+    public static function profileStats() {
+        $raw = array();
+        
+        if (apcuAvailable()) {
+            $endpoints = apcu_fetch(self::PROFILE_APCU_PREFIX . 'endpoints') ?: array();
+            foreach ($endpoints as $endpoint => $since) {
+                $prefix = self::PROFILE_APCU_PREFIX . md5($endpoint) . '_';
+                $entry = array('since' => $since);
+                foreach (array('requests', 'total_us', 'db_us', 'queries', 'slow_queries', 'slow_samples') as $name) {
+                    $value = apcu_fetch($prefix . $name);
+                    $entry[$name] = $value === false ? ($name === 'slow_samples' ? array() : 0) : $value;
+                }
+                $raw[$endpoint] = $entry;
+            }
+        } elseif (file_exists(self::profileStatsFile())) {
+            $raw = json_decode(@file_get_contents(self::profileStatsFile()), true) ?: array();
+        }
+        
+        $stats = array();
+        foreach ($raw as $endpoint => $entry) {
+            $requests = max(1, $entry['requests']);
+            $stats[$endpoint] = array(
+                'since' => $entry['since'],
+                'requests' => $entry['requests'],
+                'avg_ms' => round($entry['total_us'] / $requests / 1000, 2),
+                'avg_db_ms' => round($entry['db_us'] / $requests / 1000, 2),
+                'avg_queries' => round($entry['queries'] / $requests, 2),
+                'slow_queries' => $entry['slow_queries'],
+                'slow_samples' => $entry['slow_samples']
+            );
+        }
+        ksort($stats);
+        return $stats;
+    }
+}
+
+// Request profiler - see startProfiling(); off unless enabled in config.php
+if (defined('PROFILER_ENABLED') && PROFILER_ENABLED && PHP_SAPI !== 'cli') {
+    Database::startProfiling(basename($_SERVER['SCRIPT_NAME'], '.php'));
 }
 
 ?>
@@ -38,30 +38,73 @@ CREATE TABLE IF NOT EXISTS admins (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Relay messages table - stores relayed data between peers
+-- Partitioned by hour on created_at; scripts/server/relay_partitions.py
+-- pre-creates upcoming partitions (splitting pfuture) and drops expired ones
 CREATE TABLE IF NOT EXISTS relay_messages (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
     session_id VARCHAR(255) NOT NULL,
     message_type VARCHAR(50) NOT NULL,
     message_data MEDIUMTEXT NOT NULL,
+    message_blob MEDIUMBLOB NULL,  -- Raw bytes from the binary protocol (message_data is then empty)
     created_at INT NOT NULL,
     read_at INT NULL,
+    PRIMARY KEY (id, created_at),  -- Unique keys must include the partitioning column
     INDEX idx_session_id (session_id),
-    INDEX idx_read_at (read_at),
     INDEX idx_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+PARTITION BY RANGE (created_at) (
+    PARTITION pfuture VALUES LESS THAN MAXVALUE
+);
+
+-- Relay frame slots - newest screen frame per recipient (latest frame wins)
+CREATE TABLE IF NOT EXISTS relay_frame_slots (
+    session_id VARCHAR(255) NOT NULL PRIMARY KEY,  -- Recipient (peer) session
+    frame_seq BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    read_seq BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    frame_data MEDIUMTEXT NOT NULL,  -- Base64 frame from the JSON API
+    frame_blob MEDIUMBLOB NULL,  -- Raw frame from the binary protocol (frame_data is then empty)
+    updated_at INT NOT NULL,
+    INDEX idx_updated_at (updated_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Signals table - stores WebRTC signaling data
+-- Partitioned by day on created_at (see relay_messages)
 CREATE TABLE IF NOT EXISTS signals (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
     session_id VARCHAR(255) NOT NULL,
+    seq INT UNSIGNED NULL,  -- Per-session sequence (signal_queues), caps the queue
     code VARCHAR(32) NOT NULL,  -- Increased from VARCHAR(6) to support word-word codes
     signal_type VARCHAR(50) NOT NULL,
     signal_data TEXT NOT NULL,
     created_at INT NOT NULL,
     read_at INT NULL,
+    PRIMARY KEY (id, created_at),
     INDEX idx_session_id (session_id),
     INDEX idx_code (code),
     INDEX idx_read_at (read_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+PARTITION BY RANGE (created_at) (
+    PARTITION pfuture VALUES LESS THAN MAXVALUE
+);
+
+-- Signal queues - per-session signal sequence counter (api/signal_queue.php)
+CREATE TABLE IF NOT EXISTS signal_queues (
+    session_id VARCHAR(255) NOT NULL PRIMARY KEY,  -- Recipient session
+    last_seq INT UNSIGNED NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Relay stats - per-session, per-type traffic counters in 10s buckets
+-- (api/relay_stats.php, used when APCu is unavailable)
+CREATE TABLE IF NOT EXISTS relay_stats (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    session_id VARCHAR(255) NOT NULL,  -- Sending session
+    message_type VARCHAR(50) NOT NULL,
+    bucket INT NOT NULL,  -- Bucket start (unix time)
+    messages INT UNSIGNED NOT NULL,
+    bytes BIGINT UNSIGNED NOT NULL,
+    last_at INT NOT NULL,
+    UNIQUE KEY uniq_session_type_bucket (session_id, message_type, bucket),
+    INDEX idx_bucket (bucket)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Admin session info table - stores admin reconnection info
@@ -94,3 +137,11 @@ CREATE TABLE IF NOT EXISTS admin_client_codes (
     INDEX idx_last_used (last_used_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Migration ledger - one row per migrations/*.sql applied by scripts/deploy/migration_runner.py
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(191) PRIMARY KEY,
+    checksum CHAR(64) NOT NULL,
+    statements INT NOT NULL,
+    execution_ms INT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
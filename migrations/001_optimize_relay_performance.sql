@@ -8,13 +8,13 @@ USE lwavhbte_sharefast;
 SET @index_exists = (
     SELECT COUNT(*) 
     FROM INFORMATION_SCHEMA.STATISTICS 
-    WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+    WHERE TABLE_SCHEMA = DATABASE() 
     AND TABLE_NAME = 'sessions' 
     AND INDEX_NAME = 'idx_peer_id'
 );
 
 SET @sql = IF(@index_exists = 0, 
-    'ALTER TABLE sessions ADD INDEX idx_peer_id (peer_id)',
+    'ALTER TABLE sessions ADD INDEX idx_peer_id (peer_id), ALGORITHM=INPLACE, LOCK=NONE',
     'SELECT "Index idx_peer_id already exists" AS message'
 );
 PREPARE stmt FROM @sql;
@@ -26,13 +26,13 @@ DEALLOCATE PREPARE stmt;
 SET @index_exists = (
     SELECT COUNT(*) 
     FROM INFORMATION_SCHEMA.STATISTICS 
-    WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+    WHERE TABLE_SCHEMA = DATABASE() 
     AND TABLE_NAME = 'relay_messages' 
     AND INDEX_NAME = 'idx_session_read'
 );
 
 SET @sql = IF(@index_exists = 0, 
-    'ALTER TABLE relay_messages ADD INDEX idx_session_read (session_id, read_at)',
+    'ALTER TABLE relay_messages ADD INDEX idx_session_read (session_id, read_at), ALGORITHM=INPLACE, LOCK=NONE',
     'SELECT "Index idx_session_read already exists" AS message'
 );
 PREPARE stmt FROM @sql;
@@ -43,13 +43,13 @@ DEALLOCATE PREPARE stmt;
 SET @index_exists = (
     SELECT COUNT(*) 
     FROM INFORMATION_SCHEMA.STATISTICS 
-    WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+    WHERE TABLE_SCHEMA = DATABASE() 
     AND TABLE_NAME = 'sessions' 
     AND INDEX_NAME = 'idx_peer_id_not_null'
 );
 
 SET @sql = IF(@index_exists = 0, 
-    'ALTER TABLE sessions ADD INDEX idx_peer_id_not_null (peer_id, session_id, code)',
+    'ALTER TABLE sessions ADD INDEX idx_peer_id_not_null (peer_id, session_id, code), ALGORITHM=INPLACE, LOCK=NONE',
     'SELECT "Index idx_peer_id_not_null already exists" AS message'
 );
 PREPARE stmt FROM @sql;
@@ -60,7 +60,7 @@ DEALLOCATE PREPARE stmt;
 SELECT 'Migration completed successfully!' AS status;
 SELECT INDEX_NAME, COLUMN_NAME 
 FROM INFORMATION_SCHEMA.STATISTICS 
-WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+WHERE TABLE_SCHEMA = DATABASE() 
 AND TABLE_NAME IN ('sessions', 'relay_messages')
 AND INDEX_NAME IN ('idx_peer_id', 'idx_session_read', 'idx_peer_id_not_null')
 ORDER BY TABLE_NAME, INDEX_NAME;
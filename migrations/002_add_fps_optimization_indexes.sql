@@ -10,13 +10,13 @@ USE lwavhbte_sharefast;
 SET @index_exists = (
     SELECT COUNT(*) 
     FROM INFORMATION_SCHEMA.STATISTICS 
-    WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+    WHERE TABLE_SCHEMA = DATABASE() 
     AND TABLE_NAME = 'relay_messages' 
     AND INDEX_NAME = 'idx_relay_session_unread'
 );
 
 SET @sql = IF(@index_exists = 0, 
-    'ALTER TABLE relay_messages ADD INDEX idx_relay_session_unread (session_id, read_at, created_at)',
+    'ALTER TABLE relay_messages ADD INDEX idx_relay_session_unread (session_id, read_at, created_at), ALGORITHM=INPLACE, LOCK=NONE',
     'SELECT "Index idx_relay_session_unread already exists" AS message'
 );
 PREPARE stmt FROM @sql;
@@ -29,13 +29,13 @@ DEALLOCATE PREPARE stmt;
 SET @index_exists = (
     SELECT COUNT(*) 
     FROM INFORMATION_SCHEMA.STATISTICS 
-    WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+    WHERE TABLE_SCHEMA = DATABASE() 
     AND TABLE_NAME = 'sessions' 
     AND INDEX_NAME = 'idx_sessions_peer'
 );
 
 SET @sql = IF(@index_exists = 0, 
-    'ALTER TABLE sessions ADD INDEX idx_sessions_peer (session_id, peer_id)',
+    'ALTER TABLE sessions ADD INDEX idx_sessions_peer (session_id, peer_id), ALGORITHM=INPLACE, LOCK=NONE',
     'SELECT "Index idx_sessions_peer already exists" AS message'
 );
 PREPARE stmt FROM @sql;
@@ -48,13 +48,13 @@ DEALLOCATE PREPARE stmt;
 SET @index_exists = (
     SELECT COUNT(*) 
     FROM INFORMATION_SCHEMA.STATISTICS 
-    WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+    WHERE TABLE_SCHEMA = DATABASE() 
     AND TABLE_NAME = 'sessions' 
     AND INDEX_NAME = 'idx_sessions_code_peer'
 );
 
 SET @sql = IF(@index_exists = 0, 
-    'ALTER TABLE sessions ADD INDEX idx_sessions_code_peer (code, peer_id)',
+    'ALTER TABLE sessions ADD INDEX idx_sessions_code_peer (code, peer_id), ALGORITHM=INPLACE, LOCK=NONE',
     'SELECT "Index idx_sessions_code_peer already exists" AS message'
 );
 PREPARE stmt FROM @sql;
@@ -67,13 +67,13 @@ DEALLOCATE PREPARE stmt;
 SET @index_exists = (
     SELECT COUNT(*) 
     FROM INFORMATION_SCHEMA.STATISTICS 
-    WHERE TABLE_SCHEMA = 'lwavhbte_sharefast' 
+    WHERE TABLE_SCHEMA = DATABASE() 
     AND TABLE_NAME = 'relay_messages' 
     AND INDEX_NAME = 'idx_relay_session_created'
 );
 
 SET @sql = IF(@index_exists = 0, 
-    'ALTER TABLE relay_messages ADD INDEX idx_relay_session_created (session_id, created_at, read_at)',
+    'ALTER TABLE relay_messages ADD INDEX idx_relay_session_created (session_id, created_at, read_at), ALGORITHM=INPLACE, LOCK=NONE',
     'SELECT "Index idx_relay_session_created already exists" AS message'
 );
 PREPARE stmt FROM @sql;
@@ -87,7 +87,7 @@ SELECT
     INDEX_NAME, 
     GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX SEPARATOR ', ') AS columns
 FROM INFORMATION_SCHEMA.STATISTICS 
-WHERE TABLE_SCHEMA = 'lwavhbte_sharefast'
+WHERE TABLE_SCHEMA = DATABASE()
 AND TABLE_NAME IN ('sessions', 'relay_messages')
 AND INDEX_NAME IN (
     'idx_relay_session_unread',
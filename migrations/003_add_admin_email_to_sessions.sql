@@ -0,0 +1,40 @@
+-- Migration: Add admin_email column to sessions table
+-- This allows clients to specify which admin email they want to connect with
+-- Run this SQL script to update existing databases
+
+USE lwavhbte_sharefast;
+
+-- Add admin_email column if it doesn't exist
+-- (ADD COLUMN IF NOT EXISTS is MariaDB-only, so check INFORMATION_SCHEMA like the other migrations)
+SET @column_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'sessions'
+    AND COLUMN_NAME = 'admin_email'
+);
+
+SET @sql = IF(@column_exists = 0,
+    'ALTER TABLE sessions ADD COLUMN admin_email VARCHAR(255) NULL AFTER connected, ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Column admin_email already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Add index for efficient filtering by admin_email
+SET @index_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'sessions'
+    AND INDEX_NAME = 'idx_admin_email'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'ALTER TABLE sessions ADD INDEX idx_admin_email (admin_email), ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Index idx_admin_email already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
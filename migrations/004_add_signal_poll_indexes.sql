@@ -0,0 +1,41 @@
+-- Signal polling indexes
+-- Run this so poll.php and signal.php read signals straight from an index
+-- instead of sorting every signal stored for the session
+
+USE lwavhbte_sharefast;
+
+-- 1. Composite index for unread signal lookups (poll.php getSignals)
+-- Optimizes: SELECT * FROM signals WHERE session_id = ? AND read_at IS NULL ORDER BY created_at DESC LIMIT 1
+SET @index_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'signals'
+    AND INDEX_NAME = 'idx_signals_session_unread'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'ALTER TABLE signals ADD INDEX idx_signals_session_unread (session_id, read_at, created_at), ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Index idx_signals_session_unread already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 2. Composite index for the newest-100 trim (signal.php storeSignal cleanup)
+-- Optimizes: SELECT id FROM signals WHERE session_id = ? ORDER BY created_at DESC LIMIT 100
+SET @index_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'signals'
+    AND INDEX_NAME = 'idx_signals_session_created'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'ALTER TABLE signals ADD INDEX idx_signals_session_created (session_id, created_at), ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Index idx_signals_session_created already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
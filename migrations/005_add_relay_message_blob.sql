@@ -0,0 +1,23 @@
+-- Migration: Add message_blob column to relay_messages
+-- relay.php's binary protocol (Content-Type: application/octet-stream) stores
+-- frames as raw bytes here instead of base64 text in message_data, which cuts
+-- ~25% off every stored frame and skips the utf8mb4 text handling.
+-- Rows sent through the JSON API keep using message_data (message_blob NULL).
+
+USE lwavhbte_sharefast;
+
+SET @column_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'relay_messages'
+    AND COLUMN_NAME = 'message_blob'
+);
+
+SET @sql = IF(@column_exists = 0,
+    'ALTER TABLE relay_messages ADD COLUMN message_blob MEDIUMBLOB NULL AFTER message_data, ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Column message_blob already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
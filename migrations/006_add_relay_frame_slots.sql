@@ -0,0 +1,18 @@
+-- Migration: Add relay_frame_slots table
+-- Screen frames no longer queue in relay_messages: each recipient has one
+-- "current frame" row that a new frame overwrites (frame_seq counts writes,
+-- read_seq is the last one delivered). A lagging viewer jumps to the newest
+-- frame instead of draining stale ones, and frame storage stays one row per
+-- session. Input and cursor messages keep using relay_messages.
+
+USE lwavhbte_sharefast;
+
+CREATE TABLE IF NOT EXISTS relay_frame_slots (
+    session_id VARCHAR(255) NOT NULL PRIMARY KEY,  -- Recipient (peer) session
+    frame_seq BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    read_seq BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    frame_data MEDIUMTEXT NOT NULL,  -- Base64 frame from the JSON API
+    frame_blob MEDIUMBLOB NULL,  -- Raw frame from the binary protocol (frame_data is then empty)
+    updated_at INT NOT NULL,
+    INDEX idx_updated_at (updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
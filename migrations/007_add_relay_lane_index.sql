@@ -0,0 +1,26 @@
+-- Migration: Index for relay priority lanes
+-- relay.php / relay_optimized.php receive reads each message type in its own
+-- lane (input, cursor, frame - see api/relay_lanes.php):
+--   SELECT ... FROM relay_messages
+--   WHERE session_id = ? AND message_type = ? AND read_at IS NULL
+--   ORDER BY created_at ASC, id ASC LIMIT ?
+-- With message_type in the index every lane is a single range read in send
+-- order, however many messages of other types are waiting.
+
+USE lwavhbte_sharefast;
+
+SET @index_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'relay_messages'
+    AND INDEX_NAME = 'idx_relay_session_lane'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'ALTER TABLE relay_messages ADD INDEX idx_relay_session_lane (session_id, message_type, read_at, created_at), ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Index idx_relay_session_lane already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,153 @@
+-- Migration: Partition relay_messages and signals by time
+-- Both tables become RANGE-partitioned on created_at so retention drops whole
+-- partitions (scripts/server/relay_partitions.py) instead of running a
+-- row-by-row DELETE that locks the table, churns the undo log and leaves the
+-- MEDIUMTEXT pages fragmented.
+--   relay_messages: one partition per hour
+--   signals:        one partition per day
+-- Partitions are named after their upper bound (p<unix time>); the last one,
+-- pfuture, catches everything beyond the pre-created range and is kept empty
+-- by the retention job.
+--
+-- The primary key becomes (id, created_at): every unique key of a
+-- partitioned table must contain the partitioning column. id stays
+-- AUTO_INCREMENT and unique in practice.
+--
+-- Tables are not altered in place (that would copy them under a write
+-- lock): a partitioned copy is built empty, swapped in with one atomic
+-- RENAME, and only the rows still waiting to be delivered are copied over.
+-- idx_read_at is not carried over - retention no longer looks at read_at.
+
+USE lwavhbte_sharefast;
+
+SET @hour = UNIX_TIMESTAMP() DIV 3600 * 3600;
+SET @day = UNIX_TIMESTAMP() DIV 86400 * 86400;
+
+-- 1. relay_messages
+SET @partitioned = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'relay_messages'
+    AND PARTITION_NAME IS NOT NULL
+);
+
+-- Leftover from an interrupted run (only ever exists before the swap)
+DROP TABLE IF EXISTS relay_messages_partitioned;
+
+SET @sql = IF(@partitioned = 0,
+    'CREATE TABLE relay_messages_partitioned LIKE relay_messages',
+    'SELECT "relay_messages is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @sql = IF(@partitioned = 0,
+    CONCAT('ALTER TABLE relay_messages_partitioned ',
+           'DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at), DROP INDEX idx_read_at ',
+           'PARTITION BY RANGE (created_at) (',
+           'PARTITION p', @hour, ' VALUES LESS THAN (', @hour, '), ',
+           'PARTITION p', @hour + 3600, ' VALUES LESS THAN (', @hour + 3600, '), ',
+           'PARTITION p', @hour + 7200, ' VALUES LESS THAN (', @hour + 7200, '), ',
+           'PARTITION p', @hour + 10800, ' VALUES LESS THAN (', @hour + 10800, '), ',
+           'PARTITION pfuture VALUES LESS THAN MAXVALUE)'),
+    'SELECT "relay_messages is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Continue ids where the old table stopped, so copied rows cannot collide
+SET @next_id = (SELECT COALESCE(MAX(id), 0) + 100000 FROM relay_messages);
+SET @sql = IF(@partitioned = 0,
+    CONCAT('ALTER TABLE relay_messages_partitioned AUTO_INCREMENT = ', @next_id),
+    'SELECT "relay_messages is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @sql = IF(@partitioned = 0,
+    'RENAME TABLE relay_messages TO relay_messages_unpartitioned, relay_messages_partitioned TO relay_messages',
+    'SELECT "relay_messages is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Undelivered input/cursor messages from the last hour (anything older is stale)
+SET @sql = IF(@partitioned = 0,
+    CONCAT('INSERT INTO relay_messages (id, session_id, message_type, message_data, message_blob, created_at, read_at) ',
+           'SELECT id, session_id, message_type, message_data, message_blob, created_at, read_at ',
+           'FROM relay_messages_unpartitioned WHERE read_at IS NULL AND created_at >= ', @hour - 3600),
+    'SELECT "relay_messages is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+DROP TABLE IF EXISTS relay_messages_unpartitioned;
+
+-- 2. signals
+SET @partitioned = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'signals'
+    AND PARTITION_NAME IS NOT NULL
+);
+
+DROP TABLE IF EXISTS signals_partitioned;
+
+SET @sql = IF(@partitioned = 0,
+    'CREATE TABLE signals_partitioned LIKE signals',
+    'SELECT "signals is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @sql = IF(@partitioned = 0,
+    CONCAT('ALTER TABLE signals_partitioned ',
+           'DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at) ',
+           'PARTITION BY RANGE (created_at) (',
+           'PARTITION p', @day, ' VALUES LESS THAN (', @day, '), ',
+           'PARTITION p', @day + 86400, ' VALUES LESS THAN (', @day + 86400, '), ',
+           'PARTITION p', @day + 172800, ' VALUES LESS THAN (', @day + 172800, '), ',
+           'PARTITION pfuture VALUES LESS THAN MAXVALUE)'),
+    'SELECT "signals is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @next_id = (SELECT COALESCE(MAX(id), 0) + 100000 FROM signals);
+SET @sql = IF(@partitioned = 0,
+    CONCAT('ALTER TABLE signals_partitioned AUTO_INCREMENT = ', @next_id),
+    'SELECT "signals is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @sql = IF(@partitioned = 0,
+    'RENAME TABLE signals TO signals_unpartitioned, signals_partitioned TO signals',
+    'SELECT "signals is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Signals of the last day (the signalling handshake of any live session)
+SET @sql = IF(@partitioned = 0,
+    CONCAT('INSERT INTO signals (id, session_id, code, signal_type, signal_data, created_at, read_at) ',
+           'SELECT id, session_id, code, signal_type, signal_data, created_at, read_at ',
+           'FROM signals_unpartitioned WHERE created_at >= ', @day - 86400),
+    'SELECT "signals is already partitioned" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+DROP TABLE IF EXISTS signals_unpartitioned;
@@ -0,0 +1,52 @@
+-- Migration: Sequence-capped signal queues
+-- signal.php used to trim every recipient's signals after each INSERT with
+--   DELETE FROM signals WHERE session_id = ? AND id NOT IN
+--     (SELECT id FROM (SELECT id FROM signals WHERE session_id = ? ORDER BY created_at DESC LIMIT 100) AS temp)
+-- - a subquery and a sort per ICE candidate. Signals now carry a per-session
+-- sequence number (signal_queues.last_seq hands them out) and api/signal_queue.php
+-- trims by sequence on every 20th signal only:
+--   DELETE FROM signals WHERE session_id = ? AND seq <= ?
+-- Existing rows keep seq NULL and expire with their partition.
+
+USE lwavhbte_sharefast;
+
+-- 1. Per-session sequence counter
+CREATE TABLE IF NOT EXISTS signal_queues (
+    session_id VARCHAR(255) NOT NULL PRIMARY KEY,  -- Recipient session
+    last_seq INT UNSIGNED NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 2. signals.seq
+SET @column_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'signals'
+    AND COLUMN_NAME = 'seq'
+);
+
+SET @sql = IF(@column_exists = 0,
+    'ALTER TABLE signals ADD COLUMN seq INT UNSIGNED NULL AFTER session_id, ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Column seq already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 3. Index for the trim
+-- Optimizes: DELETE FROM signals WHERE session_id = ? AND seq <= ?
+SET @index_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'signals'
+    AND INDEX_NAME = 'idx_signals_session_seq'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'ALTER TABLE signals ADD INDEX idx_signals_session_seq (session_id, seq), ALGORITHM=INPLACE, LOCK=NONE',
+    'SELECT "Index idx_signals_session_seq already exists" AS message'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
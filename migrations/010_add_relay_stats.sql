@@ -0,0 +1,22 @@
+-- Migration: Incremental relay stats rollups
+-- status.php and diagnostic_dashboard.php used to aggregate relay_messages on
+-- every page load (GROUP BY message_type with SUM(LENGTH(message_data)), and
+-- IN (SELECT session_id FROM sessions WHERE code = ?) subqueries per type).
+-- api/relay_stats.php now counts messages and payload bytes as they are
+-- written, per sending session, type and 10-second bucket. With APCu the
+-- counters never touch MySQL; without it they are upserted into this table
+-- and the maintenance daemon deletes buckets older than an hour.
+
+USE lwavhbte_sharefast;
+
+CREATE TABLE IF NOT EXISTS relay_stats (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    session_id VARCHAR(255) NOT NULL,  -- Sending session
+    message_type VARCHAR(50) NOT NULL,
+    bucket INT NOT NULL,  -- Bucket start (unix time)
+    messages INT UNSIGNED NOT NULL,
+    bytes BIGINT UNSIGNED NOT NULL,
+    last_at INT NOT NULL,
+    UNIQUE KEY uniq_session_type_bucket (session_id, message_type, bucket),
+    INDEX idx_bucket (bucket)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -2,34 +2,112 @@
 """
 Deploy ShareFast PHP API files to GCP VM (sharefast-websocket)
 Uses gcloud compute scp to upload files
+
+Modes:
+- Default: upload each file individually (scp + ssh per file)
+- --bundle: ship only files whose content changed since the last deploy,
+  as one tarball, applied in a single remote step. The remote side keeps
+  a manifest of content hashes (outside the document root, in
+  /var/lib/sharefast/) so the next run can diff against it.
 """
 
+import argparse
+import hashlib
+import io
+import json
 import os
-import subprocess
+import re
 import sys
+import tarfile
+import tempfile
+import time
 from pathlib import Path
 
+from deploy_session import DeploySession
+
 # Configuration
 INSTANCE_NAME = "sharefast-websocket"
 ZONE = "us-central1-a"
 REMOTE_USER = os.getenv("GCLOUD_USER", "dash")  # Default user
 REMOTE_BASE_DIR = "/var/www/html"
+# Outside the document root - Apache would serve the file list and hashes
+REMOTE_MANIFEST_DIR = "/var/lib/sharefast"
+REMOTE_MANIFEST = f"{REMOTE_MANIFEST_DIR}/deploy_manifest.json"
+LEGACY_REMOTE_MANIFEST = f"{REMOTE_BASE_DIR}/.deploy_manifest.json"
+MANIFEST_ENTRY = ".deploy_manifest.json"  # Name inside the bundle (never extracted into REMOTE_BASE_DIR)
+REMOTE_BUNDLE_PATH = "/tmp/sharefast_deploy_bundle.tar.gz"
 
-def run_command(cmd, check=True):
-    """Run a shell command"""
-    print(f"[RUN] {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"[ERROR] Command failed: {cmd}")
-        if result.stderr:
-            print(f"Error: {result.stderr}")
-        if result.stdout:
-            print(f"Output: {result.stdout}")
-        if check:
-            return False
-    return result.returncode == 0
+# Files to deploy (local path, path relative to REMOTE_BASE_DIR)
+FILES_TO_DEPLOY = [
+    # Root files (if they exist)
+    ("config.php", "config.php"),
+    ("database.php", "database.php"),
+    (".htaccess", ".htaccess"),
+    
+    # API directory files
+    ("api/register.php", "api/register.php"),
+    ("api/validate.php", "api/validate.php"),
+    ("api/signal.php", "api/signal.php"),
+    ("api/poll.php", "api/poll.php"),
+    ("api/disconnect.php", "api/disconnect.php"),
+    ("api/relay.php", "api/relay.php"),  # OPTIMIZED VERSION
+    ("api/relay_hybrid.php", "api/relay_hybrid.php"),
+    ("api/keepalive.php", "api/keepalive.php"),
+    ("api/list_clients.php", "api/list_clients.php"),
+    ("api/admin_auth.php", "api/admin_auth.php"),
+    ("api/admin_codes.php", "api/admin_codes.php"),
+    ("api/admin_manage.php", "api/admin_manage.php"),
+    ("api/reconnect.php", "api/reconnect.php"),
+    ("api/status.php", "api/status.php"),
+    ("api/version.php", "api/version.php"),
+    ("api/rate_limit.php", "api/rate_limit.php"),
+    ("api/ssl_error_handler.php", "api/ssl_error_handler.php"),
+    ("api/test_frame_flow.php", "api/test_frame_flow.php"),
+    ("api/test_signals.php", "api/test_signals.php"),
+    ("api/test_signal_routing.php", "api/test_signal_routing.php"),
+    ("api/debug_signals.php", "api/debug_signals.php"),
+    ("api/diagnostic_dashboard.php", "api/diagnostic_dashboard.php"),
+    ("api/generate_test_session.php", "api/generate_test_session.php"),
+    ("api/terminate_session.php", "api/terminate_session.php"),
+    
+    # Modules the endpoints require_once (checked by missing_requirements())
+    ("api/apcu.php", "api/apcu.php"),
+    ("api/relay_wake.php", "api/relay_wake.php"),
+    ("api/relay_binary.php", "api/relay_binary.php"),
+    ("api/relay_frame_slot.php", "api/relay_frame_slot.php"),
+    ("api/relay_lanes.php", "api/relay_lanes.php"),
+    ("api/peer_lookup.php", "api/peer_lookup.php"),
+    ("api/relay_shm.php", "api/relay_shm.php"),
+    ("api/relay_log.php", "api/relay_log.php"),
+    ("api/signal_queue.php", "api/signal_queue.php"),
+    ("api/relay_stats.php", "api/relay_stats.php"),
+    
+    # Other root files
+    ("index.html", "index.html"),
+]
+
+REQUIRE_PATTERN = re.compile(r"require_once\s+__DIR__\s*\.\s*'([^']+)'")
+
+def missing_requirements(files_to_deploy):
+    """
+    Local files pulled in with require_once __DIR__ . '...' by a deployed PHP
+    file but not deployed themselves (paths that do not exist locally are not
+    this list's problem) - the endpoint would die with a fatal
+    error on the server. Returns sorted (requirer, missing path) pairs.
+    """
+    deployed = {os.path.normpath(local_path) for local_path, _ in files_to_deploy}
+    missing = set()
+    for local_path, _ in files_to_deploy:
+        path = Path(local_path)
+        if path.suffix != '.php' or not path.is_file():
+            continue
+        for required in REQUIRE_PATTERN.findall(path.read_text(encoding='utf-8', errors='replace')):
+            target = os.path.normpath(os.path.join(os.path.dirname(local_path), required.lstrip('/')))
+            if target not in deployed and os.path.isfile(target):
+                missing.add((local_path, target.replace('\\', '/')))
+    return sorted(missing)
 
-def deploy_files():
+def deploy_files(session):
     """Deploy all server files to GCP VM"""
     print("="*70)
     print("Deploying ShareFast API to GCP VM")
@@ -46,56 +124,22 @@ def deploy_files():
         print("Make sure you're running from the project root (zip-sharefast-api).")
         return False
     
-    # Files to deploy
-    files_to_deploy = [
-        # Root files (if they exist)
-        ("config.php", "config.php"),
-        ("database.php", "database.php"),
-        (".htaccess", ".htaccess"),
-        
-        # API directory files
-        ("api/register.php", "api/register.php"),
-        ("api/validate.php", "api/validate.php"),
-        ("api/signal.php", "api/signal.php"),
-        ("api/poll.php", "api/poll.php"),
-        ("api/disconnect.php", "api/disconnect.php"),
-        ("api/relay.php", "api/relay.php"),  # OPTIMIZED VERSION
-        ("api/relay_hybrid.php", "api/relay_hybrid.php"),
-        ("api/keepalive.php", "api/keepalive.php"),
-        ("api/list_clients.php", "api/list_clients.php"),
-        ("api/admin_auth.php", "api/admin_auth.php"),
-        ("api/admin_codes.php", "api/admin_codes.php"),
-        ("api/admin_manage.php", "api/admin_manage.php"),
-        ("api/reconnect.php", "api/reconnect.php"),
-        ("api/status.php", "api/status.php"),
-        ("api/version.php", "api/version.php"),
-        ("api/rate_limit.php", "api/rate_limit.php"),
-        ("api/ssl_error_handler.php", "api/ssl_error_handler.php"),
-        ("api/test_frame_flow.php", "api/test_frame_flow.php"),
-        ("api/test_signals.php", "api/test_signals.php"),
-        ("api/test_signal_routing.php", "api/test_signal_routing.php"),
-        ("api/debug_signals.php", "api/debug_signals.php"),
-        ("api/diagnostic_dashboard.php", "api/diagnostic_dashboard.php"),
-        ("api/generate_test_session.php", "api/generate_test_session.php"),
-        ("api/terminate_session.php", "api/terminate_session.php"),
-        
-        # Other root files
-        ("index.html", "index.html"),
-    ]
+    files_to_deploy = FILES_TO_DEPLOY
     
     print(f"[1/{len(files_to_deploy)+3}] Creating remote directories...")
     
     # Create directories on remote VM
-    # Use double quotes for Windows PowerShell compatibility
     commands = [
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} --command="sudo mkdir -p {REMOTE_BASE_DIR}/api"',
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} --command="sudo mkdir -p {REMOTE_BASE_DIR}/storage"',
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} --command="sudo chown -R www-data:www-data {REMOTE_BASE_DIR}"',
+        f"sudo mkdir -p {REMOTE_BASE_DIR}/api",
+        f"sudo mkdir -p {REMOTE_BASE_DIR}/storage",
+        f"sudo chown -R www-data:www-data {REMOTE_BASE_DIR}",
     ]
     
-    for cmd in commands:
-        if not run_command(cmd, check=False):
-            print(f"[WARNING] Directory creation command may have failed (may already exist)")
+    with session.step("Create remote directories"):
+        for cmd in commands:
+            success, _ = session.run(cmd)
+            if not success:
+                print(f"[WARNING] Directory creation command may have failed (may already exist)")
     
     print()
     
@@ -118,29 +162,18 @@ def deploy_files():
         temp_path = f"/tmp/{Path(remote_path).name}"
         
         # Step 1: Upload to /tmp
-        upload_cmd = (
-            f"gcloud compute scp {local_file_str} "
-            f"{REMOTE_USER}@{INSTANCE_NAME}:{temp_path} "
-            f"--zone={ZONE}"
-        )
-        
-        if run_command(upload_cmd, check=False):
+        if session.copy(local_file_str, temp_path):
             # Step 2: Move from /tmp to final location with sudo and set permissions
             # Create parent directory if needed
             parent_dir = str(Path(remote_path).parent)
             if parent_dir and parent_dir != '.':
-                mkdir_cmd = (
-                    f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-                    f'--command="sudo mkdir -p {REMOTE_BASE_DIR}/{parent_dir}"'
-                )
-                run_command(mkdir_cmd, check=False)
+                session.run(f"sudo mkdir -p {REMOTE_BASE_DIR}/{parent_dir}")
             
             # Move file and set permissions
-            move_cmd = (
-                f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-                f'--command="sudo mv {temp_path} {remote_full_path} && sudo chown www-data:www-data {remote_full_path} && sudo chmod 644 {remote_full_path}"'
+            moved, _ = session.run(
+                f"sudo mv {temp_path} {remote_full_path} && sudo chown www-data:www-data {remote_full_path} && sudo chmod 644 {remote_full_path}"
             )
-            if run_command(move_cmd, check=False):
+            if moved:
                 print(f"[{idx}/{len(files_to_deploy)+3}] [OK] {remote_path}")
                 uploaded += 1
             else:
@@ -152,12 +185,7 @@ def deploy_files():
     
     print()
     print(f"[{len(files_to_deploy)+3}/{len(files_to_deploy)+3}] Setting storage permissions...")
-    # Use double quotes for Windows PowerShell compatibility
-    storage_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="sudo chown -R www-data:www-data {REMOTE_BASE_DIR}/storage && sudo chmod -R 755 {REMOTE_BASE_DIR}/storage"'
-    )
-    run_command(storage_cmd, check=False)
+    session.run(f"sudo chown -R www-data:www-data {REMOTE_BASE_DIR}/storage && sudo chmod -R 755 {REMOTE_BASE_DIR}/storage")
     
     print()
     print("="*70)
@@ -179,8 +207,183 @@ def deploy_files():
         print("[WARNING] Some files failed to upload. Check errors above.")
         return False
 
+def hash_file(path):
+    """Return the sha256 hex digest of a local file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build_local_manifest(files_to_deploy):
+    """Map remote path -> (local path, sha256) for every file that exists locally"""
+    manifest = {}
+    for local_path, remote_path in files_to_deploy:
+        local_file = Path(local_path)
+        if local_file.is_file():
+            manifest[remote_path] = (local_file, hash_file(local_file))
+    return manifest
+
+def fetch_remote_manifest(session):
+    """Read the manifest recorded by the previous bundle deploy (empty if none)"""
+    success, result = session.run(
+        f"sudo cat {REMOTE_MANIFEST} 2>/dev/null || sudo cat {LEGACY_REMOTE_MANIFEST} 2>/dev/null || true"
+    )
+    if not success:
+        print("[WARNING] Could not read remote manifest, deploying all files")
+        return {}
+    
+    try:
+        data = json.loads(result.stdout.strip() or '{}')
+    except ValueError:
+        print("[WARNING] Remote manifest is not valid JSON, deploying all files")
+        return {}
+    
+    return data.get('files', {}) if isinstance(data, dict) else {}
+
+def build_bundle(changed, manifest_files, bundle_path):
+    """
+    Write a tar.gz containing the changed files plus the new manifest.
+    Entries are owned by www-data with final permissions, so extracting
+    as root with --same-owner is the whole apply step.
+    """
+    def add_entry(tar, name, data, mode=0o644):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = mode
+        info.mtime = int(time.time())
+        info.uname = info.gname = 'www-data'
+        tar.addfile(info, io.BytesIO(data))
+    
+    with tarfile.open(bundle_path, 'w:gz') as tar:
+        for remote_path, local_file in changed:
+            add_entry(tar, remote_path, local_file.read_bytes())
+        
+        manifest = {
+            'generated_at': int(time.time()),
+            'files': manifest_files,
+        }
+        add_entry(tar, MANIFEST_ENTRY, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'), mode=0o600)
+
+def deploy_bundle(session, full=False, dry_run=False):
+    """Deploy only changed files as a single content-hashed bundle"""
+    print("="*70)
+    print("Deploying ShareFast API to GCP VM (bundle mode)")
+    print("="*70)
+    print(f"Instance: {INSTANCE_NAME}")
+    print(f"Zone: {ZONE}")
+    print(f"Remote directory: {REMOTE_BASE_DIR}")
+    print()
+    
+    if not Path("api").exists():
+        print("[ERROR] api/ directory not found!")
+        print("Make sure you're running from the project root (zip-sharefast-api).")
+        return False
+    
+    print("[1/4] Hashing local files...")
+    local_manifest = build_local_manifest(FILES_TO_DEPLOY)
+    missing = [local_path for local_path, _ in FILES_TO_DEPLOY if not Path(local_path).is_file()]
+    for local_path in missing:
+        print(f"  [SKIP] {local_path} (not found)")
+    print(f"  {len(local_manifest)} files hashed")
+    print()
+    
+    print("[2/4] Diffing against remote manifest...")
+    with session.step("Fetch remote manifest"):
+        remote_manifest = {} if full else fetch_remote_manifest(session)
+    changed = [
+        (remote_path, local_file)
+        for remote_path, (local_file, digest) in sorted(local_manifest.items())
+        if remote_manifest.get(remote_path) != digest
+    ]
+    
+    # Files not shipped this time keep their previously recorded hash
+    manifest_files = dict(remote_manifest)
+    manifest_files.update({remote_path: digest for remote_path, (_, digest) in local_manifest.items()})
+    
+    for remote_path, _ in changed:
+        print(f"  [CHANGED] {remote_path}")
+    print(f"  {len(changed)} changed, {len(local_manifest) - len(changed)} unchanged")
+    print()
+    
+    if not changed:
+        print("[SUCCESS] Remote is already up to date - nothing to deploy.")
+        return True
+    
+    if dry_run:
+        print("[DRY RUN] No files were uploaded.")
+        return True
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bundle_file = Path(tmp_dir) / "bundle.tar.gz"
+        build_bundle(changed, manifest_files, bundle_file)
+        bundle_size = bundle_file.stat().st_size
+        
+        print(f"[3/4] Uploading bundle ({bundle_size} bytes, {len(changed)} files)...")
+        with session.step("Upload bundle"):
+            uploaded = session.copy(bundle_file, REMOTE_BUNDLE_PATH)
+        if not uploaded:
+            print("[ERROR] Failed to upload bundle")
+            return False
+    print()
+    
+    print("[4/4] Applying bundle on remote VM...")
+    # Single remote step: extract (owners/modes come from the tarball) except the manifest,
+    # which goes outside the document root; fix storage, clean up
+    apply_cmd = (
+        f"sudo mkdir -p {REMOTE_BASE_DIR}/api {REMOTE_BASE_DIR}/storage && "
+        f"sudo tar -xzpf {REMOTE_BUNDLE_PATH} -C {REMOTE_BASE_DIR} --same-owner --no-overwrite-dir --exclude={MANIFEST_ENTRY} && "
+        f"sudo install -d -m 700 {REMOTE_MANIFEST_DIR} && "
+        f"sudo tar -xzf {REMOTE_BUNDLE_PATH} -O {MANIFEST_ENTRY} | sudo tee {REMOTE_MANIFEST} > /dev/null && "
+        f"sudo chmod 600 {REMOTE_MANIFEST} && sudo rm -f {LEGACY_REMOTE_MANIFEST} && "
+        f"sudo chown -R www-data:www-data {REMOTE_BASE_DIR}/storage && sudo chmod -R 755 {REMOTE_BASE_DIR}/storage && "
+        f"rm -f {REMOTE_BUNDLE_PATH}"
+    )
+    with session.step("Apply bundle"):
+        applied, _ = session.run(apply_cmd)
+    if not applied:
+        print("[ERROR] Failed to apply bundle")
+        return False
+    
+    print()
+    print("="*70)
+    print("Deployment Summary")
+    print("="*70)
+    print(f"Deployed: {len(changed)} changed files in one bundle ({bundle_size} bytes)")
+    print(f"Unchanged: {len(local_manifest) - len(changed)} files")
+    print()
+    print("[SUCCESS] Bundle deployed successfully!")
+    print()
+    print("Next steps:")
+    print("1. Test API: curl https://sharefast.zip/api/status.php")
+    print("2. Check Apache logs if issues: sudo tail -f /var/log/apache2/error.log")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Deploy ShareFast API files to GCP VM')
+    parser.add_argument('--bundle', action='store_true',
+                        help='Ship only changed files as one bundle (diffed against the remote manifest)')
+    parser.add_argument('--full', action='store_true',
+                        help='With --bundle: ignore the remote manifest and ship every file')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='With --bundle: show which files would be deployed without uploading')
+    args = parser.parse_args()
+    
+    missing = missing_requirements(FILES_TO_DEPLOY)
+    if missing:
+        print("[ERROR] FILES_TO_DEPLOY is missing files that deployed PHP files require:")
+        for requirer, required in missing:
+            print(f"  {required} (required by {requirer})")
+        print("Add them to FILES_TO_DEPLOY - nothing was deployed.")
+        return False
+    
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        if args.bundle:
+            return deploy_bundle(session, full=args.full, dry_run=args.dry_run)
+        return deploy_files(session)
+
 if __name__ == "__main__":
-    success = deploy_files()
+    success = main()
     sys.exit(0 if success else 1)
 
 
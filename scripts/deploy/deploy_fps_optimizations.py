@@ -2,42 +2,29 @@
 """
 Deploy FPS Optimizations to GCP VM
 - Deploys updated database.php (connection pooling)
-- Deploys and runs database migration (indexes)
+- Gates the deploy on EXPLAIN plans of the hot queries (query_plan_gate),
+  when a local MySQL is configured (PLAN_CHECK_*) or --plan-check is given
+- Applies pending database migrations (indexes) via migration_runner
 Uses gcloud compute commands
 """
 
 import os
-import subprocess
+import shutil
 import sys
 import argparse
 from pathlib import Path
 
+from deploy_session import DeploySession
+from migration_runner import LEDGER_TABLE, MIGRATIONS_DIR, MigrationRunner
+from query_plan_gate import DEFAULT_REPORT, client_from_env, run_gate
+
 # Configuration
 INSTANCE_NAME = "sharefast-websocket"
 ZONE = "us-central1-a"
 REMOTE_USER = os.getenv("GCLOUD_USER", "dash")  # Default user
 REMOTE_BASE_DIR = "/var/www/html"
-REMOTE_MIGRATIONS_DIR = f"{REMOTE_BASE_DIR}/migrations"
-
-# Database configuration (will be read from config.php on server)
-# These are defaults - actual values should be in config.php
-DB_NAME = "lwavhbte_sharefast"  # Default database name
-
-def run_command(cmd, check=True, capture_output=False):
-    """Run a shell command"""
-    print(f"[RUN] {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=capture_output, text=True)
-    if result.returncode != 0:
-        print(f"[ERROR] Command failed: {cmd}")
-        if result.stderr:
-            print(f"Error: {result.stderr}")
-        if result.stdout:
-            print(f"Output: {result.stdout}")
-        if check:
-            return False
-    return result.returncode == 0
 
-def deploy_database_php():
+def deploy_database_php(session):
     """Deploy updated database.php with connection pooling"""
     print("="*70)
     print("Step 1: Deploying database.php (Connection Pooling)")
@@ -55,224 +42,134 @@ def deploy_database_php():
     remote_full_path = f"{REMOTE_BASE_DIR}/database.php"
     
     # Upload
-    upload_cmd = (
-        f"gcloud compute scp {local_file_str} "
-        f"{REMOTE_USER}@{INSTANCE_NAME}:{temp_path} "
-        f"--zone={ZONE}"
-    )
-    
-    if not run_command(upload_cmd, check=False):
+    if not session.copy(local_file_str, temp_path):
         print("[ERROR] Failed to upload database.php")
         return False
     
     # Move to final location with sudo
-    move_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="sudo mv {temp_path} {remote_full_path} && sudo chown www-data:www-data {remote_full_path} && sudo chmod 644 {remote_full_path}"'
-    )
+    move_cmd = f"sudo mv {temp_path} {remote_full_path} && sudo chown www-data:www-data {remote_full_path} && sudo chmod 644 {remote_full_path}"
     
-    if not run_command(move_cmd, check=False):
+    success, _ = session.run(move_cmd)
+    if not success:
         print("[ERROR] Failed to move database.php to final location")
         return False
     
     print("[OK] database.php deployed successfully!")
     return True
 
-def deploy_migration():
-    """Deploy migration SQL file"""
+def show_migration_plan(runner):
+    """Show which migrations the ledger says are still pending"""
     print()
     print("="*70)
-    print("Step 2: Deploying Database Migration")
+    print("Step 2: Checking Database Migrations")
     print("="*70)
     
-    local_file = Path("migrations/add_fps_optimization_indexes.sql")
-    if not local_file.exists():
-        print("[ERROR] Migration file not found!")
-        print("Expected: migrations/add_fps_optimization_indexes.sql")
+    try:
+        runner.print_status()
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
         return False
-    
-    # Create migrations directory on remote
-    mkdir_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="sudo mkdir -p {REMOTE_MIGRATIONS_DIR} && sudo chown {REMOTE_USER}:{REMOTE_USER} {REMOTE_MIGRATIONS_DIR}"'
-    )
-    run_command(mkdir_cmd, check=False)
-    
-    # Upload migration file
-    local_file_str = str(local_file).replace('\\', '/')
-    temp_path = "/tmp/add_fps_optimization_indexes.sql"
-    remote_full_path = f"{REMOTE_MIGRATIONS_DIR}/add_fps_optimization_indexes.sql"
-    
-    upload_cmd = (
-        f"gcloud compute scp {local_file_str} "
-        f"{REMOTE_USER}@{INSTANCE_NAME}:{temp_path} "
-        f"--zone={ZONE}"
-    )
-    
-    if not run_command(upload_cmd, check=False):
-        print("[ERROR] Failed to upload migration file")
-        return False
-    
-    # Move to final location
-    move_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="sudo mv {temp_path} {remote_full_path} && sudo chown {REMOTE_USER}:{REMOTE_USER} {remote_full_path} && sudo chmod 644 {remote_full_path}"'
-    )
-    
-    if not run_command(move_cmd, check=False):
-        print("[ERROR] Failed to move migration file")
-        return False
-    
-    print("[OK] Migration file deployed successfully!")
     return True
 
-def get_db_credentials():
-    """Read database credentials from config.php on server"""
-    print("Reading database credentials from config.php on server...")
-    
-    # Read config.php and extract DB credentials
-    read_config_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="php -r \\"'
-        f'require_once \\\\\\"{REMOTE_BASE_DIR}/config.php\\\\\\"; '
-        f'echo DB_HOST . \\\\\\"|\\\\\\" . DB_NAME . \\\\\\"|\\\\\\" . DB_USER . \\\\\\"|\\\\\\" . DB_PASS;'
-        f'\\""'
-    )
-    
-    result = subprocess.run(read_config_cmd, shell=True, capture_output=True, text=True)
-    
-    if result.returncode == 0 and result.stdout and '|' in result.stdout:
-        parts = result.stdout.strip().split('|')
-        if len(parts) >= 4:
-            db_host, db_name, db_user, db_pass = parts[0], parts[1], parts[2], parts[3]
-            print(f"[OK] Found credentials: DB={db_name}, USER={db_user}, HOST={db_host}")
-            return db_host, db_name, db_user, db_pass
-    
-    # Fallback: ask user
-    print("[WARNING] Could not read config.php automatically")
-    print("Please provide MySQL credentials manually:")
-    db_user = input("MySQL username: ").strip()
-    db_pass = input("MySQL password (or press Enter if no password): ").strip()
-    db_name = input(f"Database name (default: {DB_NAME}): ").strip() or DB_NAME
-    db_host = "localhost"
-    
-    return db_host, db_name, db_user, db_pass
-
-def run_migration(db_creds=None):
-    """Run the migration on remote MySQL server"""
+def run_migration(runner):
+    """Apply pending migrations on the remote MySQL server"""
     print()
     print("="*70)
-    print("Step 3: Running Database Migration")
+    print("Step 3: Running Database Migrations")
     print("="*70)
     print()
-    print("This will create database indexes for FPS optimization.")
-    print("The migration is safe to run multiple times (checks if indexes exist).")
+    print("Pending migrations/*.sql files are applied in order, once each,")
+    print(f"and recorded in the {LEDGER_TABLE} table. Index builds run online")
+    print("(ALGORITHM=INPLACE, LOCK=NONE) so live sessions keep relaying.")
     print()
     
-    # Get database credentials if not provided
-    if db_creds is None:
-        db_creds = get_db_credentials()
-    
-    db_host, db_name, db_user, db_pass = db_creds
-    
-    # Build MySQL command
-    migration_file = f"{REMOTE_MIGRATIONS_DIR}/add_fps_optimization_indexes.sql"
-    
-    # Use mysql with password from stdin (more secure)
-    if db_pass:
-        # Use mysql with --password flag (will prompt, but we can pipe password)
-        # Note: Using -p with password in command is less secure but works for automation
-        mysql_cmd = f"mysql -h {db_host} -u {db_user} -p'{db_pass}' {db_name} < {migration_file}"
-    else:
-        mysql_cmd = f"mysql -h {db_host} -u {db_user} {db_name} < {migration_file}"
-    
-    # Run migration via SSH
-    run_migration_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="{mysql_cmd}"'
-    )
-    
-    print()
-    print("[INFO] Running migration...")
-    print(f"[INFO] Database: {db_name}, User: {db_user}, Host: {db_host}")
+    try:
+        success = runner.run()
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        success = False
     
-    if run_command(run_migration_cmd, check=False):
-        print("[OK] Migration completed successfully!")
+    if success:
+        print("[OK] Migrations completed successfully!")
         return True
     else:
         print("[ERROR] Migration failed!")
         print()
         print("Troubleshooting:")
-        print("1. Verify MySQL credentials are correct")
+        print("1. Verify MySQL credentials in config.php are correct")
         print("2. Check if MySQL is running: sudo systemctl status mysql")
-        print("3. Verify database exists and user has permissions")
-        print("4. Try running migration manually:")
-        print(f"   gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE}")
-        print(f"   mysql -h {db_host} -u {db_user} -p {db_name} < {migration_file}")
+        print("3. Verify database exists and user has ALTER/INDEX/CREATE permissions")
+        print("4. Check migration status / rerun:")
+        print("   python scripts/deploy/migration_runner.py --status")
+        print("   python scripts/deploy/migration_runner.py")
         return False
 
-def verify_indexes(db_host, db_name, db_user, db_pass):
-    """Verify that indexes were created"""
-    print()
+def plan_check_configured():
+    """True if PLAN_CHECK_* points the gate at a local MySQL/MariaDB server"""
+    return bool(os.getenv("PLAN_CHECK_DEFAULTS_FILE") or os.getenv("PLAN_CHECK_HOST"))
+
+def check_query_plans(report_path):
+    """Gate: EXPLAIN the hot-path queries on a seeded local MySQL before touching the VM"""
     print("="*70)
-    print("Step 4: Verifying Indexes")
+    print("Step 0: Query Plan Gate")
     print("="*70)
+    print("Hot queries must use indexes - no full scans, no filesorts.")
+    print("Local MySQL settings: PLAN_CHECK_DEFAULTS_FILE / PLAN_CHECK_HOST / PLAN_CHECK_USER")
+    print()
     
-    # SQL to check indexes
-    verify_sql = f"""
-SELECT 
-    TABLE_NAME,
-    INDEX_NAME, 
-    GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX SEPARATOR ', ') AS columns
-FROM INFORMATION_SCHEMA.STATISTICS 
-WHERE TABLE_SCHEMA = '{db_name}'
-AND TABLE_NAME IN ('sessions', 'relay_messages')
-AND INDEX_NAME IN (
-    'idx_relay_session_unread',
-    'idx_sessions_peer',
-    'idx_sessions_code_peer',
-    'idx_relay_session_created'
-)
-GROUP BY TABLE_NAME, INDEX_NAME
-ORDER BY TABLE_NAME, INDEX_NAME;
-"""
-    
-    # Save SQL to temp file using a simpler approach
-    temp_sql = "/tmp/verify_indexes.sql"
-    # Escape SQL for shell command (escape quotes and newlines)
-    verify_sql_escaped = verify_sql.replace('"', '\\"').replace('$', '\\$').replace('\n', '\\n')
-    
-    # Use echo with -e to write the SQL file
-    verify_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="echo -e \\"{verify_sql_escaped}\\" > {temp_sql}"'
-    )
-    run_command(verify_cmd, check=False)
+    if not shutil.which(os.getenv("PLAN_CHECK_MYSQL", "mysql")):
+        print("[ERROR] Local mysql client not found - install it or use --skip-plan-check")
+        return False
     
-    # Run verification
-    if db_pass:
-        verify_run_cmd = f"mysql -h {db_host} -u {db_user} -p'{db_pass}' {db_name} < {temp_sql}"
-    else:
-        verify_run_cmd = f"mysql -h {db_host} -u {db_user} {db_name} < {temp_sql}"
+    return run_gate(client_from_env(), report_path)
+
+def deploy_remote(session, args):
+    """Steps 1-3 on the VM. Returns True if all of them succeeded."""
+    success = True
     
-    verify_exec_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="{verify_run_cmd}"'
-    )
+    # Step 1: Deploy database.php
+    with session.step("Deploy database.php"):
+        if not deploy_database_php(session):
+            success = False
+    
+    # Step 2: Migration status from the schema_migrations ledger
+    runner = MigrationRunner(session)
+    # The option file holds the DB password: remove it whatever happens below
+    try:
+        with session.step("Check migrations"):
+            db_ready = runner.open_credentials(interactive=not args.non_interactive)
+            if not db_ready or not show_migration_plan(runner):
+                db_ready = False
+                success = False
     
-    print()
-    print("[INFO] Verifying indexes...")
-    result = subprocess.run(verify_exec_cmd, shell=True, capture_output=True, text=True)
+        # Step 3: Run migration (optional - user can skip)
+        if not db_ready:
+            print("[SKIP] Migrations not run (database not reachable).")
+        elif args.run_migration:
+            if not args.non_interactive:
+                print()
+                try:
+                    run_mig = input("Run database migration now? (y/n, default=y): ").strip().lower()
+                except EOFError:
+                    # Non-interactive mode (e.g., when piped)
+                    run_mig = 'y'
+            else:
+                run_mig = 'y'
+        
+            if run_mig != 'n':
+                with session.step("Run migrations"):
+                    if not run_migration(runner):
+                        success = False
+            else:
+                print("[SKIP] Migration not run. You can run it manually later:")
+                print("   python scripts/deploy/migration_runner.py")
+        else:
+            print("[SKIP] Migration not run (--skip-migration flag set).")
+            print("Run later with: python scripts/deploy/migration_runner.py")
+    finally:
+        runner.close()
     
-    if result.returncode == 0:
-        print("[OK] Index verification:")
-        print(result.stdout)
-        return True
-    else:
-        print("[WARNING] Could not verify indexes (this is OK if migration succeeded)")
-        if result.stderr:
-            print(f"Error: {result.stderr}")
-        return True  # Don't fail deployment if verification fails
+    return success
 
 def main():
     """Main deployment function"""
@@ -282,8 +179,13 @@ def main():
                         help='Run database migration (default: True)')
     parser.add_argument('--skip-migration', action='store_true',
                         help='Skip running database migration')
-    parser.add_argument('--verify', action='store_true',
-                        help='Verify indexes after migration')
+    parser.add_argument('--plan-check', action='store_true',
+                        help='Require the EXPLAIN query plan gate even without PLAN_CHECK_* settings '
+                             '(needs a local MySQL/MariaDB)')
+    parser.add_argument('--skip-plan-check', action='store_true',
+                        help='Skip the EXPLAIN query plan gate')
+    parser.add_argument('--plan-report', default=DEFAULT_REPORT,
+                        help=f'Query plan report path (default: {DEFAULT_REPORT})')
     parser.add_argument('--non-interactive', action='store_true',
                         help='Run non-interactively (auto-confirm all prompts)')
     args = parser.parse_args()
@@ -306,60 +208,28 @@ def main():
         print("Make sure you're running from the project root (zip-sharefast-api).")
         sys.exit(1)
     
-    if not Path("migrations/add_fps_optimization_indexes.sql").exists():
-        print("[ERROR] Migration file not found!")
-        print("Expected: migrations/add_fps_optimization_indexes.sql")
+    if not MIGRATIONS_DIR.exists():
+        print("[ERROR] Migrations directory not found!")
+        print(f"Expected: {MIGRATIONS_DIR}")
         sys.exit(1)
     
-    success = True
-    
-    # Step 1: Deploy database.php
-    if not deploy_database_php():
-        success = False
-    
-    # Step 2: Deploy migration
-    if not deploy_migration():
-        success = False
-    
-    # Step 3: Run migration (optional - user can skip)
-    db_creds = None
-    if args.run_migration:
-        if not args.non_interactive:
-            print()
-            try:
-                run_mig = input("Run database migration now? (y/n, default=y): ").strip().lower()
-            except EOFError:
-                # Non-interactive mode (e.g., when piped)
-                run_mig = 'y'
-        else:
-            run_mig = 'y'
-        
-        if run_mig != 'n':
-            db_creds = get_db_credentials()
-            if not run_migration(db_creds):
-                success = False
-        else:
-            print("[SKIP] Migration not run. You can run it manually later.")
-            print(f"Migration file location: {REMOTE_MIGRATIONS_DIR}/add_fps_optimization_indexes.sql")
-    else:
-        print("[SKIP] Migration not run (--skip-migration flag set).")
-        print(f"Migration file location: {REMOTE_MIGRATIONS_DIR}/add_fps_optimization_indexes.sql")
+    # Step 0: Refuse to deploy if a hot query would scan or filesort
+    if args.skip_plan_check:
+        print("[SKIP] Query plan gate (--skip-plan-check flag set).")
+    elif not args.plan_check and not plan_check_configured():
+        print("[WARNING] Query plan gate skipped - no local MySQL configured.")
+        print("Set PLAN_CHECK_DEFAULTS_FILE or PLAN_CHECK_HOST (or pass --plan-check) to gate the deploy")
+        print("on EXPLAIN plans; see scripts/deploy/DEPLOY_FPS_OPTIMIZATIONS.md.")
+    elif not check_query_plans(args.plan_report):
+        print()
+        print("[ERROR] Query plan gate failed - nothing was deployed.")
+        print(f"See {args.plan_report} for the EXPLAIN output of each query.")
+        sys.exit(1)
+    print()
     
-    # Step 4: Verify (optional)
-    if success and db_creds and (args.verify or (not args.non_interactive)):
-        if args.non_interactive and not args.verify:
-            verify = 'n'
-        elif args.verify:
-            verify = 'y'
-        else:
-            try:
-                verify = input("Verify indexes were created? (y/n, default=n): ").strip().lower()
-            except EOFError:
-                verify = 'n'
-        
-        if verify == 'y':
-            db_host, db_name, db_user, db_pass = db_creds
-            verify_indexes(db_host, db_name, db_user, db_pass)
+    # One multiplexed SSH connection for every remote step (closed on any exit)
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        success = deploy_remote(session, args)
     
     print()
     print("="*70)
@@ -371,9 +241,8 @@ def main():
         print()
         print("What was deployed:")
         print("1. [OK] database.php (connection pooling)")
-        print("2. [OK] Migration file (indexes)")
         if args.run_migration and not args.skip_migration:
-            print("3. [OK] Database indexes created")
+            print("2. [OK] Pending migrations applied (indexes)")
         print()
         print("Expected improvements:")
         print("- 10-50x faster database queries")
@@ -389,8 +258,9 @@ def main():
         print()
         print("Manual steps:")
         print("1. SSH to server: gcloud compute ssh dash@sharefast-websocket --zone=us-central1-a")
-        print("2. Run migration manually:")
-        print(f"   mysql -u USER -p {DB_NAME} < {REMOTE_MIGRATIONS_DIR}/add_fps_optimization_indexes.sql")
+        print("2. Check and apply migrations:")
+        print("   python scripts/deploy/migration_runner.py --status")
+        print("   python scripts/deploy/migration_runner.py")
     
     sys.exit(0 if success else 1)
 
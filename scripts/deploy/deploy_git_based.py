@@ -4,48 +4,183 @@ Reliable Git-based Deployment for ShareFast API to GCP VM
 
 This deployment method uses Git to maintain consistency and reliability:
 1. Clones/pulls the repository on the server
-2. Syncs files to the web directory
-3. Verifies deployment
-4. Supports rollback
+2. Prepares a versioned release directory off to the side
+3. Pre-warms the PHP opcode cache for every api/*.php in the release
+4. Measures a latency baseline, activates the release with one atomic
+   symlink swap, then probes again (relay send/receive, poll, keepalive)
+5. Rolls back automatically if p50/p95 latency or throughput regress past
+   the threshold (--regression-threshold, default 25%)
+6. Supports instant manual rollback (re-point the symlink to the previous release)
+
+Layout on the VM:
+    /opt/sharefast-releases/<YYYYmmddHHMMSS>-<sha>/   api/, database.php, *.html
+        config.php -> /opt/sharefast-shared/config.php
+        storage    -> /opt/sharefast-shared/storage
+    /var/www/html -> /opt/sharefast-releases/<current release>
+
+Traffic never sees a half-copied tree: the live path flips from one complete
+release to the next with a single rename(2).
 
 Benefits:
 - Single source of truth (Git repo)
 - Automatic file tracking (no manual file lists)
 - Cross-platform compatible
-- Rollback capability
+- Atomic activation and instant rollback
 - Deployment verification
+
+Usage:
+    python scripts/deploy/deploy_git_based.py                 # deploy GIT_BRANCH
+    python scripts/deploy/deploy_git_based.py --list          # list releases
+    python scripts/deploy/deploy_git_based.py --rollback      # re-point to previous release
+    python scripts/deploy/deploy_git_based.py --rollback-to <release>
 """
 
+import argparse
+import json
 import os
-import subprocess
 import sys
+import tempfile
 from pathlib import Path
 
+from deploy_session import DeploySession
+from latency_probe import REGRESSION_THRESHOLD_PCT, compare, run_probe
+
 # Configuration
 INSTANCE_NAME = "sharefast-websocket"
 ZONE = "us-central1-a"
 REMOTE_USER = os.getenv("GCLOUD_USER", "dash")
-REMOTE_BASE_DIR = "/var/www/html"
+REMOTE_BASE_DIR = "/var/www/html"  # Live path (symlink to the active release)
 REMOTE_REPO_DIR = "/opt/sharefast-api"
+REMOTE_RELEASES_DIR = "/opt/sharefast-releases"
+REMOTE_SHARED_DIR = "/opt/sharefast-shared"  # config.php + storage/ shared by all releases
 GIT_REPO_URL = os.getenv("GIT_REPO_URL", "https://github.com/XDM-ZSBW/zip-sharefast-api.git")
 GIT_BRANCH = os.getenv("GIT_BRANCH", "main")
+KEEP_RELEASES = int(os.getenv("KEEP_RELEASES", "5"))
+
+# Tracked paths that make up a release
+RELEASE_PATHS = "api database.php index.html admin.html"
+
+# Second-level opcode cache. The web SAPI must use the same directory so that
+# it loads the pre-compiled scripts instead of compiling them on the first
+# requests: the pre-warm step sets opcache.file_cache for each
+# /etc/php/*/apache2 where it is unset, and warns where it points elsewhere.
+OPCACHE_FILE_CACHE = os.getenv("OPCACHE_FILE_CACHE", "/var/cache/php/opcache")
+
+# Reload after the swap so workers drop their realpath cache of the old
+# release (the opcode file cache survives the reload)
+WEB_RELOAD_CMD = os.getenv("WEB_RELOAD_CMD", "sudo apache2ctl graceful")
+
+# Maintenance daemon (scripts/server/maintenance_daemon.py): runs from the
+# repository checkout - releases do not contain scripts/
+MAINTENANCE_UNIT = "sharefast-maintenance"
+
+# Baseline / post-deploy latency comparison (see latency_probe.py)
+PROBE_REPORT = "probe_report.json"
+
+def upload_and_run_script(session, script_content, remote_script):
+    """Upload a bash script (Unix line endings) and execute it on the VM"""
+    # Write script to local temp file (cross-platform, ensure Unix line endings)
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False, newline='\n') as f:
+        f.write(script_content)
+        local_script = Path(f.name)
 
-def run_command(cmd, check=True, capture_output=True):
-    """Run a shell command with better error handling"""
-    print(f"[RUN] {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=capture_output, text=True)
-    if result.returncode != 0:
-        print(f"[ERROR] Command failed: {cmd}")
-        if result.stderr:
-            print(f"Error: {result.stderr}")
+    try:
+        if not session.copy(local_script, remote_script):
+            return False, None
+        success, result = session.run(f"chmod +x {remote_script} && bash {remote_script}")
         if result.stdout:
-            print(f"Output: {result.stdout}")
-        if check:
-            return False, result
-        return False, result
-    return True, result
+            print(result.stdout)
+        return success, result
+    finally:
+        try:
+            local_script.unlink()
+        except OSError:
+            pass
 
-def deploy_via_git():
+def activate_release_script(release_dir):
+    """
+    Bash snippet that atomically points REMOTE_BASE_DIR at release_dir.
+    The symlink is built under a temp name and renamed over the live path.
+    """
+    return f"""
+set -e
+if [ -d "{REMOTE_BASE_DIR}" ] && [ ! -L "{REMOTE_BASE_DIR}" ]; then
+    # First release deploy: move the old copied tree aside (one-time)
+    echo "Moving legacy {REMOTE_BASE_DIR} to {REMOTE_BASE_DIR}.pre-releases"
+    sudo mv "{REMOTE_BASE_DIR}" "{REMOTE_BASE_DIR}.pre-releases"
+fi
+sudo ln -sfn "{release_dir}" "{REMOTE_BASE_DIR}.next"
+sudo mv -Tf "{REMOTE_BASE_DIR}.next" "{REMOTE_BASE_DIR}"
+{WEB_RELOAD_CMD} || echo "WARNING: web server reload failed"
+echo "ACTIVE=$(readlink "{REMOTE_BASE_DIR}")"
+# Exit status is the caller's proof that the swap happened
+[ "$(readlink "{REMOTE_BASE_DIR}")" = "{release_dir}" ]
+"""
+
+def list_releases(session):
+    """Return (releases oldest-first, active release path)"""
+    success, result = session.run(
+        f"ls -1d {REMOTE_RELEASES_DIR}/*/ 2>/dev/null | sed 's#/$##'; echo '---'; readlink {REMOTE_BASE_DIR} || true"
+    )
+    if not success or result is None:
+        return [], None
+    releases_part, _, active_part = result.stdout.partition('---')
+    releases = sorted(line.strip() for line in releases_part.splitlines() if line.strip())
+    active = active_part.strip() or None
+    return releases, active
+
+def print_releases(session):
+    releases, active = list_releases(session)
+    print("Releases (oldest first):")
+    if not releases:
+        print("  (none)")
+    for release in releases:
+        marker = "  <- active" if release == active else ""
+        print(f"  {Path(release).name}{marker}")
+    return True
+
+def rollback(session, target=None):
+    """Re-point the live symlink to the previous (or given) release"""
+    print("="*70)
+    print("Rollback")
+    print("="*70)
+
+    with session.step("Rollback"):
+        releases, active = list_releases(session)
+        if not releases:
+            print("[ERROR] No releases found on the VM")
+            return False
+
+        if target:
+            matches = [r for r in releases if Path(r).name == target]
+            if not matches:
+                print(f"[ERROR] Release not found: {target}")
+                print_releases(session)
+                return False
+            release = matches[0]
+        else:
+            if active not in releases:
+                print(f"[ERROR] Active path {active} is not a managed release - nothing to roll back to")
+                return False
+            idx = releases.index(active)
+            if idx == 0:
+                print("[ERROR] Active release is the oldest one kept - nothing to roll back to")
+                return False
+            release = releases[idx - 1]
+
+        print(f"Active:  {Path(active).name if active else '(none)'}")
+        print(f"Target:  {Path(release).name}")
+        success, result = session.run(activate_release_script(release))
+        if result is not None and result.stdout:
+            print(result.stdout)
+
+    if success:
+        print("[SUCCESS] Rollback completed")
+    else:
+        print("[ERROR] Rollback failed")
+    return success
+
+def deploy_via_git(session, probe=True, threshold=REGRESSION_THRESHOLD_PCT):
     """
     Deploy using Git-based method (most reliable)
     """
@@ -55,24 +190,22 @@ def deploy_via_git():
     print(f"Instance: {INSTANCE_NAME}")
     print(f"Zone: {ZONE}")
     print(f"Remote repo: {REMOTE_REPO_DIR}")
-    print(f"Web directory: {REMOTE_BASE_DIR}")
+    print(f"Releases: {REMOTE_RELEASES_DIR}")
+    print(f"Web directory: {REMOTE_BASE_DIR} (symlink to active release)")
     print(f"Git branch: {GIT_BRANCH}")
     print()
-    
+
     # Step 1: Ensure Git is installed on remote VM
-    print("[1/5] Checking Git installation on remote VM...")
-    git_check_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="which git || (sudo apt-get update && sudo apt-get install -y git)"'
-    )
-    success, _ = run_command(git_check_cmd, check=False)
+    print("[1/7] Checking Git installation on remote VM...")
+    with session.step("Check Git installation"):
+        success, _ = session.run("which git || (sudo apt-get update && sudo apt-get install -y git)")
     if not success:
         print("[WARNING] Git installation check failed, but continuing...")
     print()
-    
+
     # Step 2: Clone or update repository
-    print("[2/5] Setting up repository on remote VM...")
-    
+    print("[2/7] Setting up repository on remote VM...")
+
     # Create a deployment script locally and upload it
     deploy_script_content = f"""#!/bin/bash
 set -e
@@ -90,142 +223,276 @@ else
 fi
 echo "Repository setup complete"
 """
-    
-    # Write script to local temp file (cross-platform, ensure Unix line endings)
-    import tempfile
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False, newline='\n') as f:
-        f.write(deploy_script_content)
-        local_script = Path(f.name)
-    
-    # Upload and execute script
-    upload_cmd = (
-        f"gcloud compute scp {local_script} "
-        f"{REMOTE_USER}@{INSTANCE_NAME}:/tmp/deploy_repo.sh "
-        f"--zone={ZONE}"
-    )
-    
-    success, _ = run_command(upload_cmd, check=False)
-    if success:
-        exec_cmd = (
-            f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-            f'--command="chmod +x /tmp/deploy_repo.sh && bash /tmp/deploy_repo.sh"'
-        )
-        success, result = run_command(exec_cmd, check=False)
-        if result.stdout:
-            print(result.stdout)
-    
-    # Cleanup local script
-    try:
-        local_script.unlink()
-    except:
-        pass
-    
+
+    with session.step("Set up repository"):
+        success, _ = upload_and_run_script(session, deploy_script_content, "/tmp/deploy_repo.sh")
+
     if not success:
         print("[ERROR] Failed to setup repository")
         return False
     print()
-    
-    # Step 3: Sync files to web directory
-    print("[3/5] Syncing files to web directory...")
-    
-    sync_script_content = f"""#!/bin/bash
+
+    # Step 3: Prepare release directory (nothing live is touched)
+    print("[3/7] Preparing release directory...")
+
+    prepare_script_content = f"""#!/bin/bash
 set -e
-echo "Syncing files from {REMOTE_REPO_DIR} to {REMOTE_BASE_DIR}..."
+SHA=$(git -C {REMOTE_REPO_DIR} rev-parse --short HEAD)
+RELEASE={REMOTE_RELEASES_DIR}/$(date +%Y%m%d%H%M%S)-$SHA
+echo "Preparing $RELEASE..."
 
-# Create directories
-sudo mkdir -p {REMOTE_BASE_DIR}/api
-sudo mkdir -p {REMOTE_BASE_DIR}/storage
+sudo mkdir -p "$RELEASE" {REMOTE_SHARED_DIR}/storage
 
-# Copy files (preserve structure)
-sudo cp -r {REMOTE_REPO_DIR}/api/* {REMOTE_BASE_DIR}/api/
-sudo cp {REMOTE_REPO_DIR}/database.php {REMOTE_BASE_DIR}/ 2>/dev/null || true
-sudo cp {REMOTE_REPO_DIR}/index.html {REMOTE_BASE_DIR}/ 2>/dev/null || true
+# Export tracked files only (no .git, no untracked leftovers)
+git -C {REMOTE_REPO_DIR} archive HEAD {RELEASE_PATHS} | sudo tar -x -C "$RELEASE"
+git -C {REMOTE_REPO_DIR} rev-parse HEAD | sudo tee "$RELEASE/REVISION" > /dev/null
 
-# Set permissions
-sudo chown -R www-data:www-data {REMOTE_BASE_DIR}
-sudo find {REMOTE_BASE_DIR} -type f -exec chmod 644 {{}} \\;
-sudo find {REMOTE_BASE_DIR} -type d -exec chmod 755 {{}} \\;
-sudo chmod -R 755 {REMOTE_BASE_DIR}/storage
+# One-time: adopt config.php and storage/ from a legacy (non-symlink) web directory
+if [ -d "{REMOTE_BASE_DIR}" ] && [ ! -L "{REMOTE_BASE_DIR}" ]; then
+    if [ -f "{REMOTE_BASE_DIR}/config.php" ] && [ ! -e "{REMOTE_SHARED_DIR}/config.php" ]; then
+        sudo cp -a "{REMOTE_BASE_DIR}/config.php" "{REMOTE_SHARED_DIR}/config.php"
+    fi
+    if [ -d "{REMOTE_BASE_DIR}/storage" ]; then
+        sudo cp -a "{REMOTE_BASE_DIR}/storage/." "{REMOTE_SHARED_DIR}/storage/"
+    fi
+fi
+
+if [ ! -f "{REMOTE_SHARED_DIR}/config.php" ]; then
+    echo "ERROR: {REMOTE_SHARED_DIR}/config.php missing - copy config.php.example there and configure it"
+    exit 1
+fi
+
+# Shared state lives outside the release
+sudo ln -sfn {REMOTE_SHARED_DIR}/config.php "$RELEASE/config.php"
+sudo ln -sfn {REMOTE_SHARED_DIR}/storage "$RELEASE/storage"
 
-echo "Files synced successfully"
+# Permissions are fixed on the new tree only, before it serves traffic
+sudo chown -R www-data:www-data "$RELEASE" {REMOTE_SHARED_DIR}/storage
+sudo find "$RELEASE" -type f -exec chmod 644 {{}} +
+sudo find "$RELEASE" -type d -exec chmod 755 {{}} +
+sudo chmod -R 755 {REMOTE_SHARED_DIR}/storage
+
+echo "RELEASE=$RELEASE"
 """
-    
-    # Write script to local temp file (cross-platform, ensure Unix line endings)
-    import tempfile
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False, newline='\n') as f:
-        f.write(sync_script_content)
-        local_sync_script = Path(f.name)
-    
-    # Upload and execute script
-    upload_cmd = (
-        f"gcloud compute scp {local_sync_script} "
-        f"{REMOTE_USER}@{INSTANCE_NAME}:/tmp/sync_files.sh "
-        f"--zone={ZONE}"
-    )
-    
-    success, _ = run_command(upload_cmd, check=False)
-    if success:
-        exec_cmd = (
-            f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-            f'--command="chmod +x /tmp/sync_files.sh && bash /tmp/sync_files.sh"'
-        )
-        success, result = run_command(exec_cmd, check=False)
-        if result.stdout:
-            print(result.stdout)
-    
-    # Cleanup
-    try:
-        local_sync_script.unlink()
-    except:
-        pass
-    
+
+    with session.step("Prepare release"):
+        success, result = upload_and_run_script(session, prepare_script_content, "/tmp/prepare_release.sh")
+
+    release_dir = None
+    if success and result is not None:
+        for line in result.stdout.splitlines():
+            if line.startswith("RELEASE="):
+                release_dir = line.split("=", 1)[1].strip()
+
+    if not success or not release_dir:
+        print("[ERROR] Failed to prepare release")
+        return False
+    print()
+
+    # Step 4: Lint + pre-compile every api/*.php into the opcode file cache
+    print("[4/7] Pre-warming OPcache...")
+    prewarm_script_content = f"""#!/bin/bash
+set -e
+RELEASE="{release_dir}"
+FAILED=0
+for f in "$RELEASE"/api/*.php "$RELEASE"/database.php; do
+    if ! php -l "$f" > /dev/null; then
+        echo "SYNTAX ERROR: $f"
+        FAILED=1
+    fi
+done
+if [ "$FAILED" = "1" ]; then
+    exit 1
+fi
+
+sudo mkdir -p {OPCACHE_FILE_CACHE}
+sudo chown www-data:www-data {OPCACHE_FILE_CACHE}
+
+# The web SAPI must read the same file cache, or the pre-warm is wasted.
+# Configure it where unset (takes effect with the reload on activation).
+SAPI_DIRS=$(ls -d /etc/php/*/apache2 2>/dev/null || true)
+if [ -z "$SAPI_DIRS" ]; then
+    echo "WARNING: no /etc/php/*/apache2 configuration found - cannot check opcache.file_cache of the web SAPI"
+fi
+for dir in $SAPI_DIRS; do
+    current=$(grep -hs -E '^[[:space:]]*opcache\.file_cache[[:space:]]*=' "$dir/php.ini" "$dir"/conf.d/*.ini | tail -n 1 | cut -d= -f2- | tr -d ' "'"'"'')
+    if [ -z "$current" ]; then
+        echo "Setting opcache.file_cache={OPCACHE_FILE_CACHE} for $dir"
+        echo "opcache.file_cache={OPCACHE_FILE_CACHE}" | sudo tee "$dir/conf.d/99-sharefast-opcache.ini" > /dev/null
+    elif [ "$current" != "{OPCACHE_FILE_CACHE}" ]; then
+        echo "WARNING: $dir uses opcache.file_cache=$current, not {OPCACHE_FILE_CACHE} - the pre-warm will not reach the web server"
+        echo "         (set OPCACHE_FILE_CACHE=$current for deploys, or change the php.ini)"
+    fi
+done
+sudo -u www-data php -d opcache.enable_cli=1 -d opcache.file_cache={OPCACHE_FILE_CACHE} -d opcache.file_cache_only=1 -r '
+$compiled = 0;
+foreach (glob($argv[1] . "/api/*.php") as $file) {{
+    if (@opcache_compile_file($file)) {{
+        $compiled++;
+    }} else {{
+        echo "WARNING: could not compile $file\\n";
+    }}
+}}
+echo "Compiled $compiled scripts into the opcode cache\\n";
+' "$RELEASE"
+"""
+    with session.step("Pre-warm OPcache"):
+        success, _ = upload_and_run_script(session, prewarm_script_content, "/tmp/prewarm_release.sh")
     if not success:
-        print("[ERROR] Failed to sync files")
+        print("[ERROR] Pre-warm failed (syntax error?) - release NOT activated")
+        print(f"Release left in place for inspection: {release_dir}")
         return False
     print()
-    
-    # Step 4: Verify deployment
-    print("[4/5] Verifying deployment...")
-    verify_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="test -f {REMOTE_BASE_DIR}/api/status.php && echo \'SUCCESS: status.php found\' || echo \'ERROR: status.php not found\'; '
-        f'test -f {REMOTE_BASE_DIR}/api/diagnostic_dashboard.php && echo \'SUCCESS: diagnostic_dashboard.php found\' || echo \'ERROR: diagnostic_dashboard.php not found\'"'
-    )
-    success, result = run_command(verify_cmd, check=False)
-    if result.stdout:
+
+    # Step 5: Pre-deploy baseline against the release currently serving traffic
+    _, previous_release = list_releases(session)
+    baseline = None
+    if probe:
+        print("[5/7] Measuring pre-deploy baseline...")
+        with session.step("Baseline probe"):
+            baseline = run_probe(label="baseline")
+        if baseline is None:
+            print("[WARNING] No baseline - post-deploy probe will only check for errors")
+        print()
+    else:
+        print("[5/7] Skipping latency probe (--no-probe)")
+        print()
+
+    # Step 6: Atomic activation
+    print("[6/7] Activating release (atomic symlink swap)...")
+    with session.step("Activate release"):
+        success, result = session.run(activate_release_script(release_dir))
+    if result is not None and result.stdout:
         print(result.stdout)
+    if not success:
+        print("[ERROR] Failed to activate release")
+        return False
     print()
-    
-    # Step 5: Get deployment info
-    print("[5/5] Getting deployment information...")
-    info_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="cd {REMOTE_REPO_DIR} && git log -1 --oneline && echo \'---\' && git rev-parse HEAD"'
+
+    # Step 7: Verify deployment
+    print("[7/7] Verifying deployment...")
+    verify_cmd = (
+        f"test -f {REMOTE_BASE_DIR}/api/status.php && echo 'SUCCESS: status.php found' || echo 'ERROR: status.php not found'; "
+        f"test -f {REMOTE_BASE_DIR}/api/diagnostic_dashboard.php && echo 'SUCCESS: diagnostic_dashboard.php found' || echo 'ERROR: diagnostic_dashboard.php not found'; "
+        f"echo '---'; echo \"Active release: $(readlink {REMOTE_BASE_DIR})\"; cat {REMOTE_BASE_DIR}/REVISION; "
+        f"(cd {REMOTE_REPO_DIR} && git log -1 --oneline) || true"
     )
-    success, result = run_command(info_cmd, check=False)
-    if result.stdout:
-        print("Latest commit:")
-        print(result.stdout)
+    with session.step("Verify deployment"):
+        success, result = session.run(verify_cmd)
+    output = result.stdout if result is not None else ""
+    if output:
+        print(output)
     print()
-    
+    if not success or "ERROR:" in output or f"Active release: {release_dir}" not in output:
+        print("[ERROR] Verification failed - the new release is not serving correctly")
+        restore_previous_release(session, previous_release, release_dir)
+        return False
+
+    # Post-deploy probe: roll back automatically on regression
+    if probe:
+        with session.step("Post-deploy probe"):
+            after = run_probe(label="after deploy")
+        regressions = probe_regressions(baseline, after, threshold)
+        save_probe_report(baseline, after, regressions, release_dir)
+        if regressions:
+            print("[REGRESSION] Post-deploy probe exceeded the threshold:")
+            for line in regressions:
+                print(f"  {line}")
+            print()
+            restore_previous_release(session, previous_release, release_dir)
+            return False
+        print(f"[OK] No regression beyond {threshold:g}%")
+        print()
+
+    # Install / restart the maintenance daemon so it runs the code just deployed
+    with session.step("Install maintenance daemon"):
+        success, result = session.run(
+            f"sudo install -m 644 {REMOTE_REPO_DIR}/scripts/server/{MAINTENANCE_UNIT}.service /etc/systemd/system/ && "
+            f"sudo systemctl daemon-reload && sudo systemctl enable {MAINTENANCE_UNIT} && "
+            f"sudo systemctl restart {MAINTENANCE_UNIT} && systemctl is-active {MAINTENANCE_UNIT}"
+        )
+    if not success:
+        print(f"[WARNING] {MAINTENANCE_UNIT} not running - partition retention and cleanup are stopped")
+        print(f"  Check: sudo journalctl -u {MAINTENANCE_UNIT} -n 50")
+        print()
+
+    # Prune old releases (never the active one)
+    session.run(
+        f"cd {REMOTE_RELEASES_DIR} && ls -1d */ | sed 's#/$##' | sort | head -n -{KEEP_RELEASES} | "
+        f"grep -vx \"$(basename $(readlink {REMOTE_BASE_DIR}))\" | xargs -r sudo rm -rf"
+    )
+
     print("="*70)
     print("Deployment Summary")
     print("="*70)
     print("[SUCCESS] Git-based deployment completed!")
+    print(f"Active release: {release_dir}")
+    if probe:
+        print(f"Latency probe: {PROBE_REPORT}")
     print()
     print("Next steps:")
-    print("1. Test API: curl https://sharefast.zip/api/status.php")
-    print("2. Check diagnostic dashboard: https://sharefast.zip/api/diagnostic_dashboard.php")
-    print("3. View deployment: gcloud compute ssh dash@sharefast-websocket --zone=us-central1-a")
+    print("1. Check diagnostic dashboard: https://sharefast.zip/api/diagnostic_dashboard.php")
+    print("2. View deployment: gcloud compute ssh dash@sharefast-websocket --zone=us-central1-a")
     print()
-    print("To rollback:")
-    print(f"  gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} --command=\"cd {REMOTE_REPO_DIR} && git log --oneline -10\"")
-    print(f"  gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} --command=\"cd {REMOTE_REPO_DIR} && git checkout <commit-hash>\"")
+    print("To rollback (instant, re-points the symlink):")
+    print("  python scripts/deploy/deploy_git_based.py --rollback")
     print()
-    
+
     return True
 
+def restore_previous_release(session, previous_release, release_dir):
+    """Automatic rollback after a failed verification or probe"""
+    if previous_release and previous_release.startswith(REMOTE_RELEASES_DIR + "/"):
+        print(f"Rolling back to {Path(previous_release).name}...")
+        with session.step("Automatic rollback"):
+            rolled_back, result = session.run(activate_release_script(previous_release))
+        if result is not None and result.stdout:
+            print(result.stdout)
+        print("[ROLLED BACK] Previous release restored" if rolled_back else "[ERROR] Automatic rollback failed")
+    else:
+        print("[ERROR] No previous release to roll back to - the new release stays active")
+    print(f"Rejected release kept for inspection: {release_dir}")
+
+def probe_regressions(baseline, after, threshold):
+    """Regressions of the post-deploy probe (errors only when there is no baseline)"""
+    if after is None:
+        return ["post-deploy probe could not run (API not answering?)"]
+    if baseline is None:
+        return [f"{name}: {r['errors']} of {r['requests']} requests failed"
+                for name, r in after['endpoints'].items() if r['error_rate'] > 0.02]
+    return compare(baseline, after, threshold)
+
+def save_probe_report(baseline, after, regressions, release_dir):
+    report = {
+        'release': release_dir,
+        'baseline': baseline,
+        'after': after,
+        'regressions': regressions,
+    }
+    with open(PROBE_REPORT, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description='Git-based release deployment to GCP VM')
+    parser.add_argument('--rollback', action='store_true',
+                        help='Re-point the live symlink to the previous release')
+    parser.add_argument('--rollback-to', metavar='RELEASE',
+                        help='Re-point the live symlink to the named release')
+    parser.add_argument('--list', action='store_true',
+                        help='List releases on the VM')
+    parser.add_argument('--no-probe', action='store_true',
+                        help='Skip the pre/post-deploy latency probe and automatic rollback')
+    parser.add_argument('--regression-threshold', type=float, default=REGRESSION_THRESHOLD_PCT,
+                        help=f'Roll back when p50/p95 grow by more than this percent (default: {REGRESSION_THRESHOLD_PCT:g})')
+    args = parser.parse_args()
+
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        if args.list:
+            return print_releases(session)
+        if args.rollback or args.rollback_to:
+            return rollback(session, args.rollback_to)
+        return deploy_via_git(session, probe=not args.no_probe, threshold=args.regression_threshold)
+
 if __name__ == "__main__":
-    success = deploy_via_git()
+    success = main()
     sys.exit(0 if success else 1)
-
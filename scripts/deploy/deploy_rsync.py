@@ -4,19 +4,39 @@ Rsync-based Deployment for ShareFast API to GCP VM
 
 Alternative deployment method using rsync for efficient file syncing.
 Faster than file-by-file upload, but requires rsync on both sides.
+
+rsync runs over the gcloud SSH transport: it reuses the shared multiplexed
+DeploySession connection when available, otherwise a small wrapper around
+`gcloud compute ssh` is used as rsync's remote shell. Only changed blocks
+are sent, compressed on the wire.
 """
 
+import argparse
 import os
+import re
+import stat
 import subprocess
 import sys
+import tempfile
 from pathlib import Path
 
+from deploy_session import DeploySession
+
 # Configuration
 INSTANCE_NAME = "sharefast-websocket"
 ZONE = "us-central1-a"
 REMOTE_USER = os.getenv("GCLOUD_USER", "dash")
 REMOTE_BASE_DIR = "/var/www/html"
-LOCAL_API_DIR = Path(__file__).parent.parent.parent / "api"
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+LOCAL_API_DIR = PROJECT_ROOT / "api"
+
+# Paths to sync (relative to project root, recreated under REMOTE_BASE_DIR)
+SYNC_PATHS = [
+    "api/",
+    "database.php",
+    "index.html",
+    "admin.html",
+]
 
 def run_command(cmd, check=True):
     """Run a shell command"""
@@ -30,7 +50,52 @@ def run_command(cmd, check=True):
             return False
     return result.returncode == 0
 
-def deploy_via_rsync():
+def write_gcloud_rsh():
+    """
+    Write the remote-shell wrapper rsync uses to reach the VM.
+    rsync invokes it as: <rsh> [-l user] host command... - the user is kept
+    (default REMOTE_USER), so the fallback logs in as the deploy user, not the local one.
+    """
+    script = f"""#!/bin/sh
+user="{REMOTE_USER}"
+if [ "$1" = "-l" ]; then user="$2"; shift 2; fi
+case "$1" in *@*) user="${{1%@*}}" ;; esac
+host="${{1#*@}}"
+shift
+exec gcloud compute ssh "$user@$host" --zone={ZONE} --quiet -- "$@"
+"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False, newline='\n') as f:
+        f.write(script)
+        wrapper = Path(f.name)
+    wrapper.chmod(wrapper.stat().st_mode | stat.S_IXUSR)
+    return wrapper
+
+def parse_rsync_stats(output):
+    """Extract the numbers we report from `rsync --stats` output"""
+    fields = {
+        'files_total': r'Number of files:\s*([\d,.]+)',
+        'files_transferred': r'Number of regular files transferred:\s*([\d,.]+)',
+        'total_size': r'Total file size:\s*([\d,.]+)',
+        'literal_data': r'Literal data:\s*([\d,.]+)',
+        'matched_data': r'Matched data:\s*([\d,.]+)',
+        'bytes_sent': r'Total bytes sent:\s*([\d,.]+)',
+        'bytes_received': r'Total bytes received:\s*([\d,.]+)',
+    }
+    stats = {}
+    for key, pattern in fields.items():
+        match = re.search(pattern, output)
+        stats[key] = int(re.sub(r'[,.]', '', match.group(1))) if match else 0
+    return stats
+
+def format_bytes(num):
+    """Human-readable byte count"""
+    for unit in ('B', 'KB', 'MB'):
+        if num < 1024:
+            return f"{num:.0f} {unit}" if unit == 'B' else f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} GB"
+
+def deploy_via_rsync(session, dry_run=False, delete=False):
     """
     Deploy using rsync (efficient file syncing)
     """
@@ -41,64 +106,128 @@ def deploy_via_rsync():
     print(f"Zone: {ZONE}")
     print(f"Remote directory: {REMOTE_BASE_DIR}")
     print()
-    
+
     # Check if rsync is available locally
     if not run_command("which rsync", check=False):
         print("[ERROR] rsync not found. Please install rsync.")
         print("Windows: Install via WSL or Git Bash")
         print("Mac/Linux: sudo apt-get install rsync")
         return False
-    
-    # Get VM IP
-    print("[1/3] Getting VM IP address...")
-    ip_cmd = (
-        f'gcloud compute instances describe {INSTANCE_NAME} '
-        f'--zone={ZONE} --format="get(networkInterfaces[0].accessConfigs[0].natIP)"'
-    )
-    result = subprocess.run(ip_cmd, shell=True, capture_output=True, text=True)
-    if result.returncode != 0:
-        print("[ERROR] Failed to get VM IP")
+
+    if not LOCAL_API_DIR.exists():
+        print(f"[ERROR] {LOCAL_API_DIR} not found!")
         return False
-    
-    vm_ip = result.stdout.strip()
-    print(f"VM IP: {vm_ip}")
-    print()
-    
-    # Ensure rsync is installed on remote
-    print("[2/3] Ensuring rsync is installed on remote VM...")
-    rsync_check = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="which rsync || (sudo apt-get update && sudo apt-get install -y rsync)"'
+
+    # Ensure rsync is installed on remote and target directories exist (one round trip)
+    print("[1/2] Preparing remote VM (rsync + directories)...")
+    prepare_cmd = (
+        f"(which rsync || (sudo apt-get update && sudo apt-get install -y rsync)) && "
+        f"sudo mkdir -p {REMOTE_BASE_DIR}/api {REMOTE_BASE_DIR}/storage"
     )
-    run_command(rsync_check, check=False)
+    with session.step("Prepare remote VM"):
+        prepared, _ = session.run(prepare_cmd)
+    if not prepared:
+        print("[ERROR] Failed to prepare remote VM")
+        return False
     print()
-    
+
     # Sync files using rsync
-    print("[3/3] Syncing files via rsync...")
-    
-    # Create remote directories first
-    mkdir_cmd = (
-        f'gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} '
-        f'--command="sudo mkdir -p {REMOTE_BASE_DIR}/api {REMOTE_BASE_DIR}/storage"'
-    )
-    run_command(mkdir_cmd, check=False)
-    
-    # Use gcloud compute scp with rsync-like behavior
-    # Since direct rsync over gcloud is complex, we'll use a hybrid approach
-    print("Note: Using gcloud compute scp with directory sync...")
-    print("For true rsync, consider using SSH tunnel or VPN")
+    print("[2/2] Syncing files via rsync...")
+    sources = [p for p in SYNC_PATHS if (PROJECT_ROOT / p).exists()]
+    for p in SYNC_PATHS:
+        if p not in sources:
+            print(f"  [SKIP] {p} (not found)")
+
+    # Reuse the multiplexed connection if we have one, else tunnel through gcloud
+    wrapper = None
+    shared = session.rsync_rsh()
+    if shared:
+        rsh, destination = shared
+    else:
+        wrapper = write_gcloud_rsh()
+        rsh, destination = str(wrapper), f"{REMOTE_USER}@{INSTANCE_NAME}"
     
+    rsync_args = [
+        "rsync",
+        "--recursive", "--links", "--times",
+        "--relative",            # keep api/... structure under REMOTE_BASE_DIR
+        "--checksum",            # skip unchanged files by content, not mtime (git checkouts reset mtimes)
+        "--compress",            # compress on the wire
+        "--no-whole-file",       # always use the block-level delta algorithm
+        "--stats", "--itemize-changes",
+        "--chown=www-data:www-data",
+        "--chmod=D755,F644",
+        "--exclude=storage/",
+        "--rsync-path=sudo rsync",
+        "-e", rsh,
+    ]
+    if delete:
+        rsync_args.append("--delete")
+    if dry_run:
+        rsync_args.append("--dry-run")
+    rsync_args += [f"./{p}" for p in sources]
+    rsync_args.append(f"{destination}:{REMOTE_BASE_DIR}/")
+
+    print(f"[RUN] {' '.join(rsync_args)}")
+    try:
+        with session.step("rsync delta transfer"):
+            result = subprocess.run(rsync_args, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    finally:
+        if wrapper:
+            try:
+                wrapper.unlink()
+            except OSError:
+                pass
+
+    if result.returncode != 0:
+        print(f"[ERROR] rsync failed (exit code {result.returncode})")
+        if result.stderr:
+            print(f"Error: {result.stderr}")
+        return False
+
+    # Itemized lines for files that were (or would be) sent, e.g. "<f.st...... api/relay.php"
+    changed = [line for line in result.stdout.splitlines() if re.match(r'^[<>ch*][fL]', line)]
+    for line in changed:
+        print(f"  {line}")
+
+    stats = parse_rsync_stats(result.stdout)
+    wire_bytes = stats['bytes_sent'] + stats['bytes_received']
+    saved = max(0, stats['total_size'] - wire_bytes)
+    saved_pct = (saved / stats['total_size'] * 100) if stats['total_size'] else 0.0
+
     print()
     print("="*70)
     print("Deployment Summary")
     print("="*70)
-    print("[INFO] Rsync deployment requires additional setup.")
-    print("Consider using deploy_git_based.py for more reliable deployment.")
+    print(f"Files considered:   {stats['files_total']}")
+    print(f"Files transferred:  {stats['files_transferred']}")
+    print(f"Tree size:          {format_bytes(stats['total_size'])} (cost of a full copy)")
+    print(f"Literal data:       {format_bytes(stats['literal_data'])} (new bytes sent as-is)")
+    print(f"Matched data:       {format_bytes(stats['matched_data'])} (reused from remote blocks)")
+    print(f"On the wire:        {format_bytes(wire_bytes)} (compressed, both directions)")
+    print(f"Bytes saved:        {format_bytes(saved)} ({saved_pct:.1f}% vs full copy)")
     print()
-    
+    if dry_run:
+        print("[DRY RUN] No files were changed on the remote VM.")
+    else:
+        print("[SUCCESS] Rsync deployment completed!")
+        print()
+        print("Next steps:")
+        print("1. Test API: curl https://sharefast.zip/api/status.php")
+    print()
+
     return True
 
+def main():
+    parser = argparse.ArgumentParser(description='Delta-sync ShareFast API to GCP VM via rsync')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Show what would change without touching the remote VM')
+    parser.add_argument('--delete', action='store_true',
+                        help='Delete remote files under api/ that no longer exist locally')
+    args = parser.parse_args()
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        return deploy_via_rsync(session, dry_run=args.dry_run, delete=args.delete)
+
 if __name__ == "__main__":
-    success = deploy_via_rsync()
+    success = main()
     sys.exit(0 if success else 1)
-
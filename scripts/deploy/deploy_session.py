@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Shared deploy session for ShareFast deploy scripts
+
+Opens ONE multiplexed SSH control connection to the GCP VM per deploy run
+and sends every remote command and file copy over it, instead of starting a
+new `gcloud compute ssh` (key lookup + metadata round trip + TCP/SSH
+handshake) for each command.
+
+How it works:
+1. `gcloud compute ssh --dry-run` resolves the real ssh command line once
+   (key file, known-hosts file, host alias, IP / IAP proxy)
+2. A background ssh master is started with ControlMaster/ControlPersist
+3. run()/copy() reuse the master socket via plain ssh/scp
+
+On platforms without ControlMaster support (Windows OpenSSH) or if the
+dry-run cannot be resolved, it falls back to one gcloud call per command.
+
+Each remote call and each step() block is timed; print_timings() shows
+where deploy time went.
+
+Usage:
+    from deploy_session import DeploySession
+
+    with DeploySession() as session:
+        with session.step("Upload"):
+            session.copy("database.php", "/tmp/database.php")
+        success, result = session.run("sudo mv /tmp/database.php /var/www/html/")
+"""
+
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Configuration (same defaults as the individual deploy scripts)
+INSTANCE_NAME = "sharefast-websocket"
+ZONE = "us-central1-a"
+REMOTE_USER = os.getenv("GCLOUD_USER", "dash")
+CONTROL_PERSIST_SECONDS = 600
+
+# ssh options that take a value (so we keep flag + value together when parsing)
+SSH_OPTS_WITH_VALUE = {'-i', '-o', '-p', '-F', '-J', '-l'}
+
+class DeploySession:
+    """One multiplexed SSH connection to the VM, shared by all remote steps"""
+
+    def __init__(self, instance=INSTANCE_NAME, zone=ZONE, user=REMOTE_USER, verbose=True):
+        self.instance = instance
+        self.zone = zone
+        self.user = user
+        self.verbose = verbose
+        self.target = f"{user}@{instance}"
+        self.gcloud = shutil.which('gcloud') or 'gcloud'
+        self.multiplexed = False
+        self.transport = 'gcloud per command'
+        self.timings = []
+        self._ssh_opts = []
+        self._destination = None
+        self._control_dir = None
+        self._control_path = None
+        self._started_at = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        self.print_timings()
+        return False
+
+    def open(self):
+        """Resolve the ssh command via gcloud and start the control master"""
+        self._started_at = time.perf_counter()
+        with self.step("Open SSH session"):
+            if sys.platform == 'win32':
+                self._log("[INFO] SSH multiplexing not supported on Windows - using one gcloud call per command")
+                return False
+
+            if not self._resolve_ssh_command():
+                self._log("[WARNING] Could not resolve ssh command via gcloud - using one gcloud call per command")
+                return False
+
+            self._control_dir = tempfile.mkdtemp(prefix='sfdeploy-', dir='/tmp' if os.path.isdir('/tmp') else None)
+            self._control_path = os.path.join(self._control_dir, 'ctl')
+
+            master_cmd = ['ssh'] + self._ssh_opts + [
+                '-o', 'ControlMaster=yes',
+                '-o', f'ControlPath={self._control_path}',
+                '-o', f'ControlPersist={CONTROL_PERSIST_SECONDS}',
+                '-o', 'ServerAliveInterval=30',
+                '-N', '-f',
+                self._destination,
+            ]
+            self._log(f"[RUN] {' '.join(shlex.quote(a) for a in master_cmd)}")
+            result = subprocess.run(master_cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                self._log("[WARNING] Failed to start SSH control master - using one gcloud call per command")
+                if result.stderr:
+                    self._log(f"Error: {result.stderr}")
+                self._cleanup_control_dir()
+                return False
+
+            self.multiplexed = True
+            self.transport = 'multiplexed SSH'
+            self._log(f"[OK] SSH session open ({self._destination}, multiplexed)")
+            return True
+
+    def close(self):
+        """Stop the control master"""
+        if self.multiplexed:
+            subprocess.run(
+                ['ssh', '-o', f'ControlPath={self._control_path}', '-O', 'exit', self._destination],
+                capture_output=True, text=True
+            )
+            self.multiplexed = False
+        self._cleanup_control_dir()
+
+    def _cleanup_control_dir(self):
+        if self._control_dir:
+            shutil.rmtree(self._control_dir, ignore_errors=True)
+            self._control_dir = None
+
+    def _resolve_ssh_command(self):
+        """Parse `gcloud compute ssh --dry-run` into ssh options + destination"""
+        cmd = [self.gcloud, 'compute', 'ssh', self.target, f'--zone={self.zone}', '--dry-run']
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0 or not result.stdout.strip():
+            if result.stderr:
+                self._log(f"Error: {result.stderr.strip()}")
+            return False
+
+        try:
+            tokens = shlex.split(result.stdout.strip().splitlines()[-1])
+        except ValueError:
+            return False
+        if not tokens or not os.path.basename(tokens[0]).startswith('ssh'):
+            return False
+
+        opts = []
+        destination = None
+        i = 1
+        while i < len(tokens):
+            token = tokens[i]
+            if token in ('-t', '-T'):
+                i += 1
+                continue
+            if token in SSH_OPTS_WITH_VALUE and i + 1 < len(tokens):
+                opts += [token, tokens[i + 1]]
+                i += 2
+                continue
+            if token.startswith('-'):
+                opts.append(token)
+            else:
+                destination = token
+                break
+            i += 1
+
+        if not destination:
+            return False
+
+        self._ssh_opts = opts
+        self._destination = destination
+        return True
+
+    # ------------------------------------------------------------------
+    # Remote operations
+    # ------------------------------------------------------------------
+
+    def ssh_command(self, remote_cmd):
+        """Argument list that runs remote_cmd on the VM"""
+        if self.multiplexed:
+            return ['ssh'] + self._ssh_opts + ['-o', f'ControlPath={self._control_path}', self._destination, remote_cmd]
+        return [self.gcloud, 'compute', 'ssh', self.target, f'--zone={self.zone}', f'--command={remote_cmd}']
+
+    def scp_command(self, local_path, remote_path):
+        """Argument list that copies local_path to remote_path on the VM"""
+        local_path = str(local_path).replace('\\', '/')
+        if self.multiplexed:
+            scp_opts = []
+            i = 0
+            while i < len(self._ssh_opts):
+                flag = self._ssh_opts[i]
+                if flag in SSH_OPTS_WITH_VALUE:
+                    value = self._ssh_opts[i + 1]
+                    if flag == '-p':
+                        scp_opts += ['-P', value]  # scp spells the port flag differently
+                    elif flag != '-l':
+                        scp_opts += [flag, value]
+                    i += 2
+                    continue
+                scp_opts.append(flag)
+                i += 1
+            return ['scp'] + scp_opts + ['-o', f'ControlPath={self._control_path}', local_path, f"{self._destination}:{remote_path}"]
+        return [self.gcloud, 'compute', 'scp', local_path, f"{self.target}:{remote_path}", f'--zone={self.zone}']
+
+    def rsync_rsh(self):
+        """
+        Remote shell string for `rsync -e`, reusing the control connection.
+        Returns (rsh, destination host) or None if not multiplexed.
+        """
+        if not self.multiplexed:
+            return None
+        rsh = ' '.join(shlex.quote(a) for a in ['ssh'] + self._ssh_opts + ['-o', f'ControlPath={self._control_path}'])
+        return rsh, self._destination
+
+    def run(self, remote_cmd, check=True, capture_output=True, label=None, input=None):
+        """
+        Run a command on the VM.
+        input (str) is fed to the remote command's stdin - use it for secrets
+        and SQL so they never appear on a command line.
+        Returns (success, CompletedProcess) like the deploy scripts' run_command().
+        """
+        self._log(f"[RUN] ssh {self.target}: {remote_cmd}")
+        return self._execute(self.ssh_command(remote_cmd), label or f"ssh: {remote_cmd}", capture_output, input)
+
+    def copy(self, local_path, remote_path, label=None):
+        """Copy a local file to the VM. Returns True on success."""
+        self._log(f"[RUN] scp {local_path} -> {self.target}:{remote_path}")
+        success, _ = self._execute(self.scp_command(local_path, remote_path), label or f"scp: {local_path}", True)
+        return success
+
+    def _execute(self, args, label, capture_output, input=None):
+        start = time.perf_counter()
+        result = subprocess.run(args, capture_output=capture_output, text=True, input=input)
+        self.timings.append((label, time.perf_counter() - start))
+        if result.returncode != 0:
+            self._log(f"[ERROR] Command failed with exit code {result.returncode}")
+            if result.stderr:
+                self._log(f"Error: {result.stderr}")
+            if result.stdout:
+                self._log(f"Output: {result.stdout}")
+            return False, result
+        return True, result
+
+    # ------------------------------------------------------------------
+    # Timing
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def step(self, name):
+        """Time a named deploy step (wraps any number of remote calls)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings.append((f"[step] {name}", elapsed))
+            self._log(f"[TIME] {name}: {elapsed:.2f}s")
+
+    def print_timings(self):
+        """Print per-step and per-command wall time"""
+        if not self.timings:
+            return
+        total = time.perf_counter() - self._started_at if self._started_at else sum(t for _, t in self.timings)
+        print()
+        print("="*70)
+        print(f"Deploy Timing ({self.transport})")
+        print("="*70)
+        for label, elapsed in self.timings:
+            short = label if len(label) <= 58 else label[:55] + '...'
+            print(f"  {short:<58} {elapsed:8.2f}s")
+        print(f"  {'Total wall time':<58} {total:8.2f}s")
+        print()
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
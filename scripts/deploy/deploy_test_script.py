@@ -5,27 +5,18 @@ Deploys just the test script to GCP VM
 """
 
 import os
-import subprocess
 import sys
 from pathlib import Path
 
+from deploy_session import DeploySession
+
 # Configuration
 INSTANCE_NAME = "sharefast-websocket"
 ZONE = "us-central1-a"
 REMOTE_USER = os.getenv("GCLOUD_USER", "dash")
 REMOTE_BASE_DIR = "/var/www/html"
 
-def run_command(cmd, check=True):
-    """Run a shell command"""
-    print(f"[RUN] {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    if result.returncode != 0 and check:
-        print(f"[ERROR] Command failed: {cmd}")
-        print(f"Error: {result.stderr}")
-        return False
-    return result.returncode == 0
-
-def deploy_test_script():
+def deploy_test_script(session):
     """Deploy test_frame_flow.php to GCP VM"""
     print("="*70)
     print("Deploying test_frame_flow.php to GCP VM")
@@ -58,22 +49,16 @@ def deploy_test_script():
     
     # Upload file
     remote_path = f"{REMOTE_BASE_DIR}/api/test_frame_flow.php"
-    upload_cmd = (
-        f"gcloud compute scp {local_file} "
-        f"{REMOTE_USER}@{INSTANCE_NAME}:{remote_path} "
-        f"--zone={ZONE}"
-    )
+    with session.step("Upload test_frame_flow.php"):
+        uploaded = session.copy(local_file, remote_path)
     
-    if not run_command(upload_cmd, check=False):
+    if not uploaded:
         print("[ERROR] Failed to upload file")
         return False
     
     # Set permissions
-    chown_cmd = (
-        f"gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} "
-        f"--command='sudo chown www-data:www-data {remote_path} && sudo chmod 644 {remote_path}'"
-    )
-    run_command(chown_cmd, check=False)
+    with session.step("Set permissions"):
+        session.run(f"sudo chown www-data:www-data {remote_path} && sudo chmod 644 {remote_path}")
     
     print()
     print("="*70)
@@ -85,6 +70,7 @@ def deploy_test_script():
     return True
 
 if __name__ == "__main__":
-    success = deploy_test_script()
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        success = deploy_test_script(session)
     sys.exit(0 if success else 1)
 
@@ -5,31 +5,18 @@ Quick deployment script for website updates
 """
 
 import os
-import subprocess
 import sys
 from pathlib import Path
 
+from deploy_session import DeploySession
+
 # Configuration
 INSTANCE_NAME = "sharefast-websocket"
 ZONE = "us-central1-a"
 REMOTE_USER = os.getenv("GCLOUD_USER", "dash")
 REMOTE_BASE_DIR = "/var/www/html"
 
-def run_command(cmd, check=True):
-    """Run a shell command"""
-    print(f"[RUN] {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"[ERROR] Command failed with exit code {result.returncode}")
-        if result.stderr:
-            print(f"Error output: {result.stderr}")
-        if result.stdout:
-            print(f"Standard output: {result.stdout}")
-        if check:
-            return False
-    return result.returncode == 0
-
-def deploy_website_files():
+def deploy_website_files(session):
     """Deploy website files to GCP VM"""
     print("="*70)
     print("Deploying ShareFast Website Files to GCP VM")
@@ -61,24 +48,20 @@ def deploy_website_files():
         remote_full_path = f"{REMOTE_BASE_DIR}/{remote_path}"
         
         print(f"[{idx}/{len(files_to_deploy)}] Uploading {local_path}...")
-        upload_cmd = (
-            f"gcloud compute scp {local_file} "
-            f"{REMOTE_USER}@{INSTANCE_NAME}:{temp_remote} "
-            f"--zone={ZONE}"
-        )
-        
-        if not run_command(upload_cmd, check=False):
-            print(f"[{idx}/{len(files_to_deploy)}] [FAILED] {remote_path} (upload failed)")
-            failed += 1
-            continue
-        
-        # Move to final location and set permissions with sudo
-        move_cmd = (
-            f"gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} "
-            f'--command="sudo mkdir -p {REMOTE_BASE_DIR}/{Path(remote_path).parent} && sudo mv {temp_remote} {remote_full_path} && sudo chown www-data:www-data {remote_full_path} && sudo chmod 644 {remote_full_path}"'
-        )
+        with session.step(f"Deploy {remote_path}"):
+            if not session.copy(local_file, temp_remote):
+                print(f"[{idx}/{len(files_to_deploy)}] [FAILED] {remote_path} (upload failed)")
+                failed += 1
+                continue
+            
+            # Move to final location and set permissions with sudo
+            move_cmd = (
+                f"sudo mkdir -p {REMOTE_BASE_DIR}/{Path(remote_path).parent} && sudo mv {temp_remote} {remote_full_path} && "
+                f"sudo chown www-data:www-data {remote_full_path} && sudo chmod 644 {remote_full_path}"
+            )
+            moved, _ = session.run(move_cmd)
         
-        if run_command(move_cmd, check=False):
+        if moved:
             print(f"[{idx}/{len(files_to_deploy)}] [OK] {remote_path}")
             uploaded += 1
         else:
@@ -105,6 +88,7 @@ def deploy_website_files():
         return False
 
 if __name__ == "__main__":
-    success = deploy_website_files()
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        success = deploy_website_files(session)
     sys.exit(0 if success else 1)
 
@@ -4,27 +4,18 @@ Deploy WebSocket Relay Server to GCP VM (sharefast-websocket)
 """
 
 import os
-import subprocess
 import sys
 from pathlib import Path
 
+from deploy_session import DeploySession
+
 # Configuration
 INSTANCE_NAME = "sharefast-websocket"
 ZONE = "us-central1-a"
 REMOTE_USER = os.getenv("GCLOUD_USER", "dash")
 REMOTE_DIR = "/opt/sharefast-websocket"
 
-def run_command(cmd, check=True):
-    """Run a shell command"""
-    print(f"[RUN] {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    if result.returncode != 0 and check:
-        print(f"[ERROR] Command failed: {cmd}")
-        print(f"Error: {result.stderr}")
-        return False
-    return result.returncode == 0
-
-def deploy_websocket_server():
+def deploy_websocket_server(session):
     """Deploy WebSocket server file to GCP VM"""
     print("="*70)
     print("Deploying WebSocket Relay Server to GCP VM")
@@ -41,31 +32,23 @@ def deploy_websocket_server():
         return False
     
     print("[1/4] Creating remote directory...")
-    create_dir_cmd = (
-        f"gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} "
-        f"--command='sudo mkdir -p {REMOTE_DIR} && sudo chown -R {REMOTE_USER}:{REMOTE_USER} {REMOTE_DIR}'"
-    )
-    if not run_command(create_dir_cmd, check=False):
+    with session.step("Create remote directory"):
+        success, _ = session.run(f"sudo mkdir -p {REMOTE_DIR} && sudo chown -R {REMOTE_USER}:{REMOTE_USER} {REMOTE_DIR}")
+    if not success:
         print("[WARNING] Directory creation may have failed (may already exist)")
     
     print()
     print("[2/4] Uploading WebSocket server file...")
-    upload_cmd = (
-        f"gcloud compute scp {websocket_file} "
-        f"{REMOTE_USER}@{INSTANCE_NAME}:{REMOTE_DIR}/ "
-        f"--zone={ZONE}"
-    )
-    if not run_command(upload_cmd):
+    with session.step("Upload WebSocket server"):
+        uploaded = session.copy(websocket_file, f"{REMOTE_DIR}/")
+    if not uploaded:
         print("[ERROR] Failed to upload WebSocket server file")
         return False
     
     print()
     print("[3/4] Setting permissions...")
-    chmod_cmd = (
-        f"gcloud compute ssh {REMOTE_USER}@{INSTANCE_NAME} --zone={ZONE} "
-        f"--command='sudo chmod +x {REMOTE_DIR}/websocket_relay_server.js'"
-    )
-    run_command(chmod_cmd, check=False)  # Not critical if it fails
+    with session.step("Set permissions"):
+        session.run(f"sudo chmod +x {REMOTE_DIR}/websocket_relay_server.js")  # Not critical if it fails
     
     print()
     print("[4/4] Deployment complete!")
@@ -91,6 +74,7 @@ def deploy_websocket_server():
     return True
 
 if __name__ == "__main__":
-    success = deploy_websocket_server()
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        success = deploy_websocket_server(session)
     sys.exit(0 if success else 1)
 
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Post-deploy latency probe for the ShareFast API
+
+Measures the endpoints a live session hits every frame and compares them with
+a baseline taken before the deploy:
+- relay.php send     (client -> admin frame)
+- relay.php receive  (admin drains its queue)
+- poll.php           (signal poll)
+- keepalive.php
+
+A throwaway client/admin pair is created through generate_test_session.php.
+Each endpoint is warmed up (connections opened, OPcache/buffer pool touched)
+and then hit by a few concurrent keep-alive connections; p50/p95/p99 latency,
+throughput and error rate are reported per endpoint.
+
+A regression is a p50 or p95 that grows by more than the threshold percent
+(and by more than a small absolute floor, so 3ms -> 4ms is not a failure),
+a throughput drop beyond the threshold, or a higher error rate.
+
+Usage:
+    python scripts/deploy/latency_probe.py --save baseline.json
+    ... deploy ...
+    python scripts/deploy/latency_probe.py --baseline baseline.json   # exit 1 on regression
+
+deploy_git_based.py runs this automatically around the symlink swap and
+rolls back when the threshold is exceeded.
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import math
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Configuration
+API_BASE_URL = os.getenv("PROBE_API_URL", "https://sharefast.zip/api")
+REQUESTS_PER_ENDPOINT = int(os.getenv("PROBE_REQUESTS", "100"))
+WARMUP_REQUESTS = int(os.getenv("PROBE_WARMUP", "10"))
+CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", "4"))
+FRAME_BYTES = int(os.getenv("PROBE_FRAME_BYTES", "20000"))
+REGRESSION_THRESHOLD_PCT = float(os.getenv("PROBE_REGRESSION_PCT", "25"))
+MIN_DELTA_MS = float(os.getenv("PROBE_MIN_DELTA_MS", "10"))
+REQUEST_TIMEOUT = 10
+
+# poll.php is rate limited per session and IP (signal budget burst in api/rate_limit.php)
+POLL_MAX_REQUESTS = 40
+
+ENDPOINTS = ['relay_send', 'relay_receive', 'poll', 'keepalive']
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def fmt_ms(value):
+    return f"{value:.1f}" if value is not None else "-"
+
+class ApiClient:
+    """One keep-alive HTTP(S) connection to the API"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.path = parts.path.rstrip('/')
+        conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.conn = conn_class(parts.netloc, timeout=REQUEST_TIMEOUT)
+
+    def post(self, script, payload):
+        """POST JSON; returns (http status, parsed body or None)"""
+        body = json.dumps(payload)
+        try:
+            self.conn.request('POST', f"{self.path}/{script}", body=body,
+                              headers={'Content-Type': 'application/json', 'Connection': 'keep-alive'})
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            return 0, None
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+
+    def close(self):
+        self.conn.close()
+
+def create_probe_session(base_url):
+    """Create a linked client/admin pair. Returns dict or None."""
+    client = ApiClient(base_url)
+    try:
+        status, body = client.post('generate_test_session.php', {})
+    finally:
+        client.close()
+    if status != 200 or not body or not body.get('success'):
+        return None
+    return {
+        'code': body['code'],
+        'client_session_id': body['client_session_id'],
+        'admin_session_id': body['admin_session_id'],
+    }
+
+def endpoint_requests(probe_session, frame_data):
+    """(script, payload) for each probed endpoint"""
+    code = probe_session['code']
+    client_id = probe_session['client_session_id']
+    admin_id = probe_session['admin_session_id']
+    return {
+        'relay_send': ('relay.php', {'action': 'send', 'session_id': client_id, 'code': code,
+                                     'type': 'frame', 'data': frame_data}),
+        'relay_receive': ('relay.php', {'action': 'receive', 'session_id': admin_id, 'code': code}),
+        'poll': ('poll.php', {'session_id': client_id, 'code': code}),
+        'keepalive': ('keepalive.php', {'session_id': client_id, 'code': code}),
+    }
+
+def measure(base_url, script, payload, total, warmup, concurrency):
+    """Warm up, then send `total` requests over `concurrency` connections"""
+    latencies = []
+    errors = 0
+    rate_limited = 0
+    lock = threading.Lock()
+    remaining = [total]
+
+    clients = [ApiClient(base_url) for _ in range(concurrency)]
+    for i in range(warmup):
+        clients[i % concurrency].post(script, payload)
+
+    def worker(client):
+        nonlocal errors, rate_limited
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            status, body = client.post(script, payload)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                if status == 429:
+                    rate_limited += 1
+                elif status != 200 or body is None or body.get('success') is False:
+                    errors += 1
+                else:
+                    latencies.append(elapsed_ms)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    for c in clients:
+        c.close()
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'ok': len(latencies),
+        'errors': errors,
+        'rate_limited': rate_limited,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+    }
+
+def run_probe(base_url=API_BASE_URL, requests=REQUESTS_PER_ENDPOINT, warmup=WARMUP_REQUESTS,
+              concurrency=CONCURRENCY, frame_bytes=FRAME_BYTES, label="probe"):
+    """Probe every endpoint. Returns a result dict, or None if no test session could be created."""
+    print(f"[PROBE] {label}: {base_url} ({requests} requests/endpoint, {concurrency} connections, "
+          f"{warmup} warm-up)")
+    probe_session = create_probe_session(base_url)
+    if not probe_session:
+        print("[ERROR] Could not create a probe session via generate_test_session.php")
+        return None
+
+    frame_data = base64.b64encode(os.urandom(frame_bytes)).decode('ascii')
+    results = {}
+    for name, (script, payload) in endpoint_requests(probe_session, frame_data).items():
+        total = min(requests, POLL_MAX_REQUESTS) if name == 'poll' else requests
+        results[name] = measure(base_url, script, payload, total, warmup if name != 'poll' else 2, concurrency)
+
+    report = {
+        'label': label,
+        'base_url': base_url,
+        'measured_at': int(time.time()),
+        'frame_bytes': frame_bytes,
+        'endpoints': results,
+    }
+    print_results(report)
+    return report
+
+def print_results(report):
+    print(f"  {'Endpoint':<15} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'errors':>7}")
+    for name in ENDPOINTS:
+        r = report['endpoints'].get(name)
+        if not r:
+            continue
+        extra = f" ({r['rate_limited']} rate limited)" if r['rate_limited'] else ""
+        print(f"  {name:<15} {fmt_ms(r['p50_ms']):>8} {fmt_ms(r['p95_ms']):>8} {fmt_ms(r['p99_ms']):>8} "
+              f"{r['throughput_rps']:>8.1f} {r['errors']:>7}{extra}")
+
+def compare(baseline, current, threshold_pct=REGRESSION_THRESHOLD_PCT, min_delta_ms=MIN_DELTA_MS):
+    """List of human-readable regressions of current vs baseline (empty = OK)"""
+    regressions = []
+    factor = 1 + threshold_pct / 100.0
+
+    print()
+    print(f"  {'Endpoint':<15} {'p50 before/after':>20} {'p95 before/after':>20} {'req/s before/after':>22}")
+    for name in ENDPOINTS:
+        before = baseline['endpoints'].get(name)
+        after = current['endpoints'].get(name)
+        if not before or not after:
+            continue
+
+        for metric in ('p50_ms', 'p95_ms'):
+            b, a = before[metric], after[metric]
+            if b is None:
+                continue
+            if a is None:
+                regressions.append(f"{name}: no successful requests after deploy")
+                break
+            if a > b * factor and a - b > min_delta_ms:
+                regressions.append(f"{name}: {metric[:3]} {b:.1f}ms -> {a:.1f}ms (+{(a / b - 1) * 100:.0f}%)")
+
+        if before['throughput_rps'] and after['throughput_rps'] * factor < before['throughput_rps']:
+            regressions.append(f"{name}: throughput {before['throughput_rps']:.1f} -> "
+                               f"{after['throughput_rps']:.1f} req/s")
+        if after['error_rate'] > before['error_rate'] + 0.02:
+            regressions.append(f"{name}: error rate {before['error_rate']:.1%} -> {after['error_rate']:.1%}")
+
+        pairs = [f"{fmt_ms(before[m])}/{fmt_ms(after[m])}" for m in ('p50_ms', 'p95_ms', 'throughput_rps')]
+        print(f"  {name:<15} {pairs[0]:>20} {pairs[1]:>20} {pairs[2]:>22}")
+    print()
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure ShareFast API latency and compare with a baseline')
+    parser.add_argument('--url', default=API_BASE_URL, help=f'API base URL (default: {API_BASE_URL})')
+    parser.add_argument('--requests', type=int, default=REQUESTS_PER_ENDPOINT)
+    parser.add_argument('--warmup', type=int, default=WARMUP_REQUESTS)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--save', metavar='FILE', help='Write results as JSON (e.g. the pre-deploy baseline)')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare with a saved baseline; exit 1 on regression')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD_PCT,
+                        help=f'Allowed slowdown in percent (default: {REGRESSION_THRESHOLD_PCT:g})')
+    args = parser.parse_args()
+
+    report = run_probe(args.url, args.requests, args.warmup, args.concurrency,
+                       label="baseline" if args.save and not args.baseline else "probe")
+    if report is None:
+        return False
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved: {args.save}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print("[REGRESSION]")
+            for line in regressions:
+                print(f"  {line}")
+            return False
+        print(f"[OK] No regression beyond {args.threshold:g}%")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Migration runner for the ShareFast database
+
+Applies migrations/*.sql on the GCP VM's MySQL in filename order, once each:
+- A `schema_migrations` ledger records every applied file with its SHA-256
+  checksum; applied files are skipped, edited files are refused
+- Index builds are forced online: ADD INDEX / CREATE INDEX run with
+  ALGORITHM=INPLACE, LOCK=NONE so relay_messages/signals/sessions keep taking
+  reads and writes while the index is built. If the server cannot build the
+  index online it errors instead of silently copying the table under a lock.
+- A short lock_wait_timeout makes DDL give up (instead of queueing every
+  live query behind it) when a long transaction holds the table's
+  metadata lock - rerun once traffic settles
+- Per-statement progress and server-side timing
+- Credentials never appear on a command line: a 0600 client option file is
+  generated on the VM from config.php and passed via --defaults-extra-file
+
+Each migration file is streamed to one `mysql` process over the deploy
+session, so session variables (SET @x / PREPARE) work across statements.
+
+Naming: migrations/NNN_description.sql - the numeric prefix sets the order.
+
+Usage:
+    python scripts/deploy/migration_runner.py              # apply pending
+    python scripts/deploy/migration_runner.py --status     # show ledger vs files
+    python scripts/deploy/migration_runner.py --dry-run    # show what would run
+"""
+
+import argparse
+import getpass
+import hashlib
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from deploy_session import DeploySession
+
+# Configuration
+INSTANCE_NAME = "sharefast-websocket"
+ZONE = "us-central1-a"
+REMOTE_USER = os.getenv("GCLOUD_USER", "dash")
+REMOTE_BASE_DIR = "/var/www/html"
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+MIGRATIONS_DIR = PROJECT_ROOT / "migrations"
+LEDGER_TABLE = "schema_migrations"
+
+# Seconds DDL may wait for a metadata lock before giving up
+LOCK_WAIT_TIMEOUT = int(os.getenv("MIGRATION_LOCK_WAIT_TIMEOUT", "5"))
+
+MARKER_PREFIX = "sfmig:"
+
+LEDGER_DDL = f"""CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+    version VARCHAR(191) PRIMARY KEY,
+    checksum CHAR(64) NOT NULL,
+    statements INT NOT NULL,
+    execution_ms INT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
+
+# Plain / unique secondary index builds (FULLTEXT and SPATIAL cannot use LOCK=NONE)
+ALTER_ADD_INDEX = re.compile(
+    r"^\s*ALTER\s+TABLE\s+\S+\s+ADD\s+(?:UNIQUE\s+)?(?:INDEX|KEY)\b", re.IGNORECASE
+)
+CREATE_INDEX = re.compile(r"^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\b", re.IGNORECASE)
+SQL_STRING = re.compile(r"'((?:[^'\\]|\\.|'')*)'")
+USE_STATEMENT = re.compile(r"^\s*USE\s+\S+\s*$", re.IGNORECASE)
+
+def split_statements(sql):
+    """
+    Split a SQL script on `;`, ignoring semicolons inside quotes and comments.
+    Comments are dropped. DELIMITER blocks are not supported.
+    """
+    statements = []
+    current = []
+    i = 0
+    length = len(sql)
+    while i < length:
+        ch = sql[i]
+        nxt = sql[i + 1] if i + 1 < length else ''
+
+        if ch == '-' and nxt == '-' and (i + 2 >= length or sql[i + 2] in ' \t\r\n'):
+            end = sql.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        if ch == '#':
+            end = sql.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        if ch == '/' and nxt == '*':
+            end = sql.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            current.append(' ')
+            continue
+        if ch in ("'", '"', '`'):
+            j = i + 1
+            while j < length:
+                if sql[j] == '\\' and ch != '`':
+                    j += 2
+                    continue
+                if sql[j] == ch:
+                    if j + 1 < length and sql[j + 1] == ch:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            current.append(sql[i:j + 1])
+            i = j + 1
+            continue
+        if ch == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+            i += 1
+            continue
+
+        current.append(ch)
+        i += 1
+
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+
+    for statement in statements:
+        if re.match(r'^\s*DELIMITER\b', statement, re.IGNORECASE):
+            raise ValueError("DELIMITER is not supported in migrations")
+    return statements
+
+def make_online(statement):
+    """
+    Force index DDL to build in place without blocking DML.
+    Also rewrites DDL held in string literals (the SET @sql = IF(...) / PREPARE
+    pattern our migrations use). Returns (statement, changed).
+    """
+    def rewrite(sql):
+        if 'ALGORITHM' in sql.upper():
+            return sql
+        if ALTER_ADD_INDEX.match(sql):
+            return sql.rstrip() + ', ALGORITHM=INPLACE, LOCK=NONE'
+        if CREATE_INDEX.match(sql):
+            return sql.rstrip() + ' ALGORITHM=INPLACE LOCK=NONE'
+        return sql
+
+    rewritten = rewrite(statement)
+    rewritten = SQL_STRING.sub(lambda m: "'" + rewrite(m.group(1)) + "'", rewritten)
+    return rewritten, rewritten != statement
+
+def file_checksum(path):
+    """SHA-256 of the file with normalised line endings (Windows checkouts match)"""
+    data = Path(path).read_bytes().replace(b'\r\n', b'\n')
+    return hashlib.sha256(data).hexdigest()
+
+def sql_literal(value):
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "''") + "'"
+
+class Migration:
+    """One migrations/*.sql file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.version = self.path.stem
+        self.checksum = file_checksum(self.path)
+        self.statements = []
+        self.skipped = []
+        self.online_rewrites = 0
+        for statement in split_statements(self.path.read_text(encoding='utf-8')):
+            if USE_STATEMENT.match(statement):
+                # The target database comes from config.php, not the file
+                self.skipped.append(statement)
+                continue
+            statement, changed = make_online(statement)
+            if changed:
+                self.online_rewrites += 1
+            self.statements.append(statement)
+
+    def script(self):
+        """SQL streamed to mysql: statements separated by timing markers, ledger row last"""
+        lines = [
+            f"SET SESSION lock_wait_timeout = {LOCK_WAIT_TIMEOUT};",
+            "SET @sfmig_started = NOW(6);",
+        ]
+        for n, statement in enumerate(self.statements):
+            lines.append(f"SELECT CONCAT('{MARKER_PREFIX}', {n}, ':', UNIX_TIMESTAMP(NOW(6)));")
+            lines.append(statement + ";")
+        lines.append(f"SELECT CONCAT('{MARKER_PREFIX}', {len(self.statements)}, ':', UNIX_TIMESTAMP(NOW(6)));")
+        lines.append(
+            f"INSERT INTO {LEDGER_TABLE} (version, checksum, statements, execution_ms) VALUES ("
+            f"{sql_literal(self.version)}, {sql_literal(self.checksum)}, {len(self.statements)}, "
+            f"TIMESTAMPDIFF(MICROSECOND, @sfmig_started, NOW(6)) DIV 1000);"
+        )
+        return "\n".join(lines) + "\n"
+
+def load_migrations(migrations_dir=MIGRATIONS_DIR):
+    """All migrations in apply order (by filename)"""
+    return [Migration(path) for path in sorted(Path(migrations_dir).glob('*.sql'))]
+
+def summarize(statement, width=60):
+    text = ' '.join(statement.split())
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+class MigrationRunner:
+    """Applies pending migrations over a DeploySession"""
+
+    def __init__(self, session, migrations_dir=MIGRATIONS_DIR, config_path=f"{REMOTE_BASE_DIR}/config.php"):
+        self.session = session
+        self.migrations_dir = Path(migrations_dir)
+        self.config_path = config_path
+        self.defaults_file = None
+
+    # ------------------------------------------------------------------
+    # Credentials
+    # ------------------------------------------------------------------
+
+    def open_credentials(self, interactive=True):
+        """
+        Write a 0600 mysql option file on the VM. The password is read from
+        config.php on the VM itself, or piped over stdin if entered manually.
+        """
+        php_code = (
+            f'require_once "{self.config_path}"; '
+            'echo "[client]\\nhost=", DB_HOST, "\\nuser=", DB_USER, '
+            '"\\npassword=\\"", addcslashes(DB_PASS, "\\"\\\\"), "\\"\\n[mysql]\\ndatabase=", DB_NAME, "\\n";'
+        )
+        cmd = (
+            "umask 077 && f=$(mktemp /tmp/sfmig-XXXXXX) && "
+            f"php -r {shlex.quote(php_code)} > \"$f\" && grep -q '^database=.' \"$f\" && echo \"$f\""
+        )
+        print(f"Reading database credentials from {self.config_path} on server...")
+        success, result = self.session.run(cmd, label="Create mysql option file")
+        if success and result.stdout.strip():
+            self.defaults_file = result.stdout.strip().splitlines()[-1]
+            print("[OK] Credentials loaded (option file on VM, mode 0600)")
+            return True
+
+        if not interactive:
+            print("[ERROR] Could not read config.php on the server")
+            return False
+
+        print("[WARNING] Could not read config.php automatically")
+        print("Please provide MySQL credentials manually:")
+        db_user = input("MySQL username: ").strip()
+        db_pass = getpass.getpass("MySQL password (or press Enter if no password): ")
+        db_name = input("Database name (default: lwavhbte_sharefast): ").strip() or "lwavhbte_sharefast"
+        db_host = input("MySQL host (default: localhost): ").strip() or "localhost"
+        escaped = db_pass.replace('\\', '\\\\').replace('"', '\\"')
+        options = f'[client]\nhost={db_host}\nuser={db_user}\npassword="{escaped}"\n[mysql]\ndatabase={db_name}\n'
+        success, result = self.session.run(
+            "umask 077 && f=$(mktemp /tmp/sfmig-XXXXXX) && cat > \"$f\" && echo \"$f\"",
+            label="Create mysql option file", input=options
+        )
+        if not success:
+            return False
+        self.defaults_file = result.stdout.strip().splitlines()[-1]
+        return True
+
+    def close(self):
+        if self.defaults_file:
+            self.session.run(f"rm -f {self.defaults_file}", label="Remove mysql option file")
+            self.defaults_file = None
+
+    def mysql_command(self):
+        return (
+            f"mysql --defaults-extra-file={self.defaults_file} "
+            "--batch --skip-column-names --unbuffered --show-warnings"
+        )
+
+    # ------------------------------------------------------------------
+    # Ledger
+    # ------------------------------------------------------------------
+
+    def applied(self):
+        """{version: checksum} from the ledger (created if missing)"""
+        sql = f"{LEDGER_DDL};\nSELECT version, checksum FROM {LEDGER_TABLE} ORDER BY version;\n"
+        success, result = self.session.run(self.mysql_command(), label="Read migration ledger", input=sql)
+        if not success:
+            raise RuntimeError(f"Could not read {LEDGER_TABLE}: {result.stderr.strip()}")
+        ledger = {}
+        for line in result.stdout.splitlines():
+            parts = line.split('\t')
+            if len(parts) == 2:
+                ledger[parts[0]] = parts[1]
+        return ledger
+
+    def plan(self):
+        """Returns (pending, changed, missing) against the ledger"""
+        migrations = load_migrations(self.migrations_dir)
+        ledger = self.applied()
+        pending = [m for m in migrations if m.version not in ledger]
+        changed = [m for m in migrations if m.version in ledger and ledger[m.version] != m.checksum]
+        known = {m.version for m in migrations}
+        missing = [v for v in ledger if v not in known]
+        return pending, changed, missing
+
+    def print_status(self):
+        migrations = load_migrations(self.migrations_dir)
+        ledger = self.applied()
+        print(f"{'Migration':<50} {'Status':<10} Checksum")
+        for m in migrations:
+            if m.version not in ledger:
+                status = "pending"
+            elif ledger[m.version] != m.checksum:
+                status = "CHANGED"
+            else:
+                status = "applied"
+            print(f"{m.version:<50} {status:<10} {m.checksum[:12]}")
+        for version in ledger:
+            if version not in {m.version for m in migrations}:
+                print(f"{version:<50} {'no file':<10} {ledger[version][:12]}")
+        return True
+
+    # ------------------------------------------------------------------
+    # Apply
+    # ------------------------------------------------------------------
+
+    def apply(self, migration):
+        """Stream one migration to mysql, printing per-statement progress"""
+        total = len(migration.statements)
+        print(f"[APPLY] {migration.version} ({total} statements"
+              f"{f', {migration.online_rewrites} made online' if migration.online_rewrites else ''})")
+        for statement in migration.skipped:
+            print(f"  [SKIP] {summarize(statement)} (database comes from config.php)")
+
+        args = self.session.ssh_command(self.mysql_command())
+        started = time.perf_counter()
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True)
+        proc.stdin.write(migration.script())
+        proc.stdin.close()
+
+        current = None
+        last_mark = None
+        output = []
+        for line in proc.stdout:
+            line = line.rstrip('\n')
+            if line.startswith(MARKER_PREFIX):
+                _, n, stamp = line.split(':', 2)
+                n, stamp = int(n), float(stamp)
+                if current is not None:
+                    print(f"  [{current + 1}/{total}] done in {stamp - last_mark:.3f}s")
+                last_mark = stamp
+                current = n if n < total else None
+                if current is not None:
+                    print(f"  [{current + 1}/{total}] {summarize(migration.statements[current])}")
+                continue
+            output.append(line)
+            print(f"        {line}")
+        proc.wait()
+        elapsed = time.perf_counter() - started
+        self.session.timings.append((f"migration: {migration.version}", elapsed))
+
+        if proc.returncode != 0:
+            if current is not None:
+                failed = f"statement {current + 1}/{total}"
+            else:
+                failed = "session setup" if last_mark is None else "ledger update"
+            print(f"[ERROR] {migration.version} failed at {failed} - not recorded in {LEDGER_TABLE}")
+            if any('ERROR 1205' in line for line in output):
+                print(f"        A long transaction held the metadata lock for more than {LOCK_WAIT_TIMEOUT}s;")
+                print("        the DDL backed off instead of stalling live queries. Rerun when traffic settles.")
+            if any('ERROR 1846' in line or 'ERROR 1845' in line for line in output):
+                print("        The server cannot run this change online (ALGORITHM=INPLACE, LOCK=NONE).")
+            return False
+
+        print(f"[OK] {migration.version} applied in {elapsed:.2f}s")
+        return True
+
+    def run(self, dry_run=False):
+        """Apply all pending migrations in order; stops at the first failure"""
+        pending, changed, missing = self.plan()
+
+        for version in missing:
+            print(f"[INFO] {version} is in {LEDGER_TABLE} but has no file (ignored)")
+        if changed:
+            for m in changed:
+                print(f"[ERROR] {m.version} was modified after it was applied (checksum mismatch)")
+            print("Applied migrations must not be edited - add a new migration instead.")
+            return False
+        if not pending:
+            print("[OK] Database is up to date - no pending migrations")
+            return True
+
+        print(f"Pending migrations: {len(pending)}")
+        for m in pending:
+            print(f"  - {m.version}")
+        print()
+
+        if dry_run:
+            for m in pending:
+                print(f"-- {m.version}")
+                for statement in m.statements:
+                    print(f"{statement};")
+                print()
+            print("[DRY RUN] Nothing was executed.")
+            return True
+
+        for m in pending:
+            with self.session.step(f"Migration {m.version}"):
+                if not self.apply(m):
+                    return False
+        return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending database migrations on the GCP VM')
+    parser.add_argument('--status', action='store_true',
+                        help='Show applied / pending / changed migrations')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Show pending migrations (with online rewrites) without running them')
+    parser.add_argument('--non-interactive', action='store_true',
+                        help='Fail instead of prompting when config.php cannot be read')
+    args = parser.parse_args()
+
+    with DeploySession(INSTANCE_NAME, ZONE, REMOTE_USER) as session:
+        runner = MigrationRunner(session)
+        if not runner.open_credentials(interactive=not args.non_interactive):
+            return False
+        try:
+            if args.status:
+                return runner.print_status()
+            return runner.run(dry_run=args.dry_run)
+        finally:
+            runner.close()
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
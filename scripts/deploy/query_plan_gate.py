@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Query plan gate for ShareFast hot-path SQL
+
+Proves that the statements the API runs on every frame/poll actually use
+indexes, instead of only checking that index names exist:
+1. Creates a scratch database on a local MySQL/MariaDB server
+2. Loads database_schema.sql and every migrations/*.sql
+3. Seeds a deterministic, production-shaped data set (mostly read relay
+   messages, mostly expired sessions) and runs ANALYZE TABLE
+4. EXPLAINs each statement in HOT_QUERIES
+5. Fails on full table scans, full index scans and filesorts
+
+The report is written as JSON (one entry per statement with the raw plan
+rows, violations and pass/fail) so CI can archive or diff it.
+
+Only the `mysql` command-line client is required. Connection settings come
+from a client option file (--defaults-file) or host/port/user flags; the
+password is never passed on the command line (use an option file or the
+client's own prompt-free mechanisms).
+
+Usage:
+    python scripts/deploy/query_plan_gate.py
+    python scripts/deploy/query_plan_gate.py --defaults-file ~/.my.cnf --report plan_report.json
+    python scripts/deploy/query_plan_gate.py --analyze      # add EXPLAIN ANALYZE for SELECTs (MySQL 8.0.18+)
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from migration_runner import PROJECT_ROOT, USE_STATEMENT, load_migrations, split_statements
+
+# Configuration
+SCHEMA_FILE = PROJECT_ROOT / "database_schema.sql"
+SCRATCH_DATABASE = os.getenv("PLAN_CHECK_DATABASE", "sharefast_plan_check")
+DEFAULT_REPORT = "plan_report.json"
+SEED = 1337
+
+# Seed sizes - large enough that the optimizer prefers indexes over scanning
+SEED_SESSIONS = 4000
+SEED_RELAY_MESSAGES = 60000
+SEED_SIGNALS = 20000
+INSERT_BATCH = 1000
+
+# Values every hot query is bound to (HOT_SESSION has plenty of rows)
+NOW = 1700000000
+HOT_SESSION = "sess_00002"
+HOT_CODE = "code-0001"
+HOT_ADMIN_EMAIL = "admin1@example.com"
+
+# Hot-path statements, copied from the PHP endpoints with literals bound.
+# `allow` lists violations accepted for a statement, with the reason.
+HOT_QUERIES = [
+    {
+        'name': 'relay.store.peer_by_session',
+        'source': 'api/peer_lookup.php lookupPeerId()',
+        'sql': f"SELECT peer_id FROM sessions WHERE session_id = '{HOT_SESSION}' AND peer_id IS NOT NULL LIMIT 1",
+    },
+    {
+        'name': 'relay.store.peer_by_code',
+        'source': 'api/peer_lookup.php lookupPeerId() (fallback)',
+        'sql': f"SELECT peer_id FROM sessions WHERE code = '{HOT_CODE}' AND peer_id IS NOT NULL LIMIT 1",
+    },
+    {
+        'name': 'relay.get.unread_lanes',
+        'source': 'api/relay_lanes.php relayLaneQuery()',
+        'sql': " UNION ALL ".join(
+            f"(SELECT id, message_type, message_data, message_blob, created_at FROM relay_messages "
+            f"WHERE session_id = '{HOT_SESSION}' AND message_type = '{lane}' AND read_at IS NULL "
+            f"AND created_at >= {NOW - 3600} ORDER BY created_at ASC, id ASC LIMIT {limit})"
+            for lane, limit in (('input', 50), ('cursor', 10))),
+    },
+    {
+        'name': 'relay.get.mark_read',
+        'source': 'api/relay.php fetchRelayQueueRows()',
+        'sql': (f"UPDATE relay_messages SET read_at = {NOW} WHERE id IN (11,12,13,14,15,16,17,18,19,20) "
+                f"AND created_at BETWEEN {NOW - 60} AND {NOW}"),
+    },
+    {
+        'name': 'relay.frame.fetch',
+        'source': 'api/relay_frame_slot.php fetchRelayFrame()',
+        'sql': (f"SELECT frame_seq, read_seq, frame_data, frame_blob, updated_at FROM relay_frame_slots "
+                f"WHERE session_id = '{HOT_SESSION}' AND frame_seq > read_seq"),
+    },
+    {
+        'name': 'relay.frame.mark_read',
+        'source': 'api/relay_frame_slot.php fetchRelayFrame()',
+        'sql': f"UPDATE relay_frame_slots SET read_seq = GREATEST(read_seq, 7) WHERE session_id = '{HOT_SESSION}'",
+    },
+    {
+        'name': 'poll.get_signals.unread',
+        'source': 'api/poll.php getSignals()',
+        'sql': (f"SELECT * FROM signals WHERE session_id = '{HOT_SESSION}' AND read_at IS NULL "
+                f"ORDER BY created_at DESC LIMIT 1"),
+    },
+    {
+        'name': 'poll.get_signals.mark_read',
+        'source': 'api/poll.php getSignals()',
+        'sql': f"UPDATE signals SET read_at = {NOW} WHERE id = 42 AND created_at = {NOW - 30}",
+    },
+    {
+        'name': 'poll.get_signals.count',
+        'source': 'api/poll.php getSignals() (empty poll)',
+        'sql': f"SELECT COUNT(*) as count FROM signals WHERE session_id = '{HOT_SESSION}'",
+    },
+    {
+        'name': 'signal.store.peer_by_session',
+        'source': 'api/signal.php storeSignal()',
+        'sql': f"SELECT peer_id FROM sessions WHERE session_id = '{HOT_SESSION}' AND peer_id IS NOT NULL LIMIT 1",
+    },
+    {
+        'name': 'signal.store.next_seq',
+        'source': 'api/signal_queue.php nextSignalSeq()',
+        'sql': (f"INSERT INTO signal_queues (session_id, last_seq) VALUES ('{HOT_SESSION}', LAST_INSERT_ID(1)) "
+                f"ON DUPLICATE KEY UPDATE last_seq = LAST_INSERT_ID(last_seq + 1)"),
+    },
+    {
+        'name': 'signal.store.trim',
+        'source': 'api/signal_queue.php enqueueSignal() (every 20th signal)',
+        'sql': f"DELETE FROM signals WHERE session_id = '{HOT_SESSION}' AND seq <= 140",
+    },
+    {
+        'name': 'keepalive.check',
+        'source': 'api/keepalive.php',
+        'sql': (f"SELECT * FROM sessions WHERE session_id = '{HOT_SESSION}' AND code = '{HOT_CODE}' "
+                f"AND mode = 'client' LIMIT 1"),
+    },
+    {
+        'name': 'keepalive.update',
+        'source': 'api/keepalive.php',
+        'sql': (f"UPDATE sessions SET last_keepalive = {NOW}, expires_at = {NOW + 600} "
+                f"WHERE session_id = '{HOT_SESSION}'"),
+    },
+    {
+        'name': 'list_clients.all',
+        'source': 'api/list_clients.php listAvailableClients()',
+        'sql': (f"SELECT * FROM sessions WHERE mode = 'client' AND expires_at > {NOW} "
+                f"AND (last_keepalive IS NULL OR last_keepalive > {NOW - 60} OR created_at > {NOW - 120}) "
+                f"ORDER BY created_at DESC"),
+        'allow': {'filesort': 'sorts only unexpired client sessions (range on expires_at), not the table'},
+    },
+    {
+        'name': 'list_clients.by_admin',
+        'source': 'api/list_clients.php listAvailableClients($admin_email)',
+        'sql': (f"SELECT * FROM sessions WHERE mode = 'client' AND expires_at > {NOW} "
+                f"AND (last_keepalive IS NULL OR last_keepalive > {NOW - 60} OR created_at > {NOW - 120}) "
+                f"AND admin_email = '{HOT_ADMIN_EMAIL}' ORDER BY created_at DESC"),
+        'allow': {'filesort': "sorts only one admin's clients (ref on admin_email), not the table"},
+    },
+]
+
+class MySQLClient:
+    """Thin wrapper around the local `mysql` command-line client"""
+
+    def __init__(self, mysql_bin='mysql', defaults_file=None, host=None, port=None, user=None):
+        self.base = [mysql_bin]
+        if defaults_file:
+            self.base.append(f"--defaults-extra-file={defaults_file}")
+        if host:
+            self.base.append(f"--host={host}")
+        if port:
+            self.base.append(f"--port={port}")
+        if user:
+            self.base.append(f"--user={user}")
+        self.database = None
+
+    def execute(self, sql, column_names=False):
+        """Run SQL from stdin. Returns stdout; raises RuntimeError on failure."""
+        args = self.base + ["--batch"]
+        if not column_names:
+            args.append("--skip-column-names")
+        if self.database:
+            args.append(f"--database={self.database}")
+        result = subprocess.run(args, input=sql, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"mysql exited with {result.returncode}")
+        return result.stdout
+
+    def rows(self, sql):
+        """Run one statement and return its result set as a list of dicts"""
+        lines = self.execute(sql, column_names=True).splitlines()
+        if not lines:
+            return []
+        header = lines[0].split('\t')
+        rows = []
+        for line in lines[1:]:
+            values = [None if v == 'NULL' else v for v in line.split('\t')]
+            rows.append(dict(zip(header, values)))
+        return rows
+
+def build_schema(client):
+    """Recreate the scratch database from database_schema.sql + migrations"""
+    client.database = None
+    client.execute(f"DROP DATABASE IF EXISTS `{SCRATCH_DATABASE}`;\n"
+                   f"CREATE DATABASE `{SCRATCH_DATABASE}` DEFAULT CHARSET utf8mb4 COLLATE utf8mb4_unicode_ci;\n")
+    client.database = SCRATCH_DATABASE
+
+    statements = [s for s in split_statements(SCHEMA_FILE.read_text(encoding='utf-8'))
+                  if not USE_STATEMENT.match(s)]
+    client.execute(";\n".join(statements) + ";\n")
+
+    migrations = load_migrations()
+    for migration in migrations:
+        client.execute(";\n".join(migration.statements) + ";\n")
+    return [m.version for m in migrations]
+
+def sql_value(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def insert_batches(table, columns, rows):
+    """Multi-row INSERT statements, INSERT_BATCH rows each"""
+    for start in range(0, len(rows), INSERT_BATCH):
+        chunk = rows[start:start + INSERT_BATCH]
+        values = ",\n".join("(" + ", ".join(sql_value(v) for v in row) + ")" for row in chunk)
+        yield f"INSERT INTO {table} ({', '.join(columns)}) VALUES\n{values};"
+
+def seed_data(client):
+    """
+    Deterministic production-shaped data:
+    - client/admin session pairs, ~80% expired, a few admin emails
+    - relay messages concentrated on active sessions, ~95% already read
+    - signals, ~90% already read
+    """
+    rng = random.Random(SEED)
+
+    sessions = []
+    for i in range(SEED_SESSIONS):
+        pair = i // 2
+        is_client = i % 2 == 0
+        created = NOW - rng.randint(0, 7 * 86400)
+        expired = rng.random() < 0.8
+        sessions.append((
+            f"sess_{i:05d}",
+            f"code-{pair:04d}",
+            'client' if is_client else 'admin',
+            f"sess_{i + 1 if is_client else i - 1:05d}" if rng.random() < 0.7 else None,
+            f"10.0.{pair % 256}.{pair % 200}",
+            created,
+            created + 600 if expired else NOW + rng.randint(60, 600),
+            None if expired else NOW - rng.randint(0, 120),
+            f"admin{pair % 25}@example.com" if is_client else None,
+        ))
+
+    active = [s[0] for s in sessions if s[6] > NOW] + [HOT_SESSION]
+
+    relay = []
+    for i in range(SEED_RELAY_MESSAGES):
+        session_id = rng.choice(active) if rng.random() < 0.7 else f"sess_{rng.randrange(SEED_SESSIONS):05d}"
+        created = NOW - rng.randint(0, 3600)
+        read_at = created + 1 if rng.random() < 0.95 else None
+        relay.append((session_id, 'frame' if rng.random() < 0.8 else 'input', 'x' * 64, created, read_at))
+
+    signals = []
+    signal_seq = {}
+    for i in range(SEED_SIGNALS):
+        session_id = rng.choice(active) if rng.random() < 0.7 else f"sess_{rng.randrange(SEED_SESSIONS):05d}"
+        created = NOW - rng.randint(0, 3600)
+        read_at = created + 1 if rng.random() < 0.9 else None
+        signal_seq[session_id] = signal_seq.get(session_id, 0) + 1
+        signals.append((session_id, signal_seq[session_id], f"code-{rng.randrange(SEED_SESSIONS // 2):04d}",
+                        'offer', '{}', created, read_at))
+
+    statements = []
+    statements += insert_batches(
+        'sessions',
+        ['session_id', 'code', 'mode', 'peer_id', 'ip_address', 'created_at', 'expires_at', 'last_keepalive', 'admin_email'],
+        sessions)
+    statements += insert_batches(
+        'relay_messages', ['session_id', 'message_type', 'message_data', 'created_at', 'read_at'], relay)
+    statements += insert_batches(
+        'signals', ['session_id', 'seq', 'code', 'signal_type', 'signal_data', 'created_at', 'read_at'], signals)
+    statements += insert_batches('signal_queues', ['session_id', 'last_seq'], list(signal_seq.items()))
+    statements.append("ANALYZE TABLE sessions, relay_messages, signals, signal_queues;")
+    client.execute("\n".join(statements) + "\n")
+
+    return {'sessions': len(sessions), 'relay_messages': len(relay), 'signals': len(signals), 'seed': SEED}
+
+def plan_violations(plan):
+    """Problems found in EXPLAIN rows (materialized derived/subquery tables are exempt)"""
+    violations = []
+    for row in plan:
+        table = row.get('table') or ''
+        access = (row.get('type') or '').lower()
+        extra = row.get('Extra') or ''
+        if table.startswith('<'):
+            continue
+        if access == 'all':
+            violations.append({'kind': 'full_scan', 'table': table, 'detail': f"type=ALL, rows={row.get('rows')}"})
+        elif access == 'index':
+            violations.append({'kind': 'full_index_scan', 'table': table, 'detail': f"type=index, key={row.get('key')}"})
+        if 'Using filesort' in extra:
+            violations.append({'kind': 'filesort', 'table': table, 'detail': extra})
+    return violations
+
+def check_query(client, query, analyze=False):
+    """EXPLAIN one catalogue entry and classify the result"""
+    entry = {'name': query['name'], 'source': query['source'], 'sql': query['sql']}
+    try:
+        started = time.perf_counter()
+        plan = client.rows(f"EXPLAIN {query['sql']};")
+        entry['explain_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    except RuntimeError as e:
+        entry.update({'status': 'error', 'error': str(e), 'plan': [], 'violations': [], 'allowed': []})
+        return entry
+
+    allow = query.get('allow', {})
+    violations = plan_violations(plan)
+    entry['plan'] = plan
+    entry['violations'] = [v for v in violations if v['kind'] not in allow]
+    entry['allowed'] = [dict(v, reason=allow[v['kind']]) for v in violations if v['kind'] in allow]
+    entry['status'] = 'fail' if entry['violations'] else 'pass'
+
+    if analyze and query['sql'].lstrip().upper().startswith('SELECT'):
+        try:
+            entry['analyze'] = client.execute(f"EXPLAIN ANALYZE {query['sql']};")
+        except RuntimeError as e:
+            entry['analyze'] = None
+            entry['analyze_error'] = str(e)
+    return entry
+
+def run_gate(client, report_path=DEFAULT_REPORT, analyze=False):
+    """Build, seed, EXPLAIN everything, write the report. Returns True if every query passes."""
+    print("="*70)
+    print("Query Plan Gate")
+    print("="*70)
+
+    try:
+        client.database = None
+        version = client.execute("SELECT VERSION();").strip()
+        print(f"Server: {version}")
+        print(f"Scratch database: {SCRATCH_DATABASE}")
+        migrations = build_schema(client)
+        print(f"[OK] Schema + {len(migrations)} migrations loaded")
+        seed = seed_data(client)
+        print(f"[OK] Seeded {seed['sessions']} sessions, {seed['relay_messages']} relay messages, "
+              f"{seed['signals']} signals")
+    except RuntimeError as e:
+        print(f"[ERROR] Could not prepare scratch database: {e}")
+        return False
+    print()
+
+    results = [check_query(client, query, analyze) for query in HOT_QUERIES]
+
+    for entry in results:
+        label = {'pass': '[PASS]', 'fail': '[FAIL]', 'error': '[ERROR]'}[entry['status']]
+        keys = ', '.join(sorted({row.get('key') for row in entry['plan'] if row.get('key')})) or '-'
+        print(f"{label:<8} {entry['name']:<32} key: {keys}")
+        for v in entry['violations']:
+            print(f"         {v['kind']} on {v['table']} ({v['detail']})")
+        for v in entry['allowed']:
+            print(f"         allowed {v['kind']} on {v['table']}: {v['reason']}")
+        if entry['status'] == 'error':
+            print(f"         {entry['error']}")
+
+    passed = all(entry['status'] == 'pass' for entry in results)
+    report = {
+        'generated_at': int(time.time()),
+        'server_version': version,
+        'database': SCRATCH_DATABASE,
+        'migrations': migrations,
+        'seed': seed,
+        'passed': passed,
+        'queries': results,
+    }
+    Path(report_path).write_text(json.dumps(report, indent=2) + "\n", encoding='utf-8')
+
+    print()
+    failed = sum(1 for entry in results if entry['status'] != 'pass')
+    if passed:
+        print(f"[OK] All {len(results)} hot queries use indexes without filesort")
+    else:
+        print(f"[ERROR] {failed} of {len(results)} hot queries have a bad plan")
+    print(f"Report: {report_path}")
+    return passed
+
+def client_from_env():
+    """MySQLClient configured from PLAN_CHECK_* environment variables"""
+    return MySQLClient(
+        mysql_bin=os.getenv("PLAN_CHECK_MYSQL", "mysql"),
+        defaults_file=os.getenv("PLAN_CHECK_DEFAULTS_FILE"),
+        host=os.getenv("PLAN_CHECK_HOST"),
+        port=os.getenv("PLAN_CHECK_PORT"),
+        user=os.getenv("PLAN_CHECK_USER"),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN hot-path queries against a seeded local MySQL')
+    parser.add_argument('--mysql', default=os.getenv("PLAN_CHECK_MYSQL", "mysql"),
+                        help='mysql client binary')
+    parser.add_argument('--defaults-file', default=os.getenv("PLAN_CHECK_DEFAULTS_FILE"),
+                        help='Client option file with host/user/password')
+    parser.add_argument('--host', default=os.getenv("PLAN_CHECK_HOST"))
+    parser.add_argument('--port', default=os.getenv("PLAN_CHECK_PORT"))
+    parser.add_argument('--user', default=os.getenv("PLAN_CHECK_USER"))
+    parser.add_argument('--report', default=DEFAULT_REPORT,
+                        help=f'JSON report path (default: {DEFAULT_REPORT})')
+    parser.add_argument('--analyze', action='store_true',
+                        help='Also record EXPLAIN ANALYZE output for SELECTs (MySQL 8.0.18+)')
+    args = parser.parse_args()
+
+    if not shutil.which(args.mysql):
+        print(f"[ERROR] mysql client not found: {args.mysql}")
+        return False
+
+    client = MySQLClient(args.mysql, args.defaults_file, args.host, args.port, args.user)
+    return run_gate(client, args.report, args.analyze)
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
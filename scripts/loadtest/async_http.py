@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Minimal asyncio HTTP/1.1 client for the ShareFast load tools
+
+One AsyncHttpClient is one keep-alive connection (like one browser/desktop
+client connection), so N simulated peers really open N connections instead
+of sharing a pool. Supports http/https, Content-Length and chunked
+responses, and reconnects transparently after the server closes the
+connection. Standard library only.
+"""
+
+import asyncio
+import json
+import ssl
+import time
+from urllib.parse import urlencode, urlsplit
+
+REQUEST_TIMEOUT = 15
+
+class AsyncHttpClient:
+    """One keep-alive connection to the API base URL"""
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT, verify_tls=True):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.host_header = parts.netloc
+        self.path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.ssl_context = None
+        if parts.scheme == 'https':
+            self.ssl_context = ssl.create_default_context()
+            if not verify_tls:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.reader = None
+        self.writer = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context, server_hostname=self.host if self.ssl_context else None
+        )
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+        self.reader = self.writer = None
+
+    async def post_json(self, script, payload):
+        """POST JSON to <base>/<script>. Returns (status, parsed body or None, elapsed ms)."""
+        body = json.dumps(payload).encode('utf-8')
+        return await self.request('POST', f"{self.path}/{script}", body, 'application/json')
+
+    async def get(self, script, params=None):
+        target = f"{self.path}/{script}"
+        if params:
+            target += '?' + urlencode(params)
+        return await self.request('GET', target)
+
+    async def request(self, method, target, body=b'', content_type=None, accept='application/json', raw=False):
+        """
+        Send one request, retrying once on a stale keep-alive connection.
+        The body comes back parsed as JSON, or as bytes with raw=True.
+        """
+        for attempt in (1, 2):
+            start = time.perf_counter()
+            try:
+                if self.writer is None:
+                    await self._connect()
+                status, data = await asyncio.wait_for(self._roundtrip(method, target, body, content_type, accept),
+                                                      self.timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ssl.SSLError, ValueError):
+                await self.close()
+                if attempt == 2:
+                    return 0, None, (time.perf_counter() - start) * 1000
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if raw:
+                return status, data, elapsed_ms
+            try:
+                return status, json.loads(data) if data else None, elapsed_ms
+            except ValueError:
+                return status, None, elapsed_ms
+        return 0, None, 0.0
+
+    async def _roundtrip(self, method, target, body, content_type, accept):
+        head = [f"{method} {target} HTTP/1.1", f"Host: {self.host_header}", "Connection: keep-alive",
+                f"Accept: {accept}"]
+        if body or method == 'POST':
+            head.append(f"Content-Length: {len(body)}")
+        if content_type:
+            head.append(f"Content-Type: {content_type}")
+        request = ("\r\n".join(head) + "\r\n\r\n").encode('ascii') + body
+        self.writer.write(request)
+        await self.writer.drain()
+        self.bytes_sent += len(request)
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        parts = status_line.decode('latin-1').split(' ', 2)
+        if len(parts) < 2:
+            raise ValueError("bad status line")
+        status = int(parts[1])
+
+        headers = {}
+        header_bytes = len(status_line)
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            header_bytes += len(line)
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size_line = await self.reader.readuntil(b"\r\n")
+                size = int(size_line.split(b';')[0].strip(), 16)
+                if size == 0:
+                    # Trailers (normally none) end with an empty line
+                    while (await self.reader.readuntil(b"\r\n")) != b"\r\n":
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            data = b"".join(chunks)
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            # No framing: body runs until the server closes the connection
+            data = await self.reader.read()
+            await self.close()
+
+        self.bytes_received += header_bytes + len(data)
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, data
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Minimal asyncio WebSocket client (RFC 6455) for the ShareFast load tools
+
+Just enough of the protocol to drive websocket_relay_server.js: ws/wss
+handshake, masked binary/text frames, fragmented messages, ping/pong and
+close. No compression (the relay server disables permessage-deflate).
+Standard library only; one AsyncWebSocket is one TCP connection.
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+from urllib.parse import urlsplit
+
+HANDSHAKE_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+CONNECT_TIMEOUT = 10
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+class ConnectionClosed(Exception):
+    """The server closed the WebSocket (code and reason from the close frame, if any)"""
+
+    def __init__(self, code=None, reason=''):
+        super().__init__(f"WebSocket closed ({code}) {reason}".strip())
+        self.code = code
+        self.reason = reason
+
+def mask_payload(mask, data):
+    """XOR data with the 4-byte mask (whole-buffer integer XOR - fast for large frames)"""
+    if not data:
+        return b''
+    n = len(data)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(key, 'big')).to_bytes(n, 'big')
+
+class AsyncWebSocket:
+    """One client WebSocket connection"""
+
+    def __init__(self, url, verify_tls=True, connect_timeout=CONNECT_TIMEOUT):
+        parts = urlsplit(url)
+        if parts.scheme not in ('ws', 'wss'):
+            raise ValueError(f"not a ws:// or wss:// URL: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'wss' else 80)
+        self.host_header = parts.netloc
+        self.target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        self.connect_timeout = connect_timeout
+        self.ssl_context = None
+        if parts.scheme == 'wss':
+            self.ssl_context = ssl.create_default_context()
+            if not verify_tls:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.reader = None
+        self.writer = None
+        self.closed = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    async def connect(self):
+        await asyncio.wait_for(self._handshake(), self.connect_timeout)
+        return self
+
+    async def _handshake(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context, server_hostname=self.host if self.ssl_context else None
+        )
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        request = (
+            f"GET {self.target} HTTP/1.1\r\n"
+            f"Host: {self.host_header}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            "\r\n"
+        ).encode('ascii')
+        self.writer.write(request)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        parts = status_line.decode('latin-1').split(' ', 2)
+        if len(parts) < 2 or parts[1] != '101':
+            raise ConnectionError(f"WebSocket handshake failed: {status_line.decode('latin-1').strip()}")
+        expected = base64.b64encode(hashlib.sha1((key + HANDSHAKE_GUID).encode('ascii')).digest()).decode('ascii')
+        if headers.get('sec-websocket-accept') != expected:
+            raise ConnectionError("WebSocket handshake failed: bad Sec-WebSocket-Accept")
+
+    async def send_binary(self, data):
+        await self._send_frame(OP_BINARY, data)
+
+    async def send_text(self, text):
+        await self._send_frame(OP_TEXT, text.encode('utf-8'))
+
+    async def _send_frame(self, opcode, payload):
+        if self.closed:
+            raise ConnectionClosed()
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        self.writer.write(header + mask + mask_payload(mask, payload))
+        await self.writer.drain()
+        self.bytes_sent += len(header) + 4 + length
+
+    async def _read_frame(self):
+        head = await self.reader.readexactly(2)
+        fin = head[0] & 0x80
+        opcode = head[0] & 0x0F
+        masked = head[1] & 0x80
+        length = head[1] & 0x7F
+        header_len = 2
+        if length == 126:
+            length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+            header_len += 2
+        elif length == 127:
+            length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+            header_len += 8
+        mask = None
+        if masked:
+            mask = await self.reader.readexactly(4)
+            header_len += 4
+        payload = await self.reader.readexactly(length) if length else b''
+        if mask:
+            payload = mask_payload(mask, payload)
+        self.bytes_received += header_len + length
+        return fin, opcode, payload
+
+    async def recv(self):
+        """Next data message as (opcode, payload bytes). Raises ConnectionClosed."""
+        if self.closed:
+            raise ConnectionClosed()
+        fragments = []
+        message_opcode = None
+        while True:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (asyncio.IncompleteReadError, OSError, ssl.SSLError):
+                self.closed = True
+                raise ConnectionClosed(1006, 'connection lost')
+
+            if opcode == OP_PING:
+                await self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                code = struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else None
+                reason = payload[2:].decode('utf-8', 'replace')
+                await self.close(code or 1000)
+                raise ConnectionClosed(code, reason)
+
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            fragments.append(payload)
+            if fin:
+                return message_opcode, b''.join(fragments)
+
+    async def close(self, code=1000):
+        if self.writer is None:
+            return
+        if not self.closed:
+            self.closed = True
+            try:
+                await self._send_frame_unchecked(OP_CLOSE, struct.pack('!H', code))
+            except (OSError, ssl.SSLError):
+                pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        self.writer = self.reader = None
+
+    async def _send_frame_unchecked(self, opcode, payload):
+        mask = os.urandom(4)
+        self.writer.write(struct.pack('!BB', 0x80 | opcode, 0x80 | len(payload)) + mask + mask_payload(mask, payload))
+        await self.writer.drain()
@@ -0,0 +1,852 @@
+#!/usr/bin/env python3
+"""
+Cross-backend relay benchmark
+
+Runs the same seeded workload against each relay implementation on a local
+stack and records comparable numbers:
+
+    relay            api/relay.php            (MySQL relay_messages rows)
+    relay_optimized  api/relay_optimized.php  (per-request peer_id cache)
+    relay_hybrid     api/relay_hybrid.php     (segmented NDJSON log in storage/relay)
+    websocket        scripts/server/websocket_relay_server.js (in-memory forwarding)
+
+Workload (identical for every backend, derived from --seed): N client/admin
+pairs, a fixed list of frames per pair (sizes jittered around --frame-bytes,
+incompressible payload) sent at --fps, and a fixed list of admin -> client
+input events at --input-rate. HTTP pairs come from generate_test_session.php
+and drain with relay `receive` every --receive-interval; WebSocket pairs
+connect as admin + client with the same code and use the binary framing.
+
+Recorded per backend:
+- throughput: delivered frames/s, payload bytes/s, requests/s, wire bytes/s
+- latency percentiles: frame and input send -> receive, per-endpoint request time
+- frames/inputs missing (frames superseded in a latest-frame-wins slot are
+  delivered as far as the viewer is concerned) and error rate
+- DB bytes written: InnoDB data + redo log bytes (SHOW GLOBAL STATUS deltas)
+- server memory: peak/mean RSS of the web server or node processes, plus the
+  bytes they wrote to disk (relay_hybrid's NDJSON files) - read from /proc,
+  so only when the stack runs on this host
+
+Each run is stored as JSON in --results-dir and diffed against the newest
+stored run with the same workload (same seed and parameters), or --baseline.
+DB and process counters are host-wide, so run on an otherwise idle stack.
+
+Usage:
+    python scripts/loadtest/relay_benchmark.py --url http://localhost/api --ws-url wss://localhost:8767/ --insecure
+    python scripts/loadtest/relay_benchmark.py --backends relay,relay_hybrid --pairs 8 --fps 20
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from async_http import AsyncHttpClient
+from async_ws import AsyncWebSocket, ConnectionClosed
+from relay_framing import TYPE_FRAME, TYPE_INPUT, decode, encode_frame, encode_input
+from session_pair_load import LoadStats, letters, now_ms, summarize_latencies
+
+# Configuration
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+API_BASE_URL = os.getenv("BENCH_API_URL", "http://localhost/api")
+WS_URL = os.getenv("BENCH_WS_URL", "wss://localhost:8767/")
+RESULTS_DIR = os.getenv("BENCH_RESULTS_DIR", os.path.join(PROJECT_ROOT, "bench_results"))
+DEFAULT_SEED = 1337
+DEFAULT_PAIRS = 4
+DEFAULT_FPS = 15
+DEFAULT_FRAME_BYTES = 30000
+DEFAULT_FRAME_JITTER = 0.3
+DEFAULT_INPUT_RATE = 5.0
+DEFAULT_DURATION = 20
+RECEIVE_INTERVAL = 0.05
+DRAIN_TIMEOUT = 3.0
+COOLDOWN = 3.0
+SAMPLE_INTERVAL = 0.5
+WARMUP_REQUESTS = 20
+REGRESSION_THRESHOLD_PCT = float(os.getenv("BENCH_REGRESSION_PCT", "15"))
+MIN_DELTA_MS = float(os.getenv("BENCH_MIN_DELTA_MS", "5"))
+FRAME_MARKER = "BM"
+
+HTTP_PROCESSES = r"apache2|httpd|php-fpm.*|php-cgi|nginx"
+WS_PROCESSES = r"node|nodejs|PM2.*"
+
+BACKENDS = {
+    'relay': {'kind': 'http', 'script': 'relay.php'},
+    'relay_optimized': {'kind': 'http', 'script': 'relay_optimized.php'},
+    'relay_hybrid': {'kind': 'http', 'script': 'relay_hybrid.php'},
+    'websocket': {'kind': 'ws'},
+}
+
+# (result key path, label, higher is better)
+DIFF_METRICS = [
+    ('throughput_fps', 'frames/s', True),
+    ('delivery_ratio', 'delivered', True),
+    ('frame_latency.p50_ms', 'frame p50 ms', False),
+    ('frame_latency.p95_ms', 'frame p95 ms', False),
+    ('frame_latency.p99_ms', 'frame p99 ms', False),
+    ('input_latency.p95_ms', 'input p95 ms', False),
+    ('error_rate', 'error rate', False),
+    ('db.bytes_per_frame', 'DB B/frame', False),
+    ('server.write_bytes', 'disk write B', False),
+    ('server.rss_peak_mb', 'RSS peak MB', False),
+]
+
+class Workload:
+    """Seeded frame and input schedule - identical for every backend"""
+
+    def __init__(self, seed, pairs, fps, duration, frame_bytes, frame_jitter, input_rate):
+        self.seed = seed
+        self.pairs = pairs
+        self.fps = fps
+        self.duration = duration
+        self.frame_bytes = frame_bytes
+        self.frame_jitter = frame_jitter
+        self.input_rate = input_rate
+
+        rng = random.Random(seed)
+        # Sizes are multiples of 3 so a frame's base64 is a prefix of the blob's base64
+        low = max(1, int(frame_bytes * (1 - frame_jitter)) // 3)
+        high = max(low, int(frame_bytes * (1 + frame_jitter)) // 3)
+        frames_per_pair = max(1, int(fps * duration))
+        inputs_per_pair = int(input_rate * duration)
+        self.frame_sizes = [[rng.randint(low, high) * 3 for _ in range(frames_per_pair)] for _ in range(pairs)]
+        self.inputs = [[{'type': 'mouse_move', 'x': rng.randint(0, 1920), 'y': rng.randint(0, 1080)}
+                        for _ in range(inputs_per_pair)] for _ in range(pairs)]
+        # Stagger pairs within one frame interval so they don't send in lockstep
+        self.start_offsets = [rng.uniform(0, 1.0 / fps) for _ in range(pairs)]
+        # Random bytes behave like JPEG data (incompressible); frames are prefixes of one blob
+        self.blob = rng.getrandbits(8 * 3 * high).to_bytes(3 * high, 'big')
+        self.blob_b64 = base64.b64encode(self.blob).decode('ascii')
+
+    def frame_payload(self, size):
+        return self.blob[:size]
+
+    def frame_payload_b64(self, size):
+        """base64 of frame_payload(size), as the HTTP clients send it"""
+        return self.blob_b64[:size // 3 * 4]
+
+    def spec(self):
+        return {
+            'seed': self.seed,
+            'pairs': self.pairs,
+            'fps': self.fps,
+            'duration_s': self.duration,
+            'frame_bytes': self.frame_bytes,
+            'frame_jitter': self.frame_jitter,
+            'input_rate': self.input_rate,
+            'frames_per_pair': len(self.frame_sizes[0]) if self.frame_sizes else 0,
+            'inputs_per_pair': len(self.inputs[0]) if self.inputs else 0,
+        }
+
+    def workload_id(self):
+        return hashlib.sha1(json.dumps(self.spec(), sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+class ProcessSampler:
+    """RSS and disk writes of the server processes, from /proc (Linux, same host)"""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.available = os.path.isdir('/proc')
+        self.rss_samples = []
+        self.process_counts = []
+        self.first_write = {}
+        self.last_write = {}
+        self.io_readable = True
+
+    def _matching_pids(self):
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/comm', encoding='utf-8') as f:
+                    name = f.read().strip()
+            except OSError:
+                continue
+            if self.regex.fullmatch(name):
+                yield pid
+
+    def sample(self):
+        total_kb = 0
+        count = 0
+        for pid in self._matching_pids():
+            try:
+                with open(f'/proc/{pid}/status', encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total_kb += int(line.split()[1])
+                            break
+            except OSError:
+                continue
+            count += 1
+            try:
+                with open(f'/proc/{pid}/io', encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith('write_bytes:'):
+                            written = int(line.split()[1])
+                            self.first_write.setdefault(pid, written)
+                            self.last_write[pid] = written
+                            break
+            except OSError:
+                # /proc/<pid>/io needs the same user (or root)
+                self.io_readable = False
+        self.rss_samples.append(total_kb)
+        self.process_counts.append(count)
+
+    async def run(self, stop):
+        if not self.available:
+            return
+        while not stop.is_set():
+            self.sample()
+            try:
+                await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        self.sample()
+
+    def result(self):
+        if not self.available or not any(self.process_counts):
+            return None
+        rss = [kb / 1024 for kb in self.rss_samples]
+        written = sum(self.last_write[pid] - self.first_write[pid] for pid in self.last_write)
+        return {
+            'pattern': self.pattern,
+            'processes': max(self.process_counts),
+            'rss_peak_mb': round(max(rss), 1),
+            'rss_mean_mb': round(sum(rss) / len(rss), 1),
+            'write_bytes': written if self.io_readable else None,
+        }
+
+class DbCounters:
+    """Global InnoDB write counters via the local mysql client"""
+
+    STATUS_VARS = ('Innodb_data_written', 'Innodb_os_log_written', 'Innodb_rows_inserted', 'Innodb_rows_deleted')
+
+    def __init__(self, mysql_bin='mysql', defaults_file=None, host=None, port=None, user=None):
+        self.base = [mysql_bin]
+        if defaults_file:
+            self.base.append(f"--defaults-extra-file={defaults_file}")
+        if host:
+            self.base.append(f"--host={host}")
+        if port:
+            self.base.append(f"--port={port}")
+        if user:
+            self.base.append(f"--user={user}")
+        self.error = None
+
+    def read(self):
+        """Current counter values, or None (reason in self.error)"""
+        names = ', '.join(f"'{name}'" for name in self.STATUS_VARS)
+        sql = f"SHOW GLOBAL STATUS WHERE Variable_name IN ({names})"
+        try:
+            result = subprocess.run(self.base + ["--batch", "--skip-column-names"], input=sql,
+                                    capture_output=True, text=True, timeout=15)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.error = str(e)
+            return None
+        if result.returncode != 0:
+            self.error = result.stderr.strip() or f"mysql exited with {result.returncode}"
+            return None
+        values = {}
+        for line in result.stdout.splitlines():
+            name, _, value = line.partition('\t')
+            values[name] = int(value)
+        return values
+
+    @staticmethod
+    def delta(before, after, frames_delivered):
+        if before is None or after is None:
+            return None
+        d = {name: after.get(name, 0) - before.get(name, 0) for name in DbCounters.STATUS_VARS}
+        written = d['Innodb_data_written'] + d['Innodb_os_log_written']
+        return {
+            'data_written': d['Innodb_data_written'],
+            'log_written': d['Innodb_os_log_written'],
+            'rows_inserted': d['Innodb_rows_inserted'],
+            'rows_deleted': d['Innodb_rows_deleted'],
+            'bytes_written': written,
+            'bytes_per_frame': round(written / frames_delivered) if frames_delivered else None,
+        }
+
+class BenchPair:
+    """Bookkeeping shared by the HTTP and WebSocket pair drivers"""
+
+    def __init__(self, index, workload, args, stats):
+        self.index = index
+        self.workload = workload
+        self.args = args
+        self.stats = stats
+        self.frames_sent = 0
+        self.frames_received = set()
+        self.inputs_sent = 0
+        self.inputs_received = set()
+        self.payload_bytes = 0
+
+    def frame_tag(self, seq):
+        return f"{FRAME_MARKER}:{self.index}:{seq}:{now_ms():.3f}|"
+
+    def input_event(self, seq):
+        return dict(self.workload.inputs[self.index][seq - 1], bm=f"{self.index}:{seq}:{now_ms():.3f}")
+
+    def frame_arrived(self, tag, size):
+        """tag is the 'BM:pair:seq:t_ms' prefix of a delivered frame"""
+        _, pair, seq, sent_at = tag.split(':')
+        if int(pair) != self.index:
+            return
+        self.frames_received.add(int(seq))
+        self.payload_bytes += size
+        self.stats.frame_latencies.append(now_ms() - float(sent_at))
+
+    def input_arrived(self, event):
+        if not isinstance(event, dict) or 'bm' not in event:
+            return
+        pair, seq, sent_at = event['bm'].split(':')
+        if int(pair) != self.index:
+            return
+        self.inputs_received.add(int(seq))
+        self.stats.input_latencies.append(now_ms() - float(sent_at))
+
+    async def paced(self, count, rate, send_one):
+        """Call send_one(seq) count times at `rate`/s; no catch-up bursts when falling behind"""
+        if rate <= 0:
+            return
+        interval = 1.0 / rate
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        for seq in range(1, count + 1):
+            await send_one(seq)
+            next_at += interval
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -interval:
+                next_at = loop.time()
+
+    async def run(self, start_delay):
+        await asyncio.sleep(start_delay)
+        senders_done = asyncio.Event()
+
+        async def senders():
+            try:
+                await asyncio.gather(
+                    self.paced(len(self.workload.frame_sizes[self.index]), self.workload.fps, self.send_frame),
+                    self.paced(len(self.workload.inputs[self.index]), self.workload.input_rate, self.send_input),
+                )
+            finally:
+                senders_done.set()
+
+        await asyncio.gather(senders(), self.receive_all(senders_done))
+
+    def result(self):
+        return {
+            'pair': self.index,
+            'frames_sent': self.frames_sent,
+            'frames_received': len(self.frames_received),
+            # Never delivered but older than a frame that was (latest-frame-wins slot), not lost
+            'frames_superseded': max(self.frames_received, default=0) - len(self.frames_received),
+            'inputs_sent': self.inputs_sent,
+            'inputs_received': len(self.inputs_received),
+            'payload_bytes': self.payload_bytes,
+        }
+
+class HttpPair(BenchPair):
+    """Pair on one of the PHP relay scripts"""
+
+    def __init__(self, index, workload, args, stats, script):
+        super().__init__(index, workload, args, stats)
+        self.script = script
+        self.code = None
+        self.client_id = None
+        self.admin_id = None
+        self.connections = []
+
+    def connection(self):
+        conn = AsyncHttpClient(self.args.url, verify_tls=not self.args.insecure)
+        self.connections.append(conn)
+        return conn
+
+    async def setup(self):
+        conn = self.connection()
+        status, body, _ = await conn.post_json('generate_test_session.php', {})
+        if status != 200 or not isinstance(body, dict) or not body.get('success'):
+            return False
+        self.code = body['code']
+        self.client_id = body['client_session_id']
+        self.admin_id = body['admin_session_id']
+        self.sender = self.connection()
+        self.input_sender = self.connection()
+        return True
+
+    async def warmup(self, requests):
+        """Touch OPcache, the buffer pool and the relay storage before measuring"""
+        scratch = LoadStats()
+        conn = self.connection()
+        data = self.workload.frame_payload_b64(1023)
+        for _ in range(requests):
+            status, body, elapsed = await conn.post_json(self.script, {
+                'action': 'send', 'session_id': self.client_id, 'code': self.code, 'type': 'frame', 'data': data,
+            })
+            scratch.record('relay_send', status, body, elapsed)
+            status, body, elapsed = await conn.post_json(self.script, {
+                'action': 'receive', 'session_id': self.admin_id, 'code': self.code,
+            })
+            scratch.record('relay_receive', status, body, elapsed)
+        return scratch.errors == 0
+
+    async def call(self, conn, endpoint, payload):
+        status, body, elapsed = await conn.post_json(self.script, payload)
+        return self.stats.record(endpoint, status, body, elapsed), body
+
+    async def send_frame(self, seq):
+        self.frames_sent += 1
+        size = self.workload.frame_sizes[self.index][seq - 1]
+        data = self.frame_tag(seq) + self.workload.frame_payload_b64(size)
+        await self.call(self.sender, 'relay_send', {
+            'action': 'send', 'session_id': self.client_id, 'code': self.code, 'type': 'frame', 'data': data,
+        })
+
+    async def send_input(self, seq):
+        self.inputs_sent += 1
+        await self.call(self.input_sender, 'relay_send', {
+            'action': 'send', 'session_id': self.admin_id, 'code': self.code, 'type': 'input',
+            'data': self.input_event(seq),
+        })
+
+    def consume(self, messages):
+        for message in messages:
+            data = message.get('data')
+            if message.get('type') == 'frame' and isinstance(data, str) and data.startswith(FRAME_MARKER + ':'):
+                tag, _, payload = data.partition('|')
+                self.frame_arrived(tag, len(payload) * 3 // 4)
+            elif message.get('type') == 'input':
+                if isinstance(data, str):
+                    # relay_hybrid returns input events as the JSON string it stored
+                    try:
+                        data = json.loads(data)
+                    except ValueError:
+                        continue
+                self.input_arrived(data)
+
+    async def drain(self, session_id, senders_done):
+        conn = self.connection()
+        loop = asyncio.get_running_loop()
+        drain_until = None
+        while True:
+            ok, body = await self.call(conn, 'relay_receive', {
+                'action': 'receive', 'session_id': session_id, 'code': self.code,
+            })
+            count = body.get('count', 0) if ok else 0
+            if ok:
+                self.consume(body.get('messages', []))
+            if senders_done.is_set():
+                drain_until = drain_until or loop.time() + DRAIN_TIMEOUT
+                if count == 0 or loop.time() >= drain_until:
+                    return
+            if count < 10:
+                await asyncio.sleep(self.args.receive_interval)
+
+    async def receive_all(self, senders_done):
+        await asyncio.gather(self.drain(self.admin_id, senders_done), self.drain(self.client_id, senders_done))
+
+    async def close(self):
+        if self.code:
+            await self.connections[0].get('terminate_session.php', {'code': self.code})
+        for conn in self.connections:
+            self.stats.bytes_sent += conn.bytes_sent
+            self.stats.bytes_received += conn.bytes_received
+            await conn.close()
+
+class WsPair(BenchPair):
+    """Pair on websocket_relay_server.js (admin and client linked by code)"""
+
+    def __init__(self, index, workload, args, stats, run_tag):
+        super().__init__(index, workload, args, stats)
+        self.code = f"bench-{run_tag}{letters(index)}"
+        self.client_id = f"bench_{run_tag}_{index}_client"
+        self.admin_id = f"bench_{run_tag}_{index}_admin"
+        self.client = None
+        self.admin = None
+
+    async def open(self, session_id, mode):
+        sep = '&' if '?' in self.args.ws_url else '?'
+        url = f"{self.args.ws_url}{sep}session_id={session_id}&code={self.code}&mode={mode}"
+        ws = await AsyncWebSocket(url, verify_tls=not self.args.insecure).connect()
+        opcode, payload = await asyncio.wait_for(ws.recv(), 10)
+        if json.loads(payload).get('type') != 'connected':
+            raise ConnectionError(f"unexpected greeting: {payload[:100]!r}")
+        return ws
+
+    async def setup(self):
+        # Admin first: the client's connection then links to it by code straight away
+        try:
+            self.admin = await self.open(self.admin_id, 'admin')
+            self.client = await self.open(self.client_id, 'client')
+        except (OSError, ConnectionError, ConnectionClosed, asyncio.TimeoutError, ValueError):
+            return False
+        return True
+
+    async def warmup(self, requests):
+        return True
+
+    async def timed_send(self, ws, message):
+        start = time.perf_counter()
+        try:
+            await ws.send_binary(message)
+        except (OSError, ConnectionClosed):
+            self.stats.record('ws_send', 0, None, 0.0)
+            return
+        self.stats.record('ws_send', 200, {}, (time.perf_counter() - start) * 1000)
+
+    async def send_frame(self, seq):
+        self.frames_sent += 1
+        size = self.workload.frame_sizes[self.index][seq - 1]
+        data = self.frame_tag(seq).encode('ascii') + self.workload.frame_payload(size)
+        await self.timed_send(self.client, encode_frame(data))
+
+    async def send_input(self, seq):
+        self.inputs_sent += 1
+        await self.timed_send(self.admin, encode_input(self.input_event(seq)))
+
+    async def read(self, ws, senders_done):
+        loop = asyncio.get_running_loop()
+        drain_until = None
+        while True:
+            if senders_done.is_set():
+                if self.complete():
+                    return
+                drain_until = drain_until or loop.time() + DRAIN_TIMEOUT
+            timeout = max(0.0, drain_until - loop.time()) if drain_until else 0.25
+            try:
+                opcode, message = await asyncio.wait_for(ws.recv(), timeout)
+            except asyncio.TimeoutError:
+                if drain_until and loop.time() >= drain_until:
+                    return
+                continue
+            except ConnectionClosed:
+                return
+            if opcode != 0x2:
+                continue
+            try:
+                type_byte, data, _ = decode(message)
+            except ValueError:
+                continue
+            if type_byte == TYPE_FRAME and data.startswith(FRAME_MARKER.encode('ascii') + b':'):
+                tag, _, payload = data.partition(b'|')
+                self.frame_arrived(tag.decode('ascii'), len(payload))
+            elif type_byte == TYPE_INPUT:
+                try:
+                    self.input_arrived(json.loads(data))
+                except ValueError:
+                    continue
+
+    def complete(self):
+        return len(self.frames_received) >= self.frames_sent and len(self.inputs_received) >= self.inputs_sent
+
+    async def receive_all(self, senders_done):
+        await asyncio.gather(self.read(self.admin, senders_done), self.read(self.client, senders_done))
+
+    async def close(self):
+        for ws in (self.client, self.admin):
+            if ws:
+                self.stats.bytes_sent += ws.bytes_sent
+                self.stats.bytes_received += ws.bytes_received
+                await ws.close()
+
+async def run_backend(name, args, workload, db):
+    """Run the workload against one backend. Returns its result dict."""
+    backend = BACKENDS[name]
+    stats = LoadStats()
+    run_tag = letters(int(time.time()) % (26 ** 4))
+    if backend['kind'] == 'http':
+        pairs = [HttpPair(i, workload, args, stats, backend['script']) for i in range(workload.pairs)]
+        target = f"{args.url.rstrip('/')}/{backend['script']}"
+        sampler = ProcessSampler(args.http_processes)
+    else:
+        pairs = [WsPair(i, workload, args, stats, run_tag) for i in range(workload.pairs)]
+        target = args.ws_url
+        sampler = ProcessSampler(args.ws_processes)
+
+    print(f"[BENCH] {name}: {target}")
+    setup = await asyncio.gather(*(p.setup() for p in pairs), return_exceptions=True)
+    ready = [p for p, ok in zip(pairs, setup) if ok is True]
+    failed_setup = len(pairs) - len(ready)
+    try:
+        if not ready:
+            print(f"[ERROR] {name}: no pair could be set up - is the backend running?")
+            return None
+        if not await ready[0].warmup(WARMUP_REQUESTS):
+            print(f"[WARNING] {name}: warm-up requests failed")
+
+        db_before = db.read() if db else None
+        stop = asyncio.Event()
+        sampler_task = asyncio.ensure_future(sampler.run(stop))
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(p.run(workload.start_offsets[p.index]) for p in ready),
+                                        return_exceptions=True)
+        wall = time.perf_counter() - started
+        stop.set()
+        await sampler_task
+        db_after = db.read() if db else None
+    finally:
+        await asyncio.gather(*(p.close() for p in pairs), return_exceptions=True)
+
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            print(f"[WARNING] {name}: pair failed: {outcome!r}")
+
+    per_pair = [p.result() for p in ready]
+    frames_sent = sum(r['frames_sent'] for r in per_pair)
+    frames_delivered = sum(r['frames_received'] for r in per_pair)
+    frames_superseded = sum(r['frames_superseded'] for r in per_pair)
+    payload_bytes = sum(r['payload_bytes'] for r in per_pair)
+    successful = sum(c['ok'] for c in stats.endpoint_counts.values())
+
+    return {
+        'backend': name,
+        'kind': backend['kind'],
+        'target': target,
+        'pairs': len(pairs),
+        'pairs_failed_setup': failed_setup,
+        'wall_s': round(wall, 2),
+        'frames_sent': frames_sent,
+        'frames_delivered': frames_delivered,
+        'frames_superseded': frames_superseded,
+        'frames_missing': frames_sent - frames_delivered - frames_superseded,
+        'delivery_ratio': round((frames_delivered + frames_superseded) / frames_sent, 4) if frames_sent else 0.0,
+        'inputs_sent': sum(r['inputs_sent'] for r in per_pair),
+        'inputs_delivered': sum(r['inputs_received'] for r in per_pair),
+        'throughput_fps': round(frames_delivered / wall, 2) if wall else 0.0,
+        'payload_bytes_per_s': round(payload_bytes / wall) if wall else 0,
+        'wire_bytes_per_s': round((stats.bytes_sent + stats.bytes_received) / wall) if wall else 0,
+        'frame_latency': summarize_latencies(stats.frame_latencies),
+        'input_latency': summarize_latencies(stats.input_latencies),
+        'requests': stats.requests,
+        'requests_per_s': round(successful / wall, 2) if wall else 0.0,
+        'errors': stats.errors,
+        'rate_limited': stats.rate_limited,
+        'error_rate': round(stats.errors / stats.requests, 4) if stats.requests else 0.0,
+        'endpoints': {
+            endpoint: dict(stats.endpoint_counts[endpoint], **summarize_latencies(stats.endpoint_latencies.get(endpoint, [])))
+            for endpoint in sorted(stats.endpoint_counts)
+        },
+        'db': DbCounters.delta(db_before, db_after, frames_delivered),
+        'server': sampler.result(),
+        'per_pair': per_pair,
+    }
+
+def metric(result, path):
+    value = result
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def fmt(value, digits=1):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.{digits}f}"
+    return str(value)
+
+def print_comparison(run):
+    results = run['backends']
+    names = list(results)
+    print("="*70)
+    print(f"Relay backends - workload {run['workload_id']} (seed {run['workload']['seed']}, "
+          f"{run['workload']['pairs']} pairs @ {run['workload']['fps']:g} FPS, "
+          f"{run['workload']['frame_bytes']} B frames)")
+    print("="*70)
+    rows = [
+        ('frames/s delivered', 'throughput_fps'),
+        ('delivered', 'delivery_ratio'),
+        ('payload MB/s', None),
+        ('requests/s', 'requests_per_s'),
+        ('frame p50 ms', 'frame_latency.p50_ms'),
+        ('frame p95 ms', 'frame_latency.p95_ms'),
+        ('frame p99 ms', 'frame_latency.p99_ms'),
+        ('input p95 ms', 'input_latency.p95_ms'),
+        ('error rate', 'error_rate'),
+        ('DB bytes written', 'db.bytes_written'),
+        ('DB B/frame', 'db.bytes_per_frame'),
+        ('disk write B', 'server.write_bytes'),
+        ('RSS peak MB', 'server.rss_peak_mb'),
+        ('RSS mean MB', 'server.rss_mean_mb'),
+    ]
+    print(f"  {'':<20}" + ''.join(f"{n:>17}" for n in names))
+    for label, path in rows:
+        if path is None:
+            values = [fmt(results[n]['payload_bytes_per_s'] / 1024 / 1024, 2) for n in names]
+        else:
+            values = [fmt(metric(results[n], path), 3 if path in ('delivery_ratio', 'error_rate') else 1)
+                      for n in names]
+        print(f"  {label:<20}" + ''.join(f"{v:>17}" for v in values))
+    print()
+
+def find_baseline(results_dir, workload_id, exclude=None):
+    """Newest stored run with the same workload, or None"""
+    if not os.path.isdir(results_dir):
+        return None
+    for filename in sorted(os.listdir(results_dir), reverse=True):
+        path = os.path.join(results_dir, filename)
+        if not filename.endswith('.json') or path == exclude:
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if run.get('workload_id') == workload_id:
+            return path
+    return None
+
+def diff_runs(baseline, current, threshold_pct):
+    """Print metric changes per backend. Returns a list of regressions."""
+    regressions = []
+    print(f"Diff against {baseline.get('started_at', '?')} (threshold {threshold_pct:g}%)")
+    for name, after in current['backends'].items():
+        before = baseline['backends'].get(name)
+        if not before:
+            print(f"  {name}: not in baseline")
+            continue
+        print(f"  {name}")
+        for path, label, higher_is_better in DIFF_METRICS:
+            b, a = metric(before, path), metric(after, path)
+            if b is None or a is None:
+                continue
+            if path == 'error_rate':
+                worse = a > b + 0.01
+                change = f"{(a - b) * 100:+.2f} pts"
+            elif b == 0:
+                worse = False
+                change = "new" if a else "="
+            else:
+                pct = (a / b - 1) * 100
+                worse = (pct < -threshold_pct) if higher_is_better else (pct > threshold_pct)
+                if path.endswith('_ms') and a - b <= MIN_DELTA_MS:
+                    # 2ms -> 3ms is noise, not a regression
+                    worse = False
+                change = f"{pct:+.1f}%"
+            marker = "  <-- worse" if worse else ""
+            print(f"    {label:<15} {fmt(b, 2):>12} -> {fmt(a, 2):>12}  {change:>10}{marker}")
+            if worse:
+                regressions.append(f"{name}: {label} {fmt(b, 2)} -> {fmt(a, 2)} ({change})")
+    print()
+    return regressions
+
+async def run_all(args, workload, db):
+    results = {}
+    for i, name in enumerate(args.backends):
+        if i:
+            # Let cleanup, purge threads and page cache settle between backends
+            await asyncio.sleep(args.cooldown)
+        result = await run_backend(name, args, workload, db)
+        if result:
+            results[name] = result
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the relay backends with an identical seeded workload')
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help=f'Comma-separated subset of: {", ".join(BACKENDS)}')
+    parser.add_argument('--url', default=API_BASE_URL, help=f'API base URL (default: {API_BASE_URL})')
+    parser.add_argument('--ws-url', default=WS_URL, help=f'WebSocket relay URL (default: {WS_URL})')
+    parser.add_argument('--insecure', action='store_true', help='Skip TLS certificate verification')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--pairs', type=int, default=DEFAULT_PAIRS)
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS)
+    parser.add_argument('--frame-bytes', type=int, default=DEFAULT_FRAME_BYTES,
+                        help='Mean raw frame size (HTTP backends send it base64 encoded)')
+    parser.add_argument('--frame-jitter', type=float, default=DEFAULT_FRAME_JITTER,
+                        help='Frame size variation, fraction of --frame-bytes (default: 0.3)')
+    parser.add_argument('--input-rate', type=float, default=DEFAULT_INPUT_RATE, help='Input events/s per pair')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='Seconds of frames per pair')
+    parser.add_argument('--receive-interval', type=float, default=RECEIVE_INTERVAL,
+                        help='HTTP receive poll interval when the queue is empty (s)')
+    parser.add_argument('--cooldown', type=float, default=COOLDOWN, help='Pause between backends (s)')
+    parser.add_argument('--http-processes', default=HTTP_PROCESSES,
+                        help='Regex for web server process names (RSS / disk writes)')
+    parser.add_argument('--ws-processes', default=WS_PROCESSES, help='Regex for the WebSocket server process names')
+    parser.add_argument('--no-db', action='store_true', help='Skip the InnoDB write counters')
+    parser.add_argument('--mysql', default=os.getenv("BENCH_MYSQL", "mysql"), help='mysql client binary')
+    parser.add_argument('--defaults-file', default=os.getenv("BENCH_DEFAULTS_FILE"),
+                        help='Client option file with host/user/password')
+    parser.add_argument('--host', default=os.getenv("BENCH_MYSQL_HOST"))
+    parser.add_argument('--port', default=os.getenv("BENCH_MYSQL_PORT"))
+    parser.add_argument('--user', default=os.getenv("BENCH_MYSQL_USER"))
+    parser.add_argument('--results-dir', default=RESULTS_DIR, help=f'Where runs are stored (default: {RESULTS_DIR})')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare with this run instead of the newest matching one')
+    parser.add_argument('--no-save', action='store_true', help='Do not store this run')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD_PCT,
+                        help=f'Change in percent reported as worse (default: {REGRESSION_THRESHOLD_PCT:g})')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 if any metric got worse')
+    args = parser.parse_args()
+
+    args.backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    unknown = [b for b in args.backends if b not in BACKENDS]
+    if unknown:
+        parser.error(f"unknown backend(s): {', '.join(unknown)}")
+
+    workload = Workload(args.seed, args.pairs, args.fps, args.duration, args.frame_bytes,
+                        args.frame_jitter, args.input_rate)
+    db = None
+    if not args.no_db:
+        db = DbCounters(args.mysql, args.defaults_file, args.host, args.port, args.user)
+        if db.read() is None:
+            print(f"[WARNING] InnoDB counters unavailable ({db.error}) - DB bytes written not recorded")
+            db = None
+
+    started_at = datetime.now()
+    results = asyncio.run(run_all(args, workload, db))
+    run = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'api_url': args.url,
+        'ws_url': args.ws_url,
+        'workload_id': workload.workload_id(),
+        'workload': workload.spec(),
+        'backends': results,
+    }
+    if not results:
+        print("[ERROR] No backend produced results")
+        return False
+    print_comparison(run)
+
+    saved = None
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        saved = os.path.join(args.results_dir, f"relay_bench_{started_at:%Y%m%d-%H%M%S}.json")
+        with open(saved, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved: {saved}")
+
+    baseline_path = args.baseline or find_baseline(args.results_dir, run['workload_id'], exclude=saved)
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('workload_id') != run['workload_id']:
+            print(f"[WARNING] {baseline_path} used a different workload - numbers are not directly comparable")
+        regressions = diff_runs(baseline, run, args.threshold)
+    else:
+        print("No stored run with this workload yet - this run is the baseline")
+
+    if regressions and args.fail_on_regression:
+        print("[REGRESSION]")
+        for line in regressions:
+            print(f"  {line}")
+        return False
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Binary message framing of websocket_relay_server.js (and relay.php's binary protocol)
+
+Two layouts share the leading type byte (0x01 frame, 0x02 input, 0x04 cursor):
+
+    simple:  [type:1][length:4 BE][data]
+    frame:   [0x01][flags:1][metadata_length:2 BE][metadata][frame_length:4 BE][frame_data]
+             flags bit 0 = metadata starts with cursor X, Y (uint32 BE each)
+
+The server forwards a message byte-for-byte while both peers are linked.
+Messages it had to buffer (peer not linked yet) are re-sent in the simple
+layout, and a cursor carried in frame metadata is also sent to the admin
+as a separate 0x04 message with a JSON body.
+
+relay.php's binary protocol uses only the simple layout, several messages
+back to back in one request/response body.
+"""
+
+import json
+import struct
+
+TYPE_FRAME = 0x01
+TYPE_INPUT = 0x02
+TYPE_CURSOR = 0x04
+
+TYPE_NAMES = {TYPE_FRAME: 'frame', TYPE_INPUT: 'input', TYPE_CURSOR: 'cursor'}
+
+FLAG_CURSOR = 0x01
+
+def encode_message(type_byte, data):
+    """Simple layout: [type][length][data]"""
+    return struct.pack('!BI', type_byte, len(data)) + data
+
+def encode_frame(data, cursor=None, metadata=b''):
+    """Frame layout with optional cursor position (and extra metadata after it)"""
+    flags = 0
+    if cursor is not None:
+        flags |= FLAG_CURSOR
+        metadata = struct.pack('!II', cursor[0], cursor[1]) + metadata
+    return (struct.pack('!BBH', TYPE_FRAME, flags, len(metadata)) + metadata
+            + struct.pack('!I', len(data)) + data)
+
+def encode_input(event):
+    """Input event (dict) as the clients send it: JSON in the simple layout"""
+    return encode_message(TYPE_INPUT, json.dumps(event, separators=(',', ':')).encode('utf-8'))
+
+def split_messages(body):
+    """
+    Messages of a simple-layout stream (relay.php binary receive body) as a
+    list of (type_byte, data); raises ValueError on a malformed stream
+    """
+    messages = []
+    offset = 0
+    while offset < len(body):
+        if offset + 5 > len(body):
+            raise ValueError(f"truncated header at offset {offset}")
+        type_byte, length = struct.unpack_from('!BI', body, offset)
+        if type_byte not in TYPE_NAMES:
+            raise ValueError(f"unknown message type 0x{type_byte:02x} at offset {offset}")
+        if offset + 5 + length > len(body):
+            raise ValueError(f"truncated message at offset {offset}")
+        messages.append((type_byte, body[offset + 5:offset + 5 + length]))
+        offset += 5 + length
+    return messages
+
+def decode(message):
+    """
+    Parse one relayed binary message. Returns (type_byte, data, cursor) where
+    cursor is (x, y) or None; raises ValueError on a malformed message.
+
+    A frame in the simple layout whose length is below 16 MB also has a
+    second byte <= 1, so the layouts are told apart by which one accounts for
+    the message length exactly (the server itself only checks the flags byte).
+    """
+    if len(message) < 5:
+        raise ValueError(f"message too short ({len(message)} bytes)")
+    type_byte = message[0]
+    if type_byte not in TYPE_NAMES:
+        raise ValueError(f"unknown message type 0x{type_byte:02x}")
+
+    if type_byte == TYPE_FRAME and len(message) >= 8 and message[1] <= FLAG_CURSOR:
+        flags = message[1]
+        metadata_length = struct.unpack_from('!H', message, 2)[0]
+        offset = 4 + metadata_length
+        if offset + 4 <= len(message):
+            frame_length = struct.unpack_from('!I', message, offset)[0]
+            if offset + 4 + frame_length == len(message):
+                cursor = None
+                if flags & FLAG_CURSOR and metadata_length >= 8:
+                    cursor = struct.unpack_from('!II', message, 4)
+                return type_byte, message[offset + 4:], cursor
+
+    length = struct.unpack_from('!I', message, 1)[0]
+    if 5 + length != len(message):
+        raise ValueError(f"length field {length} does not match message size {len(message)}")
+    return type_byte, message[5:], None
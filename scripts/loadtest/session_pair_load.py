@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Session-pair load generator for the ShareFast HTTP relay path
+
+Simulates N client/admin pairs through the full lifecycle, the way the
+desktop clients drive the API:
+1. client register.php (mode=client), admin register.php (same code) -> linked
+2. keepalive.php and poll.php for both sides
+3. client -> admin frames via relay.php `send` at --fps, each frame
+   --frame-bytes of base64 payload
+4. admin drains frames via relay.php `receive` (--long-poll: held open by the
+   server until data arrives)
+5. admin -> client input events at --input-rate, client drains them
+   (--input-batch N: coalesced into relay.php `send_batch` requests)
+   --binary: relay.php's binary protocol instead of JSON - raw frame bytes
+   and length-prefixed messages (relay_framing.py) in both directions
+   --lane-limits input=N,cursor=N,frame=N: per-lane receive limits
+6. periodic keepalive (client) and signal polls (both)
+7. terminate_session.php cleans the pair up
+
+Every frame/input carries its pair, sequence number and send time, so the
+receiver measures end-to-end latency (send -> relay -> receive) and counts
+missing sequence numbers.
+
+Reported per run: achieved FPS per pair (frames delivered / second),
+end-to-end frame and input latency percentiles, per-endpoint request
+latency, error rate and server throughput (requests/s, bytes/s).
+
+--sweep 5,10,20,40 runs successive steps and stops once the median pair
+drops below --collapse-ratio of the target FPS - the last healthy step is
+the number of concurrent sessions the server can carry.
+
+Note: register.php, poll.php and relay.php are rate limited per IP (api/rate_limit.php).
+Raise RATE_LIMIT_REQUESTS and the ip budgets on the test stack, otherwise most requests from a
+single load-generator host come back 429 (reported separately as
+"rate limited").
+
+Usage:
+    python scripts/loadtest/session_pair_load.py --url http://localhost/api --pairs 10 --fps 15
+    python scripts/loadtest/session_pair_load.py --url http://localhost/api --sweep 5,10,20,40 --json load.json
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import string
+import sys
+import time
+from urllib.parse import urlencode
+
+from async_http import AsyncHttpClient
+from relay_framing import TYPE_FRAME, TYPE_INPUT, TYPE_NAMES, encode_input, encode_message, split_messages
+
+# Defaults
+API_BASE_URL = os.getenv("LOADTEST_API_URL", "http://localhost/api")
+DEFAULT_PAIRS = 10
+DEFAULT_FPS = 15
+DEFAULT_FRAME_BYTES = 30000
+DEFAULT_INPUT_RATE = 5.0
+DEFAULT_DURATION = 30
+DEFAULT_RAMP = 5
+POLL_INTERVAL = 2.0
+KEEPALIVE_INTERVAL = 30.0
+DRAIN_TIMEOUT = 3.0
+FRAME_MARKER = "LG"
+BINARY_CONTENT_TYPE = 'application/octet-stream'
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize_latencies(values):
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50), 2),
+        'p95_ms': round(percentile(values, 95), 2),
+        'p99_ms': round(percentile(values, 99), 2),
+        'max_ms': round(values[-1], 2),
+    }
+
+def letters(n, width=4):
+    """Base-26 letter string (codes must match ^[a-z]+-[a-z]+$)"""
+    out = []
+    for _ in range(width):
+        n, r = divmod(n, 26)
+        out.append(string.ascii_lowercase[r])
+    return ''.join(reversed(out))
+
+def parse_lane_limits(spec):
+    """'input=50,cursor=10,frame=1' -> {'input': 50, 'cursor': 10, 'frame': 1}"""
+    limits = {}
+    for item in spec.split(','):
+        lane, _, limit = item.partition('=')
+        if lane.strip() not in ('input', 'cursor', 'frame') or not limit.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"bad lane limit '{item}' (expected input|cursor|frame=N)")
+        limits[lane.strip()] = int(limit)
+    return limits
+
+def now_ms():
+    return time.perf_counter() * 1000
+
+class LoadStats:
+    """Counters shared by every pair in one run"""
+
+    def __init__(self):
+        self.endpoint_latencies = {}
+        self.endpoint_counts = {}
+        self.errors = 0
+        self.rate_limited = 0
+        self.requests = 0
+        self.frame_latencies = []
+        self.input_latencies = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def record(self, endpoint, status, body, elapsed_ms):
+        """Count one request. Returns True if it succeeded."""
+        self.requests += 1
+        counts = self.endpoint_counts.setdefault(endpoint, {'ok': 0, 'errors': 0, 'rate_limited': 0})
+        if status == 429:
+            self.rate_limited += 1
+            counts['rate_limited'] += 1
+            return False
+        if status != 200 or not isinstance(body, dict) or body.get('success') is False:
+            self.errors += 1
+            counts['errors'] += 1
+            return False
+        counts['ok'] += 1
+        self.endpoint_latencies.setdefault(endpoint, []).append(elapsed_ms)
+        return True
+
+class SessionPair:
+    """One simulated client/admin pair"""
+
+    def __init__(self, index, run_tag, args, stats):
+        self.index = index
+        self.code = f"{run_tag}-pair{letters(index)}"
+        self.args = args
+        self.stats = stats
+        self.client_id = None
+        self.admin_id = None
+        self.frames_sent = 0
+        self.frames_late = 0
+        self.frames_received = set()
+        self.inputs_sent = 0
+        self.inputs_received = set()
+        self.started_at = None
+        self.stopped_at = None
+        self.connections = []
+        raw_payload = os.urandom(max(0, args.frame_bytes * 3 // 4))
+        # Same image bytes either way: base64 text for JSON, raw for --binary
+        self.payload = raw_payload if args.binary else base64.b64encode(raw_payload).decode('ascii')
+
+    def connection(self):
+        conn = AsyncHttpClient(self.args.url, verify_tls=not self.args.insecure)
+        self.connections.append(conn)
+        return conn
+
+    async def call(self, conn, endpoint, script, payload):
+        status, body, elapsed = await conn.post_json(script, payload)
+        ok = self.stats.record(endpoint, status, body, elapsed)
+        return ok, body
+
+    async def call_binary(self, conn, endpoint, params, body=None):
+        """
+        relay.php binary protocol: fields in the query string, messages in the
+        body. Without a body this is a receive and returns the raw response.
+        """
+        # PHP array syntax for nested fields: limits[input]=50
+        flat = {}
+        for key, value in params.items():
+            if isinstance(value, dict):
+                flat.update({f"{key}[{k}]": v for k, v in value.items()})
+            else:
+                flat[key] = value
+        target = f"{conn.path}/relay.php?{urlencode(flat)}"
+        if body is None:
+            status, data, elapsed = await conn.request('GET', target, accept=BINARY_CONTENT_TYPE, raw=True)
+            ok = self.stats.record(endpoint, status, {} if status == 200 else None, elapsed)
+            return ok, data
+        status, reply, elapsed = await conn.request('POST', target, body, BINARY_CONTENT_TYPE)
+        return self.stats.record(endpoint, status, reply, elapsed), reply
+
+    async def setup(self):
+        """register (client, admin), keepalive, first polls"""
+        client, admin = self.connection(), self.connection()
+        ok, body = await self.call(client, 'register', 'register.php', {'code': self.code, 'mode': 'client'})
+        if not ok:
+            return False
+        self.client_id = body['session_id']
+        ok, body = await self.call(admin, 'register', 'register.php', {'code': self.code, 'mode': 'admin'})
+        if not ok:
+            return False
+        self.admin_id = body['session_id']
+        await self.call(client, 'keepalive', 'keepalive.php', {'session_id': self.client_id, 'code': self.code})
+        await self.call(client, 'poll', 'poll.php', {'session_id': self.client_id, 'code': self.code})
+        await self.call(admin, 'poll', 'poll.php', {'session_id': self.admin_id, 'code': self.code})
+        return True
+
+    async def send_frames(self, end):
+        conn = self.connection()
+        interval = 1.0 / self.args.fps
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        while loop.time() < end:
+            self.frames_sent += 1
+            tag = f"{FRAME_MARKER}:{self.index}:{self.frames_sent}:{now_ms():.3f}|"
+            if self.args.binary:
+                await self.call_binary(conn, 'relay_send', {
+                    'action': 'send', 'session_id': self.client_id, 'code': self.code,
+                }, encode_message(TYPE_FRAME, tag.encode('ascii') + self.payload))
+            else:
+                await self.call(conn, 'relay_send', 'relay.php', {
+                    'action': 'send', 'session_id': self.client_id, 'code': self.code, 'type': 'frame',
+                    'data': tag + self.payload,
+                })
+            next_at += interval
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -interval:
+                # Server can't keep up with the target FPS - don't burst to catch up
+                self.frames_late += 1
+                next_at = loop.time()
+
+    async def send_inputs(self, end):
+        if self.args.input_rate <= 0:
+            return
+        conn = self.connection()
+        interval = 1.0 / self.args.input_rate
+        loop = asyncio.get_running_loop()
+        pending = []
+        while loop.time() < end:
+            self.inputs_sent += 1
+            event = {'type': 'mouse_move', 'x': random.randint(0, 1920), 'y': random.randint(0, 1080),
+                     'lg': f"{self.index}:{self.inputs_sent}:{now_ms():.3f}"}
+            if self.args.input_batch > 1:
+                # Coalesce events into one send_batch request
+                pending.append({'type': 'input', 'data': event})
+                if len(pending) >= self.args.input_batch:
+                    await self.send_batch(conn, pending)
+                    pending = []
+            elif self.args.binary:
+                await self.call_binary(conn, 'relay_send', {
+                    'action': 'send', 'session_id': self.admin_id, 'code': self.code,
+                }, encode_input(event))
+            else:
+                await self.call(conn, 'relay_send', 'relay.php', {
+                    'action': 'send', 'session_id': self.admin_id, 'code': self.code, 'type': 'input', 'data': event,
+                })
+            await asyncio.sleep(interval)
+        if pending:
+            await self.send_batch(conn, pending)
+
+    async def send_batch(self, conn, messages):
+        if self.args.binary:
+            # Binary requests carry any number of messages back to back
+            await self.call_binary(conn, 'relay_send_batch', {
+                'action': 'send', 'session_id': self.admin_id, 'code': self.code,
+            }, b''.join(encode_input(message['data']) for message in messages))
+            return
+        await self.call(conn, 'relay_send_batch', 'relay.php', {
+            'action': 'send_batch', 'session_id': self.admin_id, 'code': self.code, 'messages': messages,
+        })
+
+    def _consume_binary(self, body):
+        """Binary receive body -> the message dicts _consume() expects"""
+        messages = []
+        for type_byte, data in split_messages(body or b''):
+            if type_byte == TYPE_FRAME:
+                data = data.decode('latin-1')
+            elif type_byte == TYPE_INPUT:
+                data = json.loads(data)
+            messages.append({'type': TYPE_NAMES[type_byte], 'data': data})
+        self._consume(messages)
+        return len(messages)
+
+    def _consume(self, messages):
+        received_at = now_ms()
+        for message in messages:
+            data = message.get('data')
+            if message.get('type') == 'frame' and isinstance(data, str) and data.startswith(FRAME_MARKER + ':'):
+                _, _, seq, sent_at = data.split('|', 1)[0].split(':')
+                self.frames_received.add(int(seq))
+                self.stats.frame_latencies.append(received_at - float(sent_at))
+            elif message.get('type') == 'input' and isinstance(data, dict) and 'lg' in data:
+                _, seq, sent_at = data['lg'].split(':')
+                self.inputs_received.add(int(seq))
+                self.stats.input_latencies.append(received_at - float(sent_at))
+
+    async def receive(self, session_id, end, drain_until):
+        """Drain relay messages for one side; keeps going briefly after `end` to collect stragglers"""
+        conn = self.connection()
+        long_poll = self.args.long_poll
+        if long_poll > 0:
+            conn.timeout = max(conn.timeout, long_poll + 10)
+        loop = asyncio.get_running_loop()
+        idle_sleep = min(0.05, 0.5 / self.args.fps)
+        while True:
+            payload = {'action': 'receive', 'session_id': session_id, 'code': self.code}
+            if self.args.lane_limits:
+                payload['limits'] = self.args.lane_limits
+            if long_poll > 0 and loop.time() < end:
+                # The server holds the request until data arrives - no client-side sleep
+                payload['wait'] = min(long_poll, max(0.0, end - loop.time()))
+            if self.args.binary:
+                ok, body = await self.call_binary(conn, 'relay_receive', payload)
+                count = self._consume_binary(body) if ok else 0
+            else:
+                ok, body = await self.call(conn, 'relay_receive', 'relay.php', payload)
+                count = body.get('count', 0) if ok else 0
+                if ok:
+                    self._consume(body.get('messages', []))
+            now = loop.time()
+            if now >= end and (count == 0 or now >= drain_until):
+                return
+            if count < 10 and 'wait' not in payload:
+                await asyncio.sleep(idle_sleep)
+
+    async def housekeeping(self, end):
+        """Signal polls for both sides and client keepalives"""
+        conn = self.connection()
+        loop = asyncio.get_running_loop()
+        last_keepalive = loop.time()
+        while loop.time() < end:
+            await asyncio.sleep(self.args.poll_interval)
+            await self.call(conn, 'poll', 'poll.php', {'session_id': self.client_id, 'code': self.code})
+            await self.call(conn, 'poll', 'poll.php', {'session_id': self.admin_id, 'code': self.code})
+            if loop.time() - last_keepalive >= KEEPALIVE_INTERVAL:
+                last_keepalive = loop.time()
+                await self.call(conn, 'keepalive', 'keepalive.php', {'session_id': self.client_id, 'code': self.code})
+
+    async def run(self, start_delay):
+        await asyncio.sleep(start_delay)
+        try:
+            if not await self.setup():
+                return False
+            loop = asyncio.get_running_loop()
+            self.started_at = loop.time()
+            end = self.started_at + self.args.duration
+            drain_until = end + DRAIN_TIMEOUT
+            await asyncio.gather(
+                self.send_frames(end),
+                self.send_inputs(end),
+                self.receive(self.admin_id, end, drain_until),
+                self.receive(self.client_id, end, drain_until),
+                self.housekeeping(end),
+            )
+            self.stopped_at = end
+            return True
+        finally:
+            cleanup = AsyncHttpClient(self.args.url, verify_tls=not self.args.insecure)
+            await cleanup.get('terminate_session.php', {'code': self.code})
+            await cleanup.close()
+            for conn in self.connections:
+                self.stats.bytes_sent += conn.bytes_sent
+                self.stats.bytes_received += conn.bytes_received
+                await conn.close()
+
+    def result(self):
+        duration = (self.stopped_at - self.started_at) if self.started_at and self.stopped_at else 0
+        return {
+            'pair': self.index,
+            'code': self.code,
+            'frames_sent': self.frames_sent,
+            'frames_received': len(self.frames_received),
+            'frames_late': self.frames_late,
+            # relay.php keeps only the newest frame per peer: older undelivered ones are superseded, not lost
+            'frames_superseded': max(self.frames_received, default=0) - len(self.frames_received),
+            'frames_missing': max(0, self.frames_sent - max(self.frames_received, default=0)),
+            'inputs_sent': self.inputs_sent,
+            'inputs_received': len(self.inputs_received),
+            'achieved_fps': round(len(self.frames_received) / duration, 2) if duration else 0.0,
+            'send_fps': round(self.frames_sent / duration, 2) if duration else 0.0,
+        }
+
+async def run_load(args, pairs):
+    """One run with `pairs` concurrent session pairs"""
+    stats = LoadStats()
+    run_tag = ''.join(random.choice(string.ascii_lowercase) for _ in range(6))
+    session_pairs = [SessionPair(i, run_tag, args, stats) for i in range(pairs)]
+    ramp_step = args.ramp / pairs if pairs else 0
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(p.run(i * ramp_step) for i, p in enumerate(session_pairs)),
+                                    return_exceptions=True)
+    wall = time.perf_counter() - started
+
+    pair_results = [p.result() for p, ok in zip(session_pairs, outcomes) if ok is True]
+    failed_setup = sum(1 for ok in outcomes if ok is not True)
+    fps = sorted(r['achieved_fps'] for r in pair_results)
+    successful = sum(c['ok'] for c in stats.endpoint_counts.values())
+
+    return {
+        'pairs': pairs,
+        'pairs_failed_setup': failed_setup,
+        'target_fps': args.fps,
+        'frame_bytes': args.frame_bytes,
+        'input_rate': args.input_rate,
+        'protocol': 'binary' if args.binary else 'json',
+        'duration_s': args.duration,
+        'wall_s': round(wall, 2),
+        'achieved_fps': {
+            'median': round(percentile(fps, 50), 2) if fps else 0.0,
+            'min': fps[0] if fps else 0.0,
+            'p5': round(percentile(fps, 5), 2) if fps else 0.0,
+        },
+        'frame_latency': summarize_latencies(stats.frame_latencies),
+        'input_latency': summarize_latencies(stats.input_latencies),
+        'frames_sent': sum(r['frames_sent'] for r in pair_results),
+        'frames_received': sum(r['frames_received'] for r in pair_results),
+        'frames_superseded': sum(r['frames_superseded'] for r in pair_results),
+        'requests': stats.requests,
+        'errors': stats.errors,
+        'rate_limited': stats.rate_limited,
+        'error_rate': round(stats.errors / stats.requests, 4) if stats.requests else 0.0,
+        'throughput_rps': round(successful / wall, 2) if wall else 0.0,
+        'throughput_bytes_per_s': round((stats.bytes_sent + stats.bytes_received) / wall) if wall else 0,
+        'endpoints': {
+            name: dict(stats.endpoint_counts[name], **summarize_latencies(stats.endpoint_latencies.get(name, [])))
+            for name in sorted(stats.endpoint_counts)
+        },
+        'per_pair': pair_results,
+    }
+
+def fmt(value, suffix=''):
+    return f"{value:.1f}{suffix}" if isinstance(value, (int, float)) else "-"
+
+def print_run(result):
+    print("="*70)
+    print(f"{result['pairs']} pairs @ {result['target_fps']} FPS target, "
+          f"{result['frame_bytes']} B frames, {result['input_rate']:g} inputs/s, {result['protocol']}")
+    print("="*70)
+    if result['pairs_failed_setup']:
+        print(f"[WARNING] {result['pairs_failed_setup']} pairs failed to register/link")
+    fps = result['achieved_fps']
+    print(f"Achieved FPS per pair:  median {fmt(fps['median'])}, p5 {fmt(fps['p5'])}, min {fmt(fps['min'])}")
+    fl = result['frame_latency']
+    print(f"Frame latency (e2e):    p50 {fmt(fl['p50_ms'], 'ms')}, p95 {fmt(fl['p95_ms'], 'ms')}, "
+          f"p99 {fmt(fl['p99_ms'], 'ms')}")
+    il = result['input_latency']
+    print(f"Input latency (e2e):    p50 {fmt(il['p50_ms'], 'ms')}, p95 {fmt(il['p95_ms'], 'ms')}")
+    print(f"Frames delivered:       {result['frames_received']}/{result['frames_sent']} "
+          f"({result['frames_superseded']} superseded by a newer frame)")
+    print(f"Requests:               {result['requests']} ({result['errors']} errors, "
+          f"{result['rate_limited']} rate limited, error rate {result['error_rate']:.2%})")
+    print(f"Server throughput:      {result['throughput_rps']:.1f} req/s, "
+          f"{result['throughput_bytes_per_s'] / 1024 / 1024:.2f} MB/s")
+    print()
+    print(f"  {'Endpoint':<15} {'ok':>7} {'errors':>7} {'429':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, e in result['endpoints'].items():
+        print(f"  {name:<15} {e['ok']:>7} {e['errors']:>7} {e['rate_limited']:>6} "
+              f"{fmt(e['p50_ms']):>8} {fmt(e['p95_ms']):>8} {fmt(e['p99_ms']):>8}")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate client/admin session pairs against the HTTP relay')
+    parser.add_argument('--url', default=API_BASE_URL, help=f'API base URL (default: {API_BASE_URL})')
+    parser.add_argument('--pairs', type=int, default=DEFAULT_PAIRS, help='Concurrent client/admin pairs')
+    parser.add_argument('--sweep', help='Comma-separated pair counts to run in sequence, e.g. 5,10,20,40')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS, help='Target frames/s per pair')
+    parser.add_argument('--frame-bytes', type=int, default=DEFAULT_FRAME_BYTES,
+                        help='Base64 frame payload size in bytes')
+    parser.add_argument('--input-rate', type=float, default=DEFAULT_INPUT_RATE,
+                        help='Input events/s per pair (admin -> client), 0 to disable')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='Seconds of traffic per pair')
+    parser.add_argument('--ramp', type=float, default=DEFAULT_RAMP, help='Seconds over which pairs start')
+    parser.add_argument('--input-batch', type=int, default=1, metavar='N',
+                        help='Send input events N at a time via relay.php send_batch')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help='Signal poll interval (s)')
+    parser.add_argument('--long-poll', type=float, default=0.0, metavar='SECONDS',
+                        help='relay.php receive with wait=SECONDS (server-side long-poll) instead of polling')
+    parser.add_argument('--binary', action='store_true',
+                        help="Use relay.php's binary protocol (raw frames, length-prefixed messages)")
+    parser.add_argument('--lane-limits', type=parse_lane_limits, default=None, metavar='SPEC',
+                        help='relay.php receive lane limits, e.g. input=50,cursor=10,frame=1')
+    parser.add_argument('--collapse-ratio', type=float, default=0.8,
+                        help='Sweep stops when median achieved FPS < ratio * target (default: 0.8)')
+    parser.add_argument('--insecure', action='store_true', help='Skip TLS certificate verification')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed (payloads, input positions)')
+    parser.add_argument('--json', metavar='FILE', help='Write results as JSON')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    steps = [int(n) for n in args.sweep.split(',')] if args.sweep else [args.pairs]
+    results = []
+    for pairs in steps:
+        result = asyncio.run(run_load(args, pairs))
+        results.append(result)
+        print_run(result)
+        if args.sweep and result['achieved_fps']['median'] < args.collapse_ratio * args.fps:
+            print(f"[COLLAPSE] Median FPS {result['achieved_fps']['median']:.1f} < "
+                  f"{args.collapse_ratio:g} x {args.fps:g} at {pairs} pairs - stopping sweep")
+            break
+
+    if args.sweep:
+        print(f"{'Pairs':>6} {'median FPS':>11} {'p95 frame ms':>13} {'err rate':>9} {'req/s':>8}")
+        for r in results:
+            print(f"{r['pairs']:>6} {r['achieved_fps']['median']:>11.1f} {fmt(r['frame_latency']['p95_ms']):>13} "
+                  f"{r['error_rate']:>9.2%} {r['throughput_rps']:>8.1f}")
+        healthy = [r['pairs'] for r in results if r['achieved_fps']['median'] >= args.collapse_ratio * args.fps]
+        print()
+        print(f"Capacity: {max(healthy) if healthy else 0} concurrent pairs at {args.fps:g} FPS")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'url': args.url, 'runs': results}, f, indent=2)
+        print(f"Results: {args.json}")
+
+    return all(r['pairs_failed_setup'] == 0 for r in results)
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+"""
+Binary-protocol load tester for websocket_relay_server.js
+
+Drives many client/admin pairs over WSS with the relay's binary framing
+(relay_framing.py):
+- client -> admin frames: [0x01][flags][metadata_length][cursor X/Y][frame_length][frame],
+  optionally with the cursor flag set (the server then also sends a 0x04 cursor
+  message to the admin)
+- admin -> client input events: [0x02][length][JSON]
+
+Every frame starts with a binary tag (pair, sequence number, send time), so the
+admin side measures relay forwarding latency (directly forwarded frames only;
+frames held in the buffer are reported separately) and finds missing frames.
+
+Frame buffering: while the admin is not connected the server keeps at most
+MAX_BUFFER_SIZE (10) frames per peer in `frameBuffers` and shifts the oldest
+out. --late-admin and --admin-gap/--gap-every take the admin offline while the
+client keeps sending; missing frames are then split into
+- shift drops:  evicted by the 10-entry buffer (expected: buffered - 10 per gap)
+- unflushed:    buffered frames that were never delivered after the admin came back
+- lost online:  frames sent while both peers were linked that never arrived
+Frames delivered from the buffer arrive re-framed in the simple layout, which is
+how they are told apart from directly forwarded ones.
+
+Offline operation: the server resolves peers through PHP_API_URL/get_peer_id.php.
+The tester serves that endpoint itself from the pairs it creates (--stub-port),
+so no PHP/MySQL stack is needed. Start the server with
+    PHP_API_URL=http://127.0.0.1:8790/ SSL_CERT_PATH=... SSL_KEY_PATH=... node websocket_relay_server.js
+or let the tester do it with --spawn-server (self-signed certificate via openssl,
+needs `npm install ws` next to the server script).
+
+Usage:
+    python scripts/loadtest/ws_relay_load.py --spawn-server --pairs 50 --fps 30
+    python scripts/loadtest/ws_relay_load.py --url wss://localhost:8767/ --insecure --pairs 20 --admin-gap 2 --gap-every 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from async_ws import OP_BINARY, AsyncWebSocket, ConnectionClosed
+from relay_framing import TYPE_CURSOR, TYPE_FRAME, TYPE_INPUT, decode, encode_frame, encode_input
+from session_pair_load import letters, percentile, summarize_latencies
+
+# Configuration
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SERVER_SCRIPT = os.path.join(PROJECT_ROOT, 'scripts', 'server', 'websocket_relay_server.js')
+WS_URL = os.getenv("LOADTEST_WS_URL", "wss://localhost:8767/")
+STUB_PORT = int(os.getenv("LOADTEST_STUB_PORT", "8790"))
+SPAWN_PORT = 8767
+DEFAULT_PAIRS = 10
+DEFAULT_FPS = 30
+DEFAULT_FRAME_BYTES = 30000
+DEFAULT_INPUT_RATE = 10.0
+DEFAULT_DURATION = 30
+DEFAULT_RAMP = 2
+DRAIN_TIMEOUT = 3.0
+DISCONNECT_GRACE = 0.5
+SERVER_START_TIMEOUT = 10
+
+# Mirrors MAX_BUFFER_SIZE in websocket_relay_server.js
+MAX_BUFFER_SIZE = 10
+
+# Frame tag: magic, pair, sequence, send time (perf_counter microseconds)
+TAG = struct.Struct('!2sIIQ')
+TAG_MAGIC = b'LT'
+
+def now_us():
+    return int(time.perf_counter() * 1_000_000)
+
+class PeerIdStub:
+    """Serves get_peer_id.php for the pairs this run creates"""
+
+    def __init__(self, port):
+        self.peers = {}
+        self.lookups = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if not parts.path.endswith('/get_peer_id.php'):
+                    self.send_error(404)
+                    return
+                query = parse_qs(parts.query)
+                session_id = query.get('session_id', [''])[0]
+                stub.lookups += 1
+                peer_id = stub.peers.get(session_id)
+                body = json.dumps({'success': peer_id is not None, 'peer_id': peer_id}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def link(self, client_id, admin_id):
+        self.peers[client_id] = admin_id
+        self.peers[admin_id] = client_id
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class SpawnedServer:
+    """websocket_relay_server.js on localhost with a throwaway self-signed certificate"""
+
+    def __init__(self, port, php_api_url):
+        self.port = port
+        self.php_api_url = php_api_url
+        self.workdir = tempfile.mkdtemp(prefix='sharefast-wsload-')
+        self.log_path = os.path.join(self.workdir, 'server.log')
+        self.process = None
+
+    def start(self):
+        cert = os.path.join(self.workdir, 'cert.pem')
+        key = os.path.join(self.workdir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+                       check=True, capture_output=True)
+        env = dict(os.environ, SSL_PORT=str(self.port), SSL_CERT_PATH=cert, SSL_KEY_PATH=key,
+                   PHP_API_URL=self.php_api_url, RELAY_STORAGE_PATH=os.path.join(self.workdir, 'relay') + '/')
+        # The server logs every connection and the first 50 messages per session - keep it off the console
+        log = open(self.log_path, 'wb')
+        self.process = subprocess.Popen(['node', SERVER_SCRIPT], cwd=os.path.dirname(SERVER_SCRIPT),
+                                        env=env, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        deadline = time.time() + SERVER_START_TIMEOUT
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with {self.process.returncode}:\n{self.log_tail()}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.5).close()
+                return f"wss://localhost:{self.port}/"
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"server did not listen on port {self.port} within {SERVER_START_TIMEOUT}s")
+
+    def log_tail(self, lines=10):
+        try:
+            with open(self.log_path, encoding='utf-8', errors='replace') as f:
+                return ''.join(f.readlines()[-lines:]).rstrip()
+        except OSError:
+            return ''
+
+    def rss_mb(self):
+        try:
+            with open(f'/proc/{self.process.pid}/status', encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+class RunStats:
+    """Counters shared by every pair in one run"""
+
+    def __init__(self):
+        self.frame_latencies = []
+        self.buffered_latencies = []
+        self.input_latencies = []
+        self.frames_sent = 0
+        self.frame_bytes_sent = 0
+        self.frames_received = 0
+        self.frame_bytes_received = 0
+        self.cursor_messages = 0
+        self.malformed = 0
+        self.send_errors = 0
+        self.connect_failures = 0
+
+
+class WsLoadPair:
+    """One client/admin pair on the relay"""
+
+    def __init__(self, index, run_tag, args, stats, stub, payload):
+        self.index = index
+        self.args = args
+        self.stats = stats
+        self.payload = payload
+        self.code = f"loadtest-{run_tag}{letters(index)}"
+        self.client_id = f"lt_{run_tag}_{index}_client"
+        self.admin_id = f"lt_{run_tag}_{index}_admin"
+        stub.link(self.client_id, self.admin_id)
+        self.client = None
+        self.admin = None
+        self.admin_online = False
+        self.admin_ready = asyncio.Event()
+        # seq -> offline window the frame was sent in (None = admin linked)
+        self.frame_gap = {}
+        self.current_gap = None
+        self.gap_count = 0
+        self.direct = set()
+        self.flushed = set()
+        self.out_of_order = 0
+        self.last_seq = 0
+        self.inputs_sent = 0
+        self.inputs_received = set()
+        self.started_at = None
+        self.stopped_at = None
+
+    def offline_windows(self):
+        """(start, end) seconds into the run during which the admin is disconnected"""
+        windows = []
+        if self.args.late_admin > 0:
+            windows.append((0.0, self.args.late_admin))
+        if self.args.admin_gap > 0 and self.args.gap_every > 0:
+            t = self.args.gap_every
+            while t < self.args.duration:
+                windows.append((t, min(t + self.args.admin_gap, self.args.duration)))
+                t += self.args.gap_every
+        return windows
+
+    async def connect(self, session_id, mode):
+        sep = '&' if '?' in self.args.url else '?'
+        url = f"{self.args.url}{sep}session_id={session_id}&code={self.code}&mode={mode}"
+        try:
+            ws = await AsyncWebSocket(url, verify_tls=not self.args.insecure).connect()
+            opcode, greeting = await asyncio.wait_for(ws.recv(), 10)
+            if json.loads(greeting).get('type') != 'connected':
+                raise ConnectionError(f"unexpected greeting: {greeting[:100]!r}")
+        except (OSError, ConnectionError, ConnectionClosed, asyncio.TimeoutError, ValueError):
+            self.stats.connect_failures += 1
+            return None
+        return ws
+
+    async def read(self, ws, handler):
+        """Dispatch binary messages until the connection is closed"""
+        while True:
+            try:
+                opcode, message = await ws.recv()
+            except ConnectionClosed:
+                return
+            if opcode == OP_BINARY:
+                handler(message, now_us())
+
+    def begin_gap(self):
+        self.current_gap = self.gap_count
+        self.gap_count += 1
+        self.admin_online = False
+
+    async def admin_loop(self):
+        """Keep the admin connected outside the offline windows. Returns the last reader task."""
+        loop = asyncio.get_running_loop()
+        online_from = 0.0
+        for gap_start, gap_end in self.offline_windows() + [(None, None)]:
+            if gap_start is not None and gap_start <= online_from:
+                # Admin joins late: the client starts on its own
+                self.begin_gap()
+                self.admin_ready.set()
+                online_from = gap_end
+                continue
+
+            await asyncio.sleep(max(0.0, self.started_at + online_from - loop.time()))
+            self.admin = await self.connect(self.admin_id, 'admin')
+            self.admin_ready.set()
+            if self.admin is None:
+                return None
+            self.current_gap = None
+            self.admin_online = True
+            reader = asyncio.ensure_future(self.read(self.admin, self.on_admin_message))
+            if gap_start is None:
+                return reader
+
+            await asyncio.sleep(max(0.0, self.started_at + gap_start - loop.time()))
+            # Frames sent from here on belong to the gap; in-flight ones still get read
+            self.begin_gap()
+            await asyncio.sleep(DISCONNECT_GRACE)
+            await self.admin.close()
+            await reader
+            online_from = gap_end
+        return None
+
+    async def send_frames(self, end):
+        interval = 1.0 / self.args.fps
+        loop = asyncio.get_running_loop()
+        rng = random.Random(self.args.seed * 1000003 + self.index)
+        next_at = loop.time()
+        seq = 0
+        while loop.time() < end:
+            seq += 1
+            data = TAG.pack(TAG_MAGIC, self.index, seq, now_us()) + self.payload
+            cursor = (rng.randint(0, 1920), rng.randint(0, 1080)) if self.args.cursor else None
+            message = encode_frame(data, cursor=cursor)
+            self.frame_gap[seq] = self.current_gap
+            try:
+                await self.client.send_binary(message)
+            except (OSError, ConnectionClosed):
+                self.stats.send_errors += 1
+                return
+            self.stats.frames_sent += 1
+            self.stats.frame_bytes_sent += len(message)
+            next_at += interval
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -interval:
+                # Can't keep up with the target FPS - don't burst to catch up
+                next_at = loop.time()
+
+    async def send_inputs(self, end):
+        if self.args.input_rate <= 0:
+            return
+        rng = random.Random(self.args.seed * 7919 + self.index)
+        loop = asyncio.get_running_loop()
+        while loop.time() < end:
+            await asyncio.sleep(1.0 / self.args.input_rate)
+            if not self.admin_online:
+                continue
+            self.inputs_sent += 1
+            event = {'type': 'mouse_move', 'x': rng.randint(0, 1920), 'y': rng.randint(0, 1080),
+                     'lt': f"{self.index}:{self.inputs_sent}:{now_us()}"}
+            try:
+                await self.admin.send_binary(encode_input(event))
+            except (OSError, ConnectionClosed):
+                self.stats.send_errors += 1
+
+    def on_admin_message(self, message, received_us):
+        try:
+            type_byte, data, _ = decode(message)
+        except ValueError:
+            self.stats.malformed += 1
+            return
+        if type_byte == TYPE_CURSOR:
+            self.stats.cursor_messages += 1
+            return
+        if type_byte != TYPE_FRAME or len(data) < TAG.size or not data.startswith(TAG_MAGIC):
+            return
+        _, pair, seq, sent_us = TAG.unpack_from(data)
+        if pair != self.index:
+            return
+        # Direct forwarding passes our frame layout through unchanged; frames
+        # flushed from frameBuffers come back in the simple [type][length] layout
+        latency_ms = (received_us - sent_us) / 1000
+        if len(message) == 5 + len(data):
+            self.flushed.add(seq)
+            self.stats.buffered_latencies.append(latency_ms)
+        else:
+            self.direct.add(seq)
+            self.stats.frame_latencies.append(latency_ms)
+        if seq < self.last_seq:
+            self.out_of_order += 1
+        self.last_seq = max(self.last_seq, seq)
+        self.stats.frames_received += 1
+        self.stats.frame_bytes_received += len(message)
+
+    def on_client_message(self, message, received_us):
+        try:
+            type_byte, data, _ = decode(message)
+        except ValueError:
+            self.stats.malformed += 1
+            return
+        if type_byte != TYPE_INPUT:
+            return
+        try:
+            event = json.loads(data)
+            pair, seq, sent_us = event['lt'].split(':')
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return
+        if int(pair) == self.index:
+            self.inputs_received.add(int(seq))
+            self.stats.input_latencies.append((received_us - int(sent_us)) / 1000)
+
+    def complete(self):
+        """Every frame sent while linked and every input arrived"""
+        received = self.direct | self.flushed
+        if any(gap is None and seq not in received for seq, gap in self.frame_gap.items()):
+            return False
+        return len(self.inputs_received) >= self.inputs_sent
+
+    async def run(self, start_delay):
+        await asyncio.sleep(start_delay)
+        loop = asyncio.get_running_loop()
+        self.started_at = loop.time()
+        end = self.started_at + self.args.duration
+
+        # Admin first (unless it joins late) so the client links to it by code on connect
+        admin_task = asyncio.ensure_future(self.admin_loop())
+        await self.admin_ready.wait()
+        self.client = await self.connect(self.client_id, 'client')
+        if self.client is None:
+            admin_task.cancel()
+            return False
+        client_reader = asyncio.ensure_future(self.read(self.client, self.on_client_message))
+
+        await asyncio.gather(self.send_frames(end), self.send_inputs(end))
+        self.stopped_at = loop.time()
+        admin_reader = await admin_task
+
+        drain_until = loop.time() + DRAIN_TIMEOUT
+        while loop.time() < drain_until and not self.complete():
+            await asyncio.sleep(0.05)
+        for ws in (self.client, self.admin):
+            if ws:
+                await ws.close()
+        await client_reader
+        if admin_reader:
+            await admin_reader
+        return True
+
+    def result(self):
+        received = self.direct | self.flushed
+        lost_online = sum(1 for seq, gap in self.frame_gap.items() if gap is None and seq not in received)
+        buffered_total = shift_drops = unflushed = 0
+        for gap in range(self.gap_count):
+            buffered = [seq for seq, g in self.frame_gap.items() if g == gap and seq not in self.direct]
+            lost = sum(1 for seq in buffered if seq not in self.flushed)
+            evicted = min(lost, max(0, len(buffered) - MAX_BUFFER_SIZE))
+            buffered_total += len(buffered)
+            shift_drops += evicted
+            unflushed += lost - evicted
+        duration = (self.stopped_at - self.started_at) if self.started_at and self.stopped_at else 0
+        return {
+            'pair': self.index,
+            'frames_sent': len(self.frame_gap),
+            'frames_direct': len(self.direct),
+            'frames_flushed': len(self.flushed),
+            'frames_buffered': buffered_total,
+            'lost_online': lost_online,
+            'lost_buffer_shift': shift_drops,
+            'lost_unflushed': unflushed,
+            'out_of_order': self.out_of_order,
+            'inputs_sent': self.inputs_sent,
+            'inputs_received': len(self.inputs_received),
+            'achieved_fps': round(len(received) / duration, 2) if duration else 0.0,
+        }
+
+async def run_load(args, stub):
+    stats = RunStats()
+    run_tag = letters(random.Random(args.seed).randrange(26 ** 4) ^ (int(time.time()) % (26 ** 4)))
+    payload = random.Random(args.seed).getrandbits(8 * args.frame_bytes).to_bytes(args.frame_bytes, 'big')
+    pairs = [WsLoadPair(i, run_tag, args, stats, stub, payload) for i in range(args.pairs)]
+    ramp_step = args.ramp / args.pairs if args.pairs else 0
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(p.run(i * ramp_step) for i, p in enumerate(pairs)), return_exceptions=True)
+    wall = time.perf_counter() - started
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            print(f"[WARNING] pair failed: {outcome!r}")
+
+    per_pair = [p.result() for p, ok in zip(pairs, outcomes) if ok is True]
+    fps = sorted(r['achieved_fps'] for r in per_pair)
+    totals = {key: sum(r[key] for r in per_pair) for key in (
+        'frames_sent', 'frames_direct', 'frames_flushed', 'frames_buffered', 'lost_online',
+        'lost_buffer_shift', 'lost_unflushed', 'out_of_order', 'inputs_sent', 'inputs_received')}
+    return dict(totals, **{
+        'pairs': args.pairs,
+        'pairs_failed': sum(1 for ok in outcomes if ok is not True),
+        'target_fps': args.fps,
+        'frame_bytes': args.frame_bytes,
+        'duration_s': args.duration,
+        'wall_s': round(wall, 2),
+        'achieved_fps': {
+            'median': round(percentile(fps, 50), 2) if fps else 0.0,
+            'p5': round(percentile(fps, 5), 2) if fps else 0.0,
+            'min': fps[0] if fps else 0.0,
+        },
+        'frames_per_s': round(stats.frames_received / wall, 2) if wall else 0.0,
+        'bytes_per_s_sent': round(stats.frame_bytes_sent / wall) if wall else 0,
+        'bytes_per_s_received': round(stats.frame_bytes_received / wall) if wall else 0,
+        'forwarding_latency': summarize_latencies(stats.frame_latencies),
+        'buffered_latency': summarize_latencies(stats.buffered_latencies),
+        'input_latency': summarize_latencies(stats.input_latencies),
+        'cursor_messages': stats.cursor_messages,
+        'malformed_messages': stats.malformed,
+        'send_errors': stats.send_errors,
+        'connect_failures': stats.connect_failures,
+        'peer_lookups': stub.lookups,
+        'per_pair': per_pair,
+    })
+
+def fmt(value, suffix=''):
+    return f"{value:.1f}{suffix}" if isinstance(value, (int, float)) else "-"
+
+def print_result(result):
+    print("="*70)
+    print(f"{result['pairs']} pairs @ {result['target_fps']:g} FPS, {result['frame_bytes']} B frames, "
+          f"{result['duration_s']:g}s")
+    print("="*70)
+    if result['pairs_failed'] or result['connect_failures']:
+        print(f"[WARNING] {result['pairs_failed']} pairs failed, {result['connect_failures']} connect failures")
+    fps = result['achieved_fps']
+    print(f"Achieved FPS per pair:  median {fmt(fps['median'])}, p5 {fmt(fps['p5'])}, min {fmt(fps['min'])}")
+    fl = result['forwarding_latency']
+    print(f"Forwarding latency:     p50 {fmt(fl['p50_ms'], 'ms')}, p95 {fmt(fl['p95_ms'], 'ms')}, "
+          f"p99 {fmt(fl['p99_ms'], 'ms')}, max {fmt(fl['max_ms'], 'ms')}")
+    il = result['input_latency']
+    print(f"Input latency:          p50 {fmt(il['p50_ms'], 'ms')}, p95 {fmt(il['p95_ms'], 'ms')} "
+          f"({result['inputs_received']}/{result['inputs_sent']} delivered)")
+    print(f"Relay throughput:       {result['frames_per_s']:.1f} frames/s, "
+          f"{result['bytes_per_s_sent'] / 1024 / 1024:.2f} MB/s in, "
+          f"{result['bytes_per_s_received'] / 1024 / 1024:.2f} MB/s out")
+    delivered = result['frames_direct'] + result['frames_flushed']
+    print(f"Frames:                 {delivered}/{result['frames_sent']} delivered "
+          f"({result['frames_direct']} direct, {result['frames_flushed']} from buffer)")
+    if result['frames_buffered']:
+        print(f"Sent while admin away:  {result['frames_buffered']} "
+              f"-> {result['lost_buffer_shift']} shifted out of frameBuffers (max {MAX_BUFFER_SIZE}), "
+              f"{result['lost_unflushed']} never flushed")
+    if result['frames_flushed']:
+        bl = result['buffered_latency']
+        print(f"Buffered frame latency: p50 {fmt(bl['p50_ms'], 'ms')}, max {fmt(bl['max_ms'], 'ms')}")
+    print(f"Lost while linked:      {result['lost_online']}")
+    if result['out_of_order']:
+        print(f"Out of order:           {result['out_of_order']}")
+    if result['cursor_messages']:
+        print(f"Cursor messages:        {result['cursor_messages']}")
+    if result['malformed_messages'] or result['send_errors']:
+        print(f"Malformed / send errors: {result['malformed_messages']} / {result['send_errors']}")
+    if result.get('server_rss_mb') is not None:
+        print(f"Server RSS:             {result['server_rss_mb']:.1f} MB")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test websocket_relay_server.js with its binary protocol')
+    parser.add_argument('--url', default=WS_URL, help=f'WebSocket relay URL (default: {WS_URL})')
+    parser.add_argument('--insecure', action='store_true', help='Skip TLS certificate verification')
+    parser.add_argument('--spawn-server', action='store_true',
+                        help='Start websocket_relay_server.js locally with a self-signed certificate')
+    parser.add_argument('--port', type=int, default=SPAWN_PORT, help='Port for --spawn-server')
+    parser.add_argument('--stub-port', type=int, default=STUB_PORT,
+                        help=f'Port of the local get_peer_id.php stub (default: {STUB_PORT})')
+    parser.add_argument('--pairs', type=int, default=DEFAULT_PAIRS, help='Concurrent client/admin pairs')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS, help='Frames/s per client')
+    parser.add_argument('--frame-bytes', type=int, default=DEFAULT_FRAME_BYTES, help='Frame payload size')
+    parser.add_argument('--cursor', action='store_true', help='Send the cursor position in frame metadata')
+    parser.add_argument('--input-rate', type=float, default=DEFAULT_INPUT_RATE,
+                        help='Input events/s per admin, 0 to disable')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='Seconds of traffic per pair')
+    parser.add_argument('--ramp', type=float, default=DEFAULT_RAMP, help='Seconds over which pairs start')
+    parser.add_argument('--late-admin', type=float, default=0.0,
+                        help='Admin connects this many seconds after the client starts sending')
+    parser.add_argument('--admin-gap', type=float, default=0.0, help='Seconds the admin stays disconnected')
+    parser.add_argument('--gap-every', type=float, default=0.0, help='Disconnect the admin every N seconds')
+    parser.add_argument('--seed', type=int, default=1337, help='Seed for payload, cursor and input positions')
+    parser.add_argument('--json', metavar='FILE', help='Write results as JSON')
+    args = parser.parse_args()
+
+    stub = PeerIdStub(args.stub_port).start()
+    server = None
+    try:
+        if args.spawn_server:
+            server = SpawnedServer(args.port, stub.url)
+            try:
+                args.url = server.start()
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+                print(f"[ERROR] Could not start the relay server: {e}")
+                return False
+            args.insecure = True
+            print(f"[SERVER] websocket_relay_server.js on {args.url} (log: {server.log_path}, removed on exit)")
+        else:
+            print(f"[STUB] get_peer_id.php at {stub.url} - start the server with PHP_API_URL={stub.url}")
+
+        result = asyncio.run(run_load(args, stub))
+        if server:
+            result['server_rss_mb'] = server.rss_mb()
+    finally:
+        if server:
+            server.stop()
+        stub.stop()
+
+    print_result(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(result, url=args.url), f, indent=2)
+        print(f"Results: {args.json}")
+    return result['pairs_failed'] == 0 and result['lost_online'] == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
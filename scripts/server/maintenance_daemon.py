@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Maintenance daemon for the ShareFast database
+
+Keeps the tables the API reads on every request from growing without bound
+(replaces cleanup_relay_messages.sh). Every --interval seconds it runs:
+
+  sessions          sessions expired more than SESSION_GRACE seconds ago
+  admin_sessions    admin reconnect records expired more than SESSION_GRACE ago
+  orphaned_relay    relay_messages whose recipient session no longer exists
+  orphaned_signals  signals (and signal_queues counters) whose session no longer exists
+  frame_slots       relay_frame_slots not written for FRAME_SLOT_MAX_IDLE seconds
+  partitions        relay_messages / signals partition retention (relay_partitions.py)
+  rate_limit_files  file-fallback rate limit windows (storage/rate_limit/) idle for an hour
+
+Deletes never touch more than one chunk at a time:
+- A chunk is the next N keys in primary-key order (keyset pagination, never
+  OFFSET); the DELETE names exactly those keys and re-checks the condition,
+  so a session extended by a keepalive in the meantime survives.
+- Each chunk is its own autocommit transaction. N adapts so a chunk's DELETE
+  stays under --chunk-ms (halved when a chunk runs over, grown when it is
+  well under), which caps how long its row locks are held.
+- innodb_lock_wait_timeout is 1 second: the daemon gives way to the hot
+  path's locks, never the other way round.
+- Between chunks it pauses as long as the chunk took (at most 50% duty) and
+  waits, backing off up to BACKOFF_MAX seconds, while Threads_running or
+  the lag of any --replica is above its limit.
+- A job stops after JOB_TIME_BUDGET seconds; the rest waits for the next cycle.
+
+Metrics: one JSON line per job on stdout (rows removed, chunks, seconds
+spent working and throttled, errors) and running totals in
+storage/maintenance_stats.json.
+
+Credentials: --defaults-file, or a 0600 option file generated from
+config.php (DB_HOST/DB_USER/DB_PASS/DB_NAME) and removed on exit.
+
+Usage:
+    python3 scripts/server/maintenance_daemon.py                    # run forever
+    python3 scripts/server/maintenance_daemon.py --once             # one cycle (cron)
+    python3 scripts/server/maintenance_daemon.py --once --dry-run   # count candidates only
+    python3 scripts/server/maintenance_daemon.py --replica /etc/sharefast/replica1.cnf
+
+On the VM it runs from the repository checkout (releases do not contain
+scripts/) as the sharefast-maintenance systemd unit, which
+deploy_git_based.py installs from scripts/server/sharefast-maintenance.service:
+    python3 /opt/sharefast-api/scripts/server/maintenance_daemon.py \
+        --config /opt/sharefast-shared/config.php --storage-path /opt/sharefast-shared/storage
+"""
+
+import argparse
+import atexit
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from relay_partitions import MySQLClient, maintain_partitions
+
+# Configuration
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+CONFIG_FILE = PROJECT_ROOT / "config.php"
+STORAGE_PATH = PROJECT_ROOT / "storage"
+STATS_FILE = STORAGE_PATH / "maintenance_stats.json"
+
+DEFAULT_INTERVAL = 300      # Seconds between cycles
+SESSION_GRACE = 3600        # Expired sessions stay this long (reconnect, diagnostics)
+FRAME_SLOT_MAX_IDLE = 3600  # Frame slot of a session that stopped sending frames
+RATE_LIMIT_FILE_MAX_AGE = 3600
+RELAY_STATS_MAX_AGE = 3600  # Rollup buckets outlive the dashboards' 5-minute window
+
+CHUNK_START = 1000
+CHUNK_MIN = 50
+CHUNK_MAX = 5000
+CHUNK_MS = 200              # Target (and cap) for one chunk's DELETE
+INNODB_LOCK_WAIT = 1        # Seconds a chunk waits for a row lock before giving up
+MAX_CHUNK_ERRORS = 3        # Failed chunks before a job gives up for this cycle
+JOB_TIME_BUDGET = 120       # Seconds one job may run per cycle
+
+MAX_THREADS_RUNNING = 16    # Pause while the server is busier than this
+MAX_REPLICA_LAG = 5         # Pause while a replica is further behind (seconds)
+BACKOFF_MAX = 30
+
+# Chunked delete jobs, in run order (sessions first: their rows become orphans).
+# `where` is formatted with now; `range` names the partitioning column, so
+# the DELETE by key prunes to the partitions the chunk lives in.
+DELETE_JOBS = [
+    {
+        'name': 'sessions',
+        'table': 'sessions',
+        'key': 'id',
+        'where': "expires_at < {now} - " + str(SESSION_GRACE),
+    },
+    {
+        'name': 'admin_sessions',
+        'table': 'admin_sessions',
+        'key': 'id',
+        'where': "expires_at < {now} - " + str(SESSION_GRACE),
+    },
+    {
+        'name': 'orphaned_relay',
+        'table': 'relay_messages',
+        'key': 'id',
+        'range': 'created_at',
+        'where': "NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.session_id = relay_messages.session_id)",
+    },
+    {
+        'name': 'orphaned_signals',
+        'table': 'signals',
+        'key': 'id',
+        'range': 'created_at',
+        'where': "NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.session_id = signals.session_id)",
+    },
+    {
+        'name': 'orphaned_signal_queues',
+        'table': 'signal_queues',
+        'key': 'session_id',
+        'string_key': True,
+        'where': "NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.session_id = signal_queues.session_id)",
+    },
+    {
+        'name': 'frame_slots',
+        'table': 'relay_frame_slots',
+        'key': 'session_id',
+        'string_key': True,
+        'where': "updated_at < {now} - " + str(FRAME_SLOT_MAX_IDLE),
+    },
+    {
+        'name': 'relay_stats',
+        'table': 'relay_stats',
+        'key': 'id',
+        'where': "bucket < {now} - " + str(RELAY_STATS_MAX_AGE),
+    },
+]
+
+def sql_string(value):
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+def option_file_from_config(config_path=CONFIG_FILE):
+    """Write a 0600 mysql option file from config.php's DB_* constants (removed on exit)"""
+    php_code = (
+        f'require_once {json.dumps(str(config_path))}; '
+        'echo "[client]\\nhost=", DB_HOST, "\\nuser=", DB_USER, '
+        '"\\npassword=\\"", addcslashes(DB_PASS, "\\"\\\\"), "\\"\\n[mysql]\\ndatabase=", DB_NAME, "\\n";'
+    )
+    result = subprocess.run(['php', '-r', php_code], capture_output=True, text=True)
+    if result.returncode != 0 or '\ndatabase=' not in result.stdout:
+        raise RuntimeError(f"Could not read database settings from {config_path}: "
+                           f"{result.stderr.strip() or 'DB_NAME missing'}")
+
+    fd, path = tempfile.mkstemp(prefix="sfmaint-", suffix=".cnf")  # mkstemp creates it 0600
+    with os.fdopen(fd, 'w') as f:
+        f.write(result.stdout)
+    atexit.register(lambda: os.path.exists(path) and os.remove(path))
+    return path
+
+class Pacer:
+    """Chunk size, pauses and load back-off shared by every delete job"""
+
+    def __init__(self, client, replicas, stop, chunk_ms=CHUNK_MS,
+                 max_threads_running=MAX_THREADS_RUNNING, max_replica_lag=MAX_REPLICA_LAG):
+        self.client = client
+        self.replicas = replicas
+        self.stop = stop
+        self.chunk = CHUNK_START
+        self.chunk_ms = chunk_ms
+        self.max_threads_running = max_threads_running
+        self.max_replica_lag = max_replica_lag
+
+    def threads_running(self):
+        rows = self.client.rows("SHOW GLOBAL STATUS LIKE 'Threads_running';")
+        return int(rows[0]['Value']) if rows else 0
+
+    @staticmethod
+    def replica_lag(replica):
+        """Seconds behind the source, None if replication is stopped"""
+        for sql, column in (("SHOW REPLICA STATUS;", 'Seconds_Behind_Source'),
+                            ("SHOW SLAVE STATUS;", 'Seconds_Behind_Master')):
+            try:
+                rows = replica.rows(sql)
+            except RuntimeError:
+                continue  # Older server: try the old syntax
+            if not rows:
+                return 0  # Not a replica
+            value = rows[0].get(column)
+            return int(value) if value is not None else None
+        return None
+
+    def overloaded(self):
+        """Reason to hold off, or None"""
+        threads = self.threads_running()
+        if threads > self.max_threads_running:
+            return f"Threads_running={threads}"
+        for replica in self.replicas:
+            lag = self.replica_lag(replica)
+            if lag is None or lag > self.max_replica_lag:
+                return f"replica lag={lag}"
+        return None
+
+    def wait_for_capacity(self, deadline):
+        """
+        Block while the server is overloaded. Returns seconds spent waiting,
+        or None if the daemon is stopping or the job ran out of time.
+        """
+        waited = 0.0
+        backoff = 1.0
+        while True:
+            if self.stop.is_set() or time.monotonic() >= deadline:
+                return None
+            try:
+                reason = self.overloaded()
+            except RuntimeError as e:
+                reason = f"load check failed: {e}"
+            if reason is None:
+                return waited
+            log_event('throttle', reason=reason, wait_s=backoff)
+            self.stop.wait(backoff)
+            waited += backoff
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def record(self, elapsed):
+        """Adapt the chunk size to the last chunk's duration and pause after it"""
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms > self.chunk_ms:
+            self.chunk = max(CHUNK_MIN, self.chunk // 2)
+        elif elapsed_ms < self.chunk_ms / 4:
+            self.chunk = min(CHUNK_MAX, int(self.chunk * 1.5))
+        self.stop.wait(max(elapsed, 0.05))
+        return max(elapsed, 0.05)
+
+def log_event(event, **fields):
+    print(json.dumps(dict({'ts': int(time.time()), 'event': event}, **fields)), flush=True)
+
+def run_delete_job(client, job, pacer, now, dry_run=False):
+    """Delete every row matching a DELETE_JOBS entry, one chunk at a time"""
+    table, key = job['table'], job['key']
+    where = job['where'].format(now=now)
+    quote = sql_string if job.get('string_key') else str
+    result = {'job': job['name'], 'rows': 0, 'chunks': 0, 'work_s': 0.0, 'throttled_s': 0.0, 'errors': 0}
+    started = time.monotonic()
+    deadline = started + JOB_TIME_BUDGET
+
+    try:
+        if dry_run:
+            rows = client.rows(f"SELECT COUNT(*) AS count FROM {table} WHERE {where};")
+            result['candidates'] = int(rows[0]['count']) if rows else 0
+            return result
+
+        last = None
+        columns = key + (f", {job['range']}" if job.get('range') else '')
+        while True:
+            waited = pacer.wait_for_capacity(deadline)
+            if waited is None:
+                break
+            result['throttled_s'] += waited
+
+            after = f" AND {key} > {quote(last)}" if last is not None else ''
+            limit = pacer.chunk
+            chunk_started = time.perf_counter()
+            rows = client.rows(f"SELECT {columns} FROM {table} WHERE {where}{after} "
+                               f"ORDER BY {key} LIMIT {limit};")
+            if not rows:
+                break
+
+            keys = ', '.join(quote(row[key]) for row in rows)
+            prune = ''
+            if job.get('range'):
+                bounds = [int(row[job['range']]) for row in rows]
+                prune = f" AND {job['range']} BETWEEN {min(bounds)} AND {max(bounds)}"
+            try:
+                output = client.execute(
+                    f"SET SESSION innodb_lock_wait_timeout = {INNODB_LOCK_WAIT};\n"
+                    f"DELETE FROM {table} WHERE {key} IN ({keys}) AND {where}{prune};\n"
+                    "SELECT ROW_COUNT();\n")
+                result['rows'] += int(output.split()[-1])
+                result['chunks'] += 1
+                last = rows[-1][key]
+                deleted = True
+            except RuntimeError as e:
+                # Usually a lock wait timeout: the keys are retried after the pause, in a smaller chunk
+                result['errors'] += 1
+                log_event('chunk_error', job=job['name'], error=str(e))
+                if result['errors'] >= MAX_CHUNK_ERRORS:
+                    break
+                deleted = False
+
+            elapsed = time.perf_counter() - chunk_started
+            result['work_s'] += elapsed
+            result['throttled_s'] += pacer.record(elapsed)
+            if deleted and len(rows) < limit:
+                break
+    except RuntimeError as e:
+        result['errors'] += 1
+        result['error'] = str(e)
+    finally:
+        result['elapsed_s'] = round(time.monotonic() - started, 3)
+        result['work_s'] = round(result['work_s'], 3)
+        result['throttled_s'] = round(result['throttled_s'], 3)
+        result['chunk'] = pacer.chunk
+    return result
+
+def run_partition_job(client, dry_run=False):
+    """relay_partitions.py retention, reported like a delete job"""
+    started = time.monotonic()
+    tables = maintain_partitions(client, dry_run=dry_run)
+    errors = [t for t in tables if 'error' in t]
+    result = {
+        'job': 'partitions',
+        'rows': sum(t['rows_dropped'] for t in tables),
+        'created': sum(len(t['created']) for t in tables),
+        'dropped': sum(len(t['dropped']) for t in tables),
+        'errors': len(errors),
+        'elapsed_s': round(time.monotonic() - started, 3),
+    }
+    if errors:
+        result['error'] = '; '.join(f"{t['table']}: {t['error']}" for t in errors)
+    return result
+
+def run_rate_limit_files_job(storage_path=STORAGE_PATH, dry_run=False):
+    """Remove file-fallback rate limit windows nobody has touched for an hour"""
+    started = time.monotonic()
+    cutoff = time.time() - RATE_LIMIT_FILE_MAX_AGE
+    removed = 0
+    errors = 0
+    directory = Path(storage_path) / "rate_limit"
+    if directory.is_dir():
+        for entry in os.scandir(directory):
+            try:
+                if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    if not dry_run:
+                        os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                errors += 1  # Raced with a request rewriting or the PHP cleanup removing it
+    key = 'candidates' if dry_run else 'rows'
+    return {'job': 'rate_limit_files', key: removed, 'errors': errors,
+            'elapsed_s': round(time.monotonic() - started, 3)}
+
+def update_stats(results, stats_file=STATS_FILE):
+    """Merge one cycle's results into the running totals file"""
+    try:
+        stats = json.loads(Path(stats_file).read_text())
+    except (OSError, ValueError):
+        stats = {'jobs': {}}
+
+    for result in results:
+        job = stats['jobs'].setdefault(result['job'], {'runs': 0, 'rows': 0, 'seconds': 0.0, 'errors': 0})
+        job['runs'] += 1
+        job['rows'] += result.get('rows', 0)
+        job['seconds'] = round(job['seconds'] + result.get('elapsed_s', 0), 3)
+        job['errors'] += result.get('errors', 0)
+        job['last'] = result
+    stats['updated_at'] = int(time.time())
+
+    try:
+        Path(stats_file).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{stats_file}.tmp"
+        Path(tmp).write_text(json.dumps(stats, indent=2))
+        os.replace(tmp, stats_file)
+    except OSError as e:
+        log_event('stats_error', error=str(e))
+
+def run_cycle(client, pacer, storage_path=STORAGE_PATH, dry_run=False):
+    now = int(time.time())
+    results = []
+    for job in DELETE_JOBS:
+        if pacer.stop.is_set():
+            break
+        results.append(run_delete_job(client, job, pacer, now, dry_run))
+    if not pacer.stop.is_set():
+        results.append(run_partition_job(client, dry_run))
+        results.append(run_rate_limit_files_job(storage_path, dry_run))
+
+    for result in results:
+        log_event('job', **result)
+    if not dry_run:
+        update_stats(results, Path(storage_path) / STATS_FILE.name)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Reap expired and orphaned ShareFast rows in small, paced chunks")
+    parser.add_argument('--mysql', default='mysql', help="mysql client binary")
+    parser.add_argument('--defaults-file', help="MySQL option file (default: generated from config.php)")
+    parser.add_argument('--config', default=str(CONFIG_FILE), help="config.php to read credentials from")
+    parser.add_argument('--replica', action='append', default=[], metavar='DEFAULTS_FILE',
+                        help="option file of a replica whose lag paces the deletes (repeatable)")
+    parser.add_argument('--storage-path', default=str(STORAGE_PATH))
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL, help="seconds between cycles")
+    parser.add_argument('--chunk-ms', type=int, default=CHUNK_MS, help="target milliseconds per chunk DELETE")
+    parser.add_argument('--max-threads-running', type=int, default=MAX_THREADS_RUNNING)
+    parser.add_argument('--max-replica-lag', type=int, default=MAX_REPLICA_LAG)
+    parser.add_argument('--once', action='store_true', help="run one cycle and exit")
+    parser.add_argument('--dry-run', action='store_true', help="count what would be removed, change nothing")
+    args = parser.parse_args()
+
+    try:
+        defaults_file = args.defaults_file or option_file_from_config(args.config)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+    client = MySQLClient(args.mysql, defaults_file)
+    replicas = [MySQLClient(args.mysql, path) for path in args.replica]
+    pacer = Pacer(client, replicas, stop, args.chunk_ms, args.max_threads_running, args.max_replica_lag)
+
+    log_event('start', interval=args.interval, once=args.once, dry_run=args.dry_run)
+    while not stop.is_set():
+        run_cycle(client, pacer, args.storage_path, args.dry_run)
+        if args.once:
+            break
+        stop.wait(args.interval)
+    log_event('stop')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
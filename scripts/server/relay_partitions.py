@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Partition retention for relay_messages and signals
+
+Both tables are RANGE-partitioned on created_at (migrations/008), so
+retention works on whole partitions instead of DELETEs:
+1. Pre-creates upcoming partitions by splitting the catch-all `pfuture`
+   partition. pfuture is kept empty, so the split moves no rows.
+2. Drops partitions whose rows are all older than the table's retention.
+   A dropped partition is a dropped tablespace file - no row locks, no undo
+   log, no fragmented pages left behind, however many rows it held.
+
+Partitions are named after their upper bound (p<unix time>). Bounds are
+always read from INFORMATION_SCHEMA, never parsed from names.
+
+Every DDL runs with a short lock_wait_timeout: if a long transaction holds
+the table's metadata lock the job gives up for this run instead of queueing
+every relay query behind it. maintenance_daemon.py runs it every cycle; it
+can also run on its own from cron, well inside the pre-created range:
+
+    */10 * * * * python3 /opt/sharefast-api/scripts/server/relay_partitions.py --defaults-file /etc/sharefast/maintenance.cnf
+
+Only the `mysql` command-line client is required; credentials come from a
+client option file (or MYSQL_PWD), never from the command line.
+
+Usage:
+    python scripts/server/relay_partitions.py --defaults-file ~/.my.cnf
+    python scripts/server/relay_partitions.py --dry-run      # show the DDL only
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+# Configuration
+DEFAULT_DATABASE = "lwavhbte_sharefast"
+LOCK_WAIT_TIMEOUT = 5  # Seconds DDL may wait for a metadata lock
+
+# Table => partition width, partitions kept ahead of now, retention (all seconds).
+# A partition is dropped once its upper bound is `retention` seconds old, so
+# rows live between `retention` and `retention + interval` seconds.
+PARTITIONED_TABLES = {
+    'relay_messages': {'interval': 3600, 'ahead': 3, 'retention': 3600},
+    'signals': {'interval': 86400, 'ahead': 2, 'retention': 86400},
+}
+
+class MySQLClient:
+    """Thin wrapper around the `mysql` command-line client"""
+
+    def __init__(self, mysql_bin='mysql', defaults_file=None, host=None, port=None, user=None, database=None):
+        self.base = [mysql_bin]
+        if defaults_file:
+            self.base.append(f"--defaults-extra-file={defaults_file}")
+        if host:
+            self.base.append(f"--host={host}")
+        if port:
+            self.base.append(f"--port={port}")
+        if user:
+            self.base.append(f"--user={user}")
+        if database:
+            self.base.append(f"--database={database}")
+
+    def execute(self, sql, column_names=False):
+        """Run SQL from stdin. Returns stdout; raises RuntimeError on failure."""
+        args = self.base + ["--batch"]
+        if not column_names:
+            args.append("--skip-column-names")
+        result = subprocess.run(args, input=sql, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"mysql exited with {result.returncode}")
+        return result.stdout
+
+    def rows(self, sql):
+        """Run one statement and return its result set as a list of dicts"""
+        lines = self.execute(sql, column_names=True).splitlines()
+        if not lines:
+            return []
+        header = lines[0].split('\t')
+        rows = []
+        for line in lines[1:]:
+            values = [None if v == 'NULL' else v for v in line.split('\t')]
+            rows.append(dict(zip(header, values)))
+        return rows
+
+def list_partitions(client, table):
+    """
+    Partitions of `table` in order: dicts with name, bound (None for
+    MAXVALUE) and rows (InnoDB's estimate). Empty if it is not partitioned.
+    """
+    rows = client.rows(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM INFORMATION_SCHEMA.PARTITIONS "
+        f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table}' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION;")
+    return [{
+        'name': row['PARTITION_NAME'],
+        'bound': None if row['PARTITION_DESCRIPTION'] == 'MAXVALUE' else int(row['PARTITION_DESCRIPTION']),
+        'rows': int(row['TABLE_ROWS'] or 0),
+    } for row in rows]
+
+def plan_table(partitions, policy, now):
+    """Upper bounds to create and partitions to drop for one table"""
+    interval = policy['interval']
+    bounds = [p['bound'] for p in partitions if p['bound'] is not None]
+
+    # Bounds up to the end of the `ahead`-th interval after the current one
+    horizon = (now // interval + 1 + policy['ahead']) * interval
+    last = max(bounds) if bounds else now // interval * interval
+    create = list(range(last + interval, horizon + 1, interval))
+
+    cutoff = now - policy['retention']
+    drop = [p for p in partitions if p['bound'] is not None and p['bound'] <= cutoff]
+    return create, drop
+
+def partition_ddl(table, partitions, create, drop):
+    """ALTER TABLE statements carrying out a plan"""
+    statements = []
+    if create:
+        definitions = [f"PARTITION p{bound} VALUES LESS THAN ({bound})" for bound in create]
+        future = next((p['name'] for p in partitions if p['bound'] is None), None)
+        if future:
+            definitions.append(f"PARTITION {future} VALUES LESS THAN MAXVALUE")
+            statements.append(f"ALTER TABLE {table} REORGANIZE PARTITION {future} INTO ({', '.join(definitions)})")
+        else:
+            statements.append(f"ALTER TABLE {table} ADD PARTITION ({', '.join(definitions)})")
+    if drop:
+        statements.append(f"ALTER TABLE {table} DROP PARTITION {', '.join(p['name'] for p in drop)}")
+    return statements
+
+def maintain_table(client, table, policy, now=None, dry_run=False):
+    """
+    Bring one table's partitions up to date.
+    Returns a dict with created / dropped partition names, rows_dropped
+    (estimate), statements and elapsed_ms - or 'error'.
+    """
+    now = int(now if now is not None else time.time())
+    started = time.perf_counter()
+    result = {'table': table, 'created': [], 'dropped': [], 'rows_dropped': 0, 'statements': []}
+
+    try:
+        partitions = list_partitions(client, table)
+        if not partitions:
+            result['error'] = "not partitioned (apply migrations/008_partition_relay_messages_signals.sql)"
+            return result
+
+        create, drop = plan_table(partitions, policy, now)
+        result['statements'] = partition_ddl(table, partitions, create, drop)
+        if not dry_run:
+            for statement in result['statements']:
+                client.execute(f"SET SESSION lock_wait_timeout = {LOCK_WAIT_TIMEOUT};\n{statement};\n")
+
+        result['created'] = [f"p{bound}" for bound in create]
+        result['dropped'] = [p['name'] for p in drop]
+        result['rows_dropped'] = sum(p['rows'] for p in drop)
+    except RuntimeError as e:
+        result['error'] = str(e)
+    finally:
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+def maintain_partitions(client, tables=PARTITIONED_TABLES, now=None, dry_run=False):
+    """Run maintain_table() for every partitioned table"""
+    return [maintain_table(client, table, policy, now, dry_run) for table, policy in tables.items()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Create upcoming and drop expired relay_messages/signals partitions")
+    parser.add_argument('--mysql', default='mysql', help="mysql client binary")
+    parser.add_argument('--defaults-file', help="MySQL client option file with credentials")
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--user')
+    parser.add_argument('--database', help=f"default: the option file's, else {DEFAULT_DATABASE}")
+    parser.add_argument('--dry-run', action='store_true', help="print the DDL without running it")
+    args = parser.parse_args()
+
+    database = args.database or (None if args.defaults_file else DEFAULT_DATABASE)
+    client = MySQLClient(args.mysql, args.defaults_file, args.host, args.port, args.user, database)
+    results = maintain_partitions(client, dry_run=args.dry_run)
+
+    failed = False
+    for result in results:
+        if 'error' in result:
+            failed = True
+            print(f"[ERROR] {result['table']}: {result['error']}")
+            continue
+        label = "[DRY-RUN]" if args.dry_run else "[OK]"
+        print(f"{label} {result['table']}: created {len(result['created'])}, dropped {len(result['dropped'])} "
+              f"(~{result['rows_dropped']} rows) in {result['elapsed_ms']} ms")
+        if args.dry_run:
+            for statement in result['statements']:
+                print(f"    {statement};")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
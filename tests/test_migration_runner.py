@@ -0,0 +1,90 @@
+import pytest
+
+from migration_runner import make_online, split_statements
+
+
+def test_split_on_semicolons():
+    sql = "CREATE TABLE a (id INT);\nINSERT INTO a VALUES (1);\n\nSELECT 1"
+    assert split_statements(sql) == ["CREATE TABLE a (id INT)", "INSERT INTO a VALUES (1)", "SELECT 1"]
+
+
+def test_split_skips_empty_statements():
+    assert split_statements(";;\n  ;SELECT 1;;") == ["SELECT 1"]
+
+
+def test_split_keeps_semicolons_inside_strings():
+    sql = "INSERT INTO t VALUES ('a;b', \"c;d\");SELECT `odd;name` FROM t;"
+    assert split_statements(sql) == ["INSERT INTO t VALUES ('a;b', \"c;d\")", "SELECT `odd;name` FROM t"]
+
+
+def test_split_handles_escaped_and_doubled_quotes():
+    sql = "SELECT 'it''s;fine', 'back\\';slash';SELECT 2"
+    assert split_statements(sql) == ["SELECT 'it''s;fine', 'back\\';slash'", "SELECT 2"]
+
+
+def test_split_drops_comments():
+    sql = (
+        "-- leading comment; not a statement\n"
+        "SELECT 1; # hash comment; still a comment\n"
+        "SELECT /* inline; comment */ 2;\n"
+        "SELECT 3 -- trailing"
+    )
+    assert split_statements(sql) == ["SELECT 1", "SELECT   2", "SELECT 3"]
+
+
+def test_split_keeps_double_dash_without_space():
+    # `--` only starts a comment when followed by whitespace
+    assert split_statements("SELECT 5--1;") == ["SELECT 5--1"]
+
+
+def test_split_ignores_comment_markers_inside_strings():
+    assert split_statements("SELECT '-- no', '# no', '/* no */';") == ["SELECT '-- no', '# no', '/* no */'"]
+
+
+def test_split_rejects_delimiter():
+    sql = "DELIMITER $$\nCREATE PROCEDURE p() BEGIN SELECT 1; END $$\nDELIMITER ;"
+    with pytest.raises(ValueError, match="DELIMITER"):
+        split_statements(sql)
+
+
+def test_make_online_alter_add_index():
+    sql = "ALTER TABLE relay_messages ADD INDEX idx_lane (session_id, message_type, read_at, id)"
+    assert make_online(sql) == (sql + ", ALGORITHM=INPLACE, LOCK=NONE", True)
+
+
+def test_make_online_create_index():
+    sql = "CREATE UNIQUE INDEX idx_code ON sessions (code)"
+    assert make_online(sql) == (sql + " ALGORITHM=INPLACE LOCK=NONE", True)
+
+
+def test_make_online_keeps_existing_algorithm():
+    sql = "ALTER TABLE sessions ADD INDEX idx_expires (expires_at), ALGORITHM=COPY"
+    assert make_online(sql) == (sql, False)
+    sql = "CREATE INDEX idx_expires ON sessions (expires_at) algorithm=inplace"
+    assert make_online(sql) == (sql, False)
+
+
+def test_make_online_leaves_other_ddl_alone():
+    for sql in (
+        "ALTER TABLE sessions ADD COLUMN last_seen INT",
+        "ALTER TABLE sessions ADD FULLTEXT INDEX ft_name (name)",
+        "CREATE TABLE t (id INT)",
+    ):
+        assert make_online(sql) == (sql, False)
+
+
+def test_make_online_rewrites_ddl_in_string_literals():
+    sql = (
+        "SET @sql = IF(@exists = 0, "
+        "'ALTER TABLE relay_messages ADD INDEX idx_lane (session_id)', 'SELECT 1')"
+    )
+    expected = (
+        "SET @sql = IF(@exists = 0, "
+        "'ALTER TABLE relay_messages ADD INDEX idx_lane (session_id), ALGORITHM=INPLACE, LOCK=NONE', 'SELECT 1')"
+    )
+    assert make_online(sql) == (expected, True)
+
+
+def test_make_online_string_literal_with_algorithm():
+    sql = "SET @sql = IF(@exists = 0, 'CREATE INDEX i ON t (c) ALGORITHM=COPY', 'SELECT 1')"
+    assert make_online(sql) == (sql, False)
@@ -0,0 +1,49 @@
+from query_plan_gate import plan_violations
+
+
+def kinds(plan):
+    return [(v['kind'], v['table']) for v in plan_violations(plan)]
+
+
+def test_indexed_access_passes():
+    plan = [
+        {'table': 'relay_messages', 'type': 'ref', 'key': 'idx_lane', 'rows': 12, 'Extra': 'Using index condition'},
+        {'table': 'sessions', 'type': 'eq_ref', 'key': 'PRIMARY', 'rows': 1, 'Extra': None},
+        {'table': 'signals', 'type': 'range', 'key': 'idx_session', 'rows': 40, 'Extra': 'Using where'},
+    ]
+    assert plan_violations(plan) == []
+
+
+def test_full_table_scan():
+    plan = [{'table': 'sessions', 'type': 'ALL', 'key': None, 'rows': 4000, 'Extra': 'Using where'}]
+    assert plan_violations(plan) == [{'kind': 'full_scan', 'table': 'sessions', 'detail': 'type=ALL, rows=4000'}]
+
+
+def test_full_index_scan():
+    plan = [{'table': 'relay_messages', 'type': 'index', 'key': 'idx_created', 'rows': 60000, 'Extra': ''}]
+    assert plan_violations(plan) == [
+        {'kind': 'full_index_scan', 'table': 'relay_messages', 'detail': 'type=index, key=idx_created'}
+    ]
+
+
+def test_filesort_is_reported_alongside_access_type():
+    plan = [{'table': 'signals', 'type': 'ALL', 'rows': 20000, 'Extra': 'Using where; Using filesort'}]
+    assert kinds(plan) == [('full_scan', 'signals'), ('filesort', 'signals')]
+
+    plan = [{'table': 'signals', 'type': 'ref', 'key': 'idx_session', 'rows': 5, 'Extra': 'Using filesort'}]
+    assert kinds(plan) == [('filesort', 'signals')]
+
+
+def test_materialized_tables_are_exempt():
+    plan = [
+        {'table': '<derived2>', 'type': 'ALL', 'rows': 60, 'Extra': 'Using filesort'},
+        {'table': '<subquery3>', 'type': 'index', 'rows': 10, 'Extra': None},
+        {'table': 'relay_messages', 'type': 'ref', 'key': 'idx_lane', 'rows': 50, 'Extra': None},
+    ]
+    assert plan_violations(plan) == []
+
+
+def test_missing_columns_are_tolerated():
+    # MariaDB / older servers leave some EXPLAIN columns NULL
+    assert plan_violations([{'table': None, 'type': None, 'Extra': None}]) == []
+    assert kinds([{'table': 't', 'type': 'all'}]) == [('full_scan', 't')]